@@ -216,7 +216,8 @@ def download_data_worker(params, progress_queue, result_queue, stop_event):
             time_range=params.get('time_range', 'all'),
             progress_callback=progress_callback,
             log_callback=log_callback,
-            check_interrupt=check_interrupt
+            check_interrupt=check_interrupt,
+            storage_format=params.get('storage_format', 'csv')
         )
         
         result_queue.put(('success', '数据下载完成！'))
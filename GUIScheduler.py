@@ -262,8 +262,9 @@ class GUIScheduler(QMainWindow):
         self.schedule_timer.timeout.connect(self.check_schedule)
         
         # 初始化xtdata工具和股票名称缓存
-        from khQTTools import KhQuTools
+        from khQTTools import KhQuTools, get_trading_calendar
         self.tools = KhQuTools()
+        self.trade_calendar = get_trading_calendar()
         self.stock_names_cache = {}
         
         # 初始化自定义文件列表
@@ -1522,9 +1523,10 @@ class GUIScheduler(QMainWindow):
     
     def check_and_execute_if_trading_day(self):
         """检查是否为交易日，如果是则执行补充"""
-        today_str = datetime.now().strftime("%Y-%m-%d")
+        today = datetime.now()
+        today_str = today.strftime("%Y-%m-%d")
         
-        if self.tools.is_trade_day(today_str):
+        if self.trade_calendar.is_trade_day(today):
             self.add_log(f"今日 {today_str} 为交易日，开始执行数据补充")
             self.execute_supplement()
         else:
@@ -1550,20 +1552,13 @@ class GUIScheduler(QMainWindow):
         
         # 对于立即执行，检查是否为交易日
         from PyQt5.QtWidgets import QMessageBox
-        from datetime import timedelta
         
         today = datetime.now()
         today_str = today.strftime("%Y-%m-%d")
         
-        if not self.tools.is_trade_day(today_str):
-            # 今天不是交易日，寻找最近的交易日
-            recent_trading_day = today
-            for i in range(1, 10):  # 向前查找最多10天
-                check_date = today - timedelta(days=i)
-                check_date_str = check_date.strftime("%Y-%m-%d")
-                if self.tools.is_trade_day(check_date_str):
-                    recent_trading_day = check_date
-                    break
+        if not self.trade_calendar.is_trade_day(today):
+            # 今天不是交易日，从交易日历中取最近的前一个交易日
+            recent_trading_day = self.trade_calendar.prev_trade_day(today)
             
             reply = QMessageBox.question(
                 self, 
@@ -1673,7 +1668,7 @@ class GUIScheduler(QMainWindow):
             else:
                 check_date_str = datetime.now().strftime("%Y-%m-%d")
                 
-            if not self.tools.is_trade_day(check_date_str):
+            if not self.trade_calendar.is_trade_day(check_date_str):
                 self.add_log(f"⚠️ 注意: {check_date_str} 不是交易日，可能没有交易数据")
             
             self.add_log(f"开始补充数据: {', '.join(selected_periods)} 周期，日期: {self.current_date}")
@@ -2,6 +2,7 @@
 import numpy as np
 import pandas as pd
 import math
+from abc import ABC, abstractmethod
 
 
 # ------------------ 0级：核心工具函数（适配日线数据字段） --------------------------------------------
@@ -49,32 +50,77 @@ def MIN(S1, S2): return np.minimum(S1, S2)  # 序列最小值
 def IF(S, A, B): return np.where(S, A, B)  # 布尔判断（S为真返回A，否则B）
 
 
+def _PD(S):  # 一维序列转 pd.Series；二维数组 (K线数, 股票数) 转 pd.DataFrame，按列同时计算多只股票
+    return pd.DataFrame(S) if np.ndim(S) == 2 else pd.Series(S)
+
+
 def REF(S, N=1):  # 序列后移N位（获取历史值，如REF(CLOSE,1)为昨收价）
-    return pd.Series(S).shift(N).values
+    return _PD(S).shift(N).values
 
 
 def DIFF(S, N=1):  # 序列差分（前值-后值，如DIFF(CLOSE)为当日涨跌额）
-    return pd.Series(S).diff(N).values
+    return _PD(S).diff(N).values
 
 
 def STD(S, N):  # N日标准差（如计算波动率）
-    return pd.Series(S).rolling(N).std(ddof=0).values
+    return _PD(S).rolling(N).std(ddof=0).values
 
 
 def SUM(S, N):  # N日累计和（N=0为累加，如计算总成交量）
-    return pd.Series(S).rolling(N).sum().values if N > 0 else pd.Series(S).cumsum().values
+    return _PD(S).rolling(N).sum().values if N > 0 else _PD(S).cumsum().values
 
 
 def CONST(S):  # 序列末尾值扩展为等长常量（如固定基准值）
     return np.full(len(S), S[-1])
 
 
-def HHV(S, N):  # N日最高价（如HHV(HIGH, 5)为最近5日最高价）
-    return pd.Series(S).rolling(N).max().values
+def _RANGE_EXTREME(S, N, func):  # 动态周期窗口极值：倍增稀疏表预计算，每个位置两次查表，替代逐位置切片
+    S = np.asarray(S, dtype=float)
+    N = np.asarray(N, dtype=float)
+    N = np.broadcast_to(N.reshape(N.shape + (1,) * (S.ndim - N.ndim)), S.shape)  # 一维N对所有股票通用
+    rows = np.arange(len(S)).reshape((-1,) + (1,) * (S.ndim - 1))
+    with np.errstate(invalid='ignore'):
+        valid = ~np.isnan(N) & (N <= rows + 1)  # 周期数有效且不超过当前位置
+        L = np.where(valid, N, 1).astype(int)  # 与 int() 一致向零取整
+    valid &= L >= 1
+    table, width = [S], 1  # table[k][i] = S[i:i+2**k] 的极值
+    while width * 2 <= len(S):
+        table.append(func(table[-1][:-width], table[-1][width:]))
+        width *= 2
+    res = np.full(S.shape, np.nan)
+    idx = np.nonzero(valid)
+    end = idx[0]
+    start = end + 1 - L[idx]
+    level = np.frexp(L[idx])[1] - 1  # floor(log2(窗口长度))
+    for k in np.unique(level):
+        m = level == k
+        cols = tuple(c[m] for c in idx[1:])
+        res[(end[m],) + cols] = func(table[k][(start[m],) + cols], table[k][(end[m] - (1 << k) + 1,) + cols])
+    return res
+
+
+def HHV(S, N):
+    """
+    计算N周期内的最高价（支持N为固定值或动态序列）
+    输入：S（价格序列，如HIGH最高价字段；二维时按列计算多只股票）、N（周期数，整数或与S等长的序列）
+    输出：等长于S的最高价序列
+    示例：HHV(HIGH, 5)  # 最近5日最高价；HHV(CLOSE, N序列)  # 每个位置用对应N值计算高点
+    """
+    if np.ndim(N) == 0:
+        return _PD(S).rolling(N).max().values  # 固定周期：用pandas滚动窗口计算
+    return _RANGE_EXTREME(S, N, np.maximum)  # 动态周期：周期无效或超过当前位置处为nan
 
 
-def LLV(S, N):  # N日最低价（如LLV(LOW, 5)为最近5日最低价）
-    return pd.Series(S).rolling(N).min().values
+def LLV(S, N):
+    """
+    计算N周期内的最低价（支持N为固定值或动态序列）
+    输入：S（价格序列，如LOW最低价字段；二维时按列计算多只股票）、N（周期数，整数或与S等长的序列）
+    输出：等长于S的最低价序列
+    示例：LLV(LOW, 5)  # 最近5日最低价；LLV(CLOSE, N序列)  # 每个位置用对应N值计算低点
+    """
+    if np.ndim(N) == 0:
+        return _PD(S).rolling(N).min().values  # 固定周期：用pandas滚动窗口计算
+    return _RANGE_EXTREME(S, N, np.minimum)  # 动态周期：周期无效或超过当前位置处为nan
 
 
 def HHVBARS(S, N):  # N日内最高价到当前的周期数（如找最近5日高点位置）
@@ -86,29 +132,38 @@ def LLVBARS(S, N):  # N日内最低价到当前的周期数（如找最近5日
 
 
 def MA(S, N):  # N日简单移动平均（如MA(CLOSE, 20)为20日均线）
-    return pd.Series(S).rolling(N).mean().values
+    return _PD(S).rolling(N).mean().values
 
 
 def EMA(S, N):  # 指数移动平均（如EMA(CLOSE, 12)为12日指数均线）
-    return pd.Series(S).ewm(span=N, adjust=False).mean().values
+    return _PD(S).ewm(span=N, adjust=False).mean().values
 
 
 def SMA(S, N, M=1):  # 中国式SMA（如KDJ中的平滑计算）
-    return pd.Series(S).ewm(alpha=M / N, adjust=False).mean().values
+    return _PD(S).ewm(alpha=M / N, adjust=False).mean().values
 
 
 def WMA(S, N):  # 加权移动平均（按时间加权，近期权重更高）
     return pd.Series(S).rolling(N).apply(lambda x: x[::-1].cumsum().sum() * 2 / N / (N + 1), raw=True).values
 
 
-def DMA(S, A):  # 动态移动平均（A为平滑因子，支持序列输入）
-    if isinstance(A, (int, float)):  return pd.Series(S).ewm(alpha=A, adjust=False).mean().values
-    A = np.array(A);
-    A[np.isnan(A)] = 1.0;
-    Y = np.zeros(len(S));
+def DMA(S, A):  # 动态移动平均（A为平滑因子，支持序列输入；S为二维时按列计算多只股票）
+    if isinstance(A, (int, float)):  return _PD(S).ewm(alpha=A, adjust=False).mean().values
+    A = np.array(A, dtype=float)
+    A[np.isnan(A)] = 1.0
+    Y = np.zeros(np.shape(S))
     Y[0] = S[0]
-    for i in range(1, len(S)): Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]
-    return Y
+    if Y.ndim == 2:  # 多只股票：逐K线递推，每步对所有股票向量化
+        S = np.asarray(S, dtype=float)
+        A = np.broadcast_to(A.reshape(A.shape + (1,) * (2 - A.ndim)), Y.shape)
+        for i in range(1, len(S)): Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]
+        return Y
+    s, a, y = np.asarray(S, dtype=float).tolist(), A.tolist(), Y[0]  # 纯Python浮点递推，避免逐元素访问numpy标量
+    out = [y]
+    for i in range(1, len(s)):
+        y = a[i] * s[i] + (1 - a[i]) * y
+        out.append(y)
+    return np.array(out)
 
 
 def AVEDEV(S, N):  # 平均绝对偏差（如CCI指标中的平均偏差计算）
@@ -140,22 +195,32 @@ def EXIST(S, N):  # N日内存在满足条件（如EXIST(CLOSE>10%, 5)为近5日
     return IF(SUM(S, N) > 0, True, False)
 
 
-def FILTER(S, N):  # 条件成立后屏蔽后续N周期（如FILTER(CROSS(MA5, MA10), 3)为金叉后3日不重复提示）
-    for i in range(len(S)):
-        if S[i]: S[i + 1:i + 1 + N] = 0
+def FILTER(S, N):  # 条件成立后屏蔽后续N周期（如FILTER(CROSS(MA5, MA10), 3)为金叉后3日不重复提示），原地修改S
+    if np.ndim(S) == 2:  # 多只股票：按列原地处理
+        for j in range(S.shape[1]): FILTER(S[:, j], N)
+        return S
+    last = None  # 只遍历成立的位置：落在上一个保留信号屏蔽区内的跳过
+    for i in np.flatnonzero(S).tolist():
+        if last is None or i > last + N:
+            S[i + 1:i + 1 + N] = 0
+            last = i
     return S
 
 
+def _BARS_POS(S):  # 位置序号1..n，形状可与二维S广播
+    return np.arange(1, len(S) + 1).reshape((-1,) + (1,) * (np.ndim(S) - 1))
+
+
 def BARSLAST(S):  # 上一次条件成立到当前的周期数（如BARSLAST(CLOSE跌停)为上次跌停至今天数）
-    M = np.concatenate(([0], np.where(S, 1, 0)))
-    for i in range(1, len(M)): M[i] = 0 if M[i] else M[i - 1] + 1
-    return M[1:]
+    S = np.asarray(S)
+    pos = _BARS_POS(S)
+    return pos - np.maximum.accumulate(np.where(S, pos, 0), axis=0)  # 减去最近一次成立的位置
 
 
 def BARSLASTCOUNT(S):  # 连续满足条件的周期数（如BARSLASTCOUNT(CLOSE>OPEN)为连续阳线数）
-    rt = np.zeros(len(S) + 1)
-    for i in range(len(S)): rt[i + 1] = rt[i] + 1 if S[i] else rt[i + 1]
-    return rt[1:]
+    S = np.asarray(S)
+    pos = _BARS_POS(S)
+    return (pos - np.maximum.accumulate(np.where(S, 0, pos), axis=0)).astype(float)  # 减去最近一次不成立的位置
 
 
 def BARSSINCEN(S, N):  # N周期内首次满足条件到现在的周期数（如BARSSINCEN(CLOSE>MA20, 20)为20日内首次上穿均线至今天数）
@@ -422,42 +487,6 @@ def XSII(CLOSE, HIGH, LOW, N=102, M=7):  # 薛斯通道II
     return TD1, TD2, TD3, TD4
 
 
-# ------------------ 0级扩展：支持动态周期的核心函数 --------------------------------------------
-
-def HHV(S, N):
-    """
-    计算N周期内的最高价（支持N为固定值或动态序列）
-    输入：S（价格序列，如HIGH最高价字段）、N（周期数，整数或与S等长的序列）
-    输出：等长于S的最高价序列
-    示例：HHV(HIGH, 5)  # 最近5日最高价；HHV(CLOSE, N序列)  # 每个位置用对应N值计算高点
-    """
-    if isinstance(N, (int, float)):
-        return pd.Series(S).rolling(N).max().values  # 固定周期：用pandas滚动窗口计算
-    else:
-        res = np.repeat(np.nan, len(S))  # 初始化结果为nan
-        for i in range(len(S)):
-            if (not np.isnan(N[i])) and N[i] <= i + 1:  # 周期数有效且不超过当前位置
-                res[i] = S[i + 1 - int(N[i]):i + 1].max()  # 动态周期：截取对应长度计算高点
-        return res
-
-
-def LLV(S, N):
-    """
-    计算N周期内的最低价（支持N为固定值或动态序列）
-    输入：S（价格序列，如LOW最低价字段）、N（周期数，整数或与S等长的序列）
-    输出：等长于S的最低价序列
-    示例：LLV(LOW, 5)  # 最近5日最低价；LLV(CLOSE, N序列)  # 每个位置用对应N值计算低点
-    """
-    if isinstance(N, (int, float)):
-        return pd.Series(S).rolling(N).min().values  # 固定周期：用pandas滚动窗口计算
-    else:
-        res = np.repeat(np.nan, len(S))  # 初始化结果为nan
-        for i in range(len(S)):
-            if (not np.isnan(N[i])) and N[i] <= i + 1:  # 周期数有效且不超过当前位置
-                res[i] = S[i + 1 - int(N[i]):i + 1].min()  # 动态周期：截取对应长度计算低点
-        return res
-
-
 # ------------------ 0级扩展：高级移动平均函数 --------------------------------------------
 
 def DSMA(X, N):
@@ -474,12 +503,18 @@ def DSMA(X, N):
     c1 = 1 - c2 - c3  # 剩余系数
 
     # 计算价格变化率（Zeros为X的二阶差分）
-    Zeros = np.pad(X[2:] - X[:-2], (2, 0), 'constant')  # 填充前两个位置为0
-
-    Filt = np.zeros(len(X))  # 初始化滤波值
-    for i in range(len(X)):
-        # 递归计算滤波值（考虑前两项的影响）
-        Filt[i] = c1 * (Zeros[i] + Zeros[i - 1]) / 2 + c2 * Filt[i - 1] + c3 * Filt[i - 2]
+    if np.ndim(X) == 2:  # 多只股票：逐K线递推，每步对所有股票向量化
+        Zeros = np.pad(X[2:] - X[:-2], ((2, 0), (0, 0)), 'constant')  # 填充前两根K线为0
+        Filt = np.zeros(np.shape(X))
+        for i in range(len(X)):
+            Filt[i] = c1 * (Zeros[i] + Zeros[i - 1]) / 2 + c2 * Filt[i - 1] + c3 * Filt[i - 2]
+    else:
+        Zeros = np.pad(X[2:] - X[:-2], (2, 0), 'constant').tolist()  # 填充前两个位置为0
+        Filt = [0.0] * len(X)  # 初始化滤波值（Python列表递推，负索引读到未计算的0与原数组一致）
+        for i in range(len(X)):
+            # 递归计算滤波值（考虑前两项的影响）
+            Filt[i] = c1 * (Zeros[i] + Zeros[i - 1]) / 2 + c2 * Filt[i - 1] + c3 * Filt[i - 2]
+        Filt = np.array(Filt)
 
     # 计算滤波值的N周期均方根（RMS）
     RMS = np.sqrt(SUM(np.square(Filt), N) / N)
@@ -500,6 +535,9 @@ def SUMBARSFAST(X, A):
     输出：等长于X的周期数序列（每个位置表示从该位置向前累加至A所需的周期数）
     示例：SUMBARSFAST(VOL, 100000)  # 成交量累加至10万股的周期数；SUMBARSFAST(VOL, CAPITAL)  # 完全换手周期数
     """
+    if np.ndim(X) == 2:  # 多只股票：按列计算（A可为单值、一维公共序列或同形状二维数组）
+        return np.column_stack([SUMBARSFAST(X[:, j], A[:, j] if np.ndim(A) == 2 else A)
+                                for j in range(X.shape[1])])
     if any(X <= 0):  # 检查X是否全为正数（否则无法累加）
         raise ValueError('数组X的每个元素都必须大于0！')
 
@@ -510,15 +548,13 @@ def SUMBARSFAST(X, A):
         A = np.repeat(A, length)
     A = np.flipud(A)  # 倒转A（与X方向一致）
 
-    sumbars = np.zeros(length)  # 初始化周期数结果
     Sigma = np.insert(np.cumsum(X), 0, 0.0)  # 累加前缀和（前面插入0便于索引）
 
-    for i in range(length):
-        # 查找累加和超过A[i]的位置
-        k = np.searchsorted(Sigma[i + 1:], A[i] + Sigma[i])
-        if k < length - i:  # 找到有效位置
-            sumbars[length - i - 1] = k + 1  # 转换回原顺序的周期数
-    return sumbars.astype(int)
+    # 一次二分查找所有位置：前缀和单调不减，在整个Sigma中查找再减去前i+1项即为在Sigma[i+1:]中的位置
+    i = np.arange(length)
+    k = np.maximum(np.searchsorted(Sigma, A + Sigma[:-1]) - (i + 1), 0)
+    sumbars = np.where(k < length - i, k + 1, 0)  # 未找到有效位置的记0
+    return sumbars[::-1].astype(int)  # 转换回原顺序的周期数
 
 
 # ------------------ 2级扩展：技术指标函数 --------------------------------------------
@@ -540,7 +576,26 @@ def SAR(HIGH, LOW, N=10, S=2, M=20):
     # 计算初始极值（前N日高点/低点）
     s_hhv = REF(HHV(HIGH, N), 1)  # 前一日的N日最高价（延迟1日）
     s_llv = REF(LLV(LOW, N), 1)  # 前一日的N日最低价（延迟1日）
-    sar_x = np.repeat(np.nan, length)  # 初始化SAR序列
+
+    if np.ndim(HIGH) == 2:  # 多只股票：逐K线递推，趋势状态按股票向量化
+        HIGH, LOW = np.asarray(HIGH, dtype=float), np.asarray(LOW, dtype=float)
+        sar_x = np.full(HIGH.shape, np.nan)
+        af = np.zeros(HIGH.shape[1])
+        b_first = np.ones(HIGH.shape[1], dtype=bool)
+        for i in range(N, length):
+            ep = np.where(is_long, s_hhv[i], s_llv[i])
+            grow = ~b_first & np.where(is_long, HIGH[i] > ep, LOW[i] < ep)
+            af = np.where(b_first, f_step, np.where(grow, _PYMIN(af + f_step, f_max), af))
+            sar_x[i] = np.where(b_first, np.where(is_long, s_llv[i], s_hhv[i]),
+                                sar_x[i - 1] + af * (ep - sar_x[i - 1]))
+            b_first = np.where(is_long, LOW[i] < sar_x[i], HIGH[i] > sar_x[i])  # 反转后下一根为新趋势起始点
+            is_long = is_long ^ b_first
+        return sar_x
+
+    # 单只股票：转为Python浮点列表递推，避免逐元素访问numpy标量
+    HIGH, LOW = np.asarray(HIGH, dtype=float).tolist(), np.asarray(LOW, dtype=float).tolist()
+    s_hhv, s_llv = s_hhv.tolist(), s_llv.tolist()
+    sar_x = [np.nan] * length  # 初始化SAR序列
 
     for i in range(N, length):
         if b_first:  # 趋势起始点
@@ -559,7 +614,7 @@ def SAR(HIGH, LOW, N=10, S=2, M=20):
         if (is_long and LOW[i] < sar_x[i]) or ((not is_long) and HIGH[i] > sar_x[i]):
             is_long = not is_long  # 反转趋势
             b_first = True  # 标记为新趋势起始点
-    return sar_x
+    return np.array(sar_x)
 
 
 def TDX_SAR(High, Low, iAFStep=2, iAFLimit=20):
@@ -571,7 +626,10 @@ def TDX_SAR(High, Low, iAFStep=2, iAFLimit=20):
     """
     af_step = iAFStep / 100  # 步长因子（如iAFStep=2对应0.02）
     af_limit = iAFLimit / 100  # 步长极限（如iAFLimit=20对应0.2）
-    SarX = np.zeros(len(High))  # 初始化SAR序列
+    if np.ndim(High) == 2:
+        return _TDX_SAR_2D(np.asarray(High, dtype=float), np.asarray(Low, dtype=float), af_step, af_limit)
+    High, Low = np.asarray(High, dtype=float).tolist(), np.asarray(Low, dtype=float).tolist()  # Python浮点递推
+    SarX = [0.0] * len(High)  # 初始化SAR序列
 
     # 第一个K线：默认多头，SAR初始为当日低点
     bull = True
@@ -622,4 +680,365 @@ def TDX_SAR(High, Low, iAFStep=2, iAFLimit=20):
                 # 修正反转后的SAR值（取前两日低点的最小值）
                 SarX[i] = min(Low[i], Low[i - 1])
 
-    return SarX
\ No newline at end of file
+    return np.array(SarX)
+
+
+def _PYMIN(a, b):  # 逐元素 min(a, b)，缺失值规则与内置 min 一致（仅 b<a 时取 b）
+    return np.where(b < a, b, a)
+
+
+def _PYMAX(a, b):  # 逐元素 max(a, b)，缺失值规则与内置 max 一致（仅 b>a 时取 b）
+    return np.where(b > a, b, a)
+
+
+def _TDX_SAR_2D(High, Low, af_step, af_limit):  # TDX_SAR 多股票版：逐K线递推，每步的分支改为按股票选择
+    SarX = np.zeros(High.shape)
+    bull = np.ones(High.shape[1], dtype=bool)
+    af = np.full(High.shape[1], af_step)
+    ep = High[0].copy()
+    SarX[0] = Low[0]
+    for i in range(1, len(High)):
+        new_ep = np.where(bull, High[i] > ep, Low[i] < ep)  # 1. 创新高/新低时更新极值与加速因子
+        ep = np.where(new_ep, np.where(bull, High[i], Low[i]), ep)
+        af = np.where(new_ep, _PYMIN(af + af_step, af_limit), af)
+        sar = SarX[i - 1] + af * (ep - SarX[i - 1])  # 2. 计算SAR值
+        sar = np.where(bull, _PYMAX(SarX[i - 1], _PYMIN(_PYMIN(sar, Low[i]), Low[i - 1])),  # 3. 修正SAR值
+                       _PYMIN(SarX[i - 1], _PYMAX(_PYMAX(sar, High[i]), High[i - 1])))
+        to_bear = bull & (Low[i] < sar)  # 4. 检查趋势反转
+        to_bull = ~bull & (High[i] > sar)
+        bear_sar = np.where(High[i - 1] == ep, ep, ep + af_step * (Low[i] - ep))
+        SarX[i] = np.where(to_bear, bear_sar, np.where(to_bull, _PYMIN(Low[i], Low[i - 1]), sar))
+        ep = np.where(to_bear, Low[i], np.where(to_bull, High[i], ep))
+        af = np.where(to_bear | to_bull, af_step, af)
+        bull = (bull & ~to_bear) | to_bull
+    return SarX
+
+# ------------------ 3级：流式增量指标（每根K线增量更新，支持多股票向量化） ------------------------------
+# 回测中每根K线对不断增长的历史序列重算 MA/EMA 等指标是 O(n²) 的；流式版本保存递推状态，
+# 每次 update 只处理新到的一个值（MA/EMA/SMA 为O(1)，HHV/LLV/STD 为均摊O(1)）。
+# MA/EMA/SMA/HHV/LLV 的结果与上面的批量函数逐位一致（EWM 在 alpha=0.5 且序列中间有缺失值时
+# pandas 另有特殊处理，结果会有差异）；STD 相差在浮点误差范围内。
+# 构造时传入 size 即为多股票模式：update 接收长度为 size 的数组，一次推进整个股票池。
+#   ma = StreamingMA(5);            ma.update(10.2)                 # 单只股票，返回标量
+#   ma = StreamingMA(5, size=300);  ma.update(close_array)          # 300只股票，返回数组
+
+class _Streaming(ABC):
+    """流式指标基类：统一处理标量/多股票两种输入形状，子类实现 _step"""
+
+    def __init__(self, size=None):
+        self.size = size  # None 为标量模式
+        self.count = 0  # 已处理的K线数
+        self._n = 1 if size is None else int(size)
+
+    def _in(self, value):  # 输入统一为 (n,) 的 float64 数组
+        arr = np.asarray(value, dtype=np.float64)
+        if arr.shape != (self._n,):
+            arr = np.broadcast_to(arr, (self._n,)).copy()
+        return arr
+
+    def _out(self, arr):  # 标量模式返回标量
+        return arr[0] if self.size is None else arr
+
+    @abstractmethod
+    def _step(self, x):  # 输入 (n,) 数组，返回 (n,) 数组或其元组
+        ...
+
+    def update(self, value):
+        """输入一根K线的值，返回该K线的指标值（多输出指标返回元组）"""
+        result = self._step(self._in(value))
+        self.count += 1
+        if isinstance(result, tuple):
+            return tuple(self._out(r) for r in result)
+        return self._out(result)
+
+    def extend(self, values):
+        """依次输入一段序列（多股票模式为 (K线数, size) 二维数组），返回与批量函数等长的结果"""
+        outs = [self.update(v) for v in values]
+        if outs and isinstance(outs[0], tuple):
+            return tuple(np.array(col) for col in zip(*outs))
+        return np.array(outs)
+
+
+class _RollingWindow:
+    """固定长度的环形缓冲区，记录窗口内的原始值以便移出"""
+
+    def __init__(self, N, n):
+        self.N = N
+        self.buf = np.full((N, n), np.nan)
+        self.pos = 0
+        self.filled = 0
+
+    def push(self, x):  # 写入新值，返回被挤出窗口的旧值（窗口未满时为None）
+        old = self.buf[self.pos].copy() if self.filled == self.N else None
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.N
+        self.filled = min(self.filled + 1, self.N)
+        return old
+
+
+class StreamingMA(_Streaming):
+    """流式 MA(S, N)：补偿求和的滚动均值，与 pandas rolling(N).mean() 一致"""
+
+    def __init__(self, N, size=None):
+        super().__init__(size)
+        self.N = int(N)
+        self.window = _RollingWindow(self.N, self._n)
+        n = self._n
+        self.nobs = np.zeros(n, dtype=np.int64); self.neg_ct = np.zeros(n, dtype=np.int64)
+        self.sum_x = np.zeros(n); self.comp_add = np.zeros(n); self.comp_remove = np.zeros(n)
+        self.same_ct = np.zeros(n, dtype=np.int64); self.prev = np.full(n, np.nan)  # 连续相同值计数，消除浮点尾差
+
+    def _step(self, x):
+        old = self.window.push(x)
+        if old is not None:  # 移出窗口最早的值
+            obs = old == old
+            y = np.where(obs, -old, 0.0) - self.comp_remove
+            t = self.sum_x + y
+            self.comp_remove = np.where(obs, t - self.sum_x - y, self.comp_remove)
+            self.sum_x = np.where(obs, t, self.sum_x)
+            self.nobs -= obs
+            self.neg_ct -= obs & np.signbit(old)
+        obs = x == x  # 加入新值
+        y = np.where(obs, x, 0.0) - self.comp_add
+        t = self.sum_x + y
+        self.comp_add = np.where(obs, t - self.sum_x - y, self.comp_add)
+        self.sum_x = np.where(obs, t, self.sum_x)
+        self.nobs += obs
+        self.neg_ct += obs & np.signbit(x)
+        self.same_ct = np.where(obs, np.where(x == self.prev, self.same_ct + 1, 1), self.same_ct)
+        self.prev = np.where(obs, x, self.prev)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = self.sum_x / self.nobs
+        result = np.where(self.same_ct >= self.nobs, self.prev, result)
+        result = np.where((self.neg_ct == 0) & (result < 0), 0.0, result)
+        result = np.where((self.neg_ct == self.nobs) & (result > 0), 0.0, result)
+        return np.where((self.nobs >= self.N) & (self.nobs > 0), result, np.nan)
+
+
+class StreamingSTD(_Streaming):
+    """流式 STD(S, N)：窗口内偏移后数值的累计和与平方和随移入/移出的值更新，
+    每滚动一个窗口以窗口均值为偏移量按缓冲区重算一次（避免大数相减损失精度、消除累积误差），
+    与 pandas rolling(N).std(ddof=0) 相差在浮点误差范围内"""
+
+    def __init__(self, N, size=None):
+        super().__init__(size)
+        self.N = int(N)
+        self.window = _RollingWindow(self.N, self._n)
+        n = self._n
+        self.nobs = np.zeros(n, dtype=np.int64); self.shift = np.zeros(n)
+        self.sum_d = np.zeros(n); self.sum_d2 = np.zeros(n)  # 窗口内 (值 - shift) 的和与平方和
+        self.same_ct = np.zeros(n, dtype=np.int64); self.prev = np.full(n, np.nan)  # 窗口内全为同一值时标准差为0
+        self.nan_rows = [False] * self.N; self.nan_ct = 0  # 窗口中含缺失值的K线（按环形缓冲区位置）及其个数
+
+    def _step(self, x):
+        obs = x == x
+        has_nan = not obs.all()
+        if self.count == 0:
+            self.shift = np.where(obs, x, 0.0)
+        pos = self.window.pos
+        old = self.window.push(x)
+        if old is not None:  # 移出窗口最早的值
+            d = old - self.shift
+            if self.nan_rows[pos]:
+                old_obs = d == d
+                d[~old_obs] = 0.0
+                self.nobs -= old_obs
+                self.nan_ct -= 1
+            else:
+                self.nobs -= 1
+            self.sum_d -= d; self.sum_d2 -= d * d
+        self.nan_rows[pos] = has_nan
+        d = x - self.shift  # 加入新值
+        if has_nan:
+            d[~obs] = 0.0
+            self.nobs += obs
+            self.nan_ct += 1
+            self.same_ct = np.where(obs, np.where(x == self.prev, self.same_ct + 1, 1), self.same_ct)
+            self.prev = np.where(obs, x, self.prev)
+        else:
+            self.nobs += 1
+            self.same_ct = np.where(x == self.prev, self.same_ct + 1, 1)
+            self.prev = x
+        self.sum_d += d; self.sum_d2 += d * d
+        if self.window.pos == 0:
+            self._resync()
+
+        full = self.nan_ct == 0 and self.window.filled == self.N  # 窗口已满且无缺失值时各股票的样本数均为N
+        nobs = self.N if full else np.maximum(self.nobs, 1)
+        result = np.sqrt(np.maximum((self.sum_d2 - self.sum_d * self.sum_d / nobs) / nobs, 0.0))
+        result[self.same_ct >= self.N] = 0.0
+        if not full:
+            result[self.nobs < self.N] = np.nan
+        return result
+
+    def _resync(self):
+        buf = self.window.buf
+        obs = buf == buf
+        self.shift = np.where(obs, buf, 0.0).sum(axis=0) / np.maximum(self.nobs, 1)
+        d = np.where(obs, buf - self.shift, 0.0)
+        self.sum_d = d.sum(axis=0); self.sum_d2 = (d * d).sum(axis=0)
+
+
+class StreamingHHV(_Streaming):
+    """流式 HHV(S, N)：窗口内最高值（窗口含缺失值或未满时为nan）
+
+    按长度 N 分块：当前块记录块内前缀最值，上一块满时一次算出其后缀最值；窗口由上一块的后缀和
+    当前块的前缀组成，每次 update 查一次表，每 N 次做一次 O(N) 的后缀归约，均摊 O(1)。
+    """
+
+    _op = np.maximum
+    _identity = -np.inf
+
+    def __init__(self, N, size=None):
+        super().__init__(size)
+        self.N = int(N)
+        self.block = np.empty((self.N, self._n))
+        self.prefix = np.full(self._n, self._identity)
+        # suffix[i] 为上一块第 i 个及之后的值的最值，suffix[N] 为单位元
+        self.suffix = np.full((self.N + 1, self._n), self._identity)
+
+    def _step(self, x):
+        pos = self.count % self.N
+        self.block[pos] = x
+        self.prefix = x.copy() if pos == 0 else self._op(self.prefix, x)  # np.maximum/minimum 传播缺失值
+        result = self._op(self.suffix[pos + 1], self.prefix)
+        if pos == self.N - 1:  # 当前块已满，成为下一块的“上一块”
+            self.suffix[:self.N] = self._op.accumulate(self.block[::-1], axis=0)[::-1]
+        if self.count < self.N - 1:
+            return np.full(self._n, np.nan)
+        return result
+
+
+class StreamingLLV(StreamingHHV):
+    """流式 LLV(S, N)：窗口内最低值（窗口含缺失值或未满时为nan）"""
+
+    _op = np.minimum
+    _identity = np.inf
+
+
+class StreamingEWM(_Streaming):
+    """流式指数加权均值（adjust=False），与 pandas ewm(alpha=..., adjust=False).mean() 一致"""
+
+    def __init__(self, alpha, size=None):
+        super().__init__(size)
+        self.alpha = float(alpha)
+        self.weighted = np.full(self._n, np.nan)
+        self.old_wt = np.ones(self._n)
+
+    def _step(self, x):
+        obs = x == x
+        if self.count == 0:  # 首个值直接作为初值
+            self.weighted = x.copy()
+            return self.weighted.copy()
+        started = self.weighted == self.weighted
+        self.old_wt = np.where(started, self.old_wt * (1.0 - self.alpha), self.old_wt)
+        blend = started & obs & (self.weighted != x)
+        with np.errstate(invalid='ignore'):
+            mixed = (self.old_wt * self.weighted + self.alpha * x) / (self.old_wt + self.alpha)
+        self.weighted = np.where(blend, mixed, np.where(~started & obs, x, self.weighted))
+        self.old_wt = np.where(started & obs, 1.0, self.old_wt)
+        return self.weighted.copy()
+
+
+class StreamingEMA(StreamingEWM):
+    """流式 EMA(S, N)"""
+
+    def __init__(self, N, size=None):
+        super().__init__(2.0 / (N + 1), size)
+        self.N = N
+
+
+class StreamingSMA(StreamingEWM):
+    """流式中国式 SMA(S, N, M)"""
+
+    def __init__(self, N, M=1, size=None):
+        super().__init__(M / N, size)
+        self.N, self.M = N, M
+
+
+class StreamingMACD(_Streaming):
+    """流式 MACD(CLOSE, SHORT, LONG, M)，update(close) 返回 (DIF, DEA, MACD)"""
+
+    def __init__(self, SHORT=12, LONG=26, M=9, size=None):
+        super().__init__(size)
+        self.ema_short = StreamingEMA(SHORT, size=self._n)
+        self.ema_long = StreamingEMA(LONG, size=self._n)
+        self.ema_dif = StreamingEMA(M, size=self._n)
+
+    def _step(self, close):
+        dif = self.ema_short.update(close) - self.ema_long.update(close)
+        dea = self.ema_dif.update(dif)
+        return RD(dif), RD(dea), RD((dif - dea) * 2)
+
+
+class StreamingKDJ(_Streaming):
+    """流式 KDJ(CLOSE, HIGH, LOW, N, M1, M2)，update(close, high, low) 返回 (K, D, J)"""
+
+    def __init__(self, N=9, M1=3, M2=3, size=None):
+        super().__init__(size)
+        self.hhv = StreamingHHV(N, size=self._n)
+        self.llv = StreamingLLV(N, size=self._n)
+        self.ema_k = StreamingEMA(M1 * 2 - 1, size=self._n)
+        self.ema_d = StreamingEMA(M2 * 2 - 1, size=self._n)
+
+    def update(self, close, high, low):
+        self._high, self._low = self._in(high), self._in(low)
+        return super().update(close)
+
+    def _step(self, close):
+        hh, ll = self.hhv.update(self._high), self.llv.update(self._low)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsv = (close - ll) / (hh - ll) * 100
+        k = self.ema_k.update(rsv)
+        d = self.ema_d.update(k)
+        return k, d, k * 3 - d * 2
+
+
+class StreamingRSI(_Streaming):
+    """流式 RSI(CLOSE, N)"""
+
+    def __init__(self, N=24, size=None):
+        super().__init__(size)
+        self.prev_close = np.full(self._n, np.nan)
+        self.sma_up = StreamingSMA(N, size=self._n)
+        self.sma_abs = StreamingSMA(N, size=self._n)
+
+    def _step(self, close):
+        dif = close - self.prev_close
+        self.prev_close = close
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return RD(self.sma_up.update(MAX(dif, 0)) / self.sma_abs.update(ABS(dif)) * 100)
+
+
+class StreamingBOLL(_Streaming):
+    """流式 BOLL(CLOSE, N, P)，update(close) 返回 (UPPER, MID, LOWER)"""
+
+    def __init__(self, N=20, P=2, size=None):
+        super().__init__(size)
+        self.P = P
+        self.ma = StreamingMA(N, size=self._n)
+        self.std = StreamingSTD(N, size=self._n)
+
+    def _step(self, close):
+        mid, std = self.ma.update(close), self.std.update(close)
+        return RD(mid + std * self.P), RD(mid), RD(mid - std * self.P)
+
+
+class StreamingATR(_Streaming):
+    """流式 ATR(CLOSE, HIGH, LOW, N)，update(close, high, low)"""
+
+    def __init__(self, N=20, size=None):
+        super().__init__(size)
+        self.prev_close = np.full(self._n, np.nan)
+        self.ma = StreamingMA(N, size=self._n)
+
+    def update(self, close, high, low):
+        self._high, self._low = self._in(high), self._in(low)
+        return super().update(close)
+
+    def _step(self, close):
+        high, low = self._high, self._low
+        tr = MAX(MAX(high - low, ABS(self.prev_close - high)), ABS(self.prev_close - low))
+        self.prev_close = close
+        return self.ma.update(tr)
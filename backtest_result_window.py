@@ -28,6 +28,7 @@ import numpy as np
 import sys
 import time
 from khQTTools import KhQuTools
+from khBenchmark import BenchmarkSeries
 from xtquant import xtdata
 
 # 设置matplotlib的字体和其他参数
@@ -667,6 +668,23 @@ class BacktestResultWindow(QMainWindow):
         except Exception as e:
             logger.info(f"调整图表布局时出错: {str(e)}")
         
+    def get_benchmark_series(self):
+        """读取回测结果目录中的基准序列（只读取一次）"""
+        if not hasattr(self, '_benchmark_series'):
+            try:
+                self._benchmark_series = BenchmarkSeries.load_file(os.path.abspath(self.backtest_dir))
+            except Exception as e:
+                logger.info(f"读取基准序列时出错: {str(e)}")
+                self._benchmark_series = None
+        return self._benchmark_series
+
+    def load_benchmark_frame(self):
+        """以 date, close 两列返回主基准数据，没有基准数据时返回空DataFrame"""
+        series = self.get_benchmark_series()
+        if series is None:
+            return pd.DataFrame(columns=['date', 'close'])
+        return series.to_frame()
+
     def load_data(self):
         """加载回测数据"""
         try:
@@ -751,7 +769,7 @@ class BacktestResultWindow(QMainWindow):
                     logger.info("创建了空的基准数据DataFrame")
             else:
                 try:
-                    benchmark_df = pd.read_csv(benchmark_path, encoding='utf-8-sig')
+                    benchmark_df = self.load_benchmark_frame()
                     # 检查基准数据是否为空
                     if len(benchmark_df) == 0 or 'close' not in benchmark_df.columns or 'date' not in benchmark_df.columns:
                         logger.info("基准数据文件为空或缺少必要列")
@@ -988,9 +1006,8 @@ class BacktestResultWindow(QMainWindow):
                 # 需要基准收益率数据
                 # 这里假设已经有了基准数据，否则需要加载
                 try:
-                    benchmark_path = os.path.join(self.backtest_dir, "benchmark.csv")
-                    if os.path.exists(benchmark_path):
-                        benchmark_df = pd.read_csv(benchmark_path, encoding='utf-8-sig')
+                    if self.get_benchmark_series() is not None:
+                        benchmark_df = self.load_benchmark_frame()
                         if len(benchmark_df) > 0 and 'date' in benchmark_df.columns and 'close' in benchmark_df.columns:
                             # 计算基准收益率
                             benchmark_df['date'] = pd.to_datetime(benchmark_df['date'])
@@ -2153,10 +2170,19 @@ class BacktestResultWindow(QMainWindow):
             # 获取沪深300指数收益率作为基准
             benchmark_returns = None
             try:
-                # 获取基准指数数据 - 先尝试从benchmark.csv读取
-                benchmark_file = os.path.join(self.backtest_dir, "benchmark.csv")
-                if os.path.exists(benchmark_file):
-                    benchmark_df = pd.read_csv(benchmark_file)
+                # 获取基准指数数据 - 回测时已保存前一交易日收盘价的，直接计算含首日的收益率
+                series = self.get_benchmark_series()
+                if series is not None and len(series) > 0 and not np.isnan(series.prev_closes[0]):
+                    benchmark_returns = pd.Series(series.returns())
+                    # 确保基准收益率长度与策略收益率匹配
+                    if len(benchmark_returns) > len(returns):
+                        benchmark_returns = benchmark_returns[-len(returns):].reset_index(drop=True)
+                    elif len(benchmark_returns) < len(returns):
+                        padding = pd.Series([benchmark_returns.iloc[0]] * (len(returns) - len(benchmark_returns)))
+                        benchmark_returns = pd.concat([padding, benchmark_returns]).reset_index(drop=True)
+                elif series is not None:
+                    # 旧的回测结果只有benchmark.csv，前一交易日收盘价需要另外获取
+                    benchmark_df = self.load_benchmark_frame()
                     if len(benchmark_df) > 0 and 'date' in benchmark_df.columns and 'close' in benchmark_df.columns:
                         # 获取日期和收盘价
                         benchmark_df['date'] = pd.to_datetime(benchmark_df['date'])
@@ -0,0 +1,11 @@
+# coding: utf-8
+"""
+性能基准测试包
+
+在仓库根目录下以模块方式运行：
+    python -m benchmarks.bench_backtest     # 回测引擎吞吐量、峰值内存与各环节耗时，对比 baseline.json（原始提交的记录）
+    python -m benchmarks.bench_mytt         # MyTT 循环类指标与原实现的对比
+
+@author: OsKhQuant
+@version: 1.0
+"""
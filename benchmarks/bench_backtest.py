@@ -0,0 +1,417 @@
+# coding: utf-8
+"""
+回测引擎基准测试
+
+用合成行情（见 synthetic_market）替代 xtquant，以无界面方式运行 KhQuantFramework._run_backtest，
+对 strategies/ 下的示例策略统计吞吐量（股票·K线/秒）、峰值内存以及主循环各环节耗时
+（沿用 _run_backtest 中 time_stats 的分类），并与保存的基线 JSON 对比判断是否退化。
+
+每个场景在独立子进程中运行，保证缓存状态和峰值内存互不影响。
+
+用法：
+    python -m benchmarks.bench_backtest                       # 运行全部场景并与基线对比
+    python -m benchmarks.bench_backtest --scenarios daily_ma,minute_ma --repeat 3
+    python -m benchmarks.bench_backtest --save-baseline       # 用本次结果覆盖基线
+    python -m benchmarks.bench_backtest --repo ../khQuant-old  # 测量另一份代码（如优化前的提交）
+
+baseline.json 以 --repo 指向优化前的原始提交记录（meta.commit），对比结果反映相对原始实现的提速。
+早期版本没有交易日历、time_table 和 time_stats 属性，此时交易日按相同规则生成，时间点数取
+all_times，各环节耗时缺省，主循环吞吐量按总耗时计算。注意原始提交中 khPrice 取到的是整行数据，
+示例策略在合成行情上不产生成交，因此与该基线只能比较吞吐量和峰值内存，成交笔数和期末资产的差异
+会单独提示而不计为退化。
+
+在提交之间检查退化时，先在改动前用 --output 或 --baseline 另存一份结果，再用 --baseline 指向它：
+    git stash && python -m benchmarks.bench_backtest --baseline before.json --save-baseline
+    git stash pop && python -m benchmarks.bench_backtest --baseline before.json
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# 判定退化的默认容差：吞吐量下降或峰值内存上升超过该比例
+DEFAULT_TOLERANCE = 0.2
+
+# 基准场景：策略取 strategies/ 下同名的 .py/.kh 文件，.kh 作为配置模板
+SCENARIOS = {
+    'daily_ma': {
+        'strategy': '双均线多股票_使用MA函数', 'period': '1d', 'stocks': 50,
+        'start': '20240101', 'end': '20241231',
+    },
+    'daily_khma': {
+        'strategy': '双均线多股票_使用khMA函数', 'period': '1d', 'stocks': 50,
+        'start': '20240101', 'end': '20241231',
+    },
+    'daily_rsi': {
+        'strategy': 'RSI策略', 'period': '1d', 'stocks': 50,
+        'start': '20240101', 'end': '20241231',
+    },
+    'minute_ma': {
+        'strategy': '双均线多股票_使用MA函数', 'period': '1m', 'stocks': 5,
+        'start': '20240102', 'end': '20240112',
+    },
+    'custom_time': {
+        'strategy': '双均线多股票_使用khMA函数', 'period': '1m', 'stocks': 20,
+        'start': '20240102', 'end': '20240630', 'trigger': 'custom', 'custom_times': ['09:45:00', '14:50:00'],
+    },
+    'tick': {
+        'strategy': '双均线精简_使用khMA函数', 'period': 'tick', 'stocks': 2,
+        'start': '20240102', 'end': '20240105',
+    },
+}
+
+# 合成数据相对回测开始提前的自然日数，保证策略取历史数据时有足够的预热K线
+DAILY_WARMUP_DAYS = 730
+INTRADAY_WARMUP_DAYS = 30
+
+BENCHMARK_INDEX = '000300.SH'
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+def build_config(spec: Dict, codes: List[str], path: str, repo: str = REPO_ROOT) -> str:
+    """以策略自带的 .kh 配置为模板生成场景配置文件
+
+    Args:
+        spec: 场景定义
+        codes: 股票池
+        path: 配置文件保存路径
+        repo: 被测代码目录，策略取其 strategies/ 下的文件
+
+    Returns:
+        str: 策略文件路径
+    """
+    from benchmarks.synthetic_market import TICK_FIELDS
+
+    strategy_dir = os.path.join(repo, 'strategies')
+    strategy_file = os.path.join(strategy_dir, spec['strategy'] + '.py')
+    with open(os.path.join(strategy_dir, spec['strategy'] + '.kh'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config['strategy_file'] = strategy_file
+    config['backtest']['start_time'] = spec['start']
+    config['backtest']['end_time'] = spec['end']
+    config['backtest']['trigger']['type'] = spec.get('trigger', spec['period'])
+    if spec.get('custom_times'):
+        config['backtest']['trigger']['custom_times'] = list(spec['custom_times'])
+    config['data']['kline_period'] = spec['period']
+    config['data']['stock_list'] = codes
+    if spec['period'] == 'tick':
+        config['data']['fields'] = list(TICK_FIELDS)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+    return strategy_file
+
+
+def run_scenario(name: str, stocks: Optional[int] = None, seed: int = 0, repo: str = REPO_ROOT) -> Dict:
+    """在当前进程中运行一个基准场景（会替换 xtquant 模块并切换工作目录，应在独立进程中调用）
+
+    Args:
+        name: 场景名称
+        stocks: 覆盖场景的股票数量
+        seed: 合成行情随机种子
+        repo: 被测代码目录，默认为本仓库
+
+    Returns:
+        Dict: 场景测量结果
+    """
+    spec = dict(SCENARIOS[name])
+    if stocks:
+        spec['stocks'] = int(stocks)
+
+    # xtdata 时间戳按北京时间解释，引擎中部分转换依赖本地时区
+    os.environ['TZ'] = 'Asia/Shanghai'
+    if hasattr(time, 'tzset'):
+        time.tzset()
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    # 被测代码优先于本仓库导入，基准脚本本身仍取自本仓库
+    repo = os.path.abspath(repo)
+    sys.path.insert(0, repo)
+
+    from benchmarks.synthetic_market import SyntheticMarket, install_fake_xtquant
+
+    start = datetime.datetime.strptime(spec['start'], '%Y%m%d')
+    market = SyntheticMarket((start - datetime.timedelta(days=DAILY_WARMUP_DAYS)).strftime('%Y%m%d'), spec['end'],
+                             seed=seed,
+                             intraday_start=(start - datetime.timedelta(days=INTRADAY_WARMUP_DAYS)).strftime('%Y%m%d'))
+    install_fake_xtquant(market)
+
+    # 回测结果目录 backtest_results 写在临时目录中，结束后删除
+    workdir = tempfile.mkdtemp(prefix='khbench_')
+    os.chdir(workdir)
+    try:
+        return _run_in_workdir(name, spec, market, workdir, repo)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_in_workdir(name: str, spec: Dict, market, workdir: str, repo: str) -> Dict:
+    from benchmarks.synthetic_market import make_stock_codes
+
+    codes = make_stock_codes(spec['stocks'])
+    config_path = os.path.join(workdir, 'benchmark.kh')
+    strategy_file = build_config(spec, codes, config_path, repo)
+
+    from khFrame import KhQuantFramework
+    from khQTTools import determine_pool_type, check_t0_support
+
+    class BenchmarkFramework(KhQuantFramework):
+        def load_strategy(self, strategy_file):
+            # 基准只运行仓库自带的示例策略，直接加载，跳过面向用户策略文件的安全校验
+            module_spec = importlib.util.spec_from_file_location('benchmark_strategy', strategy_file)
+            module = importlib.util.module_from_spec(module_spec)
+            module_spec.loader.exec_module(module)
+            return module
+
+    # 提前生成合成数据，数据生成不计入回测耗时
+    for code in codes + [BENCHMARK_INDEX]:
+        for period in {spec['period'], '1d'}:
+            market.series(code, period)
+
+    framework = BenchmarkFramework(config_path, strategy_file, trader_callback=None)
+    framework.init_trader_and_account()
+    stock_codes = framework.get_stock_list()
+    framework.pool_type, framework.price_decimals = determine_pool_type(stock_codes)
+    framework.trade_mgr.set_price_decimals(framework.price_decimals)
+    framework.t0_mode = check_t0_support(stock_codes)[1]
+    framework.trade_mgr.set_t0_mode(framework.t0_mode)
+    framework.strategy_module.init(stock_codes, {
+        "__account__": framework.trade_mgr.assets,
+        "__positions__": framework.trade_mgr.positions,
+        "__stock_list__": stock_codes,
+        "__framework__": framework,
+    })
+    framework.is_running = True
+    rss_before = peak_rss_mb()
+
+    start_time = time.perf_counter()
+    framework._run_backtest()
+    elapsed = time.perf_counter() - start_time
+
+    # 早期版本只有 all_times 列表，主循环各环节耗时为局部变量
+    times = getattr(framework, 'time_table', None)
+    if times is None:
+        times = getattr(framework, 'all_times', None)
+    n_times = len(times) if times is not None else 0
+    stock_bars = n_times * len(stock_codes)
+    raw_stats = getattr(framework, 'time_stats', None) or {}
+    time_stats = {key: round(value, 4) for key, value in raw_stats.items()}
+    loop_time = raw_stats.get("总时间", elapsed)
+    time_stats["循环外(加载与输出)"] = round(max(elapsed - loop_time, 0.0), 4)
+    return {
+        'scenario': name,
+        'period': spec['period'],
+        'stocks': len(stock_codes),
+        'time_points': n_times,
+        'stock_bars': stock_bars,
+        'elapsed': round(elapsed, 4),
+        'bars_per_sec': round(stock_bars / elapsed, 1) if elapsed > 0 else 0.0,
+        'loop_bars_per_sec': round(stock_bars / loop_time, 1) if loop_time > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'data_rss_mb': round(rss_before, 1),
+        'time_stats': time_stats,
+        'trades': len(framework.backtest_records.get('trades', [])),
+        'final_asset': round(float(framework.trade_mgr.assets.get('total_asset', 0.0)), 2),
+        'data_requests': dict(market.request_count),
+    }
+
+
+def run_in_subprocess(name: str, stocks: Optional[int] = None, seed: int = 0, repo: str = REPO_ROOT) -> Dict:
+    """在独立子进程中运行场景并读取结果
+
+    Args:
+        name: 场景名称
+        stocks: 覆盖场景的股票数量
+        seed: 合成行情随机种子
+        repo: 被测代码目录
+
+    Returns:
+        Dict: 场景测量结果
+    """
+    fd, result_file = tempfile.mkstemp(prefix='khbench_', suffix='.json')
+    os.close(fd)
+    command = [sys.executable, '-m', 'benchmarks.bench_backtest', '--worker', name,
+               '--result-file', result_file, '--seed', str(seed), '--repo', repo]
+    if stocks:
+        command += ['--stocks', str(stocks)]
+    try:
+        proc = subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            tail = proc.stderr.decode('utf-8', errors='replace').strip().splitlines()[-20:]
+            raise RuntimeError(f"场景 {name} 运行失败:\n" + "\n".join(tail))
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def git_commit(repo: str) -> str:
+    """被测代码的 git 提交号，不是 git 仓库时为空字符串"""
+    try:
+        proc = subprocess.run(['git', '-C', repo, 'rev-parse', '--short', 'HEAD'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return proc.stdout.decode().strip() if proc.returncode == 0 else ''
+    except OSError:
+        return ''
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """与基线对比，返回退化项描述
+
+    Args:
+        results: 本次结果（场景名 -> 结果）
+        baseline: 基线结果（场景名 -> 结果）
+        tolerance: 容差比例
+
+    Returns:
+        List[str]: 退化描述列表，为空表示没有退化
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['stocks'] != base['stocks'] or result['time_points'] != base['time_points']:
+            print(f"  {name}: 规模与基线不同（{result['stocks']}×{result['time_points']} vs "
+                  f"{base['stocks']}×{base['time_points']}），跳过对比")
+            continue
+        if result['bars_per_sec'] < base['bars_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐量 {result['bars_per_sec']:.0f} < 基线 {base['bars_per_sec']:.0f} 股票·K线/秒")
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: 峰值内存 {result['peak_rss_mb']:.0f}MB > 基线 {base['peak_rss_mb']:.0f}MB")
+        if (result['trades'], result['final_asset']) != (base['trades'], base['final_asset']):
+            print(f"  {name}: 回测结果与基线不同（成交 {result['trades']} vs {base['trades']}，"
+                  f"期末资产 {result['final_asset']} vs {base['final_asset']}）")
+    return regressions
+
+
+def print_result(result: Dict, base: Optional[Dict]):
+    """打印单个场景的结果"""
+    def ratio(key):
+        if not base or not base.get(key):
+            return ''
+        return f" ({result[key] / base[key] - 1:+.1%})"
+
+    print(f"\n[{result['scenario']}] {result['period']}，{result['stocks']}只股票 × {result['time_points']}个时间点")
+    print(f"  耗时 {result['elapsed']:.2f}秒，吞吐量 {result['bars_per_sec']:.0f} 股票·K线/秒{ratio('bars_per_sec')}，"
+          f"主循环 {result['loop_bars_per_sec']:.0f} 股票·K线/秒{ratio('loop_bars_per_sec')}")
+    print(f"  峰值内存 {result['peak_rss_mb']:.0f}MB{ratio('peak_rss_mb')}（回测前 {result['data_rss_mb']:.0f}MB），"
+          f"成交 {result['trades']} 笔，期末资产 {result['final_asset']:.2f}")
+    total = result['time_stats'].get("总时间", 0.0)
+    for key, value in result['time_stats'].items():
+        if key == "总时间":
+            continue
+        share = f"{value / total:6.1%}" if total > 0 and key != "循环外(加载与输出)" else "      "
+        print(f"    {key:<12}{value:9.4f}秒 {share}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回测引擎基准测试')
+    parser.add_argument('--scenarios', default='', help='逗号分隔的场景名，默认全部')
+    parser.add_argument('--stocks', type=int, default=None, help='覆盖各场景的股票数量')
+    parser.add_argument('--repeat', type=int, default=1, help='每个场景运行次数，取最好结果')
+    parser.add_argument('--seed', type=int, default=0, help='合成行情随机种子')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线JSON文件')
+    parser.add_argument('--save-baseline', action='store_true', help='用本次结果更新基线')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='判定退化的容差比例')
+    parser.add_argument('--output', default='', help='本次结果另存为JSON')
+    parser.add_argument('--repo', default=REPO_ROOT, help='被测代码目录，默认为本仓库')
+    parser.add_argument('--list', action='store_true', help='列出可用场景')
+    parser.add_argument('--worker', default='', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_scenario(args.worker, args.stocks, args.seed, args.repo)
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    if args.list:
+        for name, spec in SCENARIOS.items():
+            print(f"{name:<12}{spec['strategy']}  {spec['period']}  {spec['stocks']}只  {spec['start']}-{spec['end']}")
+        return
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()] or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('scenarios', {})
+
+    results = {}
+    for name in names:
+        runs = [run_in_subprocess(name, args.stocks, args.seed, args.repo) for _ in range(max(1, args.repeat))]
+        best = max(runs, key=lambda r: r['bars_per_sec'])
+        best['peak_rss_mb'] = min(r['peak_rss_mb'] for r in runs)
+        results[name] = best
+        print_result(best, baseline.get(name))
+
+    report = {
+        'meta': {
+            'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': __import__('numpy').__version__,
+            'pandas': __import__('pandas').__version__,
+            'commit': git_commit(args.repo),
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            saved.get('scenarios', {}).update(results)
+            report['scenarios'] = saved.get('scenarios', results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+        return
+
+    if baseline:
+        print("\n与基线对比:")
+        regressions = compare(results, baseline, args.tolerance)
+        for item in regressions:
+            print(f"  退化 - {item}")
+        if regressions:
+            sys.exit(1)
+        print("  未发现退化")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+# coding: utf-8
+"""
+MyTT 循环类指标基准测试
+
+对比 MyTT 中改为向量化/列表递推后的实现与原先逐元素 Python 循环实现（保留在本文件中作为参照）：
+先校验两者输出完全一致，再分别计时并输出加速比；最后给出二维（K线数 × 股票数）一次计算
+与逐只股票调用的耗时对比。
+
+用法：
+    python -m benchmarks.bench_mytt [--bars 5000] [--stocks 300] [--repeat 3]
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+import MyTT
+
+
+# ------------------ 原逐元素循环实现（参照基线） ------------------
+
+def legacy_hhv(S, N):
+    if isinstance(N, (int, float)):
+        return pd.Series(S).rolling(N).max().values
+    res = np.repeat(np.nan, len(S))
+    for i in range(len(S)):
+        if (not np.isnan(N[i])) and N[i] <= i + 1:
+            res[i] = S[i + 1 - int(N[i]):i + 1].max()
+    return res
+
+
+def legacy_dma(S, A):
+    if isinstance(A, (int, float)):
+        return pd.Series(S).ewm(alpha=A, adjust=False).mean().values
+    A = np.array(A)
+    A[np.isnan(A)] = 1.0
+    Y = np.zeros(len(S))
+    Y[0] = S[0]
+    for i in range(1, len(S)): Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]
+    return Y
+
+
+def legacy_filter(S, N):
+    for i in range(len(S)):
+        if S[i]: S[i + 1:i + 1 + N] = 0
+    return S
+
+
+def legacy_barslast(S):
+    M = np.concatenate(([0], np.where(S, 1, 0)))
+    for i in range(1, len(M)): M[i] = 0 if M[i] else M[i - 1] + 1
+    return M[1:]
+
+
+def legacy_barslastcount(S):
+    rt = np.zeros(len(S) + 1)
+    for i in range(len(S)): rt[i + 1] = rt[i] + 1 if S[i] else rt[i + 1]
+    return rt[1:]
+
+
+def legacy_dsma(X, N):
+    a1 = math.exp(-1.414 * math.pi * 2 / N)
+    b1 = 2 * a1 * math.cos(1.414 * math.pi * 2 / N)
+    c2 = b1
+    c3 = -a1 * a1
+    c1 = 1 - c2 - c3
+    Zeros = np.pad(X[2:] - X[:-2], (2, 0), 'constant')
+    Filt = np.zeros(len(X))
+    for i in range(len(X)):
+        Filt[i] = c1 * (Zeros[i] + Zeros[i - 1]) / 2 + c2 * Filt[i - 1] + c3 * Filt[i - 2]
+    RMS = np.sqrt(MyTT.SUM(np.square(Filt), N) / N)
+    alpha1 = np.abs(Filt / RMS) * 5 / N
+    return legacy_dma(X, alpha1)
+
+
+def legacy_sumbarsfast(X, A):
+    X = np.flipud(X)
+    length = len(X)
+    if isinstance(A * 1.0, float):
+        A = np.repeat(A, length)
+    A = np.flipud(A)
+    sumbars = np.zeros(length)
+    Sigma = np.insert(np.cumsum(X), 0, 0.0)
+    for i in range(length):
+        k = np.searchsorted(Sigma[i + 1:], A[i] + Sigma[i])
+        if k < length - i:
+            sumbars[length - i - 1] = k + 1
+    return sumbars.astype(int)
+
+
+def legacy_sar(HIGH, LOW, N=10, S=2, M=20):
+    f_step = S / 100
+    f_max = M / 100
+    af = 0.0
+    is_long = HIGH[N - 1] > HIGH[N - 2]
+    b_first = True
+    length = len(HIGH)
+    s_hhv = MyTT.REF(MyTT.HHV(HIGH, N), 1)
+    s_llv = MyTT.REF(MyTT.LLV(LOW, N), 1)
+    sar_x = np.repeat(np.nan, length)
+    for i in range(N, length):
+        if b_first:
+            af = f_step
+            sar_x[i] = s_llv[i] if is_long else s_hhv[i]
+            b_first = False
+        else:
+            ep = s_hhv[i] if is_long else s_llv[i]
+            if (is_long and HIGH[i] > ep) or ((not is_long) and LOW[i] < ep):
+                af = min(af + f_step, f_max)
+            sar_x[i] = sar_x[i - 1] + af * (ep - sar_x[i - 1])
+        if (is_long and LOW[i] < sar_x[i]) or ((not is_long) and HIGH[i] > sar_x[i]):
+            is_long = not is_long
+            b_first = True
+    return sar_x
+
+
+def legacy_tdx_sar(High, Low, iAFStep=2, iAFLimit=20):
+    af_step = iAFStep / 100
+    af_limit = iAFLimit / 100
+    SarX = np.zeros(len(High))
+    bull = True
+    af = af_step
+    ep = High[0]
+    SarX[0] = Low[0]
+    for i in range(1, len(High)):
+        if bull:
+            if High[i] > ep:
+                ep = High[i]
+                af = min(af + af_step, af_limit)
+        else:
+            if Low[i] < ep:
+                ep = Low[i]
+                af = min(af + af_step, af_limit)
+        SarX[i] = SarX[i - 1] + af * (ep - SarX[i - 1])
+        if bull:
+            SarX[i] = max(SarX[i - 1], min(SarX[i], Low[i], Low[i - 1]))
+        else:
+            SarX[i] = min(SarX[i - 1], max(SarX[i], High[i], High[i - 1]))
+        if bull:
+            if Low[i] < SarX[i]:
+                bull = False
+                tmp_SarX = ep
+                ep = Low[i]
+                af = af_step
+                if High[i - 1] == tmp_SarX:
+                    SarX[i] = tmp_SarX
+                else:
+                    SarX[i] = tmp_SarX + af * (ep - tmp_SarX)
+        else:
+            if High[i] > SarX[i]:
+                bull = True
+                ep = High[i]
+                af = af_step
+                SarX[i] = min(Low[i], Low[i - 1])
+    return SarX
+
+
+# ------------------ 基准测试 ------------------
+
+def make_bars(n_bars, n_stocks, seed=0):
+    """生成随机游走K线（二维数组，形状为 (K线数, 股票数)）
+
+    Args:
+        n_bars: K线数
+        n_stocks: 股票数
+        seed: 随机种子
+
+    Returns:
+        dict: close/high/low/volume/signal 数组
+    """
+    rng = np.random.default_rng(seed)
+    close = 20 + np.cumsum(rng.normal(0, 0.2, (n_bars, n_stocks)), axis=0)
+    return {
+        'close': close,
+        'high': close + rng.random((n_bars, n_stocks)) * 0.3,
+        'low': close - rng.random((n_bars, n_stocks)) * 0.3,
+        'volume': rng.random((n_bars, n_stocks)) * 1e4 + 1,
+        'signal': rng.random((n_bars, n_stocks)) < 0.2,
+        'period': rng.integers(1, 60, n_bars).astype(float),
+    }
+
+
+def build_cases(bars):
+    """单只股票用例：名称 -> (原实现调用, 新实现调用)"""
+    c, h, l = bars['close'][:, 0], bars['high'][:, 0], bars['low'][:, 0]
+    v, sig, period = bars['volume'][:, 0], bars['signal'][:, 0], bars['period']
+    alpha = np.abs(np.sin(np.arange(len(c)))) * 0.5
+    return {
+        'HHV(动态N)': (lambda: legacy_hhv(c, period), lambda: MyTT.HHV(c, period)),
+        'DMA(序列A)': (lambda: legacy_dma(c, alpha), lambda: MyTT.DMA(c, alpha)),
+        'DSMA': (lambda: legacy_dsma(c, 20), lambda: MyTT.DSMA(c, 20)),
+        'SUMBARSFAST': (lambda: legacy_sumbarsfast(v, 5e4), lambda: MyTT.SUMBARSFAST(v, 5e4)),
+        'FILTER': (lambda: legacy_filter(sig.copy(), 5), lambda: MyTT.FILTER(sig.copy(), 5)),
+        'BARSLAST': (lambda: legacy_barslast(sig), lambda: MyTT.BARSLAST(sig)),
+        'BARSLASTCOUNT': (lambda: legacy_barslastcount(sig), lambda: MyTT.BARSLASTCOUNT(sig)),
+        'SAR': (lambda: legacy_sar(h, l), lambda: MyTT.SAR(h, l)),
+        'TDX_SAR': (lambda: legacy_tdx_sar(h, l), lambda: MyTT.TDX_SAR(h, l)),
+    }
+
+
+def best_time(func, repeat):
+    """多次运行取最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def same_output(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return a.shape == b.shape and a.dtype == b.dtype and np.array_equal(a, b, equal_nan=True)
+
+
+def run(n_bars=5000, n_stocks=300, repeat=3):
+    """运行基准测试并打印结果
+
+    Args:
+        n_bars: 每只股票的K线数
+        n_stocks: 二维对比中的股票数
+        repeat: 每项计时的重复次数
+
+    Returns:
+        bool: 所有用例输出是否与原实现一致
+    """
+    bars = make_bars(n_bars, n_stocks)
+    all_same = True
+
+    print(f"单只股票，{n_bars} 根K线")
+    print(f"{'指标':<16}{'原实现(ms)':>12}{'新实现(ms)':>12}{'加速比':>10}  一致")
+    for name, (legacy, current) in build_cases(bars).items():
+        same = same_output(legacy(), current())
+        all_same &= same
+        t_old, t_new = best_time(legacy, repeat), best_time(current, repeat)
+        print(f"{name:<16}{t_old * 1e3:>12.2f}{t_new * 1e3:>12.2f}{t_old / t_new:>9.1f}x  {'是' if same else '否'}")
+
+    c, h, l, v = bars['close'], bars['high'], bars['low'], bars['volume']
+    columns = range(n_stocks)
+    multi = {
+        'HHV(动态N)': (lambda: [MyTT.HHV(c[:, j], bars['period']) for j in columns],
+                      lambda: MyTT.HHV(c, bars['period'])),
+        'DSMA': (lambda: [MyTT.DSMA(c[:, j], 20) for j in columns], lambda: MyTT.DSMA(c, 20)),
+        'BARSLAST': (lambda: [MyTT.BARSLAST(bars['signal'][:, j]) for j in columns],
+                     lambda: MyTT.BARSLAST(bars['signal'])),
+        'SAR': (lambda: [MyTT.SAR(h[:, j], l[:, j]) for j in columns], lambda: MyTT.SAR(h, l)),
+        'TDX_SAR': (lambda: [MyTT.TDX_SAR(h[:, j], l[:, j]) for j in columns], lambda: MyTT.TDX_SAR(h, l)),
+        'MA': (lambda: [MyTT.MA(c[:, j], 20) for j in columns], lambda: MyTT.MA(c, 20)),
+        'SUMBARSFAST': (lambda: [MyTT.SUMBARSFAST(v[:, j], 5e4) for j in columns],
+                        lambda: MyTT.SUMBARSFAST(v, 5e4)),
+    }
+    print(f"\n{n_stocks} 只股票 × {n_bars} 根K线：逐只调用 vs 二维一次计算")
+    print(f"{'指标':<16}{'逐只(ms)':>12}{'二维(ms)':>12}{'加速比':>10}  一致")
+    for name, (per_stock, matrix) in multi.items():
+        same = same_output(np.column_stack(per_stock()), matrix())
+        all_same &= same
+        t_old, t_new = best_time(per_stock, 1), best_time(matrix, 1)
+        print(f"{name:<16}{t_old * 1e3:>12.2f}{t_new * 1e3:>12.2f}{t_old / t_new:>9.1f}x  {'是' if same else '否'}")
+    return all_same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MyTT 循环类指标基准测试')
+    parser.add_argument('--bars', type=int, default=5000, help='K线数')
+    parser.add_argument('--stocks', type=int, default=300, help='二维对比的股票数')
+    parser.add_argument('--repeat', type=int, default=3, help='计时重复次数')
+    args = parser.parse_args()
+    if not run(args.bars, args.stocks, args.repeat):
+        raise SystemExit('存在与原实现输出不一致的指标')
+
+
+if __name__ == '__main__':
+    main()
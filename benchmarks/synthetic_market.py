@@ -0,0 +1,317 @@
+# coding: utf-8
+"""
+合成行情数据与伪 xtquant 模块
+
+SyntheticMarket 按 (股票代码, 周期) 生成确定性的随机游走K线/tick（同一代码和随机种子每次结果相同），
+交易日取自 khQTTools 的交易日历（早期版本没有交易日历时按相同规则生成），时间戳与 xtdata 一致为北京时间对应的毫秒时间戳。
+install_fake_xtquant 把 SyntheticMarket 包装成 xtquant.xtdata 等模块注册到 sys.modules，
+须在导入 khFrame 等依赖 xtquant 的模块之前调用，用于在没有 QMT 客户端的环境下跑回测基准。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import datetime
+import sys
+import types
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 北京时间相对UTC的偏移（毫秒）
+BEIJING_OFFSET_MS = 8 * 3600 * 1000
+
+# date.toordinal() 与 Unix 纪元天数的差值
+EPOCH_ORDINAL = 719163
+
+# 各周期每根K线的对数收益波动率
+PERIOD_VOLATILITY = {'1d': 0.02, '1m': 0.0015, '5m': 0.003, 'tick': 0.0003}
+
+# 各周期在一个交易日内的时间点（当日秒数）
+_MORNING = (9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60)
+_AFTERNOON = (13 * 3600, 15 * 3600)
+
+
+def _weekday_trade_ordinals(start: str, end: str) -> np.ndarray:
+    """[start, end] 内除法定节假日外的工作日序号，与 khQTTools.TradingCalendar 的规则相同"""
+    import holidays
+
+    first = datetime.datetime.strptime(start, '%Y%m%d').toordinal()
+    last = datetime.datetime.strptime(end, '%Y%m%d').toordinal()
+    ordinals = np.arange(first, last + 1, dtype=np.int32)
+    years = range(datetime.date.fromordinal(first).year, datetime.date.fromordinal(last).year + 1)
+    holiday_ordinals = np.array([d.toordinal() for d in holidays.China(years=years)], dtype=np.int32)
+    # 公历序数1（0001-01-01）为周一
+    return ordinals[((ordinals - 1) % 7 < 5) & ~np.isin(ordinals, holiday_ordinals)]
+
+
+def _intraday_seconds(step: int) -> np.ndarray:
+    """交易时段内按 step 秒取的时间点（不含开盘时刻，含收盘时刻，与xtdata分钟K线一致）"""
+    return np.concatenate([np.arange(start + step, end + 1, step) for start, end in (_MORNING, _AFTERNOON)])
+
+
+PERIOD_SECONDS = {
+    '1d': np.array([0]),
+    '1m': _intraday_seconds(60),
+    '5m': _intraday_seconds(300),
+    'tick': _intraday_seconds(3),
+}
+
+TICK_FIELDS = ['lastPrice', 'open', 'high', 'low', 'lastClose', 'volume', 'amount']
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'amount', 'settelementPrice',
+              'openInterest', 'preClose', 'suspendFlag']
+
+
+def make_stock_codes(n: int) -> List[str]:
+    """生成 n 个互不相同的A股股票代码（深市主板与沪市主板交替，不含ETF）
+
+    Args:
+        n: 股票数量
+
+    Returns:
+        List[str]: 股票代码列表，如 ['000001.SZ', '600000.SH', ...]
+    """
+    codes = []
+    for i in range(n):
+        k = i // 2
+        codes.append(f"{1 + k:06d}.SZ" if i % 2 == 0 else f"{600000 + k:06d}.SH")
+    return codes
+
+
+def _parse_time(value: str, end: bool) -> Optional[int]:
+    """把 xtdata 风格的时间参数转为毫秒时间戳边界（end=True 时返回开区间上界）"""
+    value = str(value or '').strip()
+    if not value:
+        return None
+    if len(value) == 8:
+        day = datetime.datetime.strptime(value, '%Y%m%d')
+        if end:
+            day += datetime.timedelta(days=1)
+    else:
+        day = datetime.datetime.strptime(value[:14], '%Y%m%d%H%M%S')
+        if end:
+            day += datetime.timedelta(milliseconds=1)
+    return int((day - datetime.datetime(1970, 1, 1)).total_seconds() * 1000) - BEIJING_OFFSET_MS
+
+
+class _Series:
+    """单只股票单个周期的合成数据"""
+
+    __slots__ = ('times', 'index', 'columns')
+
+    def __init__(self, times: np.ndarray, index: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.times = times
+        self.index = index
+        self.columns = columns
+
+
+class SyntheticMarket:
+    """确定性合成行情，提供回测用到的 xtdata 接口
+
+    使用示例:
+        market = SyntheticMarket('20230101', '20241231', seed=7, intraday_start='20240101')
+        install_fake_xtquant(market)
+        from khFrame import KhQuantFramework
+
+    Attributes:
+        start: 日线数据起始日期（YYYYMMDD），早于回测开始以便策略取历史数据
+        end: 数据结束日期（YYYYMMDD）
+        intraday_start: 分钟线/tick数据起始日期，默认与 start 相同
+        seed: 随机种子
+        request_count: 各接口被调用的次数
+    """
+
+    def __init__(self, start: str, end: str, seed: int = 0, intraday_start: Optional[str] = None):
+        self.start = start
+        self.end = end
+        self.intraday_start = intraday_start or start
+        self.seed = int(seed)
+        self.request_count = {'get_market_data_ex': 0, 'get_market_data': 0}
+        self._series = {}
+
+    def trade_ordinals(self, period: str = '1d') -> np.ndarray:
+        """指定周期数据区间内的交易日序号"""
+        start = self.start if period == '1d' else self.intraday_start
+        try:
+            from khQTTools import get_trading_calendar
+        except ImportError:
+            # 记录基线的早期版本没有交易日历，按相同规则（工作日且非法定节假日）生成
+            return _weekday_trade_ordinals(start, self.end)
+        return np.asarray(get_trading_calendar().range_ordinals(start, self.end))
+
+    def series(self, code: str, period: str) -> _Series:
+        """获取（首次调用时生成）指定股票和周期的合成数据
+
+        Args:
+            code: 股票代码
+            period: 周期，支持 1d/1m/5m/tick
+
+        Returns:
+            _Series: 时间戳、索引字符串与各字段数组
+        """
+        key = (code, period)
+        if key not in self._series:
+            self._series[key] = self._generate(code, period)
+        return self._series[key]
+
+    def _generate(self, code: str, period: str) -> _Series:
+        if period not in PERIOD_SECONDS:
+            raise ValueError(f"合成行情不支持的周期: {period}")
+        rng = np.random.default_rng([self.seed, zlib.crc32(code.encode('ascii')), zlib.crc32(period.encode('ascii'))])
+        ordinals = self.trade_ordinals(period)
+        seconds = PERIOD_SECONDS[period]
+        local_ms = ((ordinals[:, None] - EPOCH_ORDINAL) * 86400 + seconds[None, :]).reshape(-1) * 1000
+        times = local_ms - BEIJING_OFFSET_MS
+        day_of = np.repeat(np.arange(len(ordinals)), len(seconds))
+        index = pd.to_datetime(local_ms, unit='ms').strftime('%Y%m%d' if period == '1d' else '%Y%m%d%H%M%S')
+
+        n = len(times)
+        sigma = PERIOD_VOLATILITY[period]
+        base = 5 + 45 * rng.random()
+        close = base * np.exp(np.cumsum(rng.normal(0, sigma, n)))
+        volume = np.floor(rng.lognormal(8, 1, n)) + 1
+
+        if period == 'tick':
+            day_start = np.flatnonzero(np.r_[True, day_of[1:] != day_of[:-1]])
+            day_close = close[np.r_[day_start[1:], n] - 1]
+            columns = {
+                'lastPrice': close,
+                'open': close[day_start][day_of],
+                'high': np.concatenate([np.maximum.accumulate(d) for d in np.split(close, day_start[1:])]),
+                'low': np.concatenate([np.minimum.accumulate(d) for d in np.split(close, day_start[1:])]),
+                'lastClose': np.r_[close[0], day_close[:-1]][day_of],
+                'volume': np.concatenate([np.cumsum(d) for d in np.split(volume, day_start[1:])]),
+            }
+            columns['amount'] = columns['volume'] * close * 100
+        else:
+            prev_close = np.r_[close[0], close[:-1]]
+            open_ = prev_close * np.exp(rng.normal(0, sigma / 3, n))
+            spread = 1 + np.abs(rng.normal(0, sigma / 2, (2, n)))
+            columns = {
+                'open': open_,
+                'high': np.maximum(open_, close) * spread[0],
+                'low': np.minimum(open_, close) / spread[1],
+                'close': close,
+                'volume': volume,
+                'amount': volume * close * 100,
+                'settelementPrice': np.zeros(n),
+                'openInterest': np.zeros(n),
+                'preClose': prev_close,
+                'suspendFlag': np.zeros(n),
+            }
+        return _Series(times.astype(np.int64), np.asarray(index), columns)
+
+    def _frame(self, code: str, period: str, fields: List[str], start_time: str, end_time: str,
+               count: int) -> pd.DataFrame:
+        s = self.series(code, period)
+        start_ms, end_ms = _parse_time(start_time, False), _parse_time(end_time, True)
+        lo = 0 if start_ms is None else int(np.searchsorted(s.times, start_ms))
+        hi = len(s.times) if end_ms is None else int(np.searchsorted(s.times, end_ms))
+        if count is not None and count > 0:
+            lo = max(lo, hi - count)
+        fields = [f for f in (fields or ['time'] + list(s.columns)) if f == 'time' or f in s.columns]
+        data = {f: (s.times[lo:hi] if f == 'time' else s.columns[f][lo:hi]) for f in fields}
+        return pd.DataFrame(data, index=s.index[lo:hi])
+
+    # ------------------ xtdata 接口 ------------------
+
+    def get_market_data_ex(self, field_list=[], stock_list=[], period='1d', start_time='', end_time='',
+                           count=-1, dividend_type='none', fill_data=True):
+        self.request_count['get_market_data_ex'] += 1
+        return {code: self._frame(code, period, list(field_list), start_time, end_time, count)
+                for code in stock_list}
+
+    def get_local_data(self, field_list=[], stock_list=[], period='1d', start_time='', end_time='',
+                       count=-1, dividend_type='none', fill_data=True, data_dir=None):
+        return self.get_market_data_ex(field_list, stock_list, period, start_time, end_time, count,
+                                       dividend_type, fill_data)
+
+    def get_market_data(self, field_list=[], stock_list=[], period='1d', start_time='', end_time='',
+                        count=-1, dividend_type='none', fill_data=True):
+        self.request_count['get_market_data'] += 1
+        frames = {code: self._frame(code, period, list(field_list), start_time, end_time, count)
+                  for code in stock_list}
+        return {field: pd.DataFrame({code: df[field] for code, df in frames.items() if field in df}).T
+                for field in (field_list or BAR_FIELDS)}
+
+    def get_instrument_detail(self, code, iscomplete=False):
+        return {'InstrumentID': code.split('.')[0], 'ExchangeID': code.split('.')[-1],
+                'InstrumentName': code, 'PriceTick': 0.01, 'VolumeMultiple': 1}
+
+    def download_history_data(self, *args, **kwargs):
+        pass
+
+    def download_history_data2(self, stock_list, period, start_time='', end_time='', callback=None, **kwargs):
+        if callback:
+            callback({'finished': len(stock_list), 'total': len(stock_list)})
+
+    def download_sector_data(self, *args, **kwargs):
+        pass
+
+    def get_sector_list(self):
+        return []
+
+    def get_stock_list_in_sector(self, sector_name):
+        return []
+
+
+# 回测路径用到的 xtconstant 常量
+XTCONSTANT = {
+    'SECURITY_ACCOUNT': 2,
+    'STOCK_BUY': 23,
+    'STOCK_SELL': 24,
+    'FIX_PRICE': 11,
+    'LATEST_PRICE': 5,
+    'ORDER_SUCCEEDED': 56,
+    'DIRECTION_FLAG_LONG': 48,
+    'OFFSET_FLAG_OPEN': 48,
+    'OFFSET_FLAG_CLOSE': 49,
+    'LIMIT': 50,
+}
+
+
+class _XtQuantTraderCallback:
+    pass
+
+
+class _XtQuantTrader:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class _StockAccount:
+    def __init__(self, account_id, account_type='STOCK'):
+        self.account_id = account_id
+        self.account_type = account_type
+
+
+def install_fake_xtquant(market: SyntheticMarket) -> types.ModuleType:
+    """把合成行情注册为 xtquant 包（xtdata/xtconstant/xttrader/xttype），覆盖已安装的 xtquant
+
+    Args:
+        market: 合成行情对象
+
+    Returns:
+        types.ModuleType: 伪 xtquant.xtdata 模块
+    """
+    package = types.ModuleType('xtquant')
+    package.__path__ = []
+    xtdata = types.ModuleType('xtquant.xtdata')
+    for name in dir(market):
+        if not name.startswith('_') and callable(getattr(market, name)):
+            setattr(xtdata, name, getattr(market, name))
+    xtdata.market = market
+    xtconstant = types.ModuleType('xtquant.xtconstant')
+    xtconstant.__dict__.update(XTCONSTANT)
+    xttrader = types.ModuleType('xtquant.xttrader')
+    xttrader.XtQuantTrader = _XtQuantTrader
+    xttrader.XtQuantTraderCallback = _XtQuantTraderCallback
+    xttype = types.ModuleType('xtquant.xttype')
+    xttype.StockAccount = _StockAccount
+    for name, module in (('xtdata', xtdata), ('xtconstant', xtconstant), ('xttrader', xttrader), ('xttype', xttype)):
+        setattr(package, name, module)
+        sys.modules[f'xtquant.{name}'] = module
+    sys.modules['xtquant'] = package
+    return xtdata
@@ -0,0 +1,172 @@
+# coding: utf-8
+"""
+无界面回测入口
+
+供持续集成和批量服务器直接执行回测，不创建任何界面对象：
+
+- 不传入交易回调（trader_callback），框架中所有面向界面的日志消息在构造之前即被跳过；
+- 进度、成交、完成和异常以结构化事件输出，每行一个JSON对象（JSON Lines）；
+- 结果文件在回测结束后一次写出到结果目录（与界面回测的目录结构相同）。
+
+命令行用法:
+    python -m khBacktest --config strategies/双均线.kh --strategy strategies/双均线.py \\
+        --events events.jsonl --output-dir backtest_results
+
+    --events - 表示将事件写到标准输出，此时控制台日志改写到标准错误。
+    退出码：0 表示回测完成，1 表示回测失败。
+
+代码调用:
+    from khBacktest import run_backtest, JsonLinesSink
+    with open("events.jsonl", "w", encoding="utf-8") as f:
+        result = run_backtest("strategies/双均线.kh", event_sink=JsonLinesSink(f))
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+
+def _json_default(value: Any):
+    """JSON序列化时处理 numpy 标量和日期时间"""
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+    return str(value)
+
+
+class JsonLinesSink:
+    """将框架事件逐行写出为JSON对象，每条事件附加时间戳 ts（秒）"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def emit(self, event: Dict):
+        event['ts'] = round(time.time(), 3)
+        self.stream.write(json.dumps(event, ensure_ascii=False, default=_json_default) + '\n')
+        self.stream.flush()
+
+
+def set_log_level(level: int, stream=None):
+    """设置框架各模块日志器的级别
+
+    get_module_logger 为每个模块单独设置级别和处理器，需逐个调整。
+
+    Args:
+        level: 日志级别
+        stream: 控制台处理器的输出流，为None时不变
+    """
+    for name, item in list(logging.root.manager.loggerDict.items()):
+        if not name.startswith('OsKhQuant') or not isinstance(item, logging.Logger):
+            continue
+        item.setLevel(level)
+        for handler in item.handlers:
+            handler.setLevel(level)
+            if stream is not None and type(handler) is logging.StreamHandler:
+                handler.setStream(stream)
+    logging.getLogger().setLevel(level)
+
+
+def run_backtest(config_path: str, strategy_file: Optional[str] = None, output_dir: Optional[str] = None,
+                 start_time: Optional[str] = None, end_time: Optional[str] = None,
+                 event_sink=None) -> Dict:
+    """执行一次无界面回测
+
+    Args:
+        config_path: 策略配置文件（.kh）路径
+        strategy_file: 策略文件路径，默认使用配置中的 strategy_file
+        output_dir: 回测结果根目录，默认为 backtest_results
+        start_time: 回测开始日期 YYYYMMDD，默认使用配置中的设置
+        end_time: 回测结束日期 YYYYMMDD，默认使用配置中的设置
+        event_sink: 事件输出对象，需提供 emit(dict)，为None时不产生事件
+
+    Returns:
+        Dict: backtest_dir（结果目录）、records（回测记录）和 elapsed（耗时，秒）
+
+    Raises:
+        ValueError: 未指定策略文件时抛出
+    """
+    from khFrame import KhQuantFramework
+
+    if strategy_file is None:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            strategy_file = json.load(f).get('strategy_file')
+    if not strategy_file:
+        raise ValueError("未指定策略文件，请通过参数或配置中的 strategy_file 设置")
+
+    started = time.time()
+    framework = KhQuantFramework(config_path, strategy_file)
+    config = framework.config
+    config.config_dict['strategy_file'] = os.path.abspath(strategy_file)
+    if start_time:
+        config.backtest_start = config.config_dict['backtest']['start_time'] = start_time
+    if end_time:
+        config.backtest_end = config.config_dict['backtest']['end_time'] = end_time
+    if output_dir:
+        framework.results_root = output_dir
+    framework.event_sink = event_sink
+
+    records = framework.run_headless()
+    return {
+        'backtest_dir': framework.backtest_dir,
+        'records': records,
+        'elapsed': time.time() - started,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m khBacktest', description='无界面执行策略回测')
+    parser.add_argument('--config', required=True, help='策略配置文件（.kh）')
+    parser.add_argument('--strategy', help='策略文件，默认使用配置中的 strategy_file')
+    parser.add_argument('--start', help='回测开始日期 YYYYMMDD')
+    parser.add_argument('--end', help='回测结束日期 YYYYMMDD')
+    parser.add_argument('--output-dir', help='回测结果根目录，默认为 backtest_results')
+    parser.add_argument('--events', help='事件输出文件（JSON Lines），- 表示标准输出')
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help='日志级别')
+    args = parser.parse_args(argv)
+
+    # 先导入框架，使各模块的日志器都已创建
+    import khFrame  # noqa: F401
+    events_to_stdout = args.events == '-'
+    set_log_level(getattr(logging, args.log_level), sys.stderr if events_to_stdout else None)
+
+    events_file = None
+    if events_to_stdout:
+        sink = JsonLinesSink(sys.stdout)
+    elif args.events:
+        events_file = open(args.events, 'w', encoding='utf-8')
+        sink = JsonLinesSink(events_file)
+    else:
+        sink = None
+
+    try:
+        result = run_backtest(args.config, args.strategy, args.output_dir, args.start, args.end, sink)
+    except Exception as e:
+        logger.error(f"回测失败: {e}", exc_info=True)
+        return 1
+    finally:
+        if events_file is not None:
+            events_file.close()
+
+    if not events_to_stdout:
+        records = result['records']
+        print(f"回测完成: {len(records.get('trades', []))} 笔交易, {len(records.get('daily_stats', []))} 个交易日, "
+              f"耗时 {result['elapsed']:.2f}秒, 结果目录 {result['backtest_dir']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
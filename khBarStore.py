@@ -0,0 +1,492 @@
+# coding: utf-8
+"""
+列式行情存储模块
+
+回测开始前将各股票的历史DataFrame一次性转换为按字段组织的NumPy矩阵，
+形状为 (时间点数, 股票数)。回测循环中通过轻量级的只读行视图 BarView
+访问某一时间点某只股票的数据，保持与 pandas Series 相同的
+data[code]['close'] / .get() / in / .empty 访问方式，
+避免每个时间点为每只股票创建一个 pandas Series。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import time as _time
+from collections.abc import Mapping
+from datetime import date as _date, datetime as _datetime, time as _dtime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# 可作为时间字段的列名，按优先级排列
+TIME_FIELD_CANDIDATES = ('time', 'timestamp', 'date', 'datetime')
+
+
+def find_time_field(df: pd.DataFrame) -> Optional[str]:
+    """查找DataFrame中的时间字段
+
+    Args:
+        df: 股票历史数据
+
+    Returns:
+        Optional[str]: 时间字段名，未找到返回None
+    """
+    for field in TIME_FIELD_CANDIDATES:
+        if field in df.columns:
+            return field
+    return None
+
+
+def to_epoch_ms(values) -> np.ndarray:
+    """将时间值统一转换为int64毫秒级时间戳
+
+    支持毫秒级/秒级数值时间戳、datetime64以及可被pandas解析的时间字符串。
+    数值小于1e10的视为秒级时间戳。
+
+    Args:
+        values: 时间值序列
+
+    Returns:
+        np.ndarray: int64毫秒级时间戳数组
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'M':
+        return arr.astype('datetime64[ms]').astype(np.int64)
+    if arr.dtype.kind not in 'iuf':
+        return pd.to_datetime(arr.astype(str)).values.astype('datetime64[ms]').astype(np.int64)
+    arr = arr.astype(np.int64)
+    return np.where(arr < 1e10, arr * 1000, arr)
+
+
+def local_utc_offsets_ms(ts_ms: np.ndarray) -> np.ndarray:
+    """计算每个毫秒级时间戳对应的本地时区UTC偏移（毫秒）
+
+    按UTC自然日去重后逐日查询本地时区偏移，再广播回每个时间戳，
+    避免对每个时间戳调用 datetime.fromtimestamp。
+
+    Args:
+        ts_ms: 毫秒级时间戳数组
+
+    Returns:
+        np.ndarray: 与输入等长的int64偏移数组
+    """
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    if ts_ms.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    utc_days = ts_ms // 86400000
+    unique_days, inverse = np.unique(utc_days, return_inverse=True)
+    offsets = np.array(
+        [_time.localtime(int(day) * 86400 + 43200).tm_gmtoff for day in unique_days],
+        dtype=np.int64
+    ) * 1000
+    return offsets[inverse.reshape(-1)]
+
+
+def seconds_of_day(ts_ms: np.ndarray) -> np.ndarray:
+    """计算毫秒级时间戳在本地时间中的当日秒数（从午夜开始）"""
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    return ((ts_ms + local_utc_offsets_ms(ts_ms)) // 1000) % 86400
+
+
+def local_midnights_ms(dates: Sequence) -> np.ndarray:
+    """计算一组日期在本地时区零点的毫秒级时间戳
+
+    Args:
+        dates: datetime.date 序列
+
+    Returns:
+        np.ndarray: int64毫秒级时间戳数组
+    """
+    ordinals = np.array([d.toordinal() for d in dates], dtype=np.int64)
+    # 719163 为 1970-01-01 的公历序数
+    utc_midnights = (ordinals - 719163) * 86400000
+    return utc_midnights - local_utc_offsets_ms(utc_midnights)
+
+
+def align_timelines(time_arrays: Sequence[np.ndarray], times: Optional[Sequence] = None):
+    """对齐多只股票的时间轴
+
+    Args:
+        time_arrays: 每只股票的毫秒级时间戳数组
+        times: 指定的时间轴，为None时取所有股票时间点的并集
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (排序去重后的毫秒级时间轴,
+            形状为 (时间点数, 股票数) 的行号矩阵，缺失数据为-1)
+    """
+    if times is None:
+        if time_arrays:
+            timeline = np.unique(np.concatenate(time_arrays))
+        else:
+            timeline = np.empty(0, dtype=np.int64)
+    else:
+        timeline = np.unique(to_epoch_ms(times))
+
+    n_times = len(timeline)
+    row_index = np.full((n_times, len(time_arrays)), -1, dtype=np.int64)
+    for j, stock_times in enumerate(time_arrays):
+        if n_times == 0 or len(stock_times) == 0:
+            continue
+        pos = np.searchsorted(timeline, stock_times)
+        pos_clipped = np.minimum(pos, n_times - 1)
+        matched = (pos < n_times) & (timeline[pos_clipped] == stock_times)
+        # 同一时间点出现多行时保留最后一行，与按时间建立索引的行为一致
+        row_index[pos[matched], j] = np.flatnonzero(matched)
+    return timeline, row_index
+
+
+def _missing_value(dtype: np.dtype):
+    """返回指定类型矩阵中缺失数据的占位值"""
+    if dtype.kind == 'f':
+        return np.nan
+    if dtype.kind in 'iub':
+        return 0
+    return None
+
+
+class BarView(Mapping):
+    """单只股票在单个时间点的只读行视图
+
+    不复制任何数据，只记录所属的存储、时间点下标和股票列下标。
+    对于缺失数据的时间点，视图表现为空（len为0，empty为True），
+    与原先的空 pd.Series 行为一致。
+    """
+
+    __slots__ = ('_store', '_t', '_j')
+
+    def __init__(self, store: 'BarStore', t: int, j: int):
+        self._store = store
+        self._t = t
+        self._j = j
+
+    @property
+    def empty(self) -> bool:
+        """该时间点是否无数据"""
+        return not self._store.valid[self._t, self._j]
+
+    @property
+    def name(self) -> str:
+        """股票代码"""
+        return self._store.codes[self._j]
+
+    def __getitem__(self, field):
+        if not self._store.valid[self._t, self._j]:
+            raise KeyError(field)
+        column = self._store.columns.get(field)
+        if column is None:
+            raise KeyError(field)
+        return column[self._t, self._j]
+
+    def __getattr__(self, field):
+        # 兼容 pd.Series 的属性访问方式，如 row.close
+        if field.startswith('_'):
+            raise AttributeError(field)
+        try:
+            return self[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def __contains__(self, field) -> bool:
+        return bool(self._store.valid[self._t, self._j]) and field in self._store.columns
+
+    def get(self, field, default=None):
+        if not self._store.valid[self._t, self._j]:
+            return default
+        column = self._store.columns.get(field)
+        if column is None:
+            return default
+        return column[self._t, self._j]
+
+    def __iter__(self):
+        if self._store.valid[self._t, self._j]:
+            return iter(self._store.fields)
+        return iter(())
+
+    def __len__(self) -> int:
+        return len(self._store.fields) if self._store.valid[self._t, self._j] else 0
+
+    def to_dict(self) -> Dict:
+        """转换为普通字典"""
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"BarView({self.name}, {self.to_dict()})"
+
+
+class BarStore:
+    """按字段组织的列式行情存储
+
+    Attributes:
+        codes: 股票代码列表，对应矩阵的列
+        code_index: 股票代码到列下标的映射
+        times: 对齐后的int64毫秒级时间轴，对应矩阵的行
+        fields: 字段名列表（保持原DataFrame列顺序）
+        columns: 字段名到 (时间点数, 股票数) 矩阵的映射
+        row_index: 时间点在各股票原始DataFrame中的行号，缺失为-1
+        valid: 布尔矩阵，标记某时间点某股票是否有数据
+    """
+
+    def __init__(self, codes: Sequence[str], times: np.ndarray, fields: Sequence[str],
+                 columns: Dict[str, np.ndarray], row_index: np.ndarray):
+        self.codes = list(codes)
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+        self.times = times
+        self.fields = list(fields)
+        self.columns = columns
+        self.row_index = row_index
+        self.valid = row_index >= 0
+
+    @property
+    def n_times(self) -> int:
+        return self.valid.shape[0]
+
+    @property
+    def n_stocks(self) -> int:
+        return self.valid.shape[1]
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], times: Optional[Sequence] = None) -> 'BarStore':
+        """由各股票的DataFrame构建列式存储
+
+        所有时间戳先统一为int64毫秒，再通过 np.unique 求并集时间轴、
+        searchsorted 建立行号矩阵，循环中不再需要处理秒/毫秒精度差异。
+
+        Args:
+            frames: 股票代码到历史数据DataFrame的映射
+            times: 指定的回测时间轴（如自定义定时触发生成的时间点），
+                为None时使用所有股票时间点的并集
+
+        Returns:
+            BarStore: 构建好的列式存储，没有时间字段的股票会被忽略
+        """
+        codes = []
+        time_arrays = []
+        for code, df in frames.items():
+            time_field = find_time_field(df)
+            if time_field is not None:
+                stock_times = to_epoch_ms(df[time_field].values)
+            elif isinstance(df.index, pd.DatetimeIndex):
+                stock_times = to_epoch_ms(df.index.values)
+            else:
+                continue
+            codes.append(code)
+            time_arrays.append(stock_times)
+
+        timeline, row_index = align_timelines(time_arrays, times)
+
+        # 字段取所有股票列的并集，保持首次出现的顺序
+        fields = []
+        dtypes = {}
+        for code in codes:
+            for field, dtype in frames[code].dtypes.items():
+                if field not in dtypes:
+                    fields.append(field)
+                    dtypes[field] = dtype
+                elif dtypes[field] != dtype:
+                    dtypes[field] = np.result_type(dtypes[field], dtype) \
+                        if dtypes[field].kind != 'O' and dtype.kind != 'O' else np.dtype(object)
+
+        n_times, n_stocks = row_index.shape
+        columns = {}
+        for field in fields:
+            dtype = np.dtype(dtypes[field])
+            columns[field] = np.full((n_times, n_stocks), _missing_value(dtype), dtype=dtype)
+
+        for j, code in enumerate(codes):
+            df = frames[code]
+            rows = row_index[:, j]
+            target = np.flatnonzero(rows >= 0)
+            source = rows[target]
+            for field in df.columns:
+                columns[field][target, j] = df[field].values[source]
+
+        return cls(codes, timeline, fields, columns, row_index)
+
+    def view(self, t: int, code: str) -> BarView:
+        """获取单只股票在时间点t的行视图"""
+        return BarView(self, t, self.code_index[code])
+
+    def row(self, t: int) -> Dict[str, BarView]:
+        """获取时间点t所有股票的行视图
+
+        Returns:
+            Dict[str, BarView]: 股票代码到行视图的映射
+        """
+        return {code: BarView(self, t, j) for j, code in enumerate(self.codes)}
+
+    def empty_codes(self, t: int) -> List[str]:
+        """获取时间点t无数据的股票代码列表"""
+        return [self.codes[j] for j in np.flatnonzero(~self.valid[t])]
+
+    def has_any(self, t: int) -> bool:
+        """时间点t是否至少有一只股票有数据"""
+        return bool(self.valid[t].any())
+
+
+class TimeInfoTable:
+    """回测时间轴的时间信息表
+
+    在时间轴确定后一次性计算每个时间点的日期/时间字符串、日期序数、
+    当日秒数以及是否为当日最后一个时间点。字符串只对去重后的日期和
+    当日秒数格式化一次，再按下标批量展开，回测循环中无需再调用
+    datetime.fromtimestamp / strftime。
+
+    Attributes:
+        timestamps: int64毫秒级时间戳
+        day_ordinals: 本地日期的公历序数（date.toordinal）
+        seconds: 本地时间的当日秒数
+        millis: 毫秒部分
+        date_strs: 日期字符串，如 "2024-06-03"
+        date_nums: 数字日期字符串，如 "20240603"
+        time_strs: 时间字符串，如 "09:30:00"
+        datetime_strs: 日期时间字符串，如 "2024-06-03 09:30:00"
+        is_last_of_day: 是否为当日最后一个时间点
+        unique_days: 时间轴覆盖的本地日期序数（去重排序）
+        day_index: 每个时间点所属日期在 unique_days 中的下标
+    """
+
+    def __init__(self, times_ms: np.ndarray):
+        self.timestamps = np.asarray(times_ms, dtype=np.int64)
+        local_ms = self.timestamps + local_utc_offsets_ms(self.timestamps)
+        local_days = local_ms // 86400000
+        # 719163 为 1970-01-01 的公历序数
+        self.day_ordinals = local_days + 719163
+        self.seconds = (local_ms // 1000) % 86400
+        self.millis = local_ms % 1000
+
+        self.unique_days, day_index = np.unique(self.day_ordinals, return_inverse=True)
+        self.day_index = day_index.reshape(-1)
+        unique_dates = [_date.fromordinal(int(o)) for o in self.unique_days]
+        day_strs = np.array([d.strftime("%Y-%m-%d") for d in unique_dates], dtype=object)
+        day_nums = np.array([d.strftime("%Y%m%d") for d in unique_dates], dtype=object)
+
+        unique_seconds, second_index = np.unique(self.seconds, return_inverse=True)
+        second_strs = np.array(
+            [f"{s // 3600:02d}:{(s % 3600) // 60:02d}:{s % 60:02d}" for s in unique_seconds.tolist()],
+            dtype=object
+        )
+
+        self.date_strs = day_strs[self.day_index]
+        self.date_nums = day_nums[self.day_index]
+        self.time_strs = second_strs[second_index.reshape(-1)]
+        self.datetime_strs = self.date_strs + " " + self.time_strs
+
+        n = len(self.timestamps)
+        self.is_last_of_day = np.ones(n, dtype=bool)
+        if n > 1:
+            self.is_last_of_day[:-1] = self.day_ordinals[1:] != self.day_ordinals[:-1]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def trading_dates(self) -> List[str]:
+        """时间轴覆盖的日期字符串列表（"YYYY-MM-DD"，排序去重）"""
+        return [_date.fromordinal(int(o)).strftime("%Y-%m-%d") for o in self.unique_days]
+
+    def date_at(self, i: int) -> _date:
+        """第i个时间点的本地日期"""
+        return _date.fromordinal(int(self.day_ordinals[i]))
+
+    def datetime_at(self, i: int) -> _datetime:
+        """第i个时间点的本地时间（naive datetime）"""
+        s = int(self.seconds[i])
+        return _datetime.combine(
+            self.date_at(i),
+            _dtime(s // 3600, (s % 3600) // 60, s % 60, int(self.millis[i]) * 1000)
+        )
+
+    def info(self, i: int) -> Dict:
+        """构造第i个时间点的时间信息字典（即 data["__current_time__"]）"""
+        timestamp = int(self.timestamps[i])
+        return {
+            "timestamp": timestamp,
+            "datetime": self.datetime_strs[i],
+            "date": self.date_strs[i],
+            "time": self.time_strs[i],
+            "raw_time": timestamp,
+            "date_num": self.date_nums[i],
+            "day_ordinal": int(self.day_ordinals[i]),
+            "bar_index": i
+        }
+
+
+class DailyPriceMatrix:
+    """回测区间内全部股票的日线收盘价矩阵
+
+    回测开始前一次性请求整个股票池、整个回测区间的日线收盘价（与回测数据相同的复权方式），
+    形状为 (交易日数, 股票数)。每日收盘统计时按日期行和持仓股票列直接取值，
+    不再逐日调用 xtdata.get_market_data。
+
+    Attributes:
+        codes: 股票代码列表，对应矩阵的列
+        code_index: 股票代码到列下标的映射
+        dates: int类型的交易日 YYYYMMDD，升序，对应矩阵的行
+        closes: (交易日数, 股票数) 收盘价矩阵，缺失为NaN
+    """
+
+    def __init__(self, codes: Sequence[str], dates: np.ndarray, closes: np.ndarray):
+        self.codes = list(codes)
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+
+    @classmethod
+    def from_close_frame(cls, close_frame: pd.DataFrame) -> 'DailyPriceMatrix':
+        """由 get_market_data 返回的收盘价DataFrame（行为股票代码、列为日期）构建"""
+        dates = np.array([int(str(c).replace('-', '')[:8]) for c in close_frame.columns], dtype=np.int64)
+        order = np.argsort(dates, kind='stable')
+        closes = close_frame.to_numpy(dtype=np.float64, na_value=np.nan).T[order]
+        return cls(list(close_frame.index), dates[order], closes)
+
+    @classmethod
+    def load(cls, xtdata, codes: Sequence[str], start_time: str, end_time: str,
+             dividend_type: str = 'none') -> 'DailyPriceMatrix':
+        """一次请求加载股票池在回测区间内的日线收盘价
+
+        Args:
+            xtdata: 行情接口模块
+            codes: 股票代码列表
+            start_time: 开始日期，格式 YYYYMMDD
+            end_time: 结束日期，格式 YYYYMMDD
+            dividend_type: 复权方式，应与回测数据一致
+
+        Returns:
+            DailyPriceMatrix: 收盘价矩阵，未返回数据的股票不包含在内
+        """
+        data = xtdata.get_market_data(
+            field_list=['close'],
+            stock_list=list(codes),
+            period='1d',
+            start_time=start_time,
+            end_time=end_time,
+            dividend_type=dividend_type
+        )
+        close_frame = data.get('close') if isinstance(data, dict) else None
+        if not isinstance(close_frame, pd.DataFrame):
+            return cls([], np.empty(0, dtype=np.int64), np.empty((0, 0)))
+        return cls.from_close_frame(close_frame)
+
+    def __contains__(self, code) -> bool:
+        return code in self.code_index
+
+    def gather(self, date: int, codes: Sequence[str]) -> np.ndarray:
+        """取指定日期一组股票的收盘价
+
+        Args:
+            date: int类型的日期 YYYYMMDD
+            codes: 股票代码列表
+
+        Returns:
+            np.ndarray: 与codes等长的收盘价数组，日期或股票不在矩阵中时为NaN
+        """
+        result = np.full(len(codes), np.nan)
+        t = int(np.searchsorted(self.dates, date))
+        if t >= len(self.dates) or self.dates[t] != date:
+            return result
+        columns = np.array([self.code_index.get(code, -1) for code in codes], dtype=np.int64)
+        found = columns >= 0
+        result[found] = self.closes[t, columns[found]]
+        return result
@@ -0,0 +1,232 @@
+# coding: utf-8
+"""
+基准指数序列模块
+
+回测原先逐行遍历基准数据，以 "benchmark_{日期}_{代码}" 字符串为键缓存收盘价，
+每日收盘统计时再拼接字符串查找；回测结束时重新请求一遍基准数据写入 benchmark.csv，
+结果窗口计算阿尔法/贝塔时又多次读取该文件，并额外请求沪深300的前一交易日收盘价。
+
+BenchmarkSeries 一次请求全部基准指数（可同时设置多个，如沪深300和中证500）的日线收盘价，
+保存为以 int 类型日期 YYYYMMDD 为行、基准指数为列的 NumPy 数组，并记录回测开始前
+一个交易日的收盘价用于计算首日收益率。回测中按交易日轴对齐后按下标取值；回测结束后写出：
+
+    {backtest_dir}/benchmark.csv     # 第一个基准指数的 date, close，格式不变
+    {backtest_dir}/benchmarks.npz    # 全部基准指数的日期、收盘价和前收盘价
+
+结果窗口通过 load_file 读取，不再重复解析CSV或请求行情。每日统计的 benchmark_close 和
+收益指标（基准收益、阿尔法/贝塔）按主基准计算；设置了多个基准时，每日统计另在
+benchmark_closes 中记录各基准指数当日的收盘价。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import datetime
+import os
+import re
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 获取前收盘价时向前多取的自然日数（覆盖春节等长假）
+PREV_CLOSE_LOOKBACK_DAYS = 20
+
+BENCHMARK_CSV = "benchmark.csv"
+BENCHMARK_NPZ = "benchmarks.npz"
+
+
+def parse_benchmark_codes(value: Union[str, Sequence[str], None]) -> List[str]:
+    """解析基准指数设置
+
+    支持逗号/空格分隔的字符串或列表，"sh.000300" 形式转换为 "000300.SH"。
+
+    Args:
+        value: 基准指数设置，如 "sh.000300" 或 "000300.SH,000905.SH"
+
+    Returns:
+        List[str]: 去重后的基准指数代码列表，第一个为主基准
+    """
+    if not value:
+        return []
+    items = re.split(r'[,，\s]+', value) if isinstance(value, str) else list(value)
+    codes = []
+    for item in items:
+        item = str(item).strip()
+        if not item:
+            continue
+        match = re.fullmatch(r'(sh|sz|bj)\.(\d+)', item, flags=re.IGNORECASE)
+        code = f"{match.group(2)}.{match.group(1).upper()}" if match else item
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+def ordinals_to_date_nums(ordinals: np.ndarray) -> np.ndarray:
+    """将公历序数（date.toordinal）转换为 int 类型的 YYYYMMDD"""
+    # 719163 为 1970-01-01 的公历序数
+    days = (np.asarray(ordinals, dtype=np.int64) - 719163).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_of_year = months.astype(np.int64) % 12 + 1
+    day_of_month = (days - months).astype(np.int64) + 1
+    return years * 10000 + month_of_year * 100 + day_of_month
+
+
+class BenchmarkSeries:
+    """基准指数日线收盘价
+
+    Attributes:
+        codes: 基准指数代码列表，第一个为主基准
+        dates: int类型的交易日 YYYYMMDD，升序
+        closes: (交易日数, 基准数) 收盘价矩阵，缺失为NaN
+        prev_closes: 各基准指数在第一个交易日之前一个交易日的收盘价，未知为NaN
+    """
+
+    def __init__(self, codes: Sequence[str], dates: np.ndarray, closes: np.ndarray,
+                 prev_closes: Optional[np.ndarray] = None):
+        self.codes = list(codes)
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.closes = np.asarray(closes, dtype=np.float64).reshape(len(self.dates), len(self.codes))
+        self.prev_closes = np.full(len(self.codes), np.nan) if prev_closes is None \
+            else np.asarray(prev_closes, dtype=np.float64)
+
+    @property
+    def code(self) -> Optional[str]:
+        """主基准指数代码"""
+        return self.codes[0] if self.codes else None
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def load(cls, xtdata, codes: Sequence[str], start_time: str, end_time: str,
+             download: bool = True) -> 'BenchmarkSeries':
+        """一次请求加载全部基准指数在回测区间内的日线收盘价
+
+        Args:
+            xtdata: 行情接口模块
+            codes: 基准指数代码列表
+            start_time: 开始日期，格式 YYYYMMDD
+            end_time: 结束日期，格式 YYYYMMDD
+            download: 是否先下载数据到本地
+
+        Returns:
+            BenchmarkSeries: 基准序列，请求区间向前多取若干天用于确定前收盘价
+        """
+        codes = list(codes)
+        start = datetime.datetime.strptime(start_time, "%Y%m%d")
+        lookback_start = (start - datetime.timedelta(days=PREV_CLOSE_LOOKBACK_DAYS)).strftime("%Y%m%d")
+        if download:
+            from khDownloader import download_history_batch
+            download_history_batch(xtdata, codes, '1d', lookback_start, end_time)
+
+        data = xtdata.get_market_data(
+            field_list=['close'],
+            stock_list=codes,
+            period='1d',
+            start_time=lookback_start,
+            end_time=end_time
+        )
+        close_frame = data.get('close') if isinstance(data, dict) else None
+        if not isinstance(close_frame, pd.DataFrame) or close_frame.empty:
+            return cls(codes, np.empty(0, dtype=np.int64), np.empty((0, len(codes))))
+
+        close_frame = close_frame.reindex(codes)
+        all_dates = np.array([int(str(c).replace('-', '')[:8]) for c in close_frame.columns], dtype=np.int64)
+        order = np.argsort(all_dates, kind='stable')
+        all_dates = all_dates[order]
+        all_closes = close_frame.to_numpy(dtype=np.float64, na_value=np.nan).T[order]
+
+        in_range = all_dates >= int(start_time)
+        before = all_closes[~in_range]
+        prev_closes = np.full(len(codes), np.nan)
+        if len(before):
+            # 每个基准指数回测开始前最后一个有效收盘价
+            valid = ~np.isnan(before)
+            last = len(before) - 1 - valid[::-1].argmax(axis=0)
+            has_prev = valid.any(axis=0)
+            prev_closes[has_prev] = before[last[has_prev], np.flatnonzero(has_prev)]
+        return cls(codes, all_dates[in_range], all_closes[in_range], prev_closes)
+
+    @classmethod
+    def load_file(cls, backtest_dir: str) -> Optional['BenchmarkSeries']:
+        """读取回测结果目录中的基准序列
+
+        优先读取 benchmarks.npz；旧的回测结果只有 benchmark.csv，此时前收盘价未知。
+
+        Returns:
+            Optional[BenchmarkSeries]: 无基准数据时为None
+        """
+        npz_path = os.path.join(backtest_dir, BENCHMARK_NPZ)
+        if os.path.exists(npz_path):
+            with np.load(npz_path, allow_pickle=False) as data:
+                return cls(data['codes'].tolist(), data['dates'], data['closes'], data['prev_closes'])
+
+        csv_path = os.path.join(backtest_dir, BENCHMARK_CSV)
+        if not os.path.exists(csv_path):
+            return None
+        df = pd.read_csv(csv_path, encoding='utf-8-sig')
+        if len(df) == 0 or 'date' not in df.columns or 'close' not in df.columns:
+            return None
+        dates = pd.to_datetime(df['date'])
+        order = np.argsort(dates.to_numpy(), kind='stable')
+        date_nums = dates.dt.strftime('%Y%m%d').astype(np.int64).to_numpy()[order]
+        closes = pd.to_numeric(df['close'], errors='coerce').to_numpy(dtype=np.float64)[order]
+        return cls(['benchmark'], date_nums, closes.reshape(-1, 1))
+
+    def save(self, backtest_dir: str):
+        """写出 benchmark.csv（主基准）和 benchmarks.npz（全部基准）"""
+        os.makedirs(backtest_dir, exist_ok=True)
+        self.to_frame().to_csv(os.path.join(backtest_dir, BENCHMARK_CSV), index=False)
+        with open(os.path.join(backtest_dir, BENCHMARK_NPZ), 'wb') as f:
+            np.savez(f, codes=np.array(self.codes, dtype=str), dates=self.dates,
+                     closes=self.closes, prev_closes=self.prev_closes)
+
+    def column(self, code: Optional[str] = None) -> int:
+        """基准指数在矩阵中的列下标，code为None时为主基准"""
+        return 0 if code is None else self.codes.index(code)
+
+    def align(self, dates: np.ndarray) -> np.ndarray:
+        """按指定交易日轴对齐
+
+        Args:
+            dates: int类型的日期 YYYYMMDD 数组
+
+        Returns:
+            np.ndarray: (len(dates), 基准数) 收盘价矩阵，没有数据的日期为NaN
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        result = np.full((len(dates), len(self.codes)), np.nan)
+        if not len(self.dates):
+            return result
+        rows = np.searchsorted(self.dates, dates)
+        rows_clipped = np.minimum(rows, len(self.dates) - 1)
+        found = self.dates[rows_clipped] == dates
+        result[found] = self.closes[rows_clipped[found]]
+        return result
+
+    def close(self, date: int, code: Optional[str] = None) -> float:
+        """指定日期的收盘价，没有数据时为NaN"""
+        t = int(np.searchsorted(self.dates, date))
+        if t >= len(self.dates) or self.dates[t] != date:
+            return np.nan
+        return float(self.closes[t, self.column(code)])
+
+    def returns(self, code: Optional[str] = None) -> np.ndarray:
+        """日收益率序列，与 dates 等长；首日相对前收盘价计算，前收盘价未知时为NaN"""
+        closes = self.closes[:, self.column(code)]
+        previous = np.concatenate([[self.prev_closes[self.column(code)]], closes[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (closes - previous) / previous
+
+    def to_frame(self, code: Optional[str] = None) -> pd.DataFrame:
+        """以 benchmark.csv 的格式（date, close）返回一个基准指数的数据"""
+        return pd.DataFrame({
+            'date': pd.to_datetime(self.dates.astype(str), format='%Y%m%d'),
+            'close': self.closes[:, self.column(code)]
+        })
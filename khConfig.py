@@ -59,6 +59,9 @@ class KhConfig:
         self.kline_period = data_config.get("kline_period", "1d")
         # 优先从stock_list读取，如果没有则使用stock_pool（兼容性）
         self.stock_pool = data_config.get("stock_list", data_config.get("stock_pool", []))
+        # 回测数据批量加载：每批请求的股票数量与并发请求数
+        self.load_chunk_size = data_config.get("load_chunk_size", 50)
+        self.load_workers = data_config.get("load_workers", 4)
 
         # 风控配置，设置默认值
         risk_config = self.config_dict.get("risk", {})
@@ -79,7 +82,12 @@ class KhConfig:
         self.realtime_enabled = realtime_config.get("enabled", False)
         self.realtime_period = realtime_config.get("period", "5m")
         self.auto_reconnect = realtime_config.get("auto_reconnect", True)
-        
+        self.subscribe_mode = realtime_config.get("subscribe_mode", "auto")
+        # 实时行情分发：是否在工作线程中执行策略、合并窗口（毫秒）与待处理队列容量
+        self.async_dispatch = realtime_config.get("async_dispatch", True)
+        self.coalesce_ms = realtime_config.get("coalesce_ms", 50)
+        self.dispatch_queue_size = realtime_config.get("dispatch_queue_size", 1024)
+
     @property
     def initial_cash(self):
         """获取初始资金，确保与回测配置中的init_capital保持一致"""
@@ -0,0 +1,465 @@
+# coding: utf-8
+"""
+列式行情数据湖模块
+
+download_and_store_data 原先为每只股票写一个CSV文件，日期和时间以格式化字符串保存，
+之后的特征计算、图表加载和分析代码都要用 pd.read_csv + pd.to_datetime 重新解析。
+DataLake 以列式文件按 周期/年份/股票 分区存放行情：
+
+    {root}/{period}/{year}/{stock_code}.{parquet|feather|npz}
+    {root}/_manifest.json      # 周期 -> 股票 -> 时间范围、行数、字段及各年份分区的范围
+
+时间列以int64毫秒时间戳（UTC）保存，年份分区按北京时间划分，与下载数据的时间换算一致。
+读取时先按清单裁剪股票和年份分区，再在分区内按时间过滤（Parquet 使用 pyarrow 的过滤条件
+下推，其余格式在有序时间列上二分查找），只读取需要的字段。
+
+Parquet/Feather 格式依赖 pyarrow；未安装时使用 NumPy 的 npz 格式，功能相同。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from khBarStore import to_epoch_ms
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    feather = None
+    pq = None
+
+# 行情时间（北京时间）相对UTC的偏移
+MARKET_UTC_OFFSET_MS = 8 * 3600 * 1000
+DAY_MS = 86400 * 1000
+
+MANIFEST_FILE = '_manifest.json'
+FORMAT_EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'npz': '.npz'}
+
+
+def default_format() -> str:
+    """默认存储格式：已安装 pyarrow 时为 parquet，否则为 npz"""
+    return 'parquet' if pa is not None else 'npz'
+
+
+def date_to_ms(value, end_of_day: bool = False) -> int:
+    """将日期转换为北京时间零点（或当日结束）的毫秒时间戳
+
+    Args:
+        value: 'YYYYMMDD' / 'YYYY-MM-DD' 字符串、datetime/date 或毫秒时间戳
+        end_of_day: 为True时返回当日最后一毫秒
+
+    Returns:
+        int: 毫秒级时间戳
+    """
+    if isinstance(value, (int, np.integer)) and value > 1e10:
+        return int(value)
+    text = str(value)
+    if len(text) == 8 and text.isdigit():
+        text = f"{text[:4]}-{text[4:6]}-{text[6:]}"
+    day = np.datetime64(pd.Timestamp(text).date(), 'D').astype(np.int64)
+    ms = int(day) * DAY_MS - MARKET_UTC_OFFSET_MS
+    return ms + DAY_MS - 1 if end_of_day else ms
+
+
+def market_years(ts_ms: np.ndarray) -> np.ndarray:
+    """毫秒时间戳对应的北京时间年份"""
+    local = (np.asarray(ts_ms, dtype=np.int64) + MARKET_UTC_OFFSET_MS).astype('datetime64[ms]')
+    return local.astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def time_labels(ts_ms: np.ndarray, intraday: bool = True) -> Dict[str, np.ndarray]:
+    """由毫秒时间戳生成与CSV格式一致的 date / time 字符串列（向量化）"""
+    local = (np.asarray(ts_ms, dtype=np.int64) + MARKET_UTC_OFFSET_MS).astype('datetime64[ms]').astype('datetime64[s]')
+    text = np.datetime_as_string(local, unit='s')
+    labels = {'date': text.astype('U10')}
+    if intraday:
+        labels['time'] = pd.Series(text).str[11:].to_numpy(dtype='U8')
+    return labels
+
+
+def frame_format(path: str) -> str:
+    """由文件扩展名确定单文件表格的格式（parquet / feather / npz / csv）"""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext not in ('parquet', 'feather', 'npz', 'csv'):
+        raise ValueError(f"不支持的文件格式: {path}")
+    if ext in ('parquet', 'feather') and pa is None:
+        raise ImportError(f"{ext} 格式需要安装 pyarrow")
+    return ext
+
+
+def write_frame(df: pd.DataFrame, path: str):
+    """将DataFrame写为单个列式文件（先写临时文件再替换），格式由扩展名决定
+
+    Args:
+        df: 待写入数据（不保存索引）
+        path: 文件路径，扩展名为 .parquet / .feather / .npz / .csv
+    """
+    fmt = frame_format(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if fmt == 'csv':
+        df.to_csv(tmp_path, index=False)
+    elif fmt == 'npz':
+        columns = {}
+        for name in df.columns:
+            values = df[name].to_numpy()
+            if values.dtype.kind == 'O' or not isinstance(values, np.ndarray):
+                values = np.asarray(values, dtype=str)
+            columns[str(name)] = values
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+    else:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if fmt == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_frame(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """读取 write_frame 写出的文件
+
+    Args:
+        path: 文件路径
+        columns: 需要的列，None 表示全部
+
+    Returns:
+        pd.DataFrame: 文件内容，列式格式只读取需要的列
+    """
+    fmt = frame_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    if fmt == 'npz':
+        with np.load(path) as npz:
+            names = npz.files if columns is None else [c for c in columns if c in npz.files]
+            return pd.DataFrame({name: npz[name] for name in names})
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns).to_pandas()
+    return feather.read_table(path, columns=columns).to_pandas()
+
+
+def _concat_columns(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """按字段并集依次拼接多段列数据，某段缺少的字段数值型填NaN、其他类型填None
+
+    只有确实需要填充缺失值时整数字段才会升为 float64，空段不影响类型。
+    """
+    names = []
+    for part in parts:
+        names.extend(name for name in part if name not in names)
+    columns = {}
+    for name in names:
+        dtype = next(part[name].dtype for part in parts if name in part)
+        chunks = []
+        for part in parts:
+            if name in part:
+                chunks.append(part[name])
+            else:
+                n = len(part['time'])
+                if n == 0:
+                    chunks.append(np.empty(0, dtype=dtype))
+                elif dtype.kind in 'fiu':
+                    chunks.append(np.full(n, np.nan))
+                else:
+                    chunks.append(np.full(n, None, dtype=object))
+        columns[name] = np.concatenate(chunks)
+    return columns
+
+
+class DataLake:
+    """按 周期/年份/股票 分区的列式行情数据湖
+
+    Attributes:
+        root: 数据根目录
+        fmt: 存储格式（parquet / feather / npz）
+        manifest: 清单，{周期: {股票代码: {'start', 'end', 'rows', 'fields', 'years', 'partitions'}}}
+    """
+
+    def __init__(self, root: str, fmt: Optional[str] = None):
+        """初始化数据湖
+
+        Args:
+            root: 数据根目录，不存在时自动创建
+            fmt: 存储格式，默认见 default_format()；已有清单时沿用清单记录的格式
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.manifest = self._load_manifest()
+        fmt = fmt or self.manifest.get('__format__') or default_format()
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"不支持的存储格式: {fmt}")
+        if fmt != 'npz' and pa is None:
+            raise ImportError(f"{fmt} 格式需要安装 pyarrow")
+        self.fmt = fmt
+        self.manifest['__format__'] = fmt
+
+    # ------------------ 清单 ------------------
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILE)
+
+    def _load_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取数据湖清单失败: {e}")
+            return {}
+
+    def save_manifest(self):
+        """保存清单（先写临时文件再替换，避免中断时清单损坏）"""
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def symbols(self, period: str) -> List[str]:
+        """某周期下已存储的股票代码"""
+        return list(self.manifest.get(period, {}))
+
+    def date_range(self, stock_code: str, period: str) -> Optional[tuple]:
+        """某股票某周期已存储数据的时间范围（毫秒时间戳），无数据时返回None"""
+        entry = self.manifest.get(period, {}).get(stock_code)
+        if not entry:
+            return None
+        return entry['start'], entry['end']
+
+    # ------------------ 写入 ------------------
+
+    def _partition_path(self, period: str, year: int, stock_code: str) -> str:
+        return os.path.join(self.root, period, str(year), stock_code + FORMAT_EXTENSIONS[self.fmt])
+
+    def write(self, stock_code: str, period: str, df: pd.DataFrame, save_manifest: bool = True) -> int:
+        """写入一只股票的行情，与已有分区按时间合并（相同时间以新数据为准）
+
+        Args:
+            stock_code: 股票代码
+            period: 周期，如 '1m' / '5m' / '1d' / 'tick'
+            df: 行情数据，需包含 time 列（毫秒时间戳或datetime）
+            save_manifest: 是否立即保存清单，批量写入时可在最后统一调用 save_manifest()
+
+        Returns:
+            int: 写入的行数
+        """
+        if df is None or df.empty:
+            return 0
+        if 'time' not in df.columns:
+            raise ValueError("写入数据湖的数据需要包含 time 列")
+
+        times = to_epoch_ms(df['time'].values)
+        fields = [c for c in df.columns if c != 'time']
+        columns = {'time': times}
+        for field in fields:
+            columns[field] = df[field].to_numpy()
+
+        order = np.argsort(times, kind='stable')
+        if not np.all(order == np.arange(len(order))):
+            columns = {name: values[order] for name, values in columns.items()}
+
+        years = market_years(columns['time'])
+        bounds = np.flatnonzero(np.diff(years)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(years)]))
+        partitions = {}
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            year = int(years[start])
+            part = {name: values[start:end] for name, values in columns.items()}
+            path = self._partition_path(period, year, stock_code)
+            if os.path.exists(path):
+                part = self._merge(self._read_partition(path), part)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_partition(path, part)
+            part_times = part['time']
+            partitions[str(year)] = [int(part_times[0]), int(part_times[-1]), len(part_times)]
+
+        with self._lock:
+            self._update_manifest(stock_code, period, fields, partitions)
+            if save_manifest:
+                self.save_manifest()
+        return len(times)
+
+    @staticmethod
+    def _merge(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """合并同一分区的新旧数据：按时间排序去重，新数据覆盖旧数据
+
+        新数据只覆盖其包含的字段，同一时间新数据没有的字段保留旧值。整数字段只在合并后
+        确有缺失值（如追加的新行没有该字段）时才升为 float64 并填NaN。
+        """
+        merged = _concat_columns([old, new])
+        times = merged['time']
+        # 稳定排序后同一时间的新数据排在后面，保留每组最后一条
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]
+        index = order[keep]
+        result = {name: values[index] for name, values in merged.items()}
+
+        old_only = [name for name in old if name not in new]
+        old_times = old['time']
+        if old_only and len(old_times):
+            # 旧分区按时间有序且无重复，按时间找回被新行覆盖的旧行
+            kept_times = result['time']
+            pos = np.minimum(np.searchsorted(old_times, kept_times), len(old_times) - 1)
+            hit = (index >= len(old_times)) & (old_times[pos] == kept_times)
+            if hit.any():
+                for name in old_only:
+                    result[name][hit] = old[name][pos[hit]]
+
+        # 找回旧值后不再有缺失的整数字段（如 volume）还原为原来的整数类型
+        for name, values in result.items():
+            dtypes = [part[name].dtype for part in (old, new) if name in part]
+            if values.dtype.kind == 'f' and all(dtype.kind in 'iu' for dtype in dtypes) \
+                    and not np.isnan(values).any():
+                result[name] = values.astype(np.result_type(*dtypes))
+        return result
+
+    def _update_manifest(self, stock_code: str, period: str, fields: List[str], partitions: Dict[str, list]):
+        """更新清单中一只股票的条目
+
+        Args:
+            partitions: 本次写入的分区，{年份: [起始时间, 结束时间, 行数]}
+        """
+        entries = self.manifest.setdefault(period, {})
+        entry = entries.get(stock_code, {'fields': [], 'partitions': {}})
+        entry['partitions'].update(partitions)
+        stats = list(entry['partitions'].values())
+        entry.update({
+            'start': min(p[0] for p in stats),
+            'end': max(p[1] for p in stats),
+            'rows': sum(p[2] for p in stats),
+            'fields': entry['fields'] + [f for f in fields if f not in entry['fields']],
+            'years': sorted(int(year) for year in entry['partitions']),
+        })
+        entries[stock_code] = entry
+
+    def _write_partition(self, path: str, columns: Dict[str, np.ndarray]):
+        tmp_path = path + '.tmp'
+        if self.fmt == 'npz':
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **columns)
+        else:
+            table = pa.table({name: pa.array(values) for name, values in columns.items()})
+            if self.fmt == 'parquet':
+                pq.write_table(table, tmp_path)
+            else:
+                feather.write_feather(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    # ------------------ 读取 ------------------
+
+    def _read_partition(self, path: str, fields: Optional[Sequence[str]] = None,
+                        start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """读取一个分区，只返回需要的字段和时间范围 [start, end] 内的行"""
+        columns = None if fields is None else ['time'] + [f for f in fields if f != 'time']
+        if self.fmt == 'parquet':
+            filters = []
+            if start is not None:
+                filters.append(('time', '>=', start))
+            if end is not None:
+                filters.append(('time', '<=', end))
+            table = pq.read_table(path, columns=columns, filters=filters or None)
+            return {name: table.column(name).to_numpy() for name in table.column_names}
+
+        if self.fmt == 'feather':
+            table = feather.read_table(path, columns=columns, memory_map=True)
+            data = {name: table.column(name).to_numpy() for name in table.column_names}
+        else:
+            with np.load(path, allow_pickle=True) as npz:
+                names = npz.files if columns is None else [c for c in columns if c in npz.files]
+                data = {name: npz[name] for name in names}
+
+        times = data['time']
+        lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+        if lo == 0 and hi == len(times):
+            return data
+        return {name: values[lo:hi] for name, values in data.items()}
+
+    def read(self, stock_code: str, period: str, start=None, end=None,
+             fields: Optional[Sequence[str]] = None, with_labels: bool = False) -> pd.DataFrame:
+        """读取一只股票的行情
+
+        Args:
+            stock_code: 股票代码
+            period: 周期
+            start: 起始日期（含），'YYYYMMDD' / 'YYYY-MM-DD' 或毫秒时间戳
+            end: 结束日期（含当日）
+            fields: 需要的字段，None 表示全部
+            with_labels: 为True时返回与CSV文件一致的布局：date（及分钟/tick周期的 time）为字符串列，
+                毫秒时间戳移到 timestamp 列
+
+        Returns:
+            pd.DataFrame: time 列为int64毫秒时间戳，按时间升序；无数据时为空DataFrame
+        """
+        entry = self.manifest.get(period, {}).get(stock_code)
+        if not entry:
+            return pd.DataFrame()
+        start_ms = None if start is None else date_to_ms(start)
+        end_ms = None if end is None else date_to_ms(end, end_of_day=True)
+        if (start_ms is not None and start_ms > entry['end']) or (end_ms is not None and end_ms < entry['start']):
+            return pd.DataFrame()
+
+        # 按清单记录的分区时间范围裁剪
+        parts = []
+        for year in entry['years']:
+            part_start, part_end, _ = entry['partitions'][str(year)]
+            if (start_ms is not None and part_end < start_ms) or (end_ms is not None and part_start > end_ms):
+                continue
+            path = self._partition_path(period, year, stock_code)
+            if os.path.exists(path):
+                parts.append(self._read_partition(path, fields, start_ms, end_ms))
+        if not parts:
+            return pd.DataFrame()
+
+        # 各年份分区的字段可能不同（如后来补写的字段），按字段并集拼接
+        df = pd.DataFrame(_concat_columns(parts))
+        if with_labels:
+            labels = time_labels(df['time'].values, intraday=period != '1d')
+            df = df.rename(columns={'time': 'timestamp'})
+            for i, (name, values) in enumerate(labels.items()):
+                df.insert(i, name, values)
+        return df
+
+    def read_many(self, stock_codes: Optional[Iterable[str]], period: str, start=None, end=None,
+                  fields: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """读取多只股票的行情，合并为带 stock_code 列的长表
+
+        Args:
+            stock_codes: 股票代码列表，None 表示该周期下的全部股票
+            period: 周期
+            start: 起始日期（含）
+            end: 结束日期（含当日）
+            fields: 需要的字段，None 表示全部
+
+        Returns:
+            pd.DataFrame: 列为 stock_code、time 及所需字段
+        """
+        if stock_codes is None:
+            stock_codes = self.symbols(period)
+        frames = []
+        for stock_code in stock_codes:
+            df = self.read(stock_code, period, start, end, fields)
+            if not df.empty:
+                df.insert(0, 'stock_code', stock_code)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,159 @@
+# coding: utf-8
+"""
+回测历史数据加载模块
+
+将股票池按批次拆分，每批通过一次 get_market_data_ex 请求获取多只股票的数据，
+并使用线程池并发执行各批次请求，汇总报告加载进度。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+from logging_config import get_module_logger
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+# 日志系统
+logger = get_module_logger(__name__)
+
+# 默认每批请求的股票数量
+DEFAULT_CHUNK_SIZE = 50
+
+# 默认并发请求数
+DEFAULT_MAX_WORKERS = 4
+
+
+def chunk_list(items: List, chunk_size: int) -> List[List]:
+    """按固定大小拆分列表
+
+    Args:
+        items: 待拆分列表
+        chunk_size: 每批数量
+
+    Returns:
+        List[List]: 拆分后的批次列表
+    """
+    chunk_size = max(1, int(chunk_size))
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+class BacktestDataLoader:
+    """回测历史数据批量加载器
+
+    使用示例:
+        loader = BacktestDataLoader(chunk_size=50, max_workers=4)
+        data = loader.load(codes, ['time', 'close'], '1m', '20240101', '20240630')
+
+    Attributes:
+        chunk_size: 每批请求的股票数量
+        max_workers: 并发请求数，为1时按批次串行加载
+        failed_codes: 最近一次加载中请求失败的股票代码
+    """
+
+    def __init__(self, xtdata_module=None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 progress_callback: Optional[Callable[[int, int], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        """初始化加载器
+
+        Args:
+            xtdata_module: 行情数据模块，需提供 get_market_data_ex 接口，
+                默认使用 xtquant.xtdata，测试时可传入桩模块
+            chunk_size: 每批请求的股票数量
+            max_workers: 并发请求数
+            progress_callback: 进度回调，参数为 (已完成股票数, 总股票数)
+            should_stop: 中止检查函数，返回True时不再发起新的请求
+        """
+        if xtdata_module is None:
+            from xtquant import xtdata as xtdata_module
+        self.xtdata = xtdata_module
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_workers = max(1, int(max_workers))
+        self.progress_callback = progress_callback
+        self.should_stop = should_stop
+        self.failed_codes = []
+        self._lock = threading.Lock()
+
+    def _stopped(self) -> bool:
+        return bool(self.should_stop and self.should_stop())
+
+    def _load_chunk(self, codes: List[str], request: Dict) -> Dict[str, pd.DataFrame]:
+        """加载一个批次的股票数据"""
+        if self._stopped():
+            return {}
+        data = self.xtdata.get_market_data_ex(stock_list=codes, **request)
+        if not data:
+            return {}
+        return {code: data[code] for code in codes if code in data}
+
+    def load(self, stock_codes: List[str], field_list: List[str], period: str,
+             start_time: str, end_time: str, dividend_type: str = 'none',
+             fill_data: bool = True) -> Dict[str, pd.DataFrame]:
+        """批量加载股票历史数据
+
+        Args:
+            stock_codes: 股票代码列表
+            field_list: 字段列表
+            period: 数据周期
+            start_time: 开始时间
+            end_time: 结束时间
+            dividend_type: 复权方式
+            fill_data: 是否填充缺失数据
+
+        Returns:
+            Dict[str, pd.DataFrame]: 股票代码到历史数据的映射，按 stock_codes 顺序排列
+        """
+        request = {
+            'field_list': field_list,
+            'period': period,
+            'start_time': start_time,
+            'end_time': end_time,
+            'dividend_type': dividend_type,
+            'fill_data': fill_data,
+        }
+        chunks = chunk_list(list(stock_codes), self.chunk_size)
+        total = len(stock_codes)
+        loaded = {}
+        self.failed_codes = []
+        finished = 0
+
+        def on_chunk_done(codes, result, error):
+            nonlocal finished
+            with self._lock:
+                if error is not None:
+                    logger.error(f"加载 {codes[0]} 等{len(codes)}只股票的数据失败: {error}")
+                    self.failed_codes.extend(codes)
+                else:
+                    loaded.update(result)
+                finished += len(codes)
+                done = finished
+            if self.progress_callback:
+                self.progress_callback(done, total)
+
+        if self.max_workers == 1 or len(chunks) <= 1:
+            for codes in chunks:
+                if self._stopped():
+                    break
+                try:
+                    on_chunk_done(codes, self._load_chunk(codes, request), None)
+                except Exception as e:
+                    on_chunk_done(codes, None, e)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)),
+                                    thread_name_prefix='khDataLoader') as executor:
+                futures = {executor.submit(self._load_chunk, codes, request): codes for codes in chunks}
+                for future in as_completed(futures):
+                    codes = futures[future]
+                    try:
+                        on_chunk_done(codes, future.result(), None)
+                    except Exception as e:
+                        on_chunk_done(codes, None, e)
+                    if self._stopped():
+                        for pending in futures:
+                            pending.cancel()
+
+        return {code: loaded[code] for code in stock_codes if code in loaded}
@@ -0,0 +1,358 @@
+# coding: utf-8
+"""
+批量历史数据下载引擎
+
+数据下载和定时补充原先逐只股票串行执行：下载、读取、写文件依次进行，每只股票之后
+再固定休眠1秒，全市场分钟线补充需要数小时，中途中断后只能从头开始。
+BulkDownloader 将股票池按批次拆分：
+
+- 下载线程池按批次调用下载与读取接口（I/O密集），由令牌桶限制请求速率；
+- 写入线程池对已取回的每只股票执行转换和写文件（CPU/磁盘），与后续批次的下载重叠进行；
+- 每只股票处理完成后追加写入检查点日志，同一任务中断后再次运行时跳过已完成的股票；
+- 汇总吞吐量指标（股票数/秒、行数/秒）。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+from khDataLoader import chunk_list
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 默认每批请求的股票数量
+DEFAULT_CHUNK_SIZE = 20
+
+# 默认并发下载请求数
+DEFAULT_DOWNLOAD_WORKERS = 2
+
+# 默认写入线程数
+DEFAULT_WRITE_WORKERS = 2
+
+# 默认请求速率（批次/秒）
+DEFAULT_RATE_LIMIT = 2.0
+
+
+def task_key(**params) -> str:
+    """由任务参数生成检查点日志的任务标识（参数相同的任务共用同一份日志）"""
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+def default_journal_dir() -> str:
+    """默认检查点日志目录（用户数据目录下的 download_journal）"""
+    if os.name == 'nt':
+        user_data_dir = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'KhQuant')
+    else:
+        user_data_dir = os.path.join(os.path.expanduser('~'), '.khquant')
+    return os.path.join(user_data_dir, 'download_journal')
+
+
+def download_history_batch(xtdata_module, codes: List[str], period: str, start_time: str, end_time: str,
+                           incrementally: Optional[bool] = None):
+    """下载一批股票的历史数据到本地
+
+    xtdata 提供 download_history_data2 时一次请求整批股票，否则逐只调用 download_history_data。
+    """
+    kwargs = {'period': period, 'start_time': start_time, 'end_time': end_time}
+    if incrementally is not None:
+        kwargs['incrementally'] = incrementally
+    batch_download = getattr(xtdata_module, 'download_history_data2', None)
+    if batch_download is not None and len(codes) > 1:
+        batch_download(codes, **kwargs)
+        return
+    for code in codes:
+        xtdata_module.download_history_data(code, **kwargs)
+
+
+class RateLimiter:
+    """令牌桶限速器，rate 为每秒允许的请求数，为空或不大于0时不限速"""
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1):
+        self.rate = rate if rate and rate > 0 else None
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None):
+        """获取一个令牌，不足时等待"""
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            if should_stop and should_stop():
+                return
+            time.sleep(min(wait_time, 0.2))
+
+
+class DownloadJournal:
+    """检查点日志：JSON Lines 文件，首行记录任务标识，之后每行记录一只已完成的股票"""
+
+    def __init__(self, path: Optional[str], key: str):
+        """打开检查点日志
+
+        Args:
+            path: 日志文件路径，为空时不记录（不支持断点续传）
+            key: 任务标识，与文件中记录的标识不同时丢弃旧日志
+        """
+        self.path = path
+        self.key = key
+        self.completed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if not path:
+            return
+        if os.path.exists(path):
+            self._load()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if self.completed:
+            self._file = open(path, 'a', encoding='utf-8')
+            # 不完整的最后一行之后另起一行，避免新记录接在其后无法解析
+            if self._file.tell() and not self._ends_with_newline():
+                self._file.write('\n')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._file.write(json.dumps({'task': key, 'created': time.strftime('%Y-%m-%d %H:%M:%S')}) + '\n')
+            self._file.flush()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('task') != self.key:
+                    return
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    self.completed[record['code']] = record.get('rows', 0)
+        except Exception as e:
+            logger.warning(f"读取下载检查点日志失败，将重新开始: {e}")
+            self.completed = {}
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def mark(self, code: str, rows: int):
+        """记录一只股票已完成"""
+        with self._lock:
+            self.completed[code] = rows
+            if self._file is not None:
+                self._file.write(json.dumps({'code': code, 'rows': rows}) + '\n')
+                self._file.flush()
+
+    def close(self, finished: bool = False):
+        """关闭日志，任务全部完成时删除日志文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if finished and self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class BulkDownloader:
+    """批量、可断点续传的历史数据下载引擎
+
+    使用示例:
+        downloader = BulkDownloader(journal_path=path, check_interrupt=stop_event.is_set)
+        stats = downloader.run(stocks, fetch, store)
+
+    其中 fetch(codes) 下载并读取一批股票，返回 {股票代码: DataFrame}；
+    store(code, df) 转换并写入一只股票，返回写入行数。
+
+    Attributes:
+        stats: 最近一次运行的统计信息
+        failed_codes: 最近一次运行中失败的股票代码
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+                 write_workers: int = DEFAULT_WRITE_WORKERS, rate_limit: Optional[float] = DEFAULT_RATE_LIMIT,
+                 journal_path: Optional[str] = None, task: str = '',
+                 progress_callback: Optional[Callable[[int], None]] = None,
+                 log_callback: Optional[Callable[[str], None]] = None,
+                 check_interrupt: Optional[Callable[[], bool]] = None):
+        """初始化下载引擎
+
+        Args:
+            chunk_size: 每批请求的股票数量
+            download_workers: 并发下载请求数
+            write_workers: 写入线程数
+            rate_limit: 请求速率上限（批次/秒），为空时不限速
+            journal_path: 检查点日志路径，为空时不支持断点续传
+            task: 任务标识，见 task_key()
+            progress_callback: 进度回调，参数为完成百分比（0-100）
+            log_callback: 日志回调
+            check_interrupt: 中断检查函数，返回True时停止并抛出 InterruptedError
+        """
+        self.chunk_size = max(1, int(chunk_size))
+        self.download_workers = max(1, int(download_workers))
+        self.write_workers = max(1, int(write_workers))
+        self.limiter = RateLimiter(rate_limit)
+        self.journal_path = journal_path
+        self.task = task
+        self.progress_callback = progress_callback
+        self.log_callback = log_callback
+        self.check_interrupt = check_interrupt
+        self.failed_codes: List[str] = []
+        self.stats: Dict = {}
+
+    def _interrupted(self) -> bool:
+        return bool(self.check_interrupt and self.check_interrupt())
+
+    def _log(self, message: str):
+        logger.info(message)
+        if self.log_callback:
+            self.log_callback(message)
+
+    def run(self, stocks: Iterable[str], fetch: Callable[[List[str]], Dict],
+            store: Callable[[str, object], int]) -> Dict:
+        """执行下载任务
+
+        Args:
+            stocks: 股票代码列表
+            fetch: 批次下载读取函数
+            store: 单只股票转换写入函数
+
+        Returns:
+            Dict: 统计信息，包括 total / completed / skipped / failed / rows / elapsed /
+                symbols_per_sec / rows_per_sec
+
+        Raises:
+            InterruptedError: 被中断时抛出，已完成的股票已写入检查点日志
+        """
+        stocks = list(dict.fromkeys(stocks))
+        journal = DownloadJournal(self.journal_path, self.task)
+        pending = [code for code in stocks if code not in journal.completed]
+        skipped = len(stocks) - len(pending)
+        if skipped:
+            self._log(f"从检查点恢复: 跳过已完成的 {skipped} 只股票，剩余 {len(pending)} 只")
+
+        total = len(stocks)
+        self.failed_codes = []
+        counters = {'completed': 0, 'rows': 0}
+        start = time.perf_counter()
+        last_percent = -1
+
+        def report_progress():
+            nonlocal last_percent
+            if not self.progress_callback or total == 0:
+                return
+            done = skipped + counters['completed'] + len(self.failed_codes)
+            percent = int(done / total * 100)
+            if percent != last_percent:
+                last_percent = percent
+                self.progress_callback(percent)
+
+        chunks = iter(chunk_list(pending, self.chunk_size))
+        exhausted = False
+        fetches = {}
+        writes = {}
+        interrupted = False
+        download_pool = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix='khDownload')
+        write_pool = ThreadPoolExecutor(max_workers=self.write_workers, thread_name_prefix='khDownloadWrite')
+        try:
+            while True:
+                if self._interrupted():
+                    interrupted = True
+                    break
+                # 保持下载线程满负荷，同时限制已取回未写入的数据量
+                while not exhausted and len(fetches) < self.download_workers \
+                        and len(writes) < self.chunk_size * self.write_workers * 2:
+                    codes = next(chunks, None)
+                    if codes is None:
+                        exhausted = True
+                        break
+                    self.limiter.acquire(self.check_interrupt)
+                    fetches[download_pool.submit(fetch, codes)] = codes
+                if not fetches and not writes:
+                    break
+
+                done, _ = wait(list(fetches) + list(writes), timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetches:
+                        codes = fetches.pop(future)
+                        try:
+                            data = future.result() or {}
+                        except InterruptedError:
+                            interrupted = True
+                            continue
+                        except Exception as e:
+                            self._log(f"下载 {codes[0]} 等{len(codes)}只股票的数据失败: {e}")
+                            self.failed_codes.extend(codes)
+                            continue
+                        for code in codes:
+                            writes[write_pool.submit(store, code, data.get(code))] = code
+                    else:
+                        code = writes.pop(future)
+                        try:
+                            rows = int(future.result() or 0)
+                        except InterruptedError:
+                            interrupted = True
+                            continue
+                        except Exception as e:
+                            self._log(f"处理 {code} 数据时出错: {e}")
+                            self.failed_codes.append(code)
+                            continue
+                        journal.mark(code, rows)
+                        counters['completed'] += 1
+                        counters['rows'] += rows
+                report_progress()
+                if interrupted:
+                    break
+        finally:
+            for future in list(fetches) + list(writes):
+                future.cancel()
+            # 等待已开始的写入结束，保证检查点日志与文件一致
+            download_pool.shutdown(wait=True)
+            write_pool.shutdown(wait=True)
+            for future, code in writes.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    rows = int(future.result() or 0)
+                    journal.mark(code, rows)
+                    counters['completed'] += 1
+                    counters['rows'] += rows
+            journal.close(finished=not interrupted and not self.failed_codes)
+
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            'total': total,
+            'completed': counters['completed'],
+            'skipped': skipped,
+            'failed': len(self.failed_codes),
+            'rows': counters['rows'],
+            'elapsed': elapsed,
+            'symbols_per_sec': counters['completed'] / elapsed if elapsed > 0 else 0.0,
+            'rows_per_sec': counters['rows'] / elapsed if elapsed > 0 else 0.0,
+        }
+        self._log(
+            f"下载统计: 完成 {self.stats['completed']} 只, 跳过 {skipped} 只, 失败 {self.stats['failed']} 只, "
+            f"共 {self.stats['rows']} 行, 耗时 {elapsed:.1f} 秒, "
+            f"{self.stats['symbols_per_sec']:.2f} 只/秒, {self.stats['rows_per_sec']:.0f} 行/秒"
+        )
+        if self.failed_codes:
+            self._log(f"以下股票处理失败，再次运行同一任务时将重试: {', '.join(self.failed_codes[:10])}"
+                      + (f" 等{len(self.failed_codes)}只" if len(self.failed_codes) > 10 else ""))
+        if interrupted:
+            raise InterruptedError("下载过程被用户中断")
+        return self.stats
@@ -0,0 +1,283 @@
+# coding: utf-8
+"""
+日内特征计算流水线
+
+calculate_intraday_features 原先逐个文件串行处理，用 DataFrame.apply(axis=1) 逐行计算
+特征，再逐个追加写入同一个CSV文件。FeaturePipeline 改为：
+
+- 特征定义登记在 FEATURE_REGISTRY 中，每个特征是一个作用于整列的向量化函数；
+- 各股票的读取与计算分发到进程池并行执行（工作函数只依赖 numpy/pandas，可在子进程中导入）；
+- 全部结果合并后一次写出为单个文件（.parquet / .feather / .npz，或兼容原格式的 .csv）；
+- 在输出文件旁记录各股票已处理的日期范围和源文件修改时间，源数据增长后再次运行时
+  只计算新增日期，源文件未变化的股票直接跳过。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from khDataLake import read_frame, write_frame
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 计算成交量比例时防止除零的小常数
+EPS = 1e-8
+
+# 特征名称 -> 计算函数，函数参数为 (合并后的分钟数据, 参数字典)，返回与行数等长的数组
+FEATURE_REGISTRY: Dict[str, Callable[[pd.DataFrame, Dict], np.ndarray]] = {}
+
+
+def register_feature(name: str):
+    """登记特征计算函数的装饰器
+
+    计算函数可使用的列：分钟数据的原有列、price（收盘价或成交价）、
+    past_avg_volume（过去5个交易日的平均日成交量）、prev_close（前一交易日收盘价）。
+    """
+    def decorator(func):
+        FEATURE_REGISTRY[name] = func
+        return func
+    return decorator
+
+
+@register_feature('volume_ratio')
+def volume_ratio(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """分钟成交量相对过去5日平均每分钟成交量的比例"""
+    past_avg_volume = frame['past_avg_volume'].to_numpy(dtype=np.float64)
+    volume = frame['volume'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = volume / (past_avg_volume / params.get('trading_minutes', 240) + EPS)
+    return np.where(np.isnan(past_avg_volume), np.nan, ratio)
+
+
+@register_feature('return_rate')
+def return_rate(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """相对前一交易日收盘价的收益率"""
+    prev_close = frame['prev_close'].to_numpy(dtype=np.float64)
+    price = frame['price'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = (price - prev_close) / prev_close
+    return np.where(np.isnan(prev_close), np.nan, rate)
+
+
+def compute_symbol_features(minute_data: pd.DataFrame, daily_data: pd.DataFrame, feature_types: List[str],
+                            stock_code: str, trading_minutes: int = 240,
+                            since: Optional[pd.Timestamp] = None,
+                            min_date: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """计算一只股票的日内特征
+
+    Args:
+        minute_data: 分钟数据，包含 date / time 列及 volume、close（或 price）
+        daily_data: 日线数据，包含 date / volume / close 列
+        feature_types: 特征名称列表，见 FEATURE_REGISTRY
+        stock_code: 股票代码
+        trading_minutes: 每个交易日的交易分钟数
+        since: 增量计算时只输出该日期（含）之后的行
+        min_date: 全部数据的起始日期，增量计算时沿用首次计算的值
+
+    Returns:
+        pd.DataFrame: 列为 date、time、各特征和 stock_code；去掉数据开始后6天内和最后一天的数据
+    """
+    unknown = [name for name in feature_types if name not in FEATURE_REGISTRY]
+    if unknown:
+        raise ValueError(f"未登记的特征类型: {unknown}")
+
+    daily = pd.DataFrame({'date': pd.to_datetime(daily_data['date'])})
+    # 计算过去5天的平均交易量与前一天的收盘价
+    daily['past_avg_volume'] = daily_data['volume'].rolling(window=5).mean().shift(1).to_numpy()
+    daily['prev_close'] = daily_data['close'].shift(1).to_numpy()
+
+    minute = minute_data.copy()
+    minute['date'] = pd.to_datetime(minute['date'])
+    data_min_date = minute['date'].min() if min_date is None else min_date
+    max_date = minute['date'].max()
+    if since is not None:
+        # 增量计算：只处理新增日期，日线滚动指标仍基于完整的日线数据
+        minute = minute[minute['date'] >= since]
+
+    # 分钟数据没有 close 列时使用 price 列
+    minute['price'] = minute['close'] if 'close' in minute.columns else minute['price']
+    merged = pd.merge(minute, daily, on='date', how='left')
+
+    params = {'trading_minutes': trading_minutes}
+    result = merged[['date', 'time']].copy()
+    for name in feature_types:
+        result[name] = FEATURE_REGISTRY[name](merged, params)
+    result['stock_code'] = stock_code
+
+    # 去掉前6天(包括第6天)和最后一天的数据
+    mask = (result['date'] > data_min_date + pd.Timedelta(days=6)) & (result['date'] < max_date)
+    return result[mask].reset_index(drop=True)
+
+
+def _process_symbol(task: Dict) -> Dict:
+    """进程池工作函数：读取一只股票的分钟与日线文件并计算特征"""
+    try:
+        minute_data = pd.read_csv(task['minute_file'])
+        daily_data = pd.read_csv(task['daily_file'])
+        since = pd.Timestamp(task['since']) if task.get('since') else None
+        min_date = pd.Timestamp(task['min_date']) if task.get('min_date') else None
+        features = compute_symbol_features(
+            minute_data, daily_data, task['feature_types'], task['stock_code'],
+            task['trading_minutes'], since=since, min_date=min_date
+        )
+        dates = pd.to_datetime(minute_data['date'])
+        return {
+            'stock_code': task['stock_code'],
+            'features': features,
+            'min_date': str((min_date or dates.min()).date()),
+            'max_date': str(dates.max().date()),
+            'mtime': task['mtime'],
+        }
+    except Exception as e:
+        return {'stock_code': task['stock_code'], 'error': str(e)}
+
+
+class FeaturePipeline:
+    """日内特征计算流水线
+
+    使用示例:
+        pipeline = FeaturePipeline(file_path, "000001.SZ_1m_20240101_20240430_all_none.csv",
+                                   "000001.SZ_1d_20240101_20240430_all_none.csv",
+                                   ['volume_ratio', 'return_rate'], output_path, "features.parquet")
+        pipeline.run()
+
+    Attributes:
+        output_file: 输出文件路径
+        state_file: 增量状态文件路径（输出文件名加 .state.json）
+        failed: 最近一次运行中计算失败的股票及原因
+    """
+
+    def __init__(self, file_path: str, sample_file_name: str, daily_file_name_pattern: str,
+                 feature_types: List[str], output_path: str, output_file_name: str,
+                 trading_minutes: int = 240, max_workers: Optional[int] = None, incremental: bool = True):
+        """初始化流水线
+
+        Args:
+            file_path: 股票数据文件所在目录
+            sample_file_name: 分钟数据样本文件名，用于确定周期类型和起止日期
+            daily_file_name_pattern: 日线数据文件名（以样本股票代码为例）
+            feature_types: 特征名称列表
+            output_path: 输出目录
+            output_file_name: 输出文件名，扩展名决定格式
+            trading_minutes: 每个交易日的交易分钟数
+            max_workers: 进程数，默认为CPU核数，为1时在当前进程中串行计算
+            incremental: 是否增量计算
+        """
+        self.file_path = file_path
+        self.sample_file_name = sample_file_name
+        self.daily_file_name_pattern = daily_file_name_pattern
+        self.feature_types = list(feature_types)
+        self.output_file = os.path.join(output_path, output_file_name)
+        self.state_file = self.output_file + '.state.json'
+        self.trading_minutes = trading_minutes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.incremental = incremental
+        self.failed: Dict[str, str] = {}
+
+    def _source_files(self) -> List[tuple]:
+        """(股票代码, 分钟数据文件, 日线数据文件) 列表"""
+        file_name_parts = self.sample_file_name.split('_')
+        data_type, start_date, end_date = file_name_parts[1], file_name_parts[2], file_name_parts[3]
+        file_pattern = f"*_{data_type}_{start_date}_{end_date}_*.csv"
+        stock_code_example = self.daily_file_name_pattern.split('_')[0]
+        files = []
+        for minute_file in sorted(glob.glob(os.path.join(self.file_path, file_pattern))):
+            stock_code = os.path.basename(minute_file).split('_')[0]
+            daily_file_name = self.daily_file_name_pattern.replace(stock_code_example, stock_code)
+            files.append((stock_code, minute_file, os.path.join(self.file_path, daily_file_name)))
+        return files
+
+    def _load_state(self) -> Dict:
+        if not self.incremental or not os.path.exists(self.state_file) or not os.path.exists(self.output_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取特征增量状态失败，将全量计算: {e}")
+            return {}
+        if state.get('feature_types') != self.feature_types or state.get('trading_minutes') != self.trading_minutes:
+            return {}
+        return state
+
+    def run(self) -> pd.DataFrame:
+        """执行特征计算并写出结果
+
+        Returns:
+            pd.DataFrame: 输出文件的完整内容
+        """
+        state = self._load_state()
+        symbols_state = state.get('symbols', {})
+        tasks = []
+        for stock_code, minute_file, daily_file in self._source_files():
+            mtime = [os.path.getmtime(minute_file),
+                     os.path.getmtime(daily_file) if os.path.exists(daily_file) else 0]
+            previous = symbols_state.get(stock_code)
+            if previous and previous.get('mtime') == mtime:
+                continue
+            tasks.append({
+                'stock_code': stock_code,
+                'minute_file': minute_file,
+                'daily_file': daily_file,
+                'feature_types': self.feature_types,
+                'trading_minutes': self.trading_minutes,
+                # 上次计算时最后一天被排除，从该日起重新计算
+                'since': previous.get('max_date') if previous else None,
+                'min_date': previous.get('min_date') if previous else None,
+                'mtime': mtime,
+            })
+
+        if not tasks and state:
+            logger.info("特征数据已是最新，无需计算")
+            return read_frame(self.output_file)
+
+        if self.max_workers == 1 or len(tasks) <= 1:
+            results = [_process_symbol(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+                results = list(executor.map(_process_symbol, tasks, chunksize=max(1, len(tasks) // (self.max_workers * 4))))
+
+        self.failed = {}
+        frames = []
+        for result in results:
+            stock_code = result['stock_code']
+            if 'error' in result:
+                self.failed[stock_code] = result['error']
+                logger.error(f"计算 {stock_code} 的特征失败: {result['error']}")
+                continue
+            frames.append(result['features'])
+            symbols_state[stock_code] = {k: result[k] for k in ('min_date', 'max_date', 'mtime')}
+
+        columns = ['date', 'time'] + self.feature_types + ['stock_code']
+        new_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        if state:
+            existing = read_frame(self.output_file)
+            existing['date'] = pd.to_datetime(existing['date'])
+            # 去掉重新计算范围内的旧数据：增量股票从 since 起，全量重算的股票整只替换
+            recomputed = pd.Series({task['stock_code']: pd.Timestamp(task['since']) if task['since'] else pd.Timestamp.min
+                                    for task in tasks if task['stock_code'] not in self.failed})
+            cutoff = existing['stock_code'].astype(str).map(recomputed)
+            existing = existing[cutoff.isna() | (existing['date'] < cutoff)]
+            output = pd.concat([existing, new_data], ignore_index=True)
+            output = output.sort_values('stock_code', kind='stable').reset_index(drop=True)
+        else:
+            output = new_data
+
+        write_frame(output, self.output_file)
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'feature_types': self.feature_types,
+                'trading_minutes': self.trading_minutes,
+                'symbols': symbols_state,
+            }, f, ensure_ascii=False, indent=1)
+        logger.info(f"特征计算完成: 计算 {len(frames)} 只股票, 新增 {len(new_data)} 行, 输出 {self.output_file}")
+        return output
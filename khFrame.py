@@ -1,5 +1,5 @@
 # coding: utf-8
-from logging_config import get_module_logger
+from logging_config import get_lazy_logger, RateLimitedLog
 import time
 import datetime
 import traceback
@@ -11,8 +11,11 @@ import shutil
 from types import SimpleNamespace
 import threading
 
-# 日志系统
-logger = get_module_logger(__name__)
+# 日志系统（延迟构造消息，级别关闭时回测循环中的日志不产生格式化开销）
+logger = get_lazy_logger(__name__)
+
+# 回测中空数据告警的汇总周期（K线数）
+EMPTY_DATA_LOG_BARS = 240
 
 
 from xtquant import xtdata
@@ -22,8 +25,14 @@ from xtquant import xtconstant
 
 from khTrade import KhTradeManager
 from khRisk import KhRiskManager
-from khQTTools import KhQuTools, determine_pool_type, format_price, round_price, get_price_decimals, check_t0_support, get_t0_details
+from khQTTools import KhQuTools, determine_pool_type, format_price, round_price, get_price_decimals, check_t0_support, get_t0_details, get_trading_calendar
 from khConfig import KhConfig
+from khBenchmark import BenchmarkSeries, parse_benchmark_codes, ordinals_to_date_nums
+from khBarStore import BarStore, DailyPriceMatrix, TimeInfoTable, find_time_field, to_epoch_ms, seconds_of_day, local_midnights_ms
+from khDataLoader import BacktestDataLoader
+from khHistoryCache import BacktestHistoryCache, activate_history_cache, deactivate_history_cache
+from khPortfolio import PortfolioLedger
+from khLiveDispatch import QuoteDispatcher
 
 import numpy as np
 from PyQt5.QtCore import Qt, QMetaObject, Q_ARG, QObject, QEventLoop, QTimer
@@ -47,11 +56,11 @@ class SimpleGUI:
 
     def log_message(self, message, level="INFO"):
         """记录日志消息"""
-        logger.info(f"[{level}] {datetime.datetime.now()} - {message}")
+        logger.info("[%s] %s", level, message)
 
     def on_strategy_finished(self):
         """策略完成回调"""
-        logger.info(f"[INFO] {datetime.datetime.now()} - 策略执行完成")
+        logger.info("[INFO] 策略执行完成")
 
 # 触发器基类
 class TriggerBase:
@@ -202,6 +211,43 @@ class CustomTimeTrigger(TriggerBase):
             seconds = h * 3600 + m * 60 + s
             self.trigger_seconds.append(seconds)
         self.trigger_seconds.sort()
+        # 排序后的触发秒数数组，用于向量化匹配
+        self.trigger_seconds_array = np.array(self.trigger_seconds, dtype=np.int64)
+        
+    def match_timestamps(self, timestamps_ms, tolerance=1):
+        """批量判断时间戳是否接近任一触发时间点
+        
+        Args:
+            timestamps_ms: 毫秒级时间戳数组
+            tolerance: 允许的误差秒数
+            
+        Returns:
+            np.ndarray: 布尔数组，True表示该时间戳在某个触发时间点的误差范围内
+        """
+        seconds = seconds_of_day(timestamps_ms)
+        triggers = self.trigger_seconds_array
+        if triggers.size == 0:
+            return np.zeros(seconds.shape, dtype=bool)
+        # 在有序触发数组中查找左右相邻的触发点，取距离较近者
+        idx = np.searchsorted(triggers, seconds)
+        right = triggers[np.minimum(idx, triggers.size - 1)]
+        left = triggers[np.maximum(idx - 1, 0)]
+        distance = np.minimum(np.abs(seconds - left), np.abs(right - seconds))
+        return distance <= tolerance
+        
+    def build_timeline(self, trading_days):
+        """为每个交易日生成全部触发时间点
+        
+        Args:
+            trading_days: 交易日列表 (datetime.date)
+            
+        Returns:
+            np.ndarray: 按时间排序的毫秒级时间戳数组
+        """
+        if not trading_days or self.trigger_seconds_array.size == 0:
+            return np.empty(0, dtype=np.int64)
+        midnights = local_midnights_ms(trading_days)
+        return (midnights[:, None] + self.trigger_seconds_array[None, :] * 1000).ravel()
         
     def should_trigger(self, timestamp, data):
         """判断是否应该触发策略
@@ -339,7 +385,7 @@ class MyTraderCallback(XtQuantTraderCallback):
             )
             
             self.gui.log_message(order_msg, "TRADE")
-            logger.info(datetime.datetime.now(), '委托回调', order.order_remark)
+            logger.info("委托回调 %s", order.order_remark)
             
         except Exception as e:
             self.gui.log_message(f"处理委托回报时出错: {str(e)}", "ERROR")
@@ -388,7 +434,7 @@ class MyTraderCallback(XtQuantTraderCallback):
             )
             
             self.gui.log_message(trade_msg, "TRADE")
-            logger.info(datetime.datetime.now(), '成交回调', trade.order_remark)
+            logger.info("成交回调 %s", trade.order_remark)
             
         except Exception as e:
             self.gui.log_message(f"处理成交回报时出错: {str(e)}", "ERROR")
@@ -405,7 +451,7 @@ class MyTraderCallback(XtQuantTraderCallback):
             )
             
             self.gui.log_message(error_msg, "ERROR")
-            logger.error(f"委托报错回调 {order_error.order_remark} {order_error.error_msg}")
+            logger.error("委托报错回调 %s %s", order_error.order_remark, order_error.error_msg)
             
         except Exception as e:
             self.gui.log_message(f"处理委托错误时出错: {str(e)}", "ERROR")
@@ -421,7 +467,7 @@ class MyTraderCallback(XtQuantTraderCallback):
             )
             
             self.gui.log_message(error_msg, "ERROR")
-            logger.info(datetime.datetime.now(), sys._getframe().f_code.co_name)
+            logger.info("撤单错误回调 %s", cancel_error.order_id)
             
         except Exception as e:
             self.gui.log_message(f"处理撤单错误时出错: {str(e)}", "ERROR")
@@ -429,14 +475,14 @@ class MyTraderCallback(XtQuantTraderCallback):
     def on_disconnected(self):
         """连接断开"""
         self.gui.log_message("交易连接已断开", "WARNING")
-        logger.info(datetime.datetime.now(),'连接断开回调')
+        logger.info("连接断开回调")
 
     def on_order_stock_async_response(self, response):
         """异步下单回报推送"""
         try:
             msg = f"异步委托回调 - 备注: {response.order_remark}"
             self.gui.log_message(msg, "TRADE")
-            logger.info(f"异步委托回调 {response.order_remark}")
+            logger.info("异步委托回调 %s", response.order_remark)
         except Exception as e:
             self.gui.log_message(f"处理异步下单回报时出错: {str(e)}", "ERROR")
 
@@ -445,7 +491,7 @@ class MyTraderCallback(XtQuantTraderCallback):
         try:
             msg = f"撤单异步回报 - 委托编号: {response.order_id}"
             self.gui.log_message(msg, "TRADE")
-            logger.info(datetime.datetime.now(), sys._getframe().f_code.co_name)
+            logger.info("撤单异步回报 %s", response.order_id)
         except Exception as e:
             self.gui.log_message(f"处理撤单异步回报时出错: {str(e)}", "ERROR")
 
@@ -454,7 +500,7 @@ class MyTraderCallback(XtQuantTraderCallback):
         try:
             msg = f"账户状态变动 - 账户: {status.account_id} | 状态: {status.status}"
             self.gui.log_message(msg, "INFO")
-            logger.info(datetime.datetime.now(), sys._getframe().f_code.co_name)
+            logger.info("账户状态变动 %s %s", status.account_id, status.status)
         except Exception as e:
             self.gui.log_message(f"处理账户状态变动时出错: {str(e)}", "ERROR")
 
@@ -520,11 +566,21 @@ class KhQuantFramework:
         self.trader = None  # 交易API实例
         self.strategy_module = None  # 策略模块
         self.trade_mgr = KhTradeManager(self.config)  # 交易管理器
-        self.risk_mgr = KhRiskManager(self.config)  # 风险管理器
+        self.risk_mgr = KhRiskManager(self.config, self.trade_mgr)  # 风险管理器
         self.tools = KhQuTools()  # 工具类
         self.backtest_records = {}  # 回测记录
         self.daily_price_cache = {}  # 日线价格缓存，用于存储所有股票的日线数据
-        self._cached_benchmark_close = {}  # 基准指数收盘价缓存
+        self.daily_price_matrix = None  # 回测区间内股票池的日线收盘价矩阵
+        self.benchmark_series = None  # 基准指数日线收盘价
+        self._benchmark_day_closes = None  # 按回测交易日对齐的基准收盘价 (交易日数, 基准数)
+        
+        # 回测使用的行情数据接口，参数优化时替换为共享的行情快照（见 khSnapshot）
+        self.data_source = xtdata
+        # 回测结果根目录与最近一次回测的结果目录
+        self.results_root = "backtest_results"
+        self.backtest_dir = None
+        # 结构化事件输出（进度、成交等，见 khBacktest.JsonLinesSink），为None时不构造事件
+        self.event_sink = None
         
         # T+0交易模式标识（默认关闭，在run()中根据股票池判断）
         self.t0_mode = False
@@ -558,7 +614,7 @@ class KhQuantFramework:
         
         # 初始化各个模块
         self.trade_mgr = KhTradeManager(self.config)
-        self.risk_mgr = KhRiskManager(self.config) 
+        self.risk_mgr = KhRiskManager(self.config, self.trade_mgr)
         self.tools = KhQuTools()
         
         # 初始化QMT客户端路径，优先使用system.userdata_path
@@ -576,16 +632,30 @@ class KhQuantFramework:
         # 初始化交易管理器
         self.trade_mgr = KhTradeManager(self.config, self)
         
-        # 清除可能存在的历史数据缓存，确保每次运行都是干净的状态
-        if hasattr(self, 'historical_data_ref'):
-            delattr(self, 'historical_data_ref')
-        if hasattr(self, 'time_field_cache'):
-            delattr(self, 'time_field_cache')
-        if hasattr(self, 'time_idx_cache'):
-            delattr(self, 'time_idx_cache')
+        # 列式行情存储与时间信息表，回测开始时构建
+        self.bar_store = None
+        self.time_table = None
+        self.current_bar_index = -1
+        
+        # 数组化交易日历及每个时间点的交易日标记
+        self.trade_calendar = get_trading_calendar()
+        self.trade_day_mask = None
+        
+        # 回测历史数据缓存，供策略中的 khHistory / khMA 直接使用
+        self.history_cache = None
         
-        # 初始化风控管理器
-        self.risk_mgr = KhRiskManager(self.config)
+        # 最近一次回测主循环各环节的累计耗时（秒）
+        self.time_stats = {}
+        
+        # 持仓账本槽位到列式存储列下标的映射缓存
+        self._slot_columns = None
+
+        # 实时行情分发器（首次收到行情时创建）与缓存的股票池
+        self.quote_dispatcher = None
+        self._live_stock_list = None
+        
+        # 初始化风控管理器（订阅交易管理器的成交事件）
+        self.risk_mgr = KhRiskManager(self.config, self.trade_mgr)
 
         # ===== 实时交易和提醒模块初始化 =====
         self.alert_mgr = None  # 提醒管理器
@@ -622,7 +692,14 @@ class KhQuantFramework:
             self.trader_callback.gui.log_message(message, level)
         else:
             # 在调试模式下，trader_callback可能不存在，使用print输出
-            logger.info(f"[{level}] {datetime.datetime.now()} - {message}")
+            logger.info("[%s] %s", level, message)
+
+    def _emit_event(self, event: str, **fields):
+        """向事件输出发送一条结构化事件，未设置 event_sink 时直接返回"""
+        if self.event_sink is None:
+            return
+        fields['event'] = event
+        self.event_sink.emit(fields)
 
     def _should_log(self):
         """检查是否应该输出日志（用于性能优化）
@@ -737,14 +814,12 @@ class KhQuantFramework:
             self.config.account_type
         )
         
-        # 获取基准合约并转换格式
+        # 获取基准合约并转换格式，可用逗号分隔同时设置多个基准（第一个为主基准）
         original_benchmark = self.config.config_dict["backtest"].get("benchmark", "sh.000300")
-        if original_benchmark == "sh.000300":
-            self.benchmark = "000300.SH"
-        else:
-            self.benchmark = original_benchmark
+        self.benchmark_codes = parse_benchmark_codes(original_benchmark) or ["000300.SH"]
+        self.benchmark = self.benchmark_codes[0]
         
-        # 更新配置字典中的基准指数代码
+        # 更新配置字典中的基准指数代码（主基准）
         self.config.config_dict["backtest"]["benchmark"] = self.benchmark
         
         # 从回测配置中获取初始资金
@@ -762,7 +837,7 @@ class KhQuantFramework:
         }
         
         # 初始化持仓字典
-        self.trade_mgr.positions = {}  # 初始持仓为空
+        self.trade_mgr.positions = PortfolioLedger()  # 初始持仓为空
         
         # 初始化委托字典
         self.trade_mgr.orders = {}  # 初始委托为空
@@ -770,6 +845,9 @@ class KhQuantFramework:
         # 初始化成交字典
         self.trade_mgr.trades = {}  # 初始成交为空
         
+        # 风控状态以新账户为起点
+        self.risk_mgr.sync(reset_peak=True)
+        
         logger.info(f"虚拟账户初始化完成: {self.config.account_id}")
         logger.info(f"初始资产: {self.trade_mgr.assets}")
         logger.info(f"基准合约: {self.benchmark}")
@@ -827,171 +905,188 @@ class KhQuantFramework:
 
             
     def on_quote_callback(self, data: Dict):
-        """行情数据回调处理"""
+        """行情数据回调处理
+
+        启用实时分发时（realtime.async_dispatch，默认开启）回调线程只把行情合并到常驻快照并入队，
+        策略在分发器的工作线程中执行；否则在回调线程中同步执行。
+        """
         try:
-            # 提取时间信息
-            timestamp = data.get("timestamp", int(time.time()))
-            # 如果时间戳是字符串，尝试转换为整数
-            if isinstance(timestamp, str):
-                try:
-                    timestamp = int(timestamp)
-                except:
-                    timestamp = int(time.time())
-            
-            # 创建时间信息
-            if timestamp > 1e10:  # 毫秒级时间戳
-                dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-            else:  # 秒级时间戳
-                dt = datetime.datetime.fromtimestamp(timestamp)
-            
-            # 构建时间信息字典
-            time_info = {
-                "timestamp": timestamp,
-                "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "date": dt.strftime("%Y-%m-%d"),
-                "time": dt.strftime("%H:%M:%S")
-            }
-            
-            # 检查是否是交易日
-            if not self.tools.is_trade_day(time_info["date"]):
-                # 如果不是交易日，则跳过策略调用
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"日期 {time_info['date']} 不是交易日，跳过策略执行", "INFO")
+            dispatcher = self._get_quote_dispatcher()
+            if dispatcher is not None:
+                dispatcher.submit(data)
                 return
-            
-            # 创建新的数据字典，包含时间信息
-            data_with_time = {"__current_time__": time_info}
-            
-            # 将其他行情数据添加到data_with_time
-            for key, value in data.items():
-                if key != "__current_time__":
-                    data_with_time[key] = value
-            
-            # 使用触发器判断是否应该触发策略
-            if not self.trigger.should_trigger(timestamp, data_with_time):
-                # 对于K线周期触发，需要特殊处理
-                trigger_type = self.config.config_dict.get("backtest", {}).get("trigger", {}).get("type", "tick")
-                if trigger_type == "1m" or trigger_type == "5m":
-                    # 当前时间
-                    current_time_str = time_info["time"]
-                    dt_time = datetime.datetime.strptime(current_time_str, "%H:%M:%S")
-                    
-                    # 对于1分钟K线，检查是否接近每分钟的结束(57秒以后)
-                    if trigger_type == "1m" and dt_time.second >= 57:
-                        # 允许触发
-                        pass
-                    # 对于5分钟K线，检查是否接近每5分钟的结束(当前分钟为4、9、14...且秒数>=57)
-                    elif trigger_type == "5m" and dt_time.minute % 5 == 4 and dt_time.second >= 57:
-                        # 允许触发
-                        pass
-                    else:
-                        # 不是K线周期结束，不触发
-                        return
-                elif trigger_type == "1d":
-                    # 日K线触发已经在DailyTrigger中处理了逻辑
-                    # 如果触发器返回False，说明不应该触发
-                    return
-                else:
-                    # 触发器返回False，不触发策略
-                    return
-                
-            # 风控检查
-            if not self.risk_mgr.check_risk(data_with_time):
+            data_with_time = dict(data)
+            data_with_time.pop("__current_time__", None)
+            self._handle_quotes(data_with_time, data.get("timestamp"))
+        except Exception as e:
+            self.log_error(f"行情处理异常: {str(e)}")
+            traceback.print_exc()
+
+    def _get_quote_dispatcher(self) -> Optional[QuoteDispatcher]:
+        """获取实时行情分发器，首次调用时按配置创建并启动；未启用异步分发时返回None"""
+        dispatcher = self.quote_dispatcher
+        if dispatcher is not None:
+            return dispatcher if dispatcher.running else None
+        if not getattr(self.config, 'async_dispatch', True) or not self.is_running:
+            return None
+        self.quote_dispatcher = QuoteDispatcher(
+            self._on_quote_dispatch,
+            coalesce_window=getattr(self.config, 'coalesce_ms', 50) / 1000.0,
+            max_queue=getattr(self.config, 'dispatch_queue_size', 1024),
+            name="KhQuoteDispatcher"
+        )
+        self.quote_dispatcher.start()
+        return self.quote_dispatcher
+
+    def _on_quote_dispatch(self, snapshot: Dict, updated: List[str], timestamp, received: float):
+        """分发器工作线程的处理函数
+
+        Args:
+            snapshot: 行情快照副本，{股票代码: 最新行情}
+            updated: 本次合并窗口内有推送的股票代码，以 "__updated__" 字段传给策略，
+                策略可只处理有新行情的股票
+            timestamp: 最新推送的行情时间戳
+            received: 本批行情中最早一条的接收时间（perf_counter）
+        """
+        if not self.is_running:
+            return
+        snapshot["__updated__"] = updated
+        try:
+            self._handle_quotes(snapshot, timestamp)
+        except Exception as e:
+            self.log_error(f"行情处理异常: {str(e)}")
+            traceback.print_exc()
+
+    def _build_time_info(self, timestamp) -> Dict:
+        """根据行情时间戳构建时间信息字典（秒级或毫秒级，缺省为当前时间）"""
+        if timestamp is None:
+            timestamp = int(time.time())
+        elif isinstance(timestamp, str):
+            try:
+                timestamp = int(timestamp)
+            except ValueError:
+                timestamp = int(time.time())
+
+        if timestamp > 1e10:  # 毫秒级时间戳
+            dt = datetime.datetime.fromtimestamp(timestamp / 1000)
+        else:  # 秒级时间戳
+            dt = datetime.datetime.fromtimestamp(timestamp)
+
+        datetime_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+        return {
+            "timestamp": timestamp,
+            "datetime": datetime_str,
+            "date": datetime_str[:10],
+            "time": datetime_str[11:],
+            "__dt__": dt
+        }
+
+    def _handle_quotes(self, data_with_time: Dict, timestamp):
+        """执行一次实时行情的策略调用
+
+        Args:
+            data_with_time: {股票代码: 行情} 字典，函数会在其中加入框架字段后传给策略
+            timestamp: 行情时间戳
+        """
+        time_info = self._build_time_info(timestamp)
+        dt = time_info.pop("__dt__")
+        timestamp = time_info["timestamp"]
+
+        # 检查是否是交易日
+        if not self.tools.is_trade_day(time_info["date"]):
+            # 如果不是交易日，则跳过策略调用
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"日期 {time_info['date']} 不是交易日，跳过策略执行", "INFO")
+            return
+
+        data_with_time["__current_time__"] = time_info
+
+        # 使用触发器判断是否应该触发策略
+        if not self.trigger.should_trigger(timestamp, data_with_time):
+            # 对于K线周期触发，需要特殊处理
+            trigger_type = self.config.config_dict.get("backtest", {}).get("trigger", {}).get("type", "tick")
+            # 对于1分钟K线，检查是否接近每分钟的结束(57秒以后)
+            if trigger_type == "1m" and dt.second >= 57:
+                pass
+            # 对于5分钟K线，检查是否接近每5分钟的结束(当前分钟为4、9、14...且秒数>=57)
+            elif trigger_type == "5m" and dt.minute % 5 == 4 and dt.second >= 57:
+                pass
+            else:
+                # 日K线触发已经在DailyTrigger中处理了逻辑，其他情况触发器返回False即不触发
                 return
-                
-            # 添加当前时间信息到数据字典
-            current_time = datetime.datetime.fromtimestamp(timestamp)
-            time_data = {
-                "__current_time__": {
-                    "timestamp": timestamp,
-                    "datetime": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "date": current_time.strftime("%Y-%m-%d"),
-                    "time": current_time.strftime("%H:%M:%S")
-                }
-            }
-            # 将时间信息合并到数据字典中
-            data_with_time = {**data_with_time, **time_data}
-            
-            # 添加账户和持仓信息到数据字典
-            if hasattr(self, 'trade_mgr') and self.trade_mgr:
-                # 添加账户资产信息
-                account_data = {
-                    "__account__": self.trade_mgr.assets
-                }
-                # 添加持仓信息
-                positions_data = {
-                    "__positions__": self.trade_mgr.positions
-                }
-                # 添加股票池信息
-                stock_list_data = {
-                    "__stock_list__": self.get_stock_list()
-                }
-                # 合并所有信息
-                data_with_time.update(account_data)
-                data_with_time.update(positions_data)
-                data_with_time.update(stock_list_data)
-                
-                # 添加框架实例到数据字典
-                data_with_time["__framework__"] = self
-            
-            # 检查股票数据是否为空
-            stock_data_empty = True
-            empty_stocks = []
-            for key, value in data_with_time.items():
-                # 跳过框架内部字段
-                if key.startswith("__"):
-                    continue
-                # 检查股票数据是否为空
-                if isinstance(value, pd.Series) and not value.empty:
-                    stock_data_empty = False
-                elif isinstance(value, pd.Series) and value.empty:
-                    empty_stocks.append(key)
-                elif not value:  # 处理其他空值情况
+
+        # 风控检查
+        if not self.risk_mgr.check_risk(data_with_time):
+            return
+
+        # 添加账户、持仓、股票池信息和框架实例到数据字典
+        if hasattr(self, 'trade_mgr') and self.trade_mgr:
+            if self._live_stock_list is None:
+                self._live_stock_list = self.get_stock_list()
+            data_with_time["__account__"] = self.trade_mgr.assets
+            data_with_time["__positions__"] = self.trade_mgr.positions
+            data_with_time["__stock_list__"] = self._live_stock_list
+            data_with_time["__framework__"] = self
+
+        # 检查股票数据是否为空
+        stock_data_empty = True
+        empty_stocks = []
+        for key, value in data_with_time.items():
+            # 跳过框架内部字段和时间戳
+            if key.startswith("__") or key == "timestamp":
+                continue
+            if isinstance(value, pd.Series):
+                if value.empty:
                     empty_stocks.append(key)
-            
-            # 如果所有股票数据都为空，记录错误并跳过策略调用
-            if stock_data_empty:
-                current_time_str = data_with_time.get("__current_time__", {}).get("datetime", "未知时间")
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(
-                        f"警告: 时间点 {current_time_str} 的所有股票数据为空，跳过策略调用", 
-                        "WARNING"
-                    )
-                    if empty_stocks:
-                        self.trader_callback.gui.log_message(
-                            f"空数据股票列表: {', '.join(empty_stocks[:10])}" + 
-                            (f" 等{len(empty_stocks)}只股票" if len(empty_stocks) > 10 else ""),
-                            "WARNING"
-                        )
-                return
-            
-            # 如果有部分股票数据为空，记录警告但继续执行
-            if empty_stocks:
-                current_time_str = data_with_time.get("__current_time__", {}).get("datetime", "未知时间")
-                if self.trader_callback:
+                else:
+                    stock_data_empty = False
+            elif not value:  # 处理其他空值情况
+                empty_stocks.append(key)
+            else:
+                stock_data_empty = False
+
+        # 如果所有股票数据都为空，记录错误并跳过策略调用
+        if stock_data_empty:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"警告: 时间点 {time_info['datetime']} 的所有股票数据为空，跳过策略调用",
+                    "WARNING"
+                )
+                if empty_stocks:
                     self.trader_callback.gui.log_message(
-                        f"警告: 时间点 {current_time_str} 有 {len(empty_stocks)} 只股票数据为空: {', '.join(empty_stocks[:5])}" + 
-                        (f" 等" if len(empty_stocks) > 5 else ""),
+                        f"空数据股票列表: {', '.join(empty_stocks[:10])}" +
+                        (f" 等{len(empty_stocks)}只股票" if len(empty_stocks) > 10 else ""),
                         "WARNING"
                     )
-            
-            # 调用策略处理
-            signals = self.strategy_module.khHandlebar(data_with_time)
-            
-            # 处理信号中的价格精度
-            if signals:
-                for signal in signals:
-                    if 'price' in signal:
-                        # 使用动态精度
-                        signal['price'] = round(float(signal['price']), self.price_decimals)
-            
+            return
+
+        # 如果有部分股票数据为空，记录警告但继续执行
+        if empty_stocks:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"警告: 时间点 {time_info['datetime']} 有 {len(empty_stocks)} 只股票数据为空: {', '.join(empty_stocks[:5])}" +
+                    (f" 等" if len(empty_stocks) > 5 else ""),
+                    "WARNING"
+                )
+
+        # 调用策略处理
+        signals = self.strategy_module.khHandlebar(data_with_time)
+
+        # 处理信号中的价格精度
+        if signals:
+            for signal in signals:
+                if 'price' in signal:
+                    # 使用动态精度
+                    signal['price'] = round(float(signal['price']), self.price_decimals)
+
             # 发送交易指令
-            if signals:
-                self.trade_mgr.process_signals(signals)
-                
-        except Exception as e:
-            self.log_error(f"行情处理异常: {str(e)}")
-            traceback.print_exc()
+            self.trade_mgr.process_signals(signals)
+
+    def get_dispatch_stats(self) -> Dict:
+        """实时行情分发统计：队列深度、合并/丢弃次数以及行情到信号的延迟（毫秒）"""
+        if self.quote_dispatcher is None:
+            return {}
+        return self.quote_dispatcher.stats()
             
     def run(self):
         """启动框架"""
@@ -1014,7 +1109,9 @@ class KhQuantFramework:
             
             # 初始化缓存
             self.daily_price_cache = {}
-            self._cached_benchmark_close = {}
+            self.daily_price_matrix = None
+            self.benchmark_series = None
+            self._benchmark_day_closes = None
             
             # 直接从设置界面读取是否初始化数据的配置
             from PyQt5.QtCore import QSettings
@@ -1201,6 +1298,52 @@ class KhQuantFramework:
             
             self.stop()
 
+    def run_headless(self) -> Dict:
+        """不依赖界面和Qt事件循环执行一次回测
+
+        与 run() 的回测流程一致，但不下载行情数据、不启动保活定时器，
+        供参数优化的工作进程和命令行调用。
+
+        Returns:
+            Dict: 回测记录，包含 trades / daily_stats 等
+        """
+        self.start_time = time.time()
+        self.end_time = None
+        try:
+            self.init_trader_and_account()
+            self.daily_price_cache = {}
+            self.daily_price_matrix = None
+            self.benchmark_series = None
+            self._benchmark_day_closes = None
+
+            stock_codes = self.get_stock_list()
+            self.pool_type, self.price_decimals = determine_pool_type(stock_codes)
+            self.trade_mgr.set_price_decimals(self.price_decimals)
+            _, self.t0_mode = check_t0_support(stock_codes)
+            self.trade_mgr.set_t0_mode(self.t0_mode)
+
+            init_data = {
+                "__current_time__": {
+                    "timestamp": int(time.time()),
+                    "datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+                    "time": datetime.datetime.now().strftime("%H:%M:%S")
+                },
+                "__account__": self.trade_mgr.assets,
+                "__positions__": self.trade_mgr.positions,
+                "__stock_list__": stock_codes,
+                "__framework__": self
+            }
+            self.strategy_module.init(stock_codes, init_data)
+
+            self.is_running = True
+            self._run_backtest()
+            return self.backtest_records
+        finally:
+            self.end_time = time.time()
+            self.total_runtime = self.end_time - self.start_time
+            self.stop()
+
     def get_stock_list(self):
         """获取股票列表"""
         stock_codes = []
@@ -1236,29 +1379,20 @@ class KhQuantFramework:
         return stock_codes
 
     def _get_trading_days_optimized(self, start_date, end_date):
-        """优化获取交易日列表 - 使用向量化操作替代循环
+        """优化获取交易日列表 - 基于数组化交易日历的区间查询
 
         Args:
             start_date: 开始日期 (datetime.date)
             end_date: 结束日期 (datetime.date)
 
         Returns:
-            list: 交易日列表
+            list: 交易日列表 (datetime.date)
         """
-        # 生成日期范围
-        date_range = [
-            start_date + datetime.timedelta(days=i)
-            for i in range((end_date - start_date).days + 1)
-        ]
-
-        # 批量判断交易日
-        trading_days = [
-            d for d in date_range
-            if self.tools.is_trade_day(d.strftime("%Y-%m-%d"))
+        return [
+            datetime.date.fromordinal(int(o))
+            for o in self.trade_calendar.range_ordinals(start_date, end_date)
         ]
 
-        return trading_days
-
     def _check_period_consistency(self):
         """检查数据周期和触发周期的一致性"""
         try:
@@ -1407,7 +1541,8 @@ class KhQuantFramework:
                 "path": self.config.userdata_path,
                 "stock_list": stock_codes,
                 "period": getattr(self.config, 'realtime_period', '5m'),
-                "auto_reconnect": getattr(self.config, 'auto_reconnect', True)
+                "auto_reconnect": getattr(self.config, 'auto_reconnect', True),
+                "subscribe_mode": getattr(self.config, 'subscribe_mode', 'auto')
             }
 
             # 创建实时交易引擎
@@ -1490,7 +1625,7 @@ class KhQuantFramework:
                 self._log(f"使用默认目录名: {backtest_dir_name}", "INFO")
 
             # 确保backtest_results基础目录存在
-            base_results_dir = "backtest_results"
+            base_results_dir = self.results_root
             self._log(f"检查基础目录是否存在: {base_results_dir}", "INFO")
             try:
                 if not os.path.exists(base_results_dir):
@@ -1576,181 +1711,122 @@ class KhQuantFramework:
                 error_msg = f"创建回测结果目录时失败: {str(e)}"
                 self._log(error_msg, "ERROR")
                 raise Exception(error_msg)
+            self.backtest_dir = backtest_dir
 
-            benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
-
-            if not os.path.exists(benchmark_file):
+            # 一次请求全部基准指数的日线收盘价，回测中按交易日下标取值
+            benchmark_codes = getattr(self, 'benchmark_codes', None) or [benchmark_code]
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"开始获取基准指数 {','.join(benchmark_codes)} 的每日数据", "INFO")
+            try:
+                # 结果文件在回测结束后统一写出，这里只加载
+                self.benchmark_series = BenchmarkSeries.load(
+                    self.data_source, benchmark_codes, self.config.backtest_start, self.config.backtest_end
+                )
                 if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"开始获取基准指数 {benchmark_code} 的每日数据", "INFO")
-                
-                try:
-                    # 先下载数据
-                    xtdata.download_history_data(
-                        stock_code=benchmark_code,
-                        period="1d",
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    benchmark_data = xtdata.get_market_data_ex(
-                        field_list=['time', 'close'],
-                        stock_list=[benchmark_code],
-                        period='1d',
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
+                    self.trader_callback.gui.log_message(
+                        f"基准指数数据加载完成, 共 {len(self.benchmark_series)} 个交易日",
+                        "INFO"
                     )
-                    
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"获取到的数据结构: {benchmark_data.keys()}", 
-                            "INFO"
-                        )
-                        if benchmark_code in benchmark_data:
-                            self.trader_callback.gui.log_message(
-                                f"数据字段: {benchmark_data[benchmark_code].columns.tolist()}", 
-                                "INFO"
-                            )
-                    
-                    if benchmark_data and benchmark_code in benchmark_data:
-                        df = benchmark_data[benchmark_code]
-                        
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(
-                                f"基准数据形状: {df.shape}",
-                                "INFO"
-                            )
-                        
-                        # 确保有时间和收盘价列
-                        if 'time' in df.columns and 'close' in df.columns:
-                            # 转换时间戳为日期
-                            try:
-                                df['date'] = pd.to_datetime(df['time'], unit='ms')
-                            except:
-                                # 如果转换失败，尝试其他单位
-                                try:
-                                    df['date'] = pd.to_datetime(df['time'], unit='s')
-                                except:
-                                    try:
-                                        df['date'] = pd.to_datetime(df['time'])
-                                    except Exception as e:
-                                        if self.trader_callback:
-                                            self.trader_callback.gui.log_message(f"时间戳转换失败: {str(e)}", "ERROR")
-                            
-                            # 选择需要的列并保存
-                            if 'date' in df.columns:
-                                result_df = df[['date', 'close']].copy()
-                                
-                                if len(result_df) > 0:
-                                    # 确保保存目录存在
-                                    os.makedirs(os.path.dirname(benchmark_file), exist_ok=True)
-                                    result_df.to_csv(benchmark_file, index=False)
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"基准指数数据已保存到 {benchmark_file}, 共 {len(result_df)} 条记录",
-                                            "INFO"
-                                        )
-                                        
-                                    # 预先缓存所有基准指数数据，提高性能
-                                    for _, row in result_df.iterrows():
-                                        date_str = row['date'].strftime('%Y%m%d')
-                                        cache_key = f"benchmark_{date_str}_{benchmark_code}"
-                                        self._cached_benchmark_close[cache_key] = row['close']
-                                    
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"已预缓存 {len(self._cached_benchmark_close)} 条基准指数数据",
-                                            "INFO"
-                                        )
-                except Exception as e:
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"获取和保存基准指数数据失败: {str(e)}", "ERROR")
-                    logging.error(f"获取和保存基准指数数据失败: {str(e)}", exc_info=True)
+            except Exception as e:
+                self.benchmark_series = None
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(f"获取基准指数数据失败: {str(e)}", "ERROR")
+                logging.error(f"获取基准指数数据失败: {str(e)}", exc_info=True)
             
             # 获取数据周期
             data_period = self.trigger.get_data_period()
             
-            # 一次性加载所有股票的历史数据
-            historical_data = {}
-            for code in stock_codes:
-                if not self.is_running:
-                    break
-                    
-                # 确保field_list中包含time和close字段
-                field_list = self.config.config_dict["data"]["fields"]
-                if "time" not in field_list:
-                    field_list = ["time"] + field_list
-                if "close" not in field_list:
-                    field_list.append("close")
-                    
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"加载{code}的历史数据...", "INFO")
-                    
-                # 根据触发器的数据周期加载对应的历史数据
-                period = data_period
-                
-                # 对于自定义定时触发，需要特殊处理数据周期
-                if isinstance(self.trigger, CustomTimeTrigger):
-                    # 检查所有触发时间点是否都是整分钟（秒数为0）
-                    all_whole_minutes = True
-                    for seconds in self.trigger.trigger_seconds:
-                        # 计算秒数部分
-                        seconds_part = seconds % 60
-                        if seconds_part != 0:
-                            all_whole_minutes = False
-                            break
-                    
-                    if all_whole_minutes:
-                        # 如果所有时间点都是整分钟，使用1m数据
-                        period = "1m"
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
-                    else:
-                        # 如果有不是整分钟的时间点，使用tick数据
-                        period = "tick"
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
-                
-                # 对于其他触发器类型，直接使用触发器返回的数据周期
+            # 确保field_list中包含time和close字段
+            field_list = list(self.config.config_dict["data"]["fields"])
+            if "time" not in field_list:
+                field_list = ["time"] + field_list
+            if "close" not in field_list:
+                field_list.append("close")
+            
+            # 根据触发器的数据周期加载对应的历史数据
+            period = data_period
+            
+            # 对于自定义定时触发，需要特殊处理数据周期
+            if isinstance(self.trigger, CustomTimeTrigger):
+                # 检查所有触发时间点是否都是整分钟（秒数为0）
+                all_whole_minutes = True
+                for seconds in self.trigger.trigger_seconds:
+                    # 计算秒数部分
+                    seconds_part = seconds % 60
+                    if seconds_part != 0:
+                        all_whole_minutes = False
+                        break
+                
+                if all_whole_minutes:
+                    # 如果所有时间点都是整分钟，使用1m数据
+                    period = "1m"
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
+                else:
+                    # 如果有不是整分钟的时间点，使用tick数据
+                    period = "tick"
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
+            
+            # 对于其他触发器类型，直接使用触发器返回的数据周期
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"使用{period}数据周期进行回测", "INFO")
+            
+            # 一次性加载所有股票的历史数据（分批请求，多线程并发）
+            load_start = time.time()
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"开始加载{len(stock_codes)}只股票的历史数据"
+                    f"（每批{self.config.load_chunk_size}只，并发{self.config.load_workers}）...",
+                    "INFO"
+                )
+            
+            def on_load_progress(done, total):
                 if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"使用{period}数据周期进行回测", "INFO")
-                
-                data = xtdata.get_market_data_ex(
-                    field_list=field_list,
-                    stock_list=[code],
-                    period=period,
-                    start_time=self.config.backtest_start,
-                    end_time=self.config.backtest_end,
-                    dividend_type=self.config.config_dict["data"]["dividend_type"],
-                    fill_data=True
+                    self.trader_callback.gui.log_message(f"历史数据加载进度: {done}/{total}", "INFO")
+            
+            loader = BacktestDataLoader(
+                self.data_source,
+                chunk_size=self.config.load_chunk_size,
+                max_workers=self.config.load_workers,
+                progress_callback=on_load_progress,
+                should_stop=lambda: not self.is_running
+            )
+            data = loader.load(
+                stock_codes,
+                field_list,
+                period,
+                self.config.backtest_start,
+                self.config.backtest_end,
+                dividend_type=self.config.config_dict["data"]["dividend_type"],
+                fill_data=True
+            )
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"历史数据加载完成: {len(data)}/{len(stock_codes)}只股票，耗时{time.time() - load_start:.2f}秒",
+                    "INFO"
                 )
+                if loader.failed_codes:
+                    self.trader_callback.gui.log_message(
+                        f"以下股票数据加载失败: {', '.join(loader.failed_codes[:10])}"
+                        + (f" 等{len(loader.failed_codes)}只股票" if len(loader.failed_codes) > 10 else ""),
+                        "WARNING"
+                    )
+            
+            historical_data = {}
+            for code in stock_codes:
                 if data and code in data:
                     # 判断是否为自定义时间触发
                     if isinstance(self.trigger, CustomTimeTrigger):
                         # 对于自定义时间触发，只保留触发时间点附近的数据
                         df = data[code]
                         if 'time' in df.columns:
-                            # 获取所有时间戳
-                            all_timestamps = df['time'].values
-                            # 转换为秒级时间戳进行比较
-                            filtered_rows = []
-                            
-                            for ts in all_timestamps:
-                                # 转换时间戳为秒级
-                                ts_seconds = float(ts) / 1000 if float(ts) > 1e10 else float(ts)
-                                ts_dt = datetime.datetime.fromtimestamp(ts_seconds)
-                                
-                                # 计算当前时间点的秒数（从午夜开始）
-                                current_seconds = ts_dt.hour * 3600 + ts_dt.minute * 60 + ts_dt.second
-                                
-                                # 检查是否接近任一触发时间点（允许1秒误差）
-                                for trigger_second in self.trigger.trigger_seconds:
-                                    if abs(current_seconds - trigger_second) <= 1:
-                                        filtered_rows.append(ts)
-                                        break
+                            # 向量化计算每行的当日秒数，并与有序触发时间数组匹配（允许1秒误差）
+                            mask = self.trigger.match_timestamps(to_epoch_ms(df['time'].values), tolerance=1)
                             
                             # 只保留触发时间点附近的数据
-                            if filtered_rows:
-                                filtered_df = df[df['time'].isin(filtered_rows)]
+                            if mask.any():
+                                filtered_df = df[mask]
                                 historical_data[code] = filtered_df
                                 if self.trader_callback:
                                     self.trader_callback.gui.log_message(
@@ -1797,70 +1873,32 @@ class KhQuantFramework:
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"回测期间共有{len(trading_days)}个交易日", "INFO")
                 
-                # 为每个交易日生成自定义触发时间点
-                for day in trading_days:
-                    for seconds in self.trigger.trigger_seconds:
-                        # 将秒数转换为时分秒
-                        h = seconds // 3600
-                        m = (seconds % 3600) // 60
-                        s = seconds % 60
-                        
-                        # 创建完整的datetime对象
-                        dt = datetime.datetime.combine(day, datetime.time(h, m, s))
-                        
-                        # 转换为时间戳（秒级）
-                        timestamp = int(dt.timestamp())
-                        all_times.append(timestamp)
+                # 为每个交易日生成自定义触发时间点（毫秒级，与行情数据的时间精度保持一致）
+                all_times = self.trigger.build_timeline(trading_days)
                 
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"自定义时间触发模式：生成了{len(all_times)}个时间点", "INFO")
-            else:
-                # 非自定义时间触发模式，使用原来的方式获取时间点
-                for code, df in historical_data.items():
+            
+            # 检查缺少时间字段的股票（这些股票不会参与回测）
+            for code, df in historical_data.items():
+                if find_time_field(df) is None and not isinstance(df.index, pd.DatetimeIndex):
                     if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"处理{code}的数据...", "INFO")
-                    
-                    # 检查数据结构
-                    if isinstance(df, pd.DataFrame):
-                        # DataFrame结构处理
-                        if 'time' in df.columns:
-                            times = df['time'].values
-                            all_times.extend(times)
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"从{code}的DataFrame中提取了{len(times)}个时间点", "INFO")
-                        else:
-                            # 尝试使用其他可能的时间字段
-                            time_field = None
-                            for field in ['timestamp', 'date', 'datetime']:
-                                if field in df.columns:
-                                    time_field = field
-                                    break
-                            
-                            if time_field is None:
-                                # 如果没有找到任何时间字段，尝试使用索引
-                                if isinstance(df.index, pd.DatetimeIndex):
-                                    times = df.index.astype(np.int64) // 10**9  # 转换为秒级时间戳
-                                    all_times.extend(times)
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(f"从{code}的DataFrame索引中提取了{len(times)}个时间点", "INFO")
-                                else:
-                                    # 如果没有找到任何时间字段，跳过这个股票
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(f"错误: {code}的数据中没有找到任何时间字段，跳过该股票", "ERROR")
-                                    continue
-                            else:
-                                times = df[time_field].values
-                                all_times.extend(times)
-                                if self.trader_callback:
-                                    self.trader_callback.gui.log_message(f"从{code}的DataFrame的{time_field}字段中提取了{len(times)}个时间点", "INFO")
-                    else:
-                        # 处理其他可能的数据结构
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"警告: {code}的数据不是DataFrame格式，跳过该股票", "WARNING")
-                        continue
+                        self.trader_callback.gui.log_message(f"错误: {code}的数据中没有找到任何时间字段，跳过该股票", "ERROR")
             
-            # 去重并排序
-            all_times = sorted(list(set(all_times)))
+            # 构建列式行情存储：统一为毫秒级时间戳后对齐时间轴（每次回测重新构建）
+            if self.trader_callback:
+                self.trader_callback.gui.log_message("正在构建列式数据存储...", "INFO")
+            self.bar_store = BarStore.from_frames(
+                historical_data,
+                all_times if isinstance(self.trigger, CustomTimeTrigger) else None
+            )
+            all_times = self.bar_store.times
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"数据存储构建完成: {self.bar_store.n_stocks}只股票 x {self.bar_store.n_times}个时间点, "
+                    f"字段: {self.bar_store.fields}",
+                    "INFO"
+                )
             
             if len(all_times) == 0:
                 if self.trader_callback:
@@ -1874,6 +1912,45 @@ class KhQuantFramework:
             
             # 保存所有时间点到实例变量，供record_results使用
             self.all_times = all_times
+            # 预先计算所有时间点的日期/时间字符串、日期序数和日内最后时间点标记
+            self.time_table = TimeInfoTable(all_times)
+            # 按日期序数批量查表，得到每个时间点是否为交易日
+            self.trade_day_mask = self.trade_calendar.is_trade_day(self.time_table.day_ordinals)
+            # 基准收盘价按时间轴的交易日对齐，行下标即 time_table.day_index
+            if self.benchmark_series is not None:
+                self._benchmark_day_closes = self.benchmark_series.align(
+                    ordinals_to_date_nums(self.time_table.unique_days)
+                )
+            
+            # 激活回测历史数据缓存：自定义定时触发的存储只保留触发时间点，不能作为历史序列复用
+            self.history_cache = BacktestHistoryCache(
+                self.data_source,
+                self.config.backtest_start,
+                self.config.backtest_end,
+                bar_store=None if isinstance(self.trigger, CustomTimeTrigger) else self.bar_store,
+                store_period=period,
+                store_dividend_type=self.config.config_dict["data"]["dividend_type"]
+            )
+            activate_history_cache(self.history_cache)
+            
+            # 一次性加载股票池在回测区间内的日线收盘价，供每日收盘统计估值使用
+            try:
+                self.daily_price_matrix = DailyPriceMatrix.load(
+                    self.data_source,
+                    stock_codes,
+                    self.config.backtest_start,
+                    self.config.backtest_end,
+                    dividend_type=self.config.config_dict["data"].get("dividend_type", "none")
+                )
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"日线收盘价矩阵加载完成: {len(self.daily_price_matrix.dates)}个交易日 x "
+                        f"{len(self.daily_price_matrix.codes)}只股票",
+                        "INFO"
+                    )
+            except Exception as e:
+                self.daily_price_matrix = None
+                logging.error(f"加载日线收盘价矩阵失败，将逐日获取: {e}")
             
             total_times = len(all_times)
             processed_times = 0
@@ -1885,6 +1962,16 @@ class KhQuantFramework:
                 # 如果时间点太少，则每处理一个点都显示一次进度
                 progress_increment = 1
                 
+            self._emit_event(
+                'start',
+                start_time=self.config.backtest_start,
+                end_time=self.config.backtest_end,
+                period=period,
+                stock_count=len(stock_codes),
+                total_bars=total_times,
+                backtest_dir=backtest_dir
+            )
+            
             # 显示开始进度
             if self.trader_callback:
                 self.trader_callback.gui.log_message("回测进度: 0.00%", "INFO")
@@ -1893,38 +1980,6 @@ class KhQuantFramework:
                 # 注意：不要在子线程中调用 QApplication.processEvents()
                 # 这会导致GUI线程阻塞和潜在的线程安全问题
             
-            # 预先构建数据缓存（避免在循环中重复构建）
-            if not hasattr(self, 'historical_data_ref'):
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message("首次运行，正在构建数据缓存...", "INFO")
-                
-                # 创建包含原始DataFrame引用的字典
-                self.historical_data_ref = {}
-                
-                # 创建时间字段到索引的映射，用于快速查找
-                self.time_field_cache = {}
-                self.time_idx_cache = {}
-                
-                # 创建基于当前时间点的数据引用
-                for code, df in historical_data.items():
-                    # 找到时间字段
-                    for field in ['time', 'timestamp', 'date', 'datetime']:
-                        if field in df.columns:
-                            self.time_field_cache[code] = field
-                            # 保存原始DataFrame引用
-                            self.historical_data_ref[code] = df
-                            
-                            # 预先创建时间值到索引的映射（只计算一次）
-                            time_values = df[field].values
-                            time_idx_map = {}
-                            for i, tv in enumerate(time_values):
-                                time_idx_map[tv] = i
-                            self.time_idx_cache[code] = time_idx_map
-                            break
-                
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message("数据缓存构建完成", "INFO")
-            
             # 按时间顺序模拟
             current_date = None
             day_start_time = None
@@ -1948,25 +2003,12 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message("警告: 策略模块未实现 khPostMarket 方法，盘后回调将不会执行", "WARNING")
             
             # 获取唯一的交易日列表
-            trading_days = set()
-            for time_point in all_times:
-                try:
-                    timestamp = int(time_point)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                    trading_days.add(dt.strftime("%Y-%m-%d"))
-                except:
-                    pass
-            
-            trading_days = sorted(list(trading_days))
+            trading_days = self.time_table.trading_dates
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"回测期间共有 {len(trading_days)} 个交易日", "INFO")
             
-            # 初始化时间统计变量
-            time_stats = {
+            # 初始化时间统计变量（同时保存在 self.time_stats 中，供基准测试等外部读取）
+            time_stats = self.time_stats = {
                 "构造数据": 0,
                 "构造时间信息": 0,
                 "检查新日期": 0,
@@ -1981,8 +2023,20 @@ class KhQuantFramework:
                 "总时间": 0
             }
             
-            for current_time in all_times:
+            # 数据为空的K线可能连续出现，按K线数汇总告警，不再逐根输出
+            empty_all_log = RateLimitedLog(
+                lambda msg: self._log(msg, "WARNING"),
+                "警告: 最近 {periods} 根K线中有 {events} 根所有股票数据为空，已跳过策略调用，如: {samples}",
+                every=EMPTY_DATA_LOG_BARS)
+            empty_some_log = RateLimitedLog(
+                lambda msg: self._log(msg, "WARNING"),
+                "警告: 最近 {periods} 根K线中有 {events} 根存在数据为空的股票（共 {count} 只次），涉及: {samples}",
+                every=EMPTY_DATA_LOG_BARS, max_samples=10)
+            
+            for bar_index, current_time in enumerate(all_times.tolist()):
                 loop_start_time = time.time()
+                empty_all_log.tick()
+                empty_some_log.tick()
                 
                 if not self.is_running:
                     if self.trader_callback:
@@ -2007,78 +2061,25 @@ class KhQuantFramework:
                     # 只在需要输出日志时才记录进度文本
                     if self._should_log():
                         self.trader_callback.gui.log_message(f"回测进度: {progress:.2f}%", "INFO")
+                if should_show_progress and self.event_sink is not None:
+                    self._emit_event('progress', bar=processed_times, total_bars=total_times,
+                                     percent=round(processed_times / total_times * 100, 2),
+                                     datetime=self.time_table.datetime_strs[bar_index])
+                
+                # 构造时间信息（直接读取预先计算的时间信息表）
+                time_info_start = time.time()
+                self.current_bar_index = bar_index
+                time_info = self.time_table.info(bar_index)
+                time_stats["构造时间信息"] += time.time() - time_info_start
                 
                 # 进一步优化的构造数据代码
                 data_start_time = time.time()
                 
-                # 创建包含__current_time__的字典结构
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                        
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
                 # 创建当前时间点的数据视图
                 current_data = {"__current_time__": time_info}
                 
-                # 直接添加数据引用，而不是转换为字典
-                for code in self.historical_data_ref:
-                    if code in self.time_field_cache and code in self.time_idx_cache:
-                        time_field = self.time_field_cache[code]
-                        time_idx_map = self.time_idx_cache[code]
-                        df = self.historical_data_ref[code]
-                        
-                        # 尝试直接匹配当前时间
-                        if current_time in time_idx_map:
-                            idx = time_idx_map[current_time]
-                            # 直接存储行引用，而不是转换为字典
-                            current_data[code] = df.iloc[idx]
-                        else:
-                            # 尝试处理精度不一致问题
-                            matched = False
-                            idx = -1
-                            
-                            if isinstance(current_time, (int, float)):
-                                # 处理毫秒/秒的转换
-                                if current_time > 1e10:  # 毫秒级
-                                    sec_time = current_time // 1000
-                                    if sec_time in time_idx_map:
-                                        idx = time_idx_map[sec_time]
-                                        matched = True
-                                else:  # 秒级
-                                    ms_time = current_time * 1000
-                                    if ms_time in time_idx_map:
-                                        idx = time_idx_map[ms_time]
-                                        matched = True
-                            
-                            if matched:
-                                # 直接存储行引用
-                                current_data[code] = df.iloc[idx]
-                            else:
-                                # 没有匹配的数据，存储空Series
-                                current_data[code] = pd.Series({})
-                    else:
-                        # 没有时间字段的情况
-                        current_data[code] = pd.Series({})
+                # 从列式存储获取各股票的行视图（不复制数据）
+                current_data.update(self.bar_store.row(bar_index))
                 
                 time_stats["构造数据"] += time.time() - data_start_time
                 
@@ -2104,38 +2105,6 @@ class KhQuantFramework:
                         if sample_str:
                             self.trader_callback.gui.log_message(f"部分字段值: {sample_str[:-2]}", "INFO")
                 
-                # 构造时间信息
-                time_info_start = time.time()
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                        
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
-                # 添加当前时间信息到数据中
-                # 添加时间信息到数据中
-                current_data["__current_time__"] = time_info
-                time_stats["构造时间信息"] += time.time() - time_info_start
-                
                 # 添加账户和持仓信息到数据字典
                 account_data = {
                     "__account__": self.trade_mgr.assets
@@ -2161,8 +2130,7 @@ class KhQuantFramework:
                     if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
                         # 执行盘后回调
                         try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘后回调 - 日期: {current_date}", "INFO")
+                            logger.debug("执行盘后回调 - 日期: %s", current_date)
                             
                             # 设置时间信息为盘后时间
                             post_time_info = time_info.copy()
@@ -2205,17 +2173,17 @@ class KhQuantFramework:
 
                     # T+1模式下，新交易日将 can_use_volume 更新为 volume
                     if not self.trade_mgr.t0_mode:
-                        for code, pos in self.trade_mgr.positions.items():
-                            if pos.get("volume", 0) > 0:
-                                pos["can_use_volume"] = pos["volume"]
+                        self.trade_mgr.positions.release_t1()
+
+                    # 新交易日重置风控的日委托计数和日内峰值
+                    self.risk_mgr.reset_daily_counters()
 
                     # 检查是否需要执行盘前回调
                     pre_market_start = time.time()
                     if pre_market_enabled and hasattr(self.strategy_module, 'khPreMarket'):
                         # 执行盘前回调
                         try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘前回调 - 日期: {current_date}", "INFO")
+                            logger.debug("执行盘前回调 - 日期: %s", current_date)
                             
                             # 设置时间信息为盘前时间
                             pre_time_info = time_info.copy()
@@ -2270,54 +2238,25 @@ class KhQuantFramework:
                 time_stats["风控检查"] += time.time() - risk_start
                 
                 # 检查是否是交易日
-                current_date_str = current_data.get("__current_time__", {}).get("date", "")
-                if current_date_str and not self.tools.is_trade_day(current_date_str):
+                if not self.trade_day_mask[bar_index]:
                     # 如果不是交易日，跳过策略调用
                     continue
                 
                 # 添加框架实例到数据字典
                 current_data["__framework__"] = self
                 
-                # 检查股票数据是否为空
-                stock_data_empty = True
-                empty_stocks = []
-                for key, value in current_data.items():
-                    # 跳过框架内部字段
-                    if key.startswith("__"):
-                        continue
-                    # 检查股票数据是否为空
-                    if isinstance(value, pd.Series) and not value.empty:
-                        stock_data_empty = False
-                    elif isinstance(value, pd.Series) and value.empty:
-                        empty_stocks.append(key)
-                    elif not value:  # 处理其他空值情况
-                        empty_stocks.append(key)
+                # 检查股票数据是否为空（基于存储的有效性掩码）
+                stock_data_empty = not self.bar_store.has_any(bar_index)
+                empty_stocks = self.bar_store.empty_codes(bar_index)
                 
-                # 如果所有股票数据都为空，记录错误并跳过策略调用
+                # 如果所有股票数据都为空，记录告警并跳过策略调用
                 if stock_data_empty:
-                    current_time_str = current_data.get("__current_time__", {}).get("datetime", str(current_time))
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"警告: 时间点 {current_time_str} 的所有股票数据为空，跳过策略调用", 
-                            "WARNING"
-                        )
-                        if empty_stocks:
-                            self.trader_callback.gui.log_message(
-                                f"空数据股票列表: {', '.join(empty_stocks[:10])}" + 
-                                (f" 等{len(empty_stocks)}只股票" if len(empty_stocks) > 10 else ""),
-                                "WARNING"
-                            )
+                    empty_all_log.add(len(empty_stocks), (self.time_table.datetime_strs[bar_index],))
                     continue
                 
-                # 如果有部分股票数据为空，记录警告但继续执行
+                # 如果有部分股票数据为空，记录告警但继续执行
                 if empty_stocks:
-                    current_time_str = current_data.get("__current_time__", {}).get("datetime", str(current_time))
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"警告: 时间点 {current_time_str} 有 {len(empty_stocks)} 只股票数据为空: {', '.join(empty_stocks[:5])}" + 
-                            (f" 等" if len(empty_stocks) > 5 else ""),
-                            "WARNING"
-                        )
+                    empty_some_log.add(len(empty_stocks), empty_stocks)
                 
                 # 调用策略处理
                 strategy_start = time.time()
@@ -2349,6 +2288,11 @@ class KhQuantFramework:
                 # 累计总时间
                 time_stats["总时间"] += time.time() - loop_start_time
             
+            # 输出尚未汇总的告警
+            empty_all_log.flush()
+            empty_some_log.flush()
+            self.risk_mgr.flush_logs()
+            
             # 输出时间统计信息
             if self.trader_callback:
                 total_time = time_stats["总时间"]
@@ -2438,7 +2382,7 @@ class KhQuantFramework:
                 
                 # 创建当前回测的子目录（包含策略名）
                 backtest_dir = os.path.join(
-                    "backtest_results",
+                    self.results_root,
                     backtest_dir_name
                 )
 
@@ -2521,81 +2465,27 @@ class KhQuantFramework:
                 except Exception as e:
                     logging.warning(f"保存回测汇总指标时出错: {str(e)}")
 
-                # 保存基准指数数据
-                benchmark_code = self.config.config_dict["backtest"]["benchmark"]
+                # 保存基准指数数据（回测开始时已加载，失败时重新获取）
                 try:
-                    # 先下载数据确保可用
-                    xtdata.download_history_data(
-                        stock_code=benchmark_code,
-                        period="1d",
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    benchmark_data = xtdata.get_market_data(
-                        field_list=['close'],
-                        stock_list=[benchmark_code],
-                        period='1d',
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"基准数据获取结果: {benchmark_data.keys()}", 
-                            "INFO"
+                    if self.benchmark_series is None:
+                        self.benchmark_series = BenchmarkSeries.load(
+                            self.data_source,
+                            getattr(self, 'benchmark_codes', None) or [self.config.config_dict["backtest"]["benchmark"]],
+                            self.config.backtest_start,
+                            self.config.backtest_end
                         )
-
-                    if benchmark_data and 'close' in benchmark_data and len(benchmark_data['close']) > 0:
-                        closes = benchmark_data['close'].values[0]  # 获取收盘价数据
-                        if len(closes) > 0:
-                            # 直接从benchmark_data中获取日期数据
-                            # 获取交易日期索引
-                            if 'date' in benchmark_data:
-                                dates = benchmark_data['date'][0]  # 使用benchmark_data中的日期
-                            elif hasattr(benchmark_data, 'index') and benchmark_data.index is not None and not isinstance(benchmark_data.index, pd.RangeIndex):
-                                dates = benchmark_data.index  # 有些情况下日期可能在索引中
-                            elif hasattr(benchmark_data['close'], 'columns') and len(benchmark_data['close'].columns) > 0:
-                                # 从columns中获取日期（日期作为列名出现的情况）
-                                date_cols = [col for col in benchmark_data['close'].columns if str(col).isdigit()]
-                                if date_cols:
-                                    # 将列名转换为日期对象
-                                    dates = pd.to_datetime(date_cols, format='%Y%m%d')
-                                    # 确保closes的顺序与dates匹配
-                                    closes = np.array([benchmark_data['close'].iloc[0][col] for col in date_cols])
-                                else:
-                                    # 如果没有日期数据，才使用日期范围（不推荐）
-                                    self.trader_callback.gui.log_message(
-                                        "警告：基准数据中没有日期信息，将使用日期范围替代，可能不准确",
-                                        "WARNING"
-                                    )
-                                    dates = pd.date_range(
-                                        start=pd.to_datetime(self.config.backtest_start, format='%Y%m%d'),
-                                        end=pd.to_datetime(self.config.backtest_end, format='%Y%m%d'),
-                                        freq='B'  # 使用工作日频率
-                                    )
-                                
-                                # 创建包含日期和收盘价的DataFrame
-                                df = pd.DataFrame({
-                                    'date': dates,
-                                    'close': closes
-                                })
-                                
-                                # 保存到benchmark.csv
-                                benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
-                                _safe_to_csv(df, benchmark_file, "基准数据")
-                                
-                                if self.trader_callback:
-                                    self.trader_callback.gui.log_message(
-                                        f"基准指数数据已保存到 {benchmark_file}, 共 {len(df)} 条记录",
-                                        "INFO"
-                                    )
-                        else:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"基准指数 {benchmark_code} 收盘价数据为空", "WARNING")
-                    else:
+                    if len(self.benchmark_series) > 0:
+                        self.benchmark_series.save(backtest_dir)
                         if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"基准指数 {benchmark_code} 数据获取失败", "WARNING")
+                            self.trader_callback.gui.log_message(
+                                f"基准指数数据已保存到 {os.path.join(backtest_dir, 'benchmark.csv')}, "
+                                f"共 {len(self.benchmark_series)} 条记录",
+                                "INFO"
+                            )
+                    elif self.trader_callback:
+                        self.trader_callback.gui.log_message(
+                            f"基准指数 {','.join(self.benchmark_series.codes)} 收盘价数据为空", "WARNING"
+                        )
                 except Exception as e:
                     if self.trader_callback:
                         self.trader_callback.gui.log_message(f"获取基准指数数据时出错: {str(e)}", "ERROR")
@@ -2660,6 +2550,14 @@ class KhQuantFramework:
                 }
                 _safe_to_csv(pd.DataFrame([config_info]), os.path.join(backtest_dir, "config.csv"), "配置数据")
                 
+                self._emit_event(
+                    'finished',
+                    backtest_dir=self.backtest_dir,
+                    trade_count=len(self.backtest_records['trades']),
+                    trade_days=len(self.backtest_records['daily_stats']),
+                    final_asset=self.trade_mgr.assets.get('total_asset')
+                )
+                
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(
                         f"回测记录已保存到目录: {backtest_dir}", 
@@ -2687,12 +2585,15 @@ class KhQuantFramework:
         except Exception as e:
             error_msg = "回测运行异常: " + str(e)
             logging.error(error_msg, exc_info=True)
+            self._emit_event('error', message=str(e))
             # 调用错误回调函数
             if self.trader_callback:
                 self.trader_callback.gui.log_message(error_msg, "ERROR")
                 import traceback
                 self.trader_callback.gui.log_message(f"错误详情:\n{traceback.format_exc()}", "ERROR")
             raise  # 重新抛出异常
+        finally:
+            deactivate_history_cache(self.history_cache)
 
     def record_results(self, timestamp, data, signals):
         """记录回测结果
@@ -2710,8 +2611,21 @@ class KhQuantFramework:
             current_date = current_time_info.get("date", "")
             current_time = current_time_info.get("time", "")
             
+            # 回测循环中可直接使用预先计算的时间信息表和交易日标记
+            bar_index = current_time_info.get("bar_index", -1) if isinstance(current_time_info, dict) else -1
+            time_table = self.time_table
+            use_time_table = (
+                time_table is not None
+                and self.trade_day_mask is not None
+                and 0 <= bar_index < len(time_table)
+                and int(time_table.timestamps[bar_index]) == timestamp
+            )
+            
             # 检查是否是交易日
-            is_trading_day = self.tools.is_trade_day(current_date)
+            if use_time_table:
+                is_trading_day = bool(self.trade_day_mask[bar_index])
+            else:
+                is_trading_day = self.tools.is_trade_day(current_date)
             if not is_trading_day:
                 # 如果不是交易日，则跳过策略调用
                 if self.trader_callback and self._should_log():
@@ -2730,116 +2644,40 @@ class KhQuantFramework:
                     if timestamp_ms < 1e10:
                         timestamp_ms *= 1000
             
-            # 1. 时间戳处理优化 - 使用缓存和类型检查优化
-            if isinstance(timestamp, str):
-                if hasattr(self, '_cached_timestamp') and self._cached_timestamp.get('str') == timestamp:
-                    current_time = self._cached_timestamp.get('datetime')
-                    current_date = self._cached_timestamp.get('date')
-                    current_ts_seconds = self._cached_timestamp.get('ts_seconds')
-                else:
-                    current_time = datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
-                    current_date = current_time.date()
-                    current_ts_seconds = current_time.timestamp()
-                    self._cached_timestamp = {
-                        'str': timestamp,
-                        'datetime': current_time,
-                        'date': current_date,
-                        'ts_seconds': current_ts_seconds
-                    }
+            # 1. 时间戳处理 - 回测循环中直接使用预先计算的时间信息表
+            if use_time_table:
+                current_time = time_table.datetime_at(bar_index)
+                current_date = current_time.date()
+            elif isinstance(timestamp, str):
+                current_time = datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S")
+                current_date = current_time.date()
             else:
-                # 数字时间戳处理
+                # 数字时间戳处理，统一转换为秒级时间戳
                 ts_float = float(timestamp)
-                # 统一转换为秒级时间戳
                 ts_seconds = ts_float / 1000 if ts_float > 1e10 else ts_float
-                
-                # 使用缓存检查是否与上次时间戳相近（避免重复转换相近时间戳）
-                if hasattr(self, '_cached_timestamp') and abs(self._cached_timestamp.get('ts_seconds', 0) - ts_seconds) < 0.1:
-                    current_time = self._cached_timestamp.get('datetime')
-                    current_date = self._cached_timestamp.get('date')
-                    current_ts_seconds = self._cached_timestamp.get('ts_seconds')
-                else:
-                    current_time = datetime.datetime.fromtimestamp(ts_seconds)
-                    current_date = current_time.date()
-                    current_ts_seconds = ts_seconds
-                    self._cached_timestamp = {
-                        'ts_seconds': ts_seconds,
-                        'datetime': current_time,
-                        'date': current_date
-                    }
+                current_time = datetime.datetime.fromtimestamp(ts_seconds)
+                current_date = current_time.date()
             
-            # 2. 交易日检查优化 - 使用缓存避免重复查询
-            cache_key = f"trade_day_{current_date}"
-            if hasattr(self, '_cached_trade_days') and cache_key in self._cached_trade_days:
-                is_trading_day = self._cached_trade_days[cache_key]
-            else:
-                if not hasattr(self, '_cached_trade_days'):
-                    self._cached_trade_days = {}
-                    
+            # 2. 交易日检查 - 时间信息表中已有标记，否则按日期序数查交易日历
+            if not use_time_table:
                 try:
-                    # 使用KhQuTools的is_trade_day方法进行统一的交易日判断
-                    date_str = current_date.strftime("%Y-%m-%d")
-                    is_trading_day = self.tools.is_trade_day(date_str)
-                    # 缓存结果
-                    self._cached_trade_days[cache_key] = is_trading_day
+                    is_trading_day = self.trade_calendar.is_trade_day(current_date)
                 except Exception as e:
                     logging.warning(f"检查交易日失败: {str(e)}")
                     is_trading_day = True  # 出错默认为交易日
                     
-            # 3. 持仓更新优化 - 预先获取并缓存持仓列表
+            # 3. 持仓账本：市值和盈亏按数组向量化计算
             positions = self.trade_mgr.positions
-            position_codes = list(positions.keys())
             
             # 4. 非交易日处理优化
             if not is_trading_day:
                 # 非交易日情况下，不更新持仓市值
                 # 只记录每日统计数据，使用前一个交易日的市值数据
-                total_market_value = 0.0
-                for code, position in positions.items():
-                    # 使用已记录的市值，不从当天数据获取
-                    if 'market_value' in position and position['market_value'] > 0:
-                        total_market_value += position['market_value']
+                total_market_value = positions.total_market_value(positive_only=True)
             else:
-                # 5. 交易日市值计算优化 - 批量获取价格并一次性更新
-                # 预先创建价格字典并批量填充
-                prices = {}
-                
-                # 一次性从数据中提取所有价格
-                for code in position_codes:
-                    # 使用条件短路避免不必要的检查
-                    # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
-                    if code in data:
-                        if 'lastPrice' in data[code]:
-                            # Tick数据：优先使用lastPrice字段
-                            prices[code] = data[code]['lastPrice']
-                        elif 'close' in data[code]:
-                            # K线数据：使用close字段
-                            prices[code] = data[code]['close']
-                        elif code in positions and 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                            prices[code] = positions[code]['current_price']
-                        elif code in positions and 'avg_price' in positions[code]:
-                            prices[code] = positions[code]['avg_price']
-                    elif code in positions and 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                        prices[code] = positions[code]['current_price']
-                    elif code in positions and 'avg_price' in positions[code]:
-                        prices[code] = positions[code]['avg_price']
-                
-                # 一次性计算所有持仓的市值和盈亏
-                total_market_value = 0.0
-                for code in position_codes:
-                    if code in prices:
-                        position = positions[code]
-                        current_price = prices[code]
-                        volume = position['volume']
-                        avg_price = position['avg_price']
-                        
-                        # 计算市值和盈亏
-                        market_value = current_price * volume
-                        position['market_value'] = market_value
-                        position['current_price'] = current_price
-                        position['profit'] = (current_price - avg_price) * volume
-                        position['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price != 0 else 0
-                        
-                        total_market_value += market_value
+                # 5. 交易日市值计算 - 批量取价后一次性盯市
+                prices = self._position_prices(positions, data, bar_index if use_time_table else -1)
+                total_market_value = positions.mark_to_market(prices)
             
             # 6. 资产更新优化
             assets = self.trade_mgr.assets
@@ -2853,160 +2691,49 @@ class KhQuantFramework:
             # 更新资产信息
             assets['market_value'] = total_market_value
             assets['total_asset'] = assets['cash'] + total_market_value
+            self.risk_mgr.on_mark_to_market(assets['cash'], total_market_value)
             
             # 只在资产变化显著时触发回调，减少不必要的回调
             if abs(assets['total_asset'] - old_total_asset) > 0.01 and self.trader_callback:
                 self.trader_callback.on_stock_asset(SimpleNamespace(**assets))
             
-            # 7. 交易信号处理优化
+            # 7. 交易信号处理优化 - 复用信号上附加的成本明细，按占比拆分总交易成本
             if signals:
                 trade_mgr = self.trade_mgr
-                # 预先创建信号记录列表以避免多次append
-                signal_records = []
                 
                 # 提前获取资产数据
                 total_asset = assets['total_asset']
                 cash = assets['cash']
                 market_value = assets['market_value']
                 
-                # 使用列表推导式批量处理信号
-                self.backtest_records['trades'].extend([
-                    {
+                trade_records = self.backtest_records['trades']
+                for signal in signals:
+                    price = signal.get('actual_price', signal['price'])
+                    fees = trade_mgr.split_trade_cost(signal)
+                    trade_record = {
                         'datetime': current_time,
                         'code': signal['code'],
                         'action': signal['action'],
-                        'price': signal.get('actual_price', signal['price']),
+                        'price': price,
                         'volume': signal['volume'],
-                        'amount': signal.get('actual_price', signal['price']) * signal['volume'],
-                        'commission': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'stamp_tax': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['action'] == 'sell' else
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action'])
-                        ),
-                        'transfer_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['code'].startswith("sh.") else
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'flow_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_flow_fee() /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_flow_fee()
-                        ),
+                        'amount': price * signal['volume'],
+                        'commission': fees['commission'],
+                        'stamp_tax': fees['stamp_tax'],
+                        'transfer_fee': fees['transfer_fee'],
+                        'flow_fee': fees['flow_fee'],
                         'total_asset': total_asset,
                         'cash': cash,
                         'market_value': market_value
                     }
-                    for signal in signals
-                ])
+                    trade_records.append(trade_record)
+                    if self.event_sink is not None:
+                        self._emit_event('trade', **trade_record)
             
-            # 8. 最后时间点判断优化
-            # 使用函数字典替代if-else判断
-            is_last_time_point = False
-            
-            if isinstance(self.trigger, CustomTimeTrigger):
-                # 对于自定义时间触发，使用缓存优化
-                trigger_seconds = self.trigger.trigger_seconds
-                if trigger_seconds:
-                    # 缓存当天的触发时间点
-                    cache_key = f"time_points_{current_date}"
-                    if not hasattr(self, '_cached_time_points') or cache_key not in self._cached_time_points:
-                        if not hasattr(self, '_cached_time_points'):
-                            self._cached_time_points = {}
-                            
-                        # 获取当天所有触发时间点并缓存
-                        today_times = []
-                        max_trigger_second = max(trigger_seconds)
-                        
-                        # 使用列表推导式优化循环
-                        today_times = [
-                            int(datetime.datetime.combine(current_date, datetime.time(
-                                seconds // 3600,
-                                (seconds % 3600) // 60,
-                                seconds % 60
-                            )).timestamp())
-                            for seconds in trigger_seconds
-                        ]
-                        
-                        # 缓存计算结果
-                        self._cached_time_points[cache_key] = {
-                            'times': sorted(today_times),
-                            'max_second': max_trigger_second
-                        }
-                    
-                    # 使用缓存数据
-                    max_trigger_second = self._cached_time_points[cache_key]['max_second']
-                    
-                    # 计算当前时间点的秒数(使用已有变量避免重复计算)
-                    current_ts_dt = current_time
-                    current_seconds = current_ts_dt.hour * 3600 + current_ts_dt.minute * 60 + current_ts_dt.second
-                    
-                    # 检查是否是当天最后一个触发点
-                    is_last_time_point = abs(current_seconds - max_trigger_second) < 0.1
+            # 8. 最后时间点判断 - 时间信息表中已预先标记每天的最后一个时间点
+            if use_time_table:
+                is_last_time_point = bool(time_table.is_last_of_day[bar_index])
             else:
-                # 非自定义时间触发，使用all_times缓存优化
-                cache_key = f"daily_times_{current_date}"
-                if not hasattr(self, '_cached_daily_times') or cache_key not in self._cached_daily_times:
-                    if not hasattr(self, '_cached_daily_times'):
-                        self._cached_daily_times = {}
-                        
-                    # 获取当天的时间点，使用生成器表达式优化
-                    today_times = []
-                    
-                    # 使用列表推导式和异常处理优化
-                    try:
-                        today_times = [
-                            t for t in self.all_times
-                            if datetime.datetime.fromtimestamp(
-                                float(t) / 1000 if float(t) > 1e10 else float(t)
-                            ).date() == current_date
-                        ]
-                    except Exception:
-                        # 出错时使用传统循环方式作为备选
-                        for t in self.all_times:
-                            try:
-                                t_float = float(t)
-                                t_seconds = t_float / 1000 if t_float > 1e10 else t_float
-                                t_time = datetime.datetime.fromtimestamp(t_seconds)
-                                
-                                if t_time.date() == current_date:
-                                    today_times.append(t)
-                            except Exception:
-                                continue
-                    
-                    # 缓存结果
-                    self._cached_daily_times[cache_key] = sorted(today_times)
-                
-                # 使用缓存的时间点
-                today_times = self._cached_daily_times[cache_key]
-                
-                # 检查是否是最后时间点
-                if today_times:
-                    # 直接使用数值比较，避免创建新的datetime对象
-                    last_time = float(today_times[-1])
-                    last_time_seconds = last_time / 1000 if last_time > 1e10 else last_time
-                    is_last_time_point = abs(last_time_seconds - current_ts_seconds) < 0.1
+                is_last_time_point = self._is_last_time_point_of_day(current_time)
             
             # 9. 每日统计记录优化 - 只在最后时间点记录
             if is_last_time_point and is_trading_day:
@@ -3017,6 +2744,94 @@ class KhQuantFramework:
                 self.trader_callback.gui.log_message(f"记录回测结果时出错: {str(e)}", "ERROR")
             logging.error(f"记录回测结果时出错: {str(e)}", exc_info=True)
     
+    def _is_last_time_point_of_day(self, current_time):
+        """判断给定时间是否为所在日期的最后一个回测时间点（时间信息表不可用时的备用判断）
+        
+        Args:
+            current_time: 当前时间 (datetime)
+            
+        Returns:
+            bool: 是否为当日最后一个时间点
+        """
+        if isinstance(self.trigger, CustomTimeTrigger):
+            trigger_seconds = self.trigger.trigger_seconds
+            if not trigger_seconds:
+                return False
+            current_seconds = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
+            return current_seconds == max(trigger_seconds)
+        
+        all_times = getattr(self, 'all_times', None)
+        if all_times is None or len(all_times) == 0:
+            return False
+        table = self.time_table if self.time_table is not None else TimeInfoTable(all_times)
+        day_mask = table.day_ordinals == current_time.date().toordinal()
+        if not day_mask.any():
+            return False
+        last_ms = int(table.timestamps[day_mask][-1])
+        return abs(last_ms / 1000 - current_time.timestamp()) < 0.1
+
+    def _position_store_columns(self, positions):
+        """持仓账本各槽位在列式行情存储中的列下标（不在存储中为-1）
+        
+        账本槽位只增不减，映射随新登记的槽位增量扩展，每只股票只查一次代码表。
+        
+        Args:
+            positions: 持仓账本
+            
+        Returns:
+            np.ndarray: 按槽位下标的列下标数组
+        """
+        cached = self._slot_columns
+        if cached is None or cached[0] is not positions or cached[1] is not self.bar_store:
+            cached = (positions, self.bar_store, np.empty(0, dtype=np.int64))
+        columns = cached[2]
+        if len(columns) < positions.n_slots:
+            code_index = self.bar_store.code_index
+            added = [code_index.get(code, -1) for code in positions.slot_codes[len(columns):]]
+            columns = np.concatenate([columns, np.array(added, dtype=np.int64)])
+            cached = (positions, self.bar_store, columns)
+        self._slot_columns = cached
+        return columns
+    
+    def _position_prices(self, positions, data, bar_index=-1):
+        """获取所有持仓的最新估值价格（与 positions.active_slots 对齐）
+        
+        优先使用当前数据中的 lastPrice（Tick数据的close字段为nan），其次close；
+        无行情时使用持仓现价（大于0时），最后使用持仓均价。
+        回测循环中 bar_index 有效时直接从列式存储按列下标批量取价。
+        
+        Args:
+            positions: 持仓账本
+            data: 当前市场数据
+            bar_index: 当前时间点在列式存储中的下标，-1表示不可用
+            
+        Returns:
+            np.ndarray: 价格数组
+        """
+        prices = positions.fallback_prices()
+        if len(prices) == 0:
+            return prices
+        
+        store = self.bar_store
+        if store is not None and 0 <= bar_index < store.n_times:
+            field = 'lastPrice' if 'lastPrice' in store.columns else 'close' if 'close' in store.columns else None
+            if field is None:
+                return prices
+            columns = self._position_store_columns(positions)[positions.active_slots]
+            held = np.flatnonzero(columns >= 0)
+            held = held[store.valid[bar_index, columns[held]]]
+            prices[held] = store.columns[field][bar_index, columns[held]]
+            return prices
+        
+        for i, code in enumerate(positions):
+            if code in data:
+                bar = data[code]
+                if 'lastPrice' in bar:
+                    prices[i] = bar['lastPrice']
+                elif 'close' in bar:
+                    prices[i] = bar['close']
+        return prices
+
     def _record_daily_stats(self, current_date, current_time, data):
         """记录每日统计数据（从record_results中分离出来的功能）
         
@@ -3040,14 +2855,21 @@ class KhQuantFramework:
         # 重新计算一天结束时的市值
         positions = self.trade_mgr.positions
         position_codes = list(positions.keys())
-        day_end_market_value = 0.0
         
         # 转换日期为YYYYMMDD格式，用于获取日线数据
         yyyymmdd_date = date_str.replace('-', '') if '-' in date_str else date_str
         
-        # 批量获取收盘价
+        # 批量获取收盘价：优先从预加载的日线收盘价矩阵中取值
+        daily_close = np.full(len(position_codes), np.nan)
+        missing_codes = position_codes
+        matrix = self.daily_price_matrix
+        if matrix is not None and position_codes:
+            daily_close = matrix.gather(int(yyyymmdd_date), position_codes)
+            missing_codes = [code for code in position_codes if code not in matrix]
+        
+        # 不在股票池中的持仓（如策略交易了股票池以外的股票）仍按日获取
         daily_prices = {}
-        if position_codes:
+        if missing_codes:
             # 检查缓存中是否已有当日数据
             cache_date_key = f"daily_prices_{yyyymmdd_date}"
             if cache_date_key in self.daily_price_cache:
@@ -3057,10 +2879,10 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message(f"使用缓存的日线数据，日期: {yyyymmdd_date}", "INFO")
             else:
                 try:
-                    # 一次性获取所有持仓股票的日线数据
-                    daily_data = xtdata.get_market_data(
+                    # 一次性获取所有缺失股票的日线数据
+                    daily_data = self.data_source.get_market_data(
                         field_list=['close'],
-                        stock_list=position_codes,
+                        stock_list=missing_codes,
                         period='1d',
                         start_time=yyyymmdd_date,
                         end_time=yyyymmdd_date,
@@ -3068,95 +2890,58 @@ class KhQuantFramework:
                         dividend_type=self.config.config_dict["data"].get("dividend_type", "none")
                     )
                     
-                    # 优化数据提取逻辑
                     if daily_data is not None and isinstance(daily_data, dict) and 'close' in daily_data:
                         close_data = daily_data['close']
-                        # 检查close_data的类型
-                        if isinstance(close_data, pd.DataFrame):
-                            # 使用向量化操作处理DataFrame
-                            if any(code in close_data.index for code in position_codes):
-                                latest_date = close_data.columns[-1]
-                                # 使用向量化操作获取所有股票的价格
-                                valid_codes = [code for code in position_codes if code in close_data.index]
-                                daily_prices.update({
-                                    code: close_data.loc[code, latest_date]
-                                    for code in valid_codes
-                                    if close_data.loc[code, latest_date] is not None and close_data.loc[code, latest_date] > 0
-                                })
+                        if isinstance(close_data, pd.DataFrame) and len(close_data.columns):
+                            latest = close_data.iloc[:, -1]
+                            daily_prices = {
+                                code: latest[code] for code in missing_codes
+                                if code in latest.index and pd.notna(latest[code]) and latest[code] > 0
+                            }
                     
                     # 缓存获取的数据，避免同一天重复请求
                     self.daily_price_cache[cache_date_key] = daily_prices
                 except Exception as e:
                     logging.error(f"获取日线数据失败: {e}")
-        
-        # 批量计算持仓市值
-        for code in position_codes:
-            # 优先使用日线收盘价
-            if code in daily_prices and daily_prices[code] > 0:
-                current_price = daily_prices[code]
-            # 备选方案：使用触发数据中的价格
-            # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
-            elif code in data and 'lastPrice' in data[code]:
-                # Tick数据：优先使用lastPrice字段
-                current_price = data[code]['lastPrice']
-            elif code in data and 'close' in data[code]:
-                # K线数据：使用close字段
-                current_price = data[code]['close']
-            # 备选方案：使用持仓记录的价格
-            elif 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                current_price = positions[code]['current_price']
-            # 最后备选：使用持仓均价
-            else:
-                current_price = positions[code]['avg_price']
-            
-            # 计算市值
-            volume = positions[code]['volume']
-            market_value = current_price * volume
-            day_end_market_value += market_value
-            
-            # 更新持仓信息
-            positions[code]['current_price'] = current_price
-            positions[code]['market_value'] = market_value
-            
-            # 计算盈亏
-            avg_price = positions[code]['avg_price']
-            positions[code]['profit'] = (current_price - avg_price) * volume
-            positions[code]['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price > 0 else 0
+            if daily_prices:
+                for i, code in enumerate(position_codes):
+                    if code in daily_prices:
+                        daily_close[i] = daily_prices[code]
+        
+        # 批量计算持仓市值：优先使用日线收盘价，其次使用触发数据中的价格和持仓记录的价格
+        current_time_info = data.get("__current_time__", {})
+        bar_index = current_time_info.get("bar_index", -1) if isinstance(current_time_info, dict) else -1
+        prices = self._position_prices(positions, data, bar_index)
+        if position_codes:
+            has_daily = daily_close > 0
+            prices[has_daily] = daily_close[has_daily]
+        day_end_market_value = positions.mark_to_market(prices, positive_cost_only=True)
         
         # 计算总资产
         total_asset = cash + day_end_market_value
         
-        # 获取基准指数收盘价 - 使用缓存优化
+        # 获取基准指数收盘价：优先使用按交易日对齐的基准序列，其次使用触发数据中的价格
+        # benchmark_close 为主基准（第一个基准指数）；设置了多个基准时另记录各基准的收盘价
         benchmark_code = self.config.config_dict["backtest"]["benchmark"]
         benchmark_close = None
-        
-        # 使用缓存避免重复获取基准数据
-        cache_key = f"benchmark_{yyyymmdd_date}_{benchmark_code}"
-        if cache_key in self._cached_benchmark_close:
-            benchmark_close = self._cached_benchmark_close[cache_key]
-        else:
-            try:
-                # 备选：使用触发数据中的价格
-                # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
-                if benchmark_code in data:
-                    if 'lastPrice' in data[benchmark_code]:
-                        # Tick数据：优先使用lastPrice字段
-                        benchmark_close = data[benchmark_code]['lastPrice']
-                        # 缓存结果
-                        self._cached_benchmark_close[cache_key] = benchmark_close
-                    elif 'close' in data[benchmark_code]:
-                        # K线数据：使用close字段
-                        benchmark_close = data[benchmark_code]['close']
-                        # 缓存结果
-                        self._cached_benchmark_close[cache_key] = benchmark_close
-            except Exception as e:
-                logging.error(f"获取基准指数数据失败: {e}")
-                # 备选方案：先检查lastPrice判断是否是tick数据
-                if benchmark_code in data:
-                    if 'lastPrice' in data[benchmark_code]:
-                        benchmark_close = data[benchmark_code]['lastPrice']
-                    elif 'close' in data[benchmark_code]:
-                        benchmark_close = data[benchmark_code]['close']
+        benchmark_closes = None
+        day_closes = self._benchmark_day_closes
+        if day_closes is not None and self.time_table is not None and 0 <= bar_index < len(self.time_table.day_index):
+            row = day_closes[self.time_table.day_index[bar_index]]
+            value = row[self.benchmark_series.column()]
+            if not np.isnan(value):
+                benchmark_close = float(value)
+            if len(row) > 1:
+                benchmark_closes = {
+                    code: (None if np.isnan(close) else float(close))
+                    for code, close in zip(self.benchmark_series.codes, row)
+                }
+        if benchmark_close is None and benchmark_code in data:
+            # 先检查lastPrice判断是否是tick数据（tick数据的close字段值为nan）
+            if 'lastPrice' in data[benchmark_code]:
+                benchmark_close = data[benchmark_code]['lastPrice']
+            elif 'close' in data[benchmark_code]:
+                benchmark_close = data[benchmark_code]['close']
         
         # 计算当日收益率
         daily_stats = self.backtest_records['daily_stats']
@@ -3190,6 +2975,8 @@ class KhQuantFramework:
             'benchmark_close': benchmark_close,
             'positions': positions_snapshot
         }
+        if benchmark_closes is not None:
+            daily_stat['benchmark_closes'] = benchmark_closes
         self.backtest_records['daily_stats'].append(daily_stat)
         
         # 记录基准指数数据
@@ -3227,6 +3014,24 @@ class KhQuantFramework:
             self.keep_alive_timer.stop()
             self.keep_alive_timer = None
 
+        # 停止实时行情分发器
+        if self.quote_dispatcher is not None:
+            stats = self.quote_dispatcher.stats()
+            self.quote_dispatcher.stop()
+            self.quote_dispatcher = None
+            self._live_stock_list = None
+            if stats['dispatches'] and self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"实时行情分发: 推送 {stats['received']} 次, 合并 {stats['coalesced']} 次, 丢弃 {stats['dropped']} 次, "
+                    f"策略调用 {stats['dispatches']} 次, 最大队列深度 {stats['max_queue_depth']}, "
+                    f"行情到信号延迟 平均 {stats['avg_latency_ms']:.1f}ms / 最大 {stats['max_latency_ms']:.1f}ms",
+                    "INFO"
+                )
+
+        # 输出尚未汇总的风控日志
+        if getattr(self, 'risk_mgr', None) is not None:
+            self.risk_mgr.flush_logs()
+
         # 记录结束时间（如果还没有记录的话）
         if self.end_time is None:
             self.end_time = time.time()
@@ -3279,7 +3084,7 @@ class KhQuantFramework:
                     f"市值: {position.market_value:.{decimals}f}"
                 )
                 self.trader_callback.gui.log_message(position_msg, "TRADE")
-            logger.info(f"持仓变动回调: {position.stock_code}")
+            logger.info("持仓变动回调: %s", position.stock_code)
         except Exception as e:
             logger.info(f"处理持仓变动回调时出错: {str(e)}")
     
@@ -3295,7 +3100,7 @@ class KhQuantFramework:
                     f"备注: {error.order_remark}"
                 )
                 self.trader_callback.gui.log_message(error_msg, "ERROR")
-            logger.error(f"[ERROR] 委托错误: {error.error_msg}")
+            logger.error("[ERROR] 委托错误: %s", error.error_msg)
         except Exception as e:
             logger.error(f"处理委托错误回调时出错: {str(e)}")
     
@@ -3312,7 +3117,7 @@ class KhQuantFramework:
                     f"委托数量: {getattr(order, 'order_volume', 'N/A')}"
                 )
                 self.trader_callback.gui.log_message(order_msg, "TRADE")
-            logger.info(f"委托回报: {order.stock_code}")
+            logger.info("委托回报: %s", order.stock_code)
         except Exception as e:
             logger.info(f"处理委托回报时出错: {str(e)}")
     
@@ -3328,10 +3133,32 @@ class KhQuantFramework:
                     f"成交金额: {getattr(trade, 'traded_amount', 'N/A')}"
                 )
                 self.trader_callback.gui.log_message(trade_msg, "TRADE")
-            logger.info(f"成交回报: {trade.stock_code}")
+            logger.info("成交回报: %s", trade.stock_code)
         except Exception as e:
             logger.info(f"处理成交回报时出错: {str(e)}")
-    
+
+    def on_stock_batch(self, batch):
+        """批量成交汇总回调（批量执行路径每批只触发一次）"""
+        try:
+            if self.trader_callback and hasattr(self.trader_callback, 'gui'):
+                decimals = self.price_decimals
+                batch_msg = (
+                    f"批量成交 - "
+                    f"成交笔数: {batch.executed} | "
+                    f"拒绝笔数: {len(batch.rejected)} | "
+                    f"卖出金额: {batch.sell_amount:.{decimals}f} | "
+                    f"买入金额: {batch.buy_amount:.{decimals}f} | "
+                    f"交易成本: {batch.total_cost:.2f}"
+                )
+                if batch.rejected:
+                    batch_msg += " | 拒绝: " + ", ".join(f"{code}({reason})" for code, reason in batch.rejected[:5])
+                    if len(batch.rejected) > 5:
+                        batch_msg += f" 等{len(batch.rejected)}笔"
+                self.trader_callback.gui.log_message(batch_msg, "TRADE")
+            logger.info("批量成交回报: 成交%d笔, 拒绝%d笔", batch.executed, len(batch.rejected))
+        except Exception as e:
+            logger.info(f"处理批量成交回报时出错: {str(e)}")
+
     def on_stock_asset(self, asset):
         """资产变动回调"""
         try:
@@ -3343,6 +3170,6 @@ class KhQuantFramework:
                     f"市值: {getattr(asset, 'market_value', 'N/A')}"
                 )
                 self.trader_callback.gui.log_message(asset_msg, "INFO")
-            logger.info(f"资产变动: 总资产={getattr(asset, 'total_asset', 'N/A')}")
+            logger.info("资产变动: 总资产=%s", getattr(asset, 'total_asset', 'N/A'))
         except Exception as e:
             logger.info(f"处理资产变动时出错: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,371 @@
+# coding: utf-8
+"""
+回测历史数据缓存模块
+
+回测运行期间，策略每根K线都会调用 khHistory / khMA 获取历史数据，
+原实现每次都通过 get_market_data_ex 请求一段数据窗口并转换、排序。
+本模块为正在运行的回测提供按 (股票代码, 周期, 复权方式) 组织的
+NumPy 历史序列：
+
+- 与回测行情周期、复权方式一致时，直接复用框架已加载的列式行情存储，
+  仅为回测开始前的预热区间补充一次数据请求
+- 其他周期/复权方式在首次使用时按整个回测区间一次性加载
+- 每次查询通过 searchsorted 定位窗口，返回数组切片（不复制）
+- 为 khMA 按 (股票代码, 字段, 均线长度) 维护增量滑动窗口和
+
+时间比较与 khHistory 保持一致，按北京时间（UTC+8）处理。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+from logging_config import get_module_logger
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from khBarStore import to_epoch_ms
+
+# 日志系统
+logger = get_module_logger(__name__)
+
+# 北京时间相对UTC的偏移（毫秒）
+BEIJING_OFFSET_MS = 8 * 3600 * 1000
+
+# 滑动窗口和每增量更新多少次后重新精确求和一次，避免浮点误差累积
+ROLLING_RESYNC_INTERVAL = 256
+
+
+def beijing_ms(dt: datetime) -> int:
+    """将北京时间的naive datetime转换为毫秒级时间戳"""
+    return int(np.datetime64(dt, 'ms').astype(np.int64)) - BEIJING_OFFSET_MS
+
+
+def beijing_date_str(ts_ms: int) -> str:
+    """将毫秒级时间戳转换为北京时间的 YYYYMMDD 日期字符串"""
+    return (datetime(1970, 1, 1) + timedelta(milliseconds=int(ts_ms) + BEIJING_OFFSET_MS)).strftime('%Y%m%d')
+
+
+def history_lookback_days(period: str, bar_count: int) -> int:
+    """khHistory 获取数据时向前推算的自然日天数
+
+    Args:
+        period: 数据周期
+        bar_count: K线数量
+
+    Returns:
+        int: 向前推算的天数
+    """
+    if period == 'tick':
+        # tick数据只获取当天的，但向前多取几天
+        return 3
+    if period in ['1m', '5m']:
+        # 分钟数据，往前推算较多天数以确保有足够数据
+        return max(10, (bar_count * 10 + 1439) // 1440)
+    if period in ['1d']:
+        # 日线数据，往前推算更多天数以确保有足够的交易日
+        return bar_count * 5
+    return bar_count * 3
+
+
+class StockHistory:
+    """单只股票某周期、某复权方式下的历史序列
+
+    Attributes:
+        times: 排序后的int64毫秒级时间戳
+        columns: 字段名到一维数组的映射
+        start_ms: 覆盖区间起点（含）
+        rolling: (字段, 窗口长度) 到滑动窗口状态的映射
+    """
+
+    __slots__ = ('times', 'columns', 'start_ms', 'rolling')
+
+    def __init__(self, times: np.ndarray, columns: Dict[str, np.ndarray], start_ms: int):
+        self.times = times
+        self.columns = columns
+        self.start_ms = start_ms
+        self.rolling = {}
+
+    @classmethod
+    def from_frame(cls, df: Optional[pd.DataFrame], fields: Sequence[str], start_ms: int) -> 'StockHistory':
+        """由get_market_data_ex返回的单只股票DataFrame构建"""
+        if df is None or df.empty or 'time' not in df.columns:
+            return cls(np.empty(0, dtype=np.int64), {}, start_ms)
+        times = to_epoch_ms(df['time'].values)
+        order = np.argsort(times, kind='stable')
+        columns = {field: df[field].values[order] for field in fields if field in df.columns}
+        return cls(times[order], columns, start_ms)
+
+    def bounds(self, start_ms: int, end_ms: int) -> Tuple[int, int]:
+        """获取时间区间 [start_ms, end_ms) 对应的行号范围"""
+        lo = int(np.searchsorted(self.times, start_ms, side='left'))
+        hi = int(np.searchsorted(self.times, end_ms, side='left'))
+        return lo, max(lo, hi)
+
+
+class BacktestHistoryCache:
+    """回测期间的历史数据缓存
+
+    使用示例:
+        cache = BacktestHistoryCache(xtdata, '20240101', '20240630',
+                                     bar_store=store, store_period='1d',
+                                     store_dividend_type='front')
+        activate_history_cache(cache)
+        ...
+        deactivate_history_cache(cache)
+    """
+
+    def __init__(self, xtdata_module, backtest_start: str, backtest_end: str,
+                 bar_store=None, store_period: Optional[str] = None,
+                 store_dividend_type: Optional[str] = None):
+        """初始化缓存
+
+        Args:
+            xtdata_module: 行情数据模块，需提供 get_market_data_ex 接口
+            backtest_start: 回测开始日期 YYYYMMDD
+            backtest_end: 回测结束日期 YYYYMMDD
+            bar_store: 框架已加载的列式行情存储，为None时不复用
+            store_period: 列式行情存储的数据周期
+            store_dividend_type: 列式行情存储的复权方式
+        """
+        self.xtdata = xtdata_module
+        self.backtest_end = backtest_end
+        self.end_ms = beijing_ms(datetime.strptime(backtest_end, '%Y%m%d') + timedelta(days=1))
+        self.bar_store = bar_store
+        self.store_period = store_period
+        self.store_dividend_type = store_dividend_type
+        self.entries = {}
+        self.thread_id = threading.get_ident()
+        self.load_count = 0
+
+    def _query_bounds(self, period: str, current_datetime: datetime,
+                      lookback_days: int) -> Tuple[str, int, int]:
+        """计算查询的起始日期字符串、起点和终点（不含）时间戳"""
+        start_date = (current_datetime - timedelta(days=lookback_days)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        if period in ['1m', '5m', 'tick']:
+            # 分钟/tick数据按精确时间筛选，不包含当前时间点
+            end_ms = beijing_ms(current_datetime)
+        else:
+            # 日线数据只比较日期部分，不包含当前日期
+            end_ms = beijing_ms(current_datetime.replace(hour=0, minute=0, second=0, microsecond=0))
+        return start_date.strftime('%Y%m%d'), beijing_ms(start_date), end_ms
+
+    def _fetch(self, codes: List[str], fields: List[str], period: str, dividend_type: str,
+               start_time: str, end_time: str) -> Dict[str, pd.DataFrame]:
+        """一次请求获取多只股票的数据"""
+        self.load_count += 1
+        data = self.xtdata.get_market_data_ex(
+            field_list=['time'] + fields,
+            stock_list=codes,
+            period=period,
+            start_time=start_time,
+            end_time=end_time,
+            count=-1,
+            dividend_type=dividend_type,
+            fill_data=True
+        )
+        return data or {}
+
+    def _store_columns(self, code: str, fields: List[str]):
+        """获取列式行情存储中单只股票的有效时间点和字段列，不可复用时返回None"""
+        store = self.bar_store
+        if store is None or code not in store.code_index:
+            return None
+        if any(field not in store.columns for field in fields):
+            return None
+        j = store.code_index[code]
+        rows = np.flatnonzero(store.valid[:, j])
+        return store.times[rows], {field: store.columns[field][rows, j] for field in fields}
+
+    def _load(self, codes: List[str], fields: List[str], period: str, dividend_type: str,
+              start_time: str, start_ms: int) -> None:
+        """加载（或以更大的区间/字段集重新加载）多只股票的历史序列"""
+        use_store = period == self.store_period and dividend_type == self.store_dividend_type
+        from_store = {}
+        fetch_ranges = {}
+        for code in codes:
+            stored = self._store_columns(code, fields) if use_store else None
+            if stored is not None and len(stored[0]):
+                from_store[code] = stored
+                if start_ms < stored[0][0]:
+                    # 仅补充回测开始前的预热区间
+                    fetch_ranges[code] = beijing_date_str(stored[0][0])
+            else:
+                fetch_ranges[code] = self.backtest_end
+
+        # 按结束日期分组批量请求
+        groups = {}
+        for code, end_time in fetch_ranges.items():
+            groups.setdefault(end_time, []).append(code)
+        fetched = {}
+        for end_time, group in groups.items():
+            fetched.update(self._fetch(group, fields, period, dividend_type, start_time, end_time))
+
+        for code in codes:
+            entry = StockHistory.from_frame(fetched.get(code), fields, start_ms)
+            if code in from_store:
+                store_times, store_columns = from_store[code]
+                keep = entry.times < store_times[0]
+                entry = StockHistory(
+                    np.concatenate([entry.times[keep], store_times]),
+                    {field: np.concatenate([entry.columns[field][keep], store_columns[field]])
+                     if field in entry.columns else store_columns[field] for field in fields},
+                    start_ms
+                )
+            elif not len(entry.times):
+                logger.warning(f"股票 {code} 无历史数据")
+            self.entries[(code, period, dividend_type)] = entry
+
+    def _entries(self, codes: List[str], fields: List[str], period: str, dividend_type: str,
+                 start_time: str, start_ms: int) -> Dict[str, StockHistory]:
+        """获取覆盖所需区间与字段的历史序列，缺失时批量加载"""
+        missing = []
+        load_fields = list(fields)
+        for code in codes:
+            entry = self.entries.get((code, period, dividend_type))
+            if entry is not None and entry.start_ms <= start_ms \
+                    and (not entry.times.size or all(field in entry.columns for field in fields)):
+                continue
+            missing.append(code)
+            if entry is not None:
+                # 以更大的区间和字段并集重新加载
+                load_fields += [field for field in entry.columns if field not in load_fields]
+                if entry.start_ms < start_ms:
+                    start_ms = entry.start_ms
+                    start_time = beijing_date_str(start_ms)
+        if missing:
+            self._load(missing, load_fields, period, dividend_type, start_time, start_ms)
+        return {code: self.entries[(code, period, dividend_type)] for code in codes}
+
+    def servable(self, current_datetime: Optional[datetime]) -> bool:
+        """当前调用是否可由缓存应答（回测线程内且查询时间不晚于回测结束）"""
+        return (
+            current_datetime is not None
+            and threading.get_ident() == self.thread_id
+            and beijing_ms(current_datetime) <= self.end_ms
+        )
+
+    def history(self, codes: List[str], fields: List[str], bar_count: int, period: str,
+                dividend_type: str, current_datetime: datetime,
+                skip_paused: bool = False) -> Dict[str, pd.DataFrame]:
+        """获取多只股票当前时间点之前的最近bar_count条历史数据
+
+        返回格式与 khHistory 相同：{股票代码: DataFrame}，包含time列和指定字段。
+
+        Args:
+            codes: 股票代码列表
+            fields: 字段列表
+            bar_count: K线数量
+            period: 数据周期
+            dividend_type: 复权方式（xtdata格式）
+            current_datetime: 当前时间（不包含此时间点）
+            skip_paused: 是否跳过成交量为0的停牌数据
+
+        Returns:
+            Dict[str, pd.DataFrame]: 股票代码到历史数据的映射
+        """
+        start_time, start_ms, end_ms = self._query_bounds(
+            period, current_datetime, history_lookback_days(period, bar_count))
+        load_fields = list(fields)
+        if skip_paused and 'volume' not in load_fields:
+            load_fields.append('volume')
+        entries = self._entries(codes, load_fields, period, dividend_type, start_time, start_ms)
+
+        result = {}
+        for code in codes:
+            entry = entries[code]
+            if not entry.times.size:
+                result[code] = pd.DataFrame()
+                continue
+            lo, hi = entry.bounds(start_ms, end_ms)
+            rows = slice(max(lo, hi - bar_count), hi)
+            if skip_paused and 'volume' in entry.columns:
+                active = lo + np.flatnonzero(entry.columns['volume'][lo:hi] > 0)
+                rows = active[-bar_count:]
+            frame = {'time': pd.to_datetime(entry.times[rows], unit='ms') + pd.Timedelta(hours=8)}
+            for field in fields:
+                if field in entry.columns:
+                    frame[field] = entry.columns[field][rows]
+            result[code] = pd.DataFrame(frame)
+        return result
+
+    def moving_average(self, code: str, window: int, field: str, period: str,
+                       dividend_type: str, current_datetime: datetime) -> Optional[Tuple[int, float]]:
+        """计算当前时间点之前最近window条数据的均值
+
+        每个 (字段, 窗口长度) 维护一个滑动窗口和，回测时间前进时只需加入新进入
+        窗口的数据、减去移出窗口的数据。NaN 与 pandas 的 mean 一致按缺失跳过。
+
+        Args:
+            code: 股票代码
+            window: 均线长度
+            field: 计算字段
+            period: 数据周期
+            dividend_type: 复权方式（xtdata格式）
+            current_datetime: 当前时间（不包含此时间点）
+
+        Returns:
+            Optional[Tuple[int, float]]: (窗口内K线数量, 均值)，字段不是数值类型时返回None
+        """
+        start_time, start_ms, end_ms = self._query_bounds(
+            period, current_datetime, history_lookback_days(period, window))
+        entry = self._entries([code], [field], period, dividend_type, start_time, start_ms)[code]
+        if not entry.times.size:
+            return 0, float('nan')
+        values = entry.columns.get(field)
+        if values is None or values.dtype.kind not in 'fiu':
+            return None
+        lo, hi = entry.bounds(start_ms, end_ms)
+        lo = max(lo, hi - window)
+
+        # 状态: [窗口起点, 窗口终点, 窗口和, 有效值个数, 增量更新次数]
+        state = entry.rolling.get((field, window))
+        if state is not None and state[0] <= lo <= state[1] <= hi \
+                and state[4] < ROLLING_RESYNC_INTERVAL:
+            old_lo, old_hi, total, valid, updates = state
+            entering = values[old_hi:hi]
+            leaving = values[old_lo:lo]
+            total += np.nansum(entering) - np.nansum(leaving)
+            valid += np.count_nonzero(~np.isnan(entering)) - np.count_nonzero(~np.isnan(leaving))
+            state = [lo, hi, total, valid, updates + 1]
+        else:
+            state = [lo, hi, *self._window_sum(values, lo, hi)]
+        entry.rolling[(field, window)] = state
+
+        mean = state[2] / state[3] if state[3] else float('nan')
+        return hi - lo, mean
+
+    @staticmethod
+    def _window_sum(values: np.ndarray, lo: int, hi: int):
+        """精确计算窗口和、有效值个数，并重置增量更新计数"""
+        window_values = values[lo:hi]
+        return float(np.nansum(window_values)), int(np.count_nonzero(~np.isnan(window_values))), 0
+
+
+_active_cache = None
+
+
+def activate_history_cache(cache: BacktestHistoryCache) -> None:
+    """设置当前运行中回测的历史数据缓存"""
+    global _active_cache
+    _active_cache = cache
+
+
+def deactivate_history_cache(cache: Optional[BacktestHistoryCache] = None) -> None:
+    """清除历史数据缓存；指定cache时仅在其为当前缓存时清除"""
+    global _active_cache
+    if cache is None or _active_cache is cache:
+        _active_cache = None
+
+
+def get_active_history_cache(current_datetime: Optional[datetime]) -> Optional[BacktestHistoryCache]:
+    """获取可应答当前调用的历史数据缓存，非回测线程或查询时间超出回测区间时返回None"""
+    cache = _active_cache
+    if cache is not None and cache.servable(current_datetime):
+        return cache
+    return None
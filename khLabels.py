@@ -0,0 +1,294 @@
+# coding: utf-8
+"""
+截面收益率标签模块
+
+calculate_next_day_return 原先每次运行都重新读取全部日线CSV，逐只股票计算
+pct_change().shift(-1) 并重写整个输出文件。ReturnLabelBuilder 把全市场收盘价整理为
+稠密的 (交易日 × 股票) 矩阵，并据此计算多个周期（默认1/5/20日）的前瞻收益率矩阵：
+
+    ret_h[t, j] = close[t + h, j] / close[t, j] - 1
+
+其中 t + h 按矩阵的交易日序列计算，任一端缺失（停牌、未上市）时为 NaN。
+
+指定存储目录时矩阵以原始 float64 文件保存并通过 np.memmap 访问：
+
+    {store_dir}/meta.json      # 交易日、股票列表、前瞻周期、各股票已读取的源文件
+    {store_dir}/close.f64      # 收盘价矩阵
+    {store_dir}/ret_{h}.f64    # h日前瞻收益率矩阵
+
+再次 update 时只读取有变化的源文件（按路径和修改时间判断），且只读取 date/close 两列；
+交易日序列只在末尾增长时直接在文件末尾追加新行，并只重算受影响的最后若干行收益率。
+不指定存储目录时矩阵保存在内存中。
+
+源文件沿用 download_and_store_data 的CSV命名规则：
+    {股票代码}_1d_{起始日期}_{结束日期}_{时间范围}_{复权方式}.csv
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 默认前瞻收益率周期（交易日）
+DEFAULT_HORIZONS = (1, 5, 20)
+
+# 默认并发读取文件数
+DEFAULT_MAX_WORKERS = 4
+
+
+def date_to_int(dates: pd.Series) -> np.ndarray:
+    """将 "2024-01-02" 或 "20240102" 形式的日期转换为 int 类型的 YYYYMMDD"""
+    return dates.astype(str).str.replace('-', '', regex=False).str[:8].astype(np.int64).to_numpy()
+
+
+def forward_returns(closes: np.ndarray, horizon: int) -> np.ndarray:
+    """计算前瞻收益率矩阵
+
+    Args:
+        closes: (交易日 × 股票) 收盘价矩阵
+        horizon: 前瞻周期（交易日）
+
+    Returns:
+        np.ndarray: 与 closes 形状相同，最后 horizon 行为 NaN
+    """
+    result = np.full(closes.shape, np.nan)
+    if horizon < len(closes):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[:-horizon] = closes[horizon:] / closes[:-horizon] - 1
+    return result
+
+
+def matching_files(file_path: str, sample_file_name: str) -> List[Tuple[str, str]]:
+    """按样本文件名匹配同一批下载的全部文件
+
+    Args:
+        file_path: 数据文件所在目录
+        sample_file_name: 样本文件名，其中的股票代码替换为通配符后匹配
+
+    Returns:
+        List[Tuple[str, str]]: (股票代码, 文件路径) 列表，按文件名排序
+    """
+    stock_code_example = sample_file_name.split('_')[0]
+    file_pattern = sample_file_name.replace(stock_code_example, '*', 1)
+    return [(os.path.basename(path).split('_')[0], path)
+            for path in sorted(glob.glob(os.path.join(file_path, file_pattern)))]
+
+
+def _read_daily_close(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """只读取日线CSV的 date/close 两列"""
+    data = pd.read_csv(path, usecols=['date', 'close'])
+    data = data.dropna(subset=['date']).drop_duplicates(subset='date', keep='last')
+    return date_to_int(data['date']), data['close'].to_numpy(dtype=np.float64)
+
+
+class ReturnLabelBuilder:
+    """截面前瞻收益率标签
+
+    使用示例:
+        labels = ReturnLabelBuilder("D:/data/labels")
+        labels.update("D:/data/daily", "000001.SZ_1d_20200101_20241231_all_none.csv")
+        ret_5 = labels.returns(5)          # (交易日 × 股票) 矩阵
+        frame = labels.to_frame(5)         # 行为日期、列为股票代码的DataFrame
+
+    Attributes:
+        dates: 交易日，int 类型的 YYYYMMDD，升序
+        symbols: 股票代码列表，与矩阵列对应
+        horizons: 前瞻周期
+    """
+
+    def __init__(self, store_dir: Optional[str] = None, horizons: Optional[Sequence[int]] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        """初始化
+
+        Args:
+            store_dir: 存储目录，None 表示只在内存中计算
+            horizons: 前瞻周期，None 时沿用存储目录中的设置，新建时为 DEFAULT_HORIZONS
+            max_workers: 并发读取文件数
+        """
+        self.store_dir = store_dir
+        self.max_workers = max(1, int(max_workers))
+        self.dates = np.empty(0, dtype=np.int64)
+        self.symbols: List[str] = []
+        self.sources: Dict[str, list] = {}
+        self._closes = np.empty((0, 0))
+        self._returns: Dict[int, np.ndarray] = {}
+
+        stored_horizons = None
+        if store_dir and os.path.exists(self._meta_path()):
+            with open(self._meta_path(), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dates = np.asarray(meta['dates'], dtype=np.int64)
+            self.symbols = meta['symbols']
+            self.sources = meta.get('sources', {})
+            stored_horizons = tuple(meta['horizons'])
+            self._closes = self._open('close')
+            self._returns = {h: self._open(f'ret_{h}') for h in stored_horizons}
+
+        self.horizons = tuple(int(h) for h in (horizons or stored_horizons or DEFAULT_HORIZONS))
+        if stored_horizons is not None and self.horizons != stored_horizons:
+            # 周期设置变化时按收盘价矩阵补算缺少的周期
+            self._returns = {h: self._returns[h] for h in self.horizons if h in self._returns}
+            for h in self.horizons:
+                if h not in self._returns:
+                    self._returns[h] = self._store(f'ret_{h}', forward_returns(self._closes, h))
+            self._save_meta()
+            for h in set(stored_horizons) - set(self.horizons):
+                if os.path.exists(self._data_path(f'ret_{h}')):
+                    os.remove(self._data_path(f'ret_{h}'))
+
+    @property
+    def closes(self) -> np.ndarray:
+        """(交易日 × 股票) 收盘价矩阵"""
+        return self._closes
+
+    def returns(self, horizon: int) -> np.ndarray:
+        """horizon 日前瞻收益率矩阵"""
+        if horizon not in self._returns:
+            raise KeyError(f"未计算 {horizon} 日前瞻收益率，可用周期: {self.horizons}")
+        return self._returns[horizon]
+
+    def to_frame(self, horizon: int) -> pd.DataFrame:
+        """以DataFrame返回前瞻收益率矩阵（复制数据），行为日期、列为股票代码"""
+        index = pd.to_datetime(self.dates.astype(str), format='%Y%m%d')
+        return pd.DataFrame(np.array(self.returns(horizon)), index=index, columns=self.symbols)
+
+    def update(self, file_path: str, sample_file_name: str) -> int:
+        """从日线CSV文件更新矩阵
+
+        Args:
+            file_path: 日线数据文件所在目录
+            sample_file_name: 样本文件名，将其中的股票代码替换为通配符后匹配全部文件，
+                例如 "000001.SZ_1d_20240101_20240430_all_none.csv"
+
+        Returns:
+            int: 新增的交易日数
+        """
+        changed = []
+        for stock_code, path in matching_files(file_path, sample_file_name):
+            source = [os.path.abspath(path), os.path.getmtime(path)]
+            if self.sources.get(stock_code) != source:
+                changed.append((stock_code, path, source))
+        if not changed:
+            logger.info("收益率标签已是最新，无需更新")
+            return 0
+
+        if self.max_workers == 1 or len(changed) == 1:
+            loaded = [_read_daily_close(path) for _, path, _ in changed]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='khLabels') as executor:
+                loaded = list(executor.map(_read_daily_close, [path for _, path, _ in changed]))
+
+        old_dates = self.dates
+        all_dates = np.union1d(old_dates, np.concatenate([dates for dates, _ in loaded] + [old_dates]))
+        new_symbols = sorted({code for code, _, _ in changed} - set(self.symbols))
+        symbols = self.symbols + new_symbols
+        appended = len(all_dates) - len(old_dates)
+        rebuilt = False
+
+        if not new_symbols and np.array_equal(all_dates[:len(old_dates)], old_dates):
+            # 只有交易日在末尾增长：扩展文件，原有数据保持不动
+            self._closes = self._grow('close', self._closes, len(all_dates))
+            for h in self.horizons:
+                self._returns[h] = self._grow(f'ret_{h}', self._returns[h], len(all_dates))
+        else:
+            # 新股票或中间插入交易日：按新的行列重新排列后整体重写
+            rows = np.searchsorted(all_dates, old_dates)
+            closes = np.full((len(all_dates), len(symbols)), np.nan)
+            closes[np.ix_(rows, np.arange(len(self.symbols)))] = self._closes
+            # 先释放旧的映射再替换文件（Windows下不能替换仍被映射的文件）
+            self._closes, self._returns = None, {}
+            self._closes = self._store('close', closes)
+            for h in self.horizons:
+                self._returns[h] = self._store(f'ret_{h}', np.full(closes.shape, np.nan))
+            rebuilt = True
+        self.dates = all_dates
+        self.symbols = symbols
+
+        column_of = {code: i for i, code in enumerate(symbols)}
+        first_row = 0 if rebuilt else len(all_dates)
+        for (stock_code, _, source), (dates, closes) in zip(changed, loaded):
+            rows = np.searchsorted(all_dates, dates)
+            column = column_of[stock_code]
+            # 源文件通常包含已读取过的历史数据，只写入值有变化的行
+            current = self._closes[rows, column]
+            diff = ~((current == closes) | (np.isnan(current) & np.isnan(closes)))
+            if diff.any():
+                self._closes[rows[diff], column] = closes[diff]
+                first_row = min(first_row, int(rows[diff].min()))
+            self.sources[stock_code] = source
+
+        # t 行的h日收益率依赖 t..t+h 行的收盘价，只重算受影响的行
+        for h in self.horizons:
+            start = max(0, first_row - h)
+            self._returns[h][start:] = forward_returns(self._closes[start:], h)
+        self._flush()
+        self._save_meta()
+        logger.info(f"收益率标签更新完成: 读取 {len(changed)} 个文件, 新增 {appended} 个交易日, "
+                    f"共 {len(all_dates)} 个交易日 × {len(symbols)} 只股票")
+        return appended
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.store_dir, 'meta.json')
+
+    def _data_path(self, name: str) -> str:
+        return os.path.join(self.store_dir, f'{name}.f64')
+
+    def _open(self, name: str) -> np.ndarray:
+        shape = (len(self.dates), len(self.symbols))
+        if not shape[0] or not shape[1]:
+            return np.full(shape, np.nan)
+        return np.memmap(self._data_path(name), dtype=np.float64, mode='r+', shape=shape)
+
+    def _store(self, name: str, values: np.ndarray) -> np.ndarray:
+        """整体写入矩阵，返回可写的 memmap（内存模式下直接返回数组）"""
+        if not self.store_dir:
+            return values
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = self._data_path(name)
+        tmp_path = path + '.tmp'
+        np.ascontiguousarray(values, dtype=np.float64).tofile(tmp_path)
+        os.replace(tmp_path, path)
+        if not values.size:
+            return values
+        return np.memmap(path, dtype=np.float64, mode='r+', shape=values.shape)
+
+    def _grow(self, name: str, values: np.ndarray, n_rows: int) -> np.ndarray:
+        """在矩阵末尾追加 NaN 行"""
+        extra = np.full((n_rows - len(values), values.shape[1]), np.nan)
+        if not self.store_dir:
+            return np.vstack([values, extra])
+        if isinstance(values, np.memmap):
+            values.flush()
+        with open(self._data_path(name), 'ab') as f:
+            extra.tofile(f)
+        return np.memmap(self._data_path(name), dtype=np.float64, mode='r+', shape=(n_rows, values.shape[1]))
+
+    def _flush(self):
+        for values in [self._closes] + list(self._returns.values()):
+            if isinstance(values, np.memmap):
+                values.flush()
+
+    def _save_meta(self):
+        if not self.store_dir:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'horizons': list(self.horizons),
+                'dates': self.dates.tolist(),
+                'symbols': self.symbols,
+                'sources': self.sources,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path())
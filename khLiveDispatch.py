@@ -0,0 +1,226 @@
+# coding: utf-8
+"""
+实时行情分发模块
+
+xtquant 的行情推送回调运行在其内部线程上，原先在回调中直接复制整份行情、构建时间信息
+并同步执行策略，集合竞价等推送密集时段会阻塞回调线程、造成数秒的延迟。
+QuoteDispatcher 将处理拆成两段：
+
+- 回调线程只把推送的行情合并到按股票维护的常驻快照中（替换该股票的行情字典而不原地
+  修改，工作线程持有的快照副本因此不会读到半更新的行情），并向有界队列投递该股票的
+  待处理标记（同一股票已在队列中时不重复投递），从不阻塞；
+- 专用工作线程取出标记后在合并窗口内继续收集，将窗口内同一股票的多次推送合并为一次，
+  再以快照调用处理函数（执行策略）。
+
+分发器同时统计队列深度、合并/丢弃次数以及从收到行情到处理完成的延迟。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import queue
+import threading
+import time
+from collections.abc import Mapping
+from typing import Callable, Dict, Optional
+
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 推送数据中不属于股票行情的字段
+RESERVED_KEYS = ('timestamp',)
+
+
+class QuoteDispatcher:
+    """按股票合并推送并在工作线程中执行处理函数的实时行情分发器
+
+    Attributes:
+        snapshot: 股票代码到最新行情的常驻快照（按股票替换行情字典）
+        coalesce_window: 合并窗口（秒）
+        max_queue: 待处理队列容量
+    """
+
+    def __init__(self, handler: Callable[[Dict, list, int, float], None],
+                 coalesce_window: float = 0.05, max_queue: int = 1024, name: str = "QuoteDispatcher"):
+        """初始化分发器
+
+        Args:
+            handler: 处理函数，参数为 (快照副本, 本次更新的股票代码列表, 最新行情时间戳, 最早收到时间)
+            coalesce_window: 合并窗口（秒），窗口内同一股票的多次推送只处理一次
+            max_queue: 待处理队列容量，队列满时新标记被丢弃，但快照已更新，数据会在下一次分发时处理
+            name: 工作线程名称
+        """
+        self.handler = handler
+        self.coalesce_window = max(float(coalesce_window), 0.0)
+        self.max_queue = max(int(max_queue), 1)
+        self.name = name
+        self.snapshot: Dict[str, object] = {}
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = {}   # 股票代码 -> 最早未处理推送的接收时间
+        self._timestamp = None                 # 最新推送的行情时间戳
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self._stats = {
+            'received': 0,          # 收到的推送次数
+            'coalesced': 0,         # 被合并的推送次数
+            'dropped': 0,           # 队列满被丢弃的标记数
+            'dispatches': 0,        # 处理函数调用次数
+            'errors': 0,            # 处理函数异常次数
+            'max_queue_depth': 0,
+            'last_latency': 0.0,    # 最近一次收到行情到处理完成的延迟（秒）
+            'max_latency': 0.0,
+            'total_latency': 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """启动工作线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"实时行情分发器已启动: 合并窗口 {self.coalesce_window * 1000:.0f}ms, 队列容量 {self.max_queue}")
+
+    def stop(self, timeout: float = 2.0):
+        """停止工作线程"""
+        if not self._running:
+            return
+        self._running = False
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        logger.info(f"实时行情分发器已停止: {self.stats()}")
+
+    # ------------------ 回调线程 ------------------
+
+    def submit(self, data: Mapping):
+        """提交一次行情推送（在行情回调线程中调用，不阻塞）
+
+        Args:
+            data: 推送数据，{股票代码: 行情} 并可包含 timestamp 字段
+        """
+        received = time.perf_counter()
+        timestamp = data.get('timestamp')
+        with self._lock:
+            if timestamp is not None:
+                self._timestamp = timestamp
+            for code, quote in data.items():
+                if code in RESERVED_KEYS or code.startswith('__'):
+                    continue
+                self._merge(code, quote)
+                self._stats['received'] += 1
+                if code in self._pending:
+                    self._stats['coalesced'] += 1
+                    continue
+                self._pending[code] = received
+                try:
+                    self._queue.put_nowait(code)
+                except queue.Full:
+                    # 标记仍保留在 _pending 中，随下一次分发一起处理
+                    self._stats['dropped'] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+
+    def _merge(self, code: str, quote):
+        """将推送的行情合并到快照，以新字典替换旧行情，不修改工作线程可能持有的旧字典"""
+        if isinstance(quote, list):
+            if not quote:
+                return
+            quote = quote[-1]
+        current = self.snapshot.get(code)
+        if isinstance(current, dict) and isinstance(quote, Mapping):
+            self.snapshot[code] = {**current, **quote}
+        elif isinstance(quote, Mapping):
+            self.snapshot[code] = dict(quote)
+        else:
+            self.snapshot[code] = quote
+
+    # ------------------ 工作线程 ------------------
+
+    def _worker(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if first is None:
+                break
+
+            # 在合并窗口内继续收集其他股票的标记
+            deadline = time.perf_counter() + self.coalesce_window
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._running = False
+                    break
+            # 清空窗口结束时已到达的标记
+            while True:
+                try:
+                    if self._queue.get_nowait() is None:
+                        self._running = False
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                view = dict(self.snapshot)
+                timestamp = self._timestamp
+            if not pending:
+                continue
+            earliest = min(pending.values())
+            try:
+                self.handler(view, list(pending), timestamp, earliest)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.error(f"实时行情处理异常: {e}", exc_info=True)
+            self._record_latency(time.perf_counter() - earliest)
+
+    def _record_latency(self, latency: float):
+        stats = self._stats
+        stats['dispatches'] += 1
+        stats['last_latency'] = latency
+        stats['total_latency'] += latency
+        if latency > stats['max_latency']:
+            stats['max_latency'] = latency
+
+    # ------------------ 统计 ------------------
+
+    def queue_depth(self) -> int:
+        """当前待处理队列深度"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict:
+        """分发统计：队列深度、合并/丢弃次数和延迟（毫秒）"""
+        stats = dict(self._stats)
+        dispatches = stats['dispatches']
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': stats['max_queue_depth'],
+            'received': stats['received'],
+            'coalesced': stats['coalesced'],
+            'dropped': stats['dropped'],
+            'dispatches': dispatches,
+            'errors': stats['errors'],
+            'last_latency_ms': stats['last_latency'] * 1000,
+            'avg_latency_ms': stats['total_latency'] / dispatches * 1000 if dispatches else 0.0,
+            'max_latency_ms': stats['max_latency'] * 1000,
+        }
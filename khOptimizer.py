@@ -0,0 +1,572 @@
+# coding: utf-8
+"""
+策略参数优化模块
+
+在 KhQuantFramework 的回测流程之上执行多进程参数扫描和滚动（walk-forward）优化：
+
+- 主进程先用第一组参数完整回测一次，通过 RecordingDataSource 记录全部行情请求，
+  再补记录回测开始前 warmup_days 天的行情，得到覆盖整个优化区间及各参数预热区间的
+  行情快照（见 khSnapshot）；
+- 快照放入模块全局变量后创建进程池，fork 启动的工作进程共享这份内存，
+  每个工作进程以不同的参数执行 run_headless()，行情只从快照读取，快照中没有的请求
+  使该次回测失败（而不是在工作进程中访问实时行情连接）；
+- 各组参数的回测结果按结果窗口（backtest_result_window）的公式计算收益、回撤、
+  夏普、索提诺、阿尔法/贝塔、胜率等指标，汇总为一张表写出到输出目录。
+
+参数名含 "." 时表示配置文件中的路径（如 "backtest.init_capital"），否则作为策略模块的
+全局变量在 init 之前设置，同时写入配置的 strategy_params 中。
+
+使用示例:
+    optimizer = ParameterOptimizer("strategies/双均线.kh", "strategies/双均线.py", max_workers=8)
+    summary = optimizer.grid({"SHORT": [3, 5, 10], "LONG": [20, 30, 60]})
+    windows = optimizer.walk_forward({"SHORT": [3, 5, 10], "LONG": [20, 30, 60]},
+                                     train_days=120, test_days=20)
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import copy
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from khSnapshot import MarketSnapshot, RecordingDataSource, SnapshotDataSource
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 结果窗口使用的年交易日数与默认基准日收益率
+TRADING_DAYS_PER_YEAR = 250
+DEFAULT_BENCHMARK_DAILY_RETURN = 0.0003
+
+SNAPSHOT_FILE = "market_snapshot.pkl"
+
+# 工作进程中使用的行情快照（fork 时继承自主进程）
+_SNAPSHOT: Optional[MarketSnapshot] = None
+
+
+def grid_schedule(param_grid: Dict[str, Sequence]) -> List[Dict[str, Any]]:
+    """网格参数组合，按参数定义顺序展开"""
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def random_schedule(param_grid: Dict[str, Sequence], n_trials: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """从参数网格中不重复地随机抽取 n_trials 组参数
+
+    网格很大时不展开全部组合，而是抽取组合序号后按各参数的取值个数逐位还原。
+    """
+    names = list(param_grid)
+    choices = [list(param_grid[name]) for name in names]
+    sizes = [len(values) for values in choices]
+    total = int(np.prod(sizes, dtype=object)) if sizes else 0
+    indices = random.Random(seed).sample(range(total), min(n_trials, total))
+    schedule = []
+    for index in indices:
+        params = {}
+        for name, values, size in zip(reversed(names), reversed(choices), reversed(sizes)):
+            index, position = divmod(index, size)
+            params[name] = values[position]
+        schedule.append({name: params[name] for name in names})
+    return schedule
+
+
+def walk_forward_windows(start_time: str, end_time: str, train_days: int, test_days: int,
+                         step_days: Optional[int] = None) -> List[Dict[str, str]]:
+    """按交易日划分滚动优化的训练/测试区间
+
+    Args:
+        start_time: 开始日期，格式 YYYYMMDD
+        end_time: 结束日期，格式 YYYYMMDD
+        train_days: 训练区间的交易日数
+        test_days: 测试区间的交易日数
+        step_days: 相邻窗口的间隔交易日数，默认等于 test_days
+
+    Returns:
+        List[Dict[str, str]]: 每个窗口的 train_start / train_end / test_start / test_end
+    """
+    from khQTTools import get_trading_calendar
+
+    days = [day.strftime("%Y%m%d") for day in get_trading_calendar().range(start_time, end_time)]
+    step_days = step_days or test_days
+    windows = []
+    offset = 0
+    while offset + train_days + test_days <= len(days):
+        windows.append({
+            'train_start': days[offset],
+            'train_end': days[offset + train_days - 1],
+            'test_start': days[offset + train_days],
+            'test_end': days[offset + train_days + test_days - 1],
+        })
+        offset += step_days
+    return windows
+
+
+def apply_params(config_dict: Dict, params: Dict[str, Any]) -> Dict[str, Any]:
+    """将参数写入配置字典
+
+    Args:
+        config_dict: 配置字典（原地修改）
+        params: 参数，名称含 "." 的为配置路径
+
+    Returns:
+        Dict[str, Any]: 策略参数（名称不含 "." 的部分），同时写入 config_dict["strategy_params"]
+    """
+    strategy_params = {}
+    for name, value in params.items():
+        if '.' in name:
+            node = config_dict
+            *parents, key = name.split('.')
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[key] = value
+        else:
+            strategy_params[name] = value
+    config_dict.setdefault('strategy_params', {}).update(strategy_params)
+    return strategy_params
+
+
+def _max_drawdown(values: np.ndarray) -> float:
+    if len(values) < 2:
+        return 0.0
+    cummax = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = (cummax - values) / cummax * 100
+    drawdown = drawdown[np.isfinite(drawdown)]
+    return float(drawdown.max()) if len(drawdown) else 0.0
+
+
+def _win_rate_and_profit_ratio(trades: pd.DataFrame) -> Tuple[float, float]:
+    """按股票以移动平均成本计算每笔卖出的盈亏，得到胜率和盈亏比"""
+    if trades is None or len(trades) == 0:
+        return 0.0, 0.0
+    direction = trades['action'] if 'action' in trades.columns else trades.get('direction')
+    if direction is None:
+        return 0.0, 0.0
+    direction = direction.astype(str).str.lower().replace({'买入': 'buy', '卖出': 'sell'})
+    time_column = 'datetime' if 'datetime' in trades.columns else 'time'
+    frame = pd.DataFrame({
+        'code': trades['code'].to_numpy(),
+        'time': trades[time_column].to_numpy(),
+        'direction': direction.to_numpy(),
+        'price': pd.to_numeric(trades['price'], errors='coerce').to_numpy(),
+        'volume': pd.to_numeric(trades['volume'], errors='coerce').to_numpy(),
+    })
+
+    sell_count = winning = 0
+    total_profit = total_loss = 0.0
+    for _, code_trades in frame.groupby('code', sort=False):
+        position = 0.0
+        cost_basis = 0.0
+        for row in code_trades.sort_values('time', kind='stable').itertuples(index=False):
+            if row.direction == 'buy':
+                new_position = position + row.volume
+                if new_position > 0:
+                    cost_basis = (cost_basis * position + row.price * row.volume) / new_position
+                position = new_position
+            elif row.direction == 'sell' and position > 0:
+                sell_volume = min(position, row.volume)
+                profit_loss = (row.price - cost_basis) * sell_volume
+                sell_count += 1
+                if profit_loss > 0:
+                    winning += 1
+                    total_profit += profit_loss
+                else:
+                    total_loss -= profit_loss
+                position -= sell_volume
+    win_rate = winning / sell_count if sell_count > 0 else 0.0
+    profit_ratio = total_profit / total_loss if total_loss > 0 else 0.0
+    return win_rate, profit_ratio
+
+
+def compute_metrics(daily_stats: pd.DataFrame, trades: pd.DataFrame, init_capital: float,
+                    benchmark_series=None, risk_free_rate: float = 0.03) -> Dict[str, float]:
+    """按结果窗口的公式计算一次回测的绩效指标
+
+    Args:
+        daily_stats: 每日统计，包含 date / total_asset / daily_return
+        trades: 交易记录
+        init_capital: 初始资金
+        benchmark_series: 基准指数序列（BenchmarkSeries），为空时不计算阿尔法/贝塔；设置了多个基准时按主基准计算
+        risk_free_rate: 无风险利率（小数）
+
+    Returns:
+        Dict[str, float]: 收益率类指标为百分数，与结果窗口的显示一致
+    """
+    metrics = {
+        'total_return': 0.0, 'annual_return': 0.0, 'max_drawdown': 0.0, 'volatility': 0.0,
+        'sharpe_ratio': 0.0, 'sortino_ratio': 0.0, 'alpha': 0.0, 'beta': 0.0,
+        'benchmark_return': 0.0, 'win_rate': 0.0, 'profit_ratio': 0.0,
+        'trade_count': len(trades) if trades is not None else 0,
+        'trade_days': len(daily_stats) if daily_stats is not None else 0,
+    }
+    if daily_stats is None or len(daily_stats) == 0:
+        return metrics
+
+    days = len(daily_stats)
+    assets = pd.to_numeric(daily_stats['total_asset'], errors='coerce').to_numpy(dtype=np.float64)
+    final_capital = assets[-1]
+    if init_capital > 0:
+        total_return_decimal = final_capital / init_capital - 1
+        metrics['total_return'] = total_return_decimal * 100
+        metrics['annual_return'] = (pow(1 + total_return_decimal, TRADING_DAYS_PER_YEAR / days) - 1) * 100
+    metrics['max_drawdown'] = _max_drawdown(assets[~np.isnan(assets)])
+    metrics['win_rate'], metrics['profit_ratio'] = _win_rate_and_profit_ratio(trades)
+
+    returns = pd.to_numeric(daily_stats['daily_return'], errors='coerce').dropna().reset_index(drop=True) \
+        if 'daily_return' in daily_stats.columns else pd.Series(dtype=np.float64)
+    n = len(returns)
+    if n >= 2:
+        # 年化波动率 σp = √(250/n·∑(rp - r̄p)²)
+        volatility = float(np.sqrt((TRADING_DAYS_PER_YEAR / n) * np.sum((returns - returns.mean()) ** 2)))
+        returns_annual = pow((1 + returns).prod(), TRADING_DAYS_PER_YEAR / n) - 1
+        metrics['volatility'] = volatility if np.isfinite(volatility) else 0.0
+        if metrics['volatility'] > 0:
+            metrics['sharpe_ratio'] = float((returns_annual - risk_free_rate) / volatility)
+
+    benchmark_returns = None
+    if benchmark_series is not None and len(benchmark_series) > 0:
+        column = benchmark_series.column()
+        closes = benchmark_series.closes[:, column]
+        prev_close = benchmark_series.prev_closes[column]
+        start_price = prev_close if np.isfinite(prev_close) and prev_close > 0 else closes[0]
+        if start_price > 0:
+            metrics['benchmark_return'] = float((closes[-1] - start_price) / start_price * 100)
+        benchmark_annual = (pow(1 + metrics['benchmark_return'] / 100, TRADING_DAYS_PER_YEAR / days) - 1) * 100
+        benchmark_returns = pd.Series(benchmark_series.returns())
+        if np.isnan(prev_close):
+            benchmark_returns = benchmark_returns.iloc[1:].reset_index(drop=True)
+
+        # 贝塔：按日期对齐策略与基准的日收益率（基准首日收益率不可用）
+        frame = pd.DataFrame({
+            'date': pd.to_datetime(daily_stats['date']).dt.strftime('%Y%m%d').astype(np.int64),
+            'daily_return': pd.to_numeric(daily_stats['daily_return'], errors='coerce'),
+        })
+        bench = pd.DataFrame({'date': benchmark_series.dates, 'return': pd.Series(closes).pct_change()})
+        merged = frame.merge(bench, on='date', how='inner').dropna()
+        if len(merged) > 10:
+            benchmark_variance = np.var(merged['return'])
+            beta = np.cov(merged['daily_return'], merged['return'])[0, 1] / benchmark_variance \
+                if benchmark_variance != 0 else 0.0
+            metrics['beta'] = float(beta) if np.isfinite(beta) else 0.0
+            if init_capital > 0:
+                risk_free_pct = risk_free_rate * 100
+                alpha = (metrics['annual_return'] - (risk_free_pct + metrics['beta'] * (benchmark_annual - risk_free_pct))) / 100
+                metrics['alpha'] = float(alpha) if np.isfinite(alpha) else 0.0
+
+    if n >= 2:
+        # 索提诺：下行波动率只计入策略收益率低于基准收益率的部分
+        if benchmark_returns is None or len(benchmark_returns) == 0:
+            benchmark_returns = pd.Series([DEFAULT_BENCHMARK_DAILY_RETURN] * n)
+        elif len(benchmark_returns) > n:
+            benchmark_returns = benchmark_returns.iloc[-n:].reset_index(drop=True)
+        elif len(benchmark_returns) < n:
+            padding = pd.Series([benchmark_returns.iloc[0]] * (n - len(benchmark_returns)))
+            benchmark_returns = pd.concat([padding, benchmark_returns]).reset_index(drop=True)
+        diff = returns.to_numpy() - benchmark_returns.to_numpy(dtype=np.float64)
+        downside_risk = np.sqrt((TRADING_DAYS_PER_YEAR / n) * np.sum(np.where(diff < 0, diff ** 2, 0.0)))
+        if downside_risk == 0 or np.isnan(downside_risk):
+            metrics['sortino_ratio'] = np.inf if returns_annual > risk_free_rate else 0.0
+        else:
+            sortino = (returns_annual - risk_free_rate) / downside_risk
+            metrics['sortino_ratio'] = 0.0 if np.isnan(sortino) else float(sortino)
+    return metrics
+
+
+def _init_worker(snapshot_path: Optional[str]):
+    """工作进程初始化：fork 启动时已继承快照，否则从文件加载一次"""
+    global _SNAPSHOT
+    if _SNAPSHOT is None and snapshot_path and os.path.exists(snapshot_path):
+        _SNAPSHOT = MarketSnapshot.load(snapshot_path)
+
+
+def _run_trial(task: Dict) -> Dict:
+    """执行一组参数的回测并计算指标
+
+    task 包含 trial_id、config、strategy_file、params、trial_dir、risk_free_rate，
+    主进程记录快照时额外传入 data_source；strict_snapshot 为True时快照未命中即失败。
+    """
+    from khFrame import KhQuantFramework
+
+    started = time.time()
+    row = {'trial_id': task['trial_id'], **task['params']}
+    data_source = None
+    try:
+        config_dict = copy.deepcopy(task['config'])
+        strategy_params = apply_params(config_dict, task['params'])
+        os.makedirs(task['trial_dir'], exist_ok=True)
+        config_path = os.path.join(task['trial_dir'], 'config.kh')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config_dict, f, ensure_ascii=False, indent=2)
+
+        framework = KhQuantFramework(config_path, task['strategy_file'])
+        for name, value in strategy_params.items():
+            setattr(framework.strategy_module, name, value)
+        data_source = task.get('data_source')
+        if data_source is None and _SNAPSHOT is not None:
+            data_source = SnapshotDataSource(_SNAPSHOT, strict=task.get('strict_snapshot', False))
+        if data_source is not None:
+            framework.data_source = data_source
+        framework.results_root = task['trial_dir']
+
+        records = framework.run_headless()
+        metrics = compute_metrics(
+            pd.DataFrame(records.get('daily_stats', [])),
+            pd.DataFrame(records.get('trades', [])),
+            records.get('init_capital', 0),
+            framework.benchmark_series,
+            task['risk_free_rate']
+        )
+        row.update(metrics)
+        row['backtest_dir'] = framework.backtest_dir
+    except Exception as e:
+        logger.error(f"参数组合 {task['params']} 回测失败: {e}", exc_info=True)
+        row['error'] = str(e)
+    if isinstance(data_source, SnapshotDataSource):
+        row['snapshot_misses'] = data_source.misses
+        row['strict_snapshot'] = data_source.strict
+    row['elapsed'] = time.time() - started
+    return row
+
+
+class ParameterOptimizer:
+    """多进程参数优化器
+
+    Attributes:
+        output_dir: 输出目录，包含 trials/{trial_id}/ 下的各次回测结果和汇总表
+        objective: 选取最优参数的指标名称，越大越好
+    """
+
+    def __init__(self, config_path: str, strategy_file: str, output_dir: str = "optimization_results",
+                 max_workers: Optional[int] = None, objective: str = 'sharpe_ratio',
+                 risk_free_rate: float = 0.03, warmup_days: int = 365):
+        """初始化优化器
+
+        Args:
+            config_path: 策略配置文件（.kh）路径
+            strategy_file: 策略文件路径
+            output_dir: 输出目录
+            max_workers: 进程数，默认为CPU核数，为1时在当前进程中串行回测
+            objective: 选取最优参数的指标，见 compute_metrics 的返回值
+            risk_free_rate: 无风险利率（小数），与结果窗口的设置保持一致
+            warmup_days: 记录快照时在回测开始前额外记录的自然日数，需覆盖各组参数
+                指标计算所需的最长历史（khHistoryCache.history_lookback_days）
+        """
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.base_config = json.load(f)
+        self.base_config['strategy_file'] = os.path.abspath(strategy_file)
+        self.strategy_file = os.path.abspath(strategy_file)
+        self.output_dir = os.path.abspath(output_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.objective = objective
+        self.risk_free_rate = risk_free_rate
+        self.warmup_days = warmup_days
+        self.snapshot: Optional[MarketSnapshot] = None
+        self._trial_count = 0
+
+    def _task(self, params: Dict[str, Any], start_time: str, end_time: str, **extra) -> Dict:
+        config = copy.deepcopy(self.base_config)
+        config.setdefault('backtest', {})
+        config['backtest']['start_time'] = start_time
+        config['backtest']['end_time'] = end_time
+        trial_id = self._trial_count
+        self._trial_count += 1
+        task = {
+            'trial_id': trial_id,
+            'config': config,
+            'strategy_file': self.strategy_file,
+            'params': dict(params),
+            'trial_dir': os.path.join(self.output_dir, 'trials', str(trial_id)),
+            'risk_free_rate': self.risk_free_rate,
+        }
+        task.update(extra)
+        return task
+
+    def _record_snapshot(self, params: Dict[str, Any], start_time: str, end_time: str) -> Dict:
+        """在主进程中回测一次并记录行情快照，返回该次回测的结果"""
+        from xtquant import xtdata
+
+        recorder = RecordingDataSource(xtdata, self.snapshot)
+        self.snapshot = recorder.snapshot
+        started = time.time()
+        row = _run_trial(self._task(params, start_time, end_time, data_source=recorder))
+        self._record_warmup(recorder, start_time)
+        logger.info(f"行情快照记录完成: {len(self.snapshot)} 个请求, 耗时 {time.time() - started:.2f}秒")
+        return row
+
+    def _record_warmup(self, recorder: RecordingDataSource, start_time: str):
+        """补记录回测开始前 warmup_days 天的K线
+
+        记录回测只包含第一组参数所需的预热数据，其他参数（或滚动优化中靠后的子区间）
+        需要更长的历史时，由这段数据与回测区间内的数据拼接得到。
+        """
+        if self.warmup_days <= 0:
+            return
+        start_date = start_time[:8]
+        warmup_start = (datetime.datetime.strptime(start_date, '%Y%m%d')
+                        - datetime.timedelta(days=self.warmup_days)).strftime('%Y%m%d')
+        for request in list(self.snapshot.requests('get_market_data_ex')):
+            if request['count'] != -1 or request['start_time'][:8] != start_date:
+                continue
+            try:
+                recorder.get_market_data_ex(
+                    field_list=list(request['field_list']), stock_list=list(request['stock_list']),
+                    period=request['period'], start_time=warmup_start, end_time=request['start_time'],
+                    count=-1, dividend_type=request['dividend_type'], fill_data=request['fill_data'])
+            except Exception as e:
+                logger.warning(f"记录预热区间行情失败: {e}")
+
+    def _run_tasks(self, tasks: List[Dict]) -> List[Dict]:
+        """在进程池中执行回测任务，工作进程共享主进程记录的行情快照"""
+        global _SNAPSHOT
+        if not tasks:
+            return []
+        _SNAPSHOT = self.snapshot
+        try:
+            if self.max_workers == 1 or len(tasks) == 1:
+                return [_run_trial(task) for task in tasks]
+
+            # 工作进程不访问实时行情连接，快照未命中时该次回测失败
+            for task in tasks:
+                task['strict_snapshot'] = True
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+            snapshot_path = None
+            if context.get_start_method() != 'fork' and self.snapshot is not None:
+                snapshot_path = os.path.join(self.output_dir, SNAPSHOT_FILE)
+                self.snapshot.save(snapshot_path)
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks)), mp_context=context,
+                                     initializer=_init_worker, initargs=(snapshot_path,)) as executor:
+                return list(executor.map(_run_trial, tasks))
+        finally:
+            _SNAPSHOT = None
+
+    def _summarize(self, rows: List[Dict], file_name: str) -> pd.DataFrame:
+        summary = pd.DataFrame(rows)
+        if 'snapshot_misses' in summary.columns:
+            missed = summary['snapshot_misses'].fillna(0).gt(0)
+            strict = summary['strict_snapshot'].fillna(False).astype(bool)
+            # 进程池中的回测为 strict 模式，未命中即失败；串行回测未命中时回退到 xtdata
+            if (missed & strict).any():
+                logger.warning(f"{int((missed & strict).sum())} 组回测的行情不在快照中，工作进程不访问 xtdata，"
+                               f"这些回测已失败，可增大 warmup_days")
+            if (missed & ~strict).any():
+                logger.warning(f"{int((missed & ~strict).sum())} 组回测的行情不在快照中，"
+                               f"已回退到 xtdata，可增大 warmup_days")
+        failed = summary['error'].notna().sum() if 'error' in summary.columns else 0
+        if failed:
+            logger.warning(f"{failed} 组回测失败，详见汇总表的 error 列")
+        if self.objective in summary.columns:
+            summary = summary.sort_values(self.objective, ascending=False, kind='stable', na_position='last')
+        summary = summary.reset_index(drop=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary.to_csv(os.path.join(self.output_dir, file_name), index=False, encoding='utf-8-sig')
+        return summary
+
+    def run(self, schedule: List[Dict[str, Any]], start_time: Optional[str] = None,
+            end_time: Optional[str] = None, file_name: str = "summary.csv") -> pd.DataFrame:
+        """按给定的参数组合列表回测并汇总
+
+        第一组参数在主进程中回测并记录行情快照，其余参数组合在进程池中并行回测。
+
+        Args:
+            schedule: 参数组合列表
+            start_time: 回测开始日期，默认使用配置文件中的设置
+            end_time: 回测结束日期，默认使用配置文件中的设置
+            file_name: 汇总表文件名
+
+        Returns:
+            pd.DataFrame: 每组参数一行，按 objective 从高到低排列
+        """
+        if not schedule:
+            return pd.DataFrame()
+        start_time = start_time or self.base_config['backtest']['start_time']
+        end_time = end_time or self.base_config['backtest']['end_time']
+        started = time.time()
+        rows = [self._record_snapshot(schedule[0], start_time, end_time)]
+        rows += self._run_tasks([self._task(params, start_time, end_time) for params in schedule[1:]])
+        logger.info(f"参数优化完成: {len(rows)} 组参数, 进程数 {self.max_workers}, 耗时 {time.time() - started:.2f}秒")
+        return self._summarize(rows, file_name)
+
+    def grid(self, param_grid: Dict[str, Sequence], **kwargs) -> pd.DataFrame:
+        """网格搜索，参数见 run()"""
+        return self.run(grid_schedule(param_grid), **kwargs)
+
+    def random(self, param_grid: Dict[str, Sequence], n_trials: int, seed: Optional[int] = None,
+               **kwargs) -> pd.DataFrame:
+        """随机搜索，从参数网格中抽取 n_trials 组参数，其余参数见 run()"""
+        return self.run(random_schedule(param_grid, n_trials, seed), **kwargs)
+
+    def walk_forward(self, param_grid: Dict[str, Sequence], train_days: int, test_days: int,
+                     step_days: Optional[int] = None, start_time: Optional[str] = None,
+                     end_time: Optional[str] = None) -> pd.DataFrame:
+        """滚动优化：在每个训练区间网格搜索最优参数，再用该参数回测紧随其后的测试区间
+
+        全部训练区间的参数组合在同一个进程池中并行回测，之后并行回测各测试区间；
+        行情快照只在整个区间上记录一次。训练区间的明细写出到 trials.csv。
+
+        Returns:
+            pd.DataFrame: 每个窗口一行，包含区间、最优参数、训练区间目标值和测试区间指标，
+                同时写出到 walk_forward.csv
+        """
+        start_time = start_time or self.base_config['backtest']['start_time']
+        end_time = end_time or self.base_config['backtest']['end_time']
+        windows = walk_forward_windows(start_time, end_time, train_days, test_days, step_days)
+        schedule = grid_schedule(param_grid)
+        if not windows or not schedule:
+            logger.warning("回测区间不足一个训练+测试窗口，或参数网格为空")
+            return pd.DataFrame()
+
+        started = time.time()
+        self._record_snapshot(schedule[0], windows[0]['train_start'], windows[-1]['test_end'])
+
+        train_tasks = []
+        for window_index, window in enumerate(windows):
+            for params in schedule:
+                task = self._task(params, window['train_start'], window['train_end'])
+                task['window'] = window_index
+                train_tasks.append(task)
+        train_rows = self._run_tasks(train_tasks)
+        for task, row in zip(train_tasks, train_rows):
+            row['window'] = task['window']
+        trials = self._summarize(train_rows, "trials.csv")
+
+        best_params = []
+        test_tasks = []
+        for window_index, window in enumerate(windows):
+            candidates = trials[(trials['window'] == window_index) & trials[self.objective].notna()] \
+                if self.objective in trials.columns else trials.iloc[0:0]
+            if len(candidates) == 0:
+                best_params.append(None)
+                continue
+            best = candidates.iloc[0]
+            params = {name: best[name] for name in param_grid}
+            params = {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+            best_params.append((params, best[self.objective]))
+            test_tasks.append(self._task(params, window['test_start'], window['test_end'], window=window_index))
+        test_rows = {task['window']: row for task, row in zip(test_tasks, self._run_tasks(test_tasks))}
+
+        rows = []
+        for window_index, window in enumerate(windows):
+            row = {'window': window_index, **window}
+            if best_params[window_index] is not None:
+                params, train_score = best_params[window_index]
+                row.update(params)
+                row[f'train_{self.objective}'] = train_score
+                row.update({k: v for k, v in test_rows[window_index].items() if k not in params})
+            rows.append(row)
+
+        summary = pd.DataFrame(rows)
+        summary.to_csv(os.path.join(self.output_dir, "walk_forward.csv"), index=False, encoding='utf-8-sig')
+        logger.info(f"滚动优化完成: {len(windows)} 个窗口 x {len(schedule)} 组参数, 耗时 {time.time() - started:.2f}秒")
+        return summary
@@ -0,0 +1,343 @@
+# coding: utf-8
+"""
+持仓账本模块
+
+回测中的持仓原先是 {股票代码: 持仓字典} 的嵌套字典，每根K线记录结果时要逐只重算
+市值和盈亏，风控检查又要再遍历同一批字典求和市值。PortfolioLedger 将持仓的数值字段
+按列存放在 NumPy 数组中（以股票编号表的槽位为下标），盯市计算一次向量化完成，
+并缓存持仓总市值；同时实现 MutableMapping 接口，positions[code]['volume'] /
+.get() / in / .items() / del 等原有读写方式保持不变，读取 __positions__ 的策略无需修改。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+# 整数数值字段（持仓数量类）
+INT_FIELDS = ('volume', 'can_use_volume', 'frozen_volume', 'on_road_volume', 'yesterday_volume')
+# 浮点数值字段（价格与金额类）
+FLOAT_FIELDS = ('open_price', 'market_value', 'avg_price', 'current_price', 'profit', 'profit_ratio')
+NUMERIC_FIELDS = INT_FIELDS + FLOAT_FIELDS
+
+# 持仓视图的键顺序，与原持仓字典的字段顺序一致
+POSITION_KEYS = (
+    'account_type', 'account_id', 'stock_code', 'volume', 'can_use_volume', 'open_price',
+    'market_value', 'frozen_volume', 'on_road_volume', 'yesterday_volume', 'avg_price',
+    'current_price', 'direction', 'profit', 'profit_ratio'
+)
+_OBJECT_KEYS = ('account_type', 'account_id', 'direction')
+
+
+def _sequential_sum(values: np.ndarray) -> float:
+    """按顺序逐个累加求和，结果与 Python 循环 += 完全一致（np.sum 为成对求和）"""
+    if len(values) == 0:
+        return 0.0
+    return float(np.cumsum(values)[-1])
+
+
+class PositionView(MutableMapping):
+    """单只股票持仓的字典视图
+
+    不复制数据，读写直接作用于账本中该股票所在槽位的数组元素。
+    数值字段以 Python int/float 返回，便于日志输出和JSON序列化。
+    """
+
+    __slots__ = ('_ledger', '_slot')
+
+    def __init__(self, ledger: 'PortfolioLedger', slot: int):
+        self._ledger = ledger
+        self._slot = slot
+
+    def __getitem__(self, key):
+        ledger = self._ledger
+        if key in ledger._arrays:
+            return ledger._arrays[key][self._slot].item()
+        if key == 'stock_code':
+            return ledger._codes[self._slot]
+        return ledger._extras[self._slot][key]
+
+    def __setitem__(self, key, value):
+        ledger = self._ledger
+        if key in ledger._arrays:
+            ledger._arrays[key][self._slot] = value
+            if key == 'market_value':
+                ledger._total = None
+        elif key == 'stock_code':
+            if value != ledger._codes[self._slot]:
+                raise ValueError(f"持仓视图的股票代码不可修改: {ledger._codes[self._slot]} -> {value}")
+        else:
+            ledger._extras[self._slot][key] = value
+
+    def __delitem__(self, key):
+        if key in self._ledger._arrays or key == 'stock_code':
+            raise KeyError(f"持仓基本字段不可删除: {key}")
+        del self._ledger._extras[self._slot][key]
+
+    def __iter__(self) -> Iterator[str]:
+        extras = self._ledger._extras[self._slot]
+        for key in POSITION_KEYS:
+            if key in _OBJECT_KEYS:
+                if key in extras:
+                    yield key
+            else:
+                yield key
+        for key in extras:
+            if key not in _OBJECT_KEYS:
+                yield key
+
+    def __len__(self) -> int:
+        extras = self._ledger._extras[self._slot]
+        return len(NUMERIC_FIELDS) + 1 + len(extras)
+
+    def __contains__(self, key) -> bool:
+        return key in self._ledger._arrays or key == 'stock_code' or key in self._ledger._extras[self._slot]
+
+    def copy(self) -> Dict:
+        """复制为普通字典"""
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+
+class PortfolioLedger(MutableMapping):
+    """基于 NumPy 数组的持仓账本
+
+    每只股票在股票编号表中分配一个固定槽位，清仓后槽位保留，再次买入时复用，
+    因此槽位下标可以与行情列式存储的列下标建立一次性的映射。当前持仓按建仓
+    顺序记录在 _active 中，迭代顺序与原持仓字典一致。
+
+    Attributes:
+        volume / can_use_volume / avg_price / current_price / market_value / ...:
+            各数值字段的数组（按槽位下标，长度为容量，只有活动槽位有意义）
+    """
+
+    def __init__(self, positions: Optional[Mapping] = None, capacity: int = 16):
+        """初始化持仓账本
+
+        Args:
+            positions: 初始持仓，{股票代码: 持仓字典}
+            capacity: 初始槽位容量，不足时自动翻倍扩容
+        """
+        capacity = max(int(capacity), 1)
+        self._arrays = {field: np.zeros(capacity, dtype=np.int64) for field in INT_FIELDS}
+        self._arrays.update({field: np.zeros(capacity, dtype=np.float64) for field in FLOAT_FIELDS})
+        self._codes = []            # 槽位 -> 股票代码
+        self._extras = []           # 槽位 -> 非数值字段
+        self._slots = {}            # 股票代码 -> 槽位（股票编号表）
+        self._active = {}           # 当前持仓：股票代码 -> 槽位，保持建仓顺序
+        self._active_slots = None   # 活动槽位数组缓存
+        self._total = None          # 持仓总市值缓存
+        if positions:
+            for code, position in positions.items():
+                self[code] = position
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('_arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    # ------------------ 股票编号表 ------------------
+
+    @property
+    def n_slots(self) -> int:
+        """已分配的槽位数"""
+        return len(self._codes)
+
+    @property
+    def slot_codes(self):
+        """槽位对应的股票代码列表"""
+        return self._codes
+
+    def slot_of(self, code: str) -> int:
+        """获取股票代码的槽位，未登记时分配新槽位"""
+        slot = self._slots.get(code)
+        if slot is None:
+            slot = len(self._codes)
+            if slot >= len(self._arrays['volume']):
+                self._grow(slot + 1)
+            self._codes.append(code)
+            self._extras.append({})
+            self._slots[code] = slot
+        return slot
+
+    def register(self, codes: Iterable[str]) -> np.ndarray:
+        """批量登记股票代码（不建仓）
+
+        Args:
+            codes: 股票代码列表
+
+        Returns:
+            np.ndarray: 各股票代码对应的槽位
+        """
+        return np.array([self.slot_of(code) for code in codes], dtype=np.int64)
+
+    def _grow(self, min_capacity: int):
+        capacity = len(self._arrays['volume'])
+        while capacity < min_capacity:
+            capacity *= 2
+        for field, array in self._arrays.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            self._arrays[field] = grown
+
+    @property
+    def active_slots(self) -> np.ndarray:
+        """当前持仓的槽位数组（按建仓顺序）"""
+        if self._active_slots is None:
+            self._active_slots = np.fromiter(self._active.values(), dtype=np.int64, count=len(self._active))
+        return self._active_slots
+
+    # ------------------ 字典接口 ------------------
+
+    def __getitem__(self, code) -> PositionView:
+        return PositionView(self, self._active[code])
+
+    def __setitem__(self, code, position: Mapping):
+        slot = self.slot_of(code)
+        arrays = self._arrays
+        for field in NUMERIC_FIELDS:
+            arrays[field][slot] = position.get(field, 0)
+        self._extras[slot] = {
+            key: value for key, value in position.items()
+            if key not in arrays and key != 'stock_code'
+        }
+        if code not in self._active:
+            self._active[code] = slot
+            self._active_slots = None
+        self._total = None
+
+    def __delitem__(self, code):
+        slot = self._active.pop(code)
+        for array in self._arrays.values():
+            array[slot] = 0
+        self._extras[slot] = {}
+        self._active_slots = None
+        self._total = None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._active)
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    def __contains__(self, code) -> bool:
+        return code in self._active
+
+    def clear(self):
+        for code in list(self._active):
+            del self[code]
+
+    def copy(self) -> Dict[str, Dict]:
+        """复制为普通的 {股票代码: 持仓字典}（快照，可直接JSON序列化）"""
+        return {code: PositionView(self, slot).copy() for code, slot in self._active.items()}
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    # ------------------ 批量操作 ------------------
+
+    def slots_of(self, codes: Iterable[str]) -> np.ndarray:
+        """各股票代码在当前持仓中的槽位，未持仓为-1"""
+        active = self._active
+        return np.array([active.get(code, -1) for code in codes], dtype=np.int64)
+
+    def open_many(self, codes, values: Dict[str, np.ndarray], extras: Optional[Dict] = None) -> np.ndarray:
+        """批量建仓，效果与逐只 ledger[code] = {...} 相同
+
+        Args:
+            codes: 股票代码列表（不应重复）
+            values: 数值字段名到数组（或标量）的映射，未给出的字段为0
+            extras: 各持仓共同的非数值字段，如 account_type / account_id / direction
+
+        Returns:
+            np.ndarray: 新建持仓的槽位
+        """
+        slots = self.register(codes)
+        for field, array in self._arrays.items():
+            array[slots] = values.get(field, 0)
+        extras = extras or {}
+        for code, slot in zip(codes, slots.tolist()):
+            self._extras[slot] = dict(extras)
+            self._active.setdefault(code, slot)
+        self._active_slots = None
+        self._total = None
+        return slots
+
+    def mark_dirty(self):
+        """直接修改数值数组后调用，使总市值缓存失效"""
+        self._total = None
+
+    # ------------------ 向量化计算 ------------------
+
+    def mark_to_market(self, prices, positive_cost_only: bool = False) -> float:
+        """按最新价格向量化更新所有持仓的现价、市值和盈亏
+
+        Args:
+            prices: 与 active_slots 对齐的价格数组
+            positive_cost_only: 为True时仅在均价大于0时计算盈亏比例，否则在均价不为0时计算
+
+        Returns:
+            float: 持仓总市值（按建仓顺序累加）
+        """
+        slots = self.active_slots
+        if len(slots) == 0:
+            self._total = 0.0
+            return 0.0
+        arrays = self._arrays
+        prices = np.asarray(prices, dtype=np.float64)
+        volume = arrays['volume'][slots]
+        avg_price = arrays['avg_price'][slots]
+        market_value = prices * volume
+        diff = prices - avg_price
+        has_cost = avg_price > 0 if positive_cost_only else avg_price != 0
+        ratio = np.zeros(len(slots), dtype=np.float64)
+        np.divide(diff, avg_price, out=ratio, where=has_cost)
+
+        arrays['current_price'][slots] = prices
+        arrays['market_value'][slots] = market_value
+        arrays['profit'][slots] = diff * volume
+        arrays['profit_ratio'][slots] = ratio
+        self._total = _sequential_sum(market_value)
+        return self._total
+
+    def total_market_value(self, positive_only: bool = False) -> float:
+        """持仓总市值
+
+        Args:
+            positive_only: 为True时只累加市值大于0的持仓
+
+        Returns:
+            float: 总市值，未发生变化时直接返回缓存值
+        """
+        market_value = self._arrays['market_value'][self.active_slots]
+        if positive_only:
+            return _sequential_sum(market_value[market_value > 0])
+        if self._total is None:
+            self._total = _sequential_sum(market_value)
+        return self._total
+
+    def exposure(self) -> float:
+        """持仓敞口：市值为0的持仓按 现价×数量 估算（风控使用）"""
+        slots = self.active_slots
+        market_value = self._arrays['market_value'][slots]
+        estimated = self._arrays['current_price'][slots] * self._arrays['volume'][slots]
+        return _sequential_sum(np.where(market_value != 0, market_value, estimated))
+
+    def fallback_prices(self) -> np.ndarray:
+        """无行情时的估值价格：现价大于0时用现价，否则用持仓均价"""
+        slots = self.active_slots
+        current_price = self._arrays['current_price'][slots]
+        return np.where(current_price > 0, current_price, self._arrays['avg_price'][slots])
+
+    def release_t1(self):
+        """T+1模式新交易日：将持仓数量大于0的可用数量更新为持仓数量"""
+        slots = self.active_slots
+        volume = self._arrays['volume'][slots]
+        held = slots[volume > 0]
+        self._arrays['can_use_volume'][held] = self._arrays['volume'][held]
@@ -24,6 +24,7 @@ if is_subprocess():
 
 import csv
 import time
+import threading
 from datetime import datetime, timedelta
 import pandas as pd
 from xtquant import xtdata
@@ -37,6 +38,12 @@ from functools import lru_cache
 from typing import Dict, List, Union, Optional
 import math
 from khTrade import KhTradeManager
+from khFeatures import FeaturePipeline
+from khLabels import ReturnLabelBuilder, date_to_int, matching_files
+from khDataLake import write_frame
+from khHistoryCache import get_active_history_cache, history_lookback_days
+from khDownloader import (BulkDownloader, download_history_batch, default_journal_dir, task_key,
+                          DEFAULT_CHUNK_SIZE, DEFAULT_DOWNLOAD_WORKERS, DEFAULT_RATE_LIMIT)
 from types import SimpleNamespace
 
 # 延迟导入Qt相关模块，避免在子进程中意外启动Qt应用
@@ -104,26 +111,12 @@ def _is_trade_day_cached(date_str: str) -> bool:
         - 只处理标准格式的日期字符串，参数预处理由外部函数完成
     """
     try:
-        # 解析日期（支持两种标准格式）
-        if '-' in date_str and len(date_str) == 10:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        elif date_str.isdigit() and len(date_str) == 8:
-            date_obj = datetime.strptime(date_str, "%Y%m%d")
-        else:
-            # 非标准格式，不使用缓存
+        # 只处理两种标准格式，其余格式由外部函数预处理
+        if not (('-' in date_str and len(date_str) == 10) or (date_str.isdigit() and len(date_str) == 8)):
             return False
 
-        # 首先排除周末 (5代表周六, 6代表周日)
-        if date_obj.weekday() >= 5:
-            return False
-
-        # 使用holidays库判断是否为法定节假日
-        date_only = date_obj.date()
-        if date_only in _cn_holidays:
-            return False
-
-        # 非周末且非法定节假日，则视为交易日
-        return True
+        # 周末与法定节假日均已包含在数组化交易日历中
+        return get_trading_calendar().is_trade_day(date_str)
 
     except Exception:
         # 解析失败，返回False（非交易日）
@@ -146,29 +139,8 @@ def _get_trade_days_count_cached(start_date: str, end_date: str) -> int:
         - 内部调用带缓存的_is_trade_day_cached函数
     """
     try:
-        # 解析起始和结束日期
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-
-        # 确保开始日期不晚于结束日期
-        if start_dt > end_dt:
-            return 0
-
-        # 初始化计数器
-        trade_days = 0
-
-        # 遍历日期范围内的每一天
-        current_dt = start_dt
-        while current_dt <= end_dt:
-            current_date_str = current_dt.strftime("%Y-%m-%d")
-            # 使用带缓存的is_trade_day函数判断
-            if _is_trade_day_cached(current_date_str):
-                trade_days += 1
-
-            # 前进到下一天
-            current_dt += timedelta(days=1)
-
-        return trade_days
+        # 基于交易日序数数组的二分查找，无需逐日遍历
+        return get_trading_calendar().count(start_date, end_date)
 
     except Exception:
         return 0
@@ -181,8 +153,10 @@ def clear_trade_calendar_cache() -> None:
         - 在需要更新交易日历数据时调用（如假期调整）
         - 正常情况下无需调用，LRU会自动管理缓存
     """
+    global _trading_calendar
     _is_trade_day_cached.cache_clear()
     _get_trade_days_count_cached.cache_clear()
+    _trading_calendar = None
     logging.info("交易日历缓存已清理")
 
 def get_trade_calendar_cache_info() -> Dict[str, int]:
@@ -211,6 +185,190 @@ def get_trade_calendar_cache_info() -> Dict[str, int]:
         'get_trade_days_count_maxsize': info2.maxsize
     }
 
+# ============================================================================
+# 数组化交易日历
+# ============================================================================
+
+class TradingCalendar:
+    """数组化交易日历
+
+    按年份区间一次性构建：所有日期的交易日布尔查找表，以及排序后的
+    int32 交易日序数数组（date.toordinal）。
+
+    - is_trade_day: O(1) 查表，支持传入数组批量判断
+    - count / next_trade_day / prev_trade_day / range: 基于 searchsorted，O(log n)
+
+    查询超出已构建年份范围时自动扩展。
+
+    使用示例:
+        cal = get_trading_calendar()
+        cal.is_trade_day("2024-10-08")            # True
+        cal.count("2024-01-01", "2024-12-31")     # 区间交易日数
+        cal.next_trade_day("2024-10-01")          # datetime(2024, 10, 8)
+    """
+
+    def __init__(self, start_year: Optional[int] = None, end_year: Optional[int] = None):
+        """初始化交易日历
+
+        Args:
+            start_year: 起始年份，默认2000年
+            end_year: 结束年份，默认下一年
+        """
+        self._lock = threading.Lock()
+        self._build(start_year or 2000, end_year or datetime.now().year + 1)
+
+    def _build(self, start_year: int, end_year: int) -> None:
+        """构建指定年份区间的日历数组"""
+        first = datetime(start_year, 1, 1).toordinal()
+        last = datetime(end_year, 12, 31).toordinal()
+        ordinals = np.arange(first, last + 1, dtype=np.int32)
+        # 公历序数1（0001-01-01）为周一
+        weekdays = (ordinals - 1) % 7
+        holiday_ordinals = np.array(
+            [d.toordinal() for d in holidays.China(years=range(start_year, end_year + 1)).keys()],
+            dtype=np.int32
+        )
+        is_trade = (weekdays < 5) & ~np.isin(ordinals, holiday_ordinals)
+
+        self.start_year = start_year
+        self.end_year = end_year
+        self.first_ordinal = first
+        self.last_ordinal = last
+        self.is_trade_table = is_trade
+        self.trade_ordinals = ordinals[is_trade]
+
+    def _ensure_range(self, min_ordinal: int, max_ordinal: int) -> None:
+        """确保日历覆盖给定的序数区间"""
+        if min_ordinal >= self.first_ordinal and max_ordinal <= self.last_ordinal:
+            return
+        with self._lock:
+            start_year = min(self.start_year, datetime.fromordinal(max(int(min_ordinal), 1)).year)
+            end_year = max(self.end_year, datetime.fromordinal(max(int(max_ordinal), 1)).year)
+            if start_year != self.start_year or end_year != self.end_year:
+                self._build(start_year, end_year)
+
+    @staticmethod
+    def to_ordinal(value) -> int:
+        """将日期转换为公历序数
+
+        Args:
+            value: 日期，支持 datetime/date 对象、公历序数（int），
+                以及 "YYYY-MM-DD"、"YYYYMMDD"、"YYYY/MM/DD" 格式的字符串
+
+        Returns:
+            int: 公历序数
+
+        Raises:
+            ValueError: 无法解析日期时抛出
+        """
+        if hasattr(value, 'toordinal'):
+            return value.toordinal()
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        text = str(value).strip()
+        if len(text) == 10 and text[4] in '-/' and text[7] in '-/':
+            return datetime(int(text[:4]), int(text[5:7]), int(text[8:10])).toordinal()
+        if len(text) == 8 and text.isdigit():
+            return datetime(int(text[:4]), int(text[4:6]), int(text[6:8])).toordinal()
+        raise ValueError(f"无法解析日期格式: {value}")
+
+    def is_trade_day(self, value) -> Union[bool, np.ndarray]:
+        """判断是否为交易日
+
+        Args:
+            value: 单个日期，或公历序数数组（np.ndarray）/日期序列
+
+        Returns:
+            单个日期返回bool，数组输入返回同形状的布尔数组
+        """
+        if isinstance(value, (np.ndarray, list, tuple)):
+            if isinstance(value, np.ndarray) and value.dtype.kind in 'iu':
+                ordinals = value.astype(np.int64)
+            else:
+                ordinals = np.array([self.to_ordinal(v) for v in value], dtype=np.int64)
+            if ordinals.size == 0:
+                return np.zeros(ordinals.shape, dtype=bool)
+            self._ensure_range(int(ordinals.min()), int(ordinals.max()))
+            return self.is_trade_table[ordinals - self.first_ordinal]
+
+        ordinal = self.to_ordinal(value)
+        self._ensure_range(ordinal, ordinal)
+        return bool(self.is_trade_table[ordinal - self.first_ordinal])
+
+    def count(self, start, end) -> int:
+        """计算闭区间 [start, end] 内的交易日数量"""
+        start_ord = self.to_ordinal(start)
+        end_ord = self.to_ordinal(end)
+        if start_ord > end_ord:
+            return 0
+        self._ensure_range(start_ord, end_ord)
+        left = np.searchsorted(self.trade_ordinals, start_ord, side='left')
+        right = np.searchsorted(self.trade_ordinals, end_ord, side='right')
+        return int(right - left)
+
+    def next_trade_day(self, value, include_self: bool = False) -> datetime:
+        """获取给定日期之后的第一个交易日
+
+        Args:
+            value: 日期
+            include_self: 给定日期本身是交易日时是否直接返回
+
+        Returns:
+            datetime: 交易日（时间部分为0点）
+        """
+        ordinal = self.to_ordinal(value)
+        self._ensure_range(ordinal, ordinal + 31)
+        side = 'left' if include_self else 'right'
+        idx = np.searchsorted(self.trade_ordinals, ordinal, side=side)
+        return datetime.fromordinal(int(self.trade_ordinals[idx]))
+
+    def prev_trade_day(self, value, include_self: bool = False) -> Optional[datetime]:
+        """获取给定日期之前的最后一个交易日
+
+        Args:
+            value: 日期
+            include_self: 给定日期本身是交易日时是否直接返回
+
+        Returns:
+            Optional[datetime]: 交易日（时间部分为0点），日历中给定日期之前没有交易日时为None
+        """
+        ordinal = self.to_ordinal(value)
+        self._ensure_range(ordinal - 31, ordinal)
+        side = 'right' if include_self else 'left'
+        idx = np.searchsorted(self.trade_ordinals, ordinal, side=side) - 1
+        if idx < 0:
+            return None
+        return datetime.fromordinal(int(self.trade_ordinals[idx]))
+
+    def range_ordinals(self, start, end) -> np.ndarray:
+        """获取闭区间 [start, end] 内的交易日序数数组"""
+        start_ord = self.to_ordinal(start)
+        end_ord = self.to_ordinal(end)
+        if start_ord > end_ord:
+            return np.empty(0, dtype=np.int32)
+        self._ensure_range(start_ord, end_ord)
+        left = np.searchsorted(self.trade_ordinals, start_ord, side='left')
+        right = np.searchsorted(self.trade_ordinals, end_ord, side='right')
+        return self.trade_ordinals[left:right]
+
+    def range(self, start, end) -> List[datetime]:
+        """获取闭区间 [start, end] 内的交易日列表（datetime，时间部分为0点）"""
+        return [datetime.fromordinal(int(o)) for o in self.range_ordinals(start, end)]
+
+
+_trading_calendar = None
+_trading_calendar_lock = threading.Lock()
+
+
+def get_trading_calendar() -> TradingCalendar:
+    """获取全局共享的交易日历实例（首次调用时构建）"""
+    global _trading_calendar
+    if _trading_calendar is None:
+        with _trading_calendar_lock:
+            if _trading_calendar is None:
+                _trading_calendar = TradingCalendar()
+    return _trading_calendar
+
 def is_etf(stock_code: str) -> bool:
     """判断是否为ETF（不包括LOF）
     
@@ -639,6 +797,10 @@ def khMA(stock_code: str, period: int, field: str = 'close', fre_step: str = '1d
 
     Raises:
         ValueError: 如果不在交易时间（日内频率）或数据不足
+
+    说明:
+        回测运行中直接使用回测历史数据缓存维护的滑动窗口和，
+        此时不再按系统时间检查是否处于交易时间
     """
     from datetime import datetime
     
@@ -649,6 +811,23 @@ def khMA(stock_code: str, period: int, field: str = 'close', fre_step: str = '1d
         else:
             end_time = now.strftime('%Y%m%d')
 
+    # 回测运行中：由历史数据缓存的滑动窗口和直接计算，无需构建历史DataFrame
+    end_datetime = _parse_history_time(end_time.strip()) if isinstance(end_time, str) else None
+    cache = get_active_history_cache(end_datetime)
+    if cache is not None:
+        dividend_type = {'pre': 'front', 'post': 'back', 'none': 'none'}.get(fq, 'front')
+        try:
+            ma = cache.moving_average(stock_code, period, field, fre_step, dividend_type, end_datetime)
+        except Exception as e:
+            logger.info(f"获取历史数据时出错: {str(e)}")
+            ma = (0, float('nan'))
+        if ma is not None:
+            count, value = ma
+            if count < period:
+                raise ValueError(f"股票 {stock_code} 数据量不足 {period} 条，无法计算均线{period}")
+            decimals = get_price_decimals(data) if data else (3 if is_etf(stock_code) else 2)
+            return round(value, decimals)
+
     # 结合 is_trade_time 判断（仅对日内频率）
     tools = KhQuTools()
     if fre_step in ['1m', '5m', 'tick'] and not tools.is_trade_time():
@@ -956,7 +1135,7 @@ def process_row(row, stock_codes, stock_names):
         else:
             logging.info(f"跳过证券（无交易所后缀）: {stock_code}")
 
-def download_and_store_data(local_data_path, stock_files, field_list, period_type, start_date, end_date, dividend_type='none', time_range='all', progress_callback=None, log_callback=None, check_interrupt=None):
+def download_and_store_data(local_data_path, stock_files, field_list, period_type, start_date, end_date, dividend_type='none', time_range='all', progress_callback=None, log_callback=None, check_interrupt=None, storage_format='csv', chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_DOWNLOAD_WORKERS, rate_limit=DEFAULT_RATE_LIMIT, resume=True):
     """
     下载并存储指定股票、字段、周期类型和时间段的数据到文件。
 
@@ -1058,13 +1237,25 @@ def download_and_store_data(local_data_path, stock_files, field_list, period_typ
       - 该函数用于检查是否需要中断下载过程。
       - 返回True表示需要中断，返回False表示继续执行。
 
+    - storage_format (str, optional): 存储格式。
+      - 'csv'（默认）: 每只股票一个CSV文件，文件命名规则如上。
+      - 'parquet' / 'feather' / 'npz': 写入 local_data_path 下的列式数据湖（见 khDataLake），
+        按 周期/年份/股票 分区，时间列为int64毫秒时间戳，并维护股票到时间范围的清单；
+        复权方式不同的数据应使用不同的 local_data_path。
+
+    - chunk_size (int, optional): 每批下载请求的股票数量，默认20。
+    - max_workers (int, optional): 并发下载请求数，转换写文件使用同样数量的线程，默认2。
+    - rate_limit (float, optional): 下载请求速率上限（批次/秒），默认2，None 表示不限速。
+    - resume (bool, optional): 是否断点续传，默认True。
+      - 已完成的股票记录在 local_data_path 下的 .download_journal.jsonl 中，
+        以相同参数再次运行时跳过这些股票；全部完成后日志自动删除。
+
     返回值:
     - 无返回值，数据直接保存到指定目录。
 
     异常:
     - 如果股票代码文件不存在或格式错误，会记录警告并跳过。
-    - 如果数据下载失败，会记录错误并继续处理下一只股票。
-    - 如果保存文件失败，会记录错误信息。
+    - 如果数据下载或保存失败，会记录错误并继续处理其他股票，失败的股票在再次运行时重试。
     - 如果中断检查函数返回True，会抛出InterruptedError异常。
     """
     try:
@@ -1086,190 +1277,92 @@ def download_and_store_data(local_data_path, stock_files, field_list, period_typ
         if not os.path.exists(local_data_path):
             os.makedirs(local_data_path)
 
-        total_stocks = len(stocks)
-        for index, stock in enumerate(stocks, 1):
-            try:
-                # 检查是否需要中断
-                if check_interrupt and check_interrupt():
-                    logging.info("下载过程被中断")
-                    raise InterruptedError("下载过程被用户中断")
-                    
-                if log_callback:
-                    log_callback(f"正在处理 {stock} ({index}/{total_stocks})")
-
-                # 判断是否为指数
-                is_index = stock in ["000001.SH", "399001.SZ", "399006.SZ", "000688.SH", 
-                                   "000300.SH", "000905.SH", "000852.SH"]
+        lake = None
+        if storage_format != 'csv':
+            from khDataLake import DataLake
+            lake = DataLake(local_data_path, storage_format)
 
-                try:
-                    # 每次主要操作前检查中断
-                    if check_interrupt and check_interrupt():
-                        logging.info("下载过程被中断")
-                        raise InterruptedError("下载过程被用户中断")
-                        
-                    if is_index:
-                        # 指数数据处理
-                        logging.info(f"获取指数数据: {stock}")
-                        xtdata.download_history_data(stock, period=period_type, 
-                                                   start_time=start_date, end_time=end_date)
-                        
-                        # 再次检查中断
-                        if check_interrupt and check_interrupt():
-                            logging.info("下载过程被中断")
-                            raise InterruptedError("下载过程被用户中断")
-                            
-                        data = xtdata.get_market_data_ex(
-                            field_list=['time'] + field_list,
-                            stock_list=[stock],
-                            period=period_type,
-                            start_time=start_date,
-                            end_time=end_date,
-                            count=-1,
-                            dividend_type=dividend_type,  # 添加复权参数
-                            fill_data=True
-                        )
-                        if data and stock in data:
-                            df = data[stock]
-                            logging.info(f"成功获取指数数据: {stock}")
-                        else:
-                            raise Exception(f"未能获取指数数据: {stock}")
-                    else:
-                        # 普通股票数据处理
-                        logging.info(f"获取股票数据: {stock}")
-                        xtdata.download_history_data(stock, period=period_type, 
-                                                   start_time=start_date, end_time=end_date)
-                        
-                        # 再次检查中断
-                        if check_interrupt and check_interrupt():
-                            logging.info("下载过程被中断")
-                            raise InterruptedError("下载过程被用户中断")
-                            
-                        data = xtdata.get_local_data(  
-                            field_list=['time'] + field_list,
-                            stock_list=[stock],
-                            period=period_type,
-                            start_time=start_date,
-                            end_time=end_date,
-                            dividend_type=dividend_type,  # 添加复权参数
-                            fill_data=True
-                        )
-                        df = data[stock]
-
-                    # 检查中断
-                    if check_interrupt and check_interrupt():
-                        logging.info("下载过程被中断")
-                        raise InterruptedError("下载过程被用户中断")
-                        
-                    # 开始数据处理和保存
-                    logging.debug(f"准备处理数据 - 股票代码: {stock}")
-                    
-                    # 检查df是否为DataFrame类型
-                    if not isinstance(df, pd.DataFrame):
-                        error_msg = f"处理 {stock} 数据失败: 返回的数据不是DataFrame格式"
-                        logging.error(error_msg)
-                        if log_callback:
-                            log_callback(error_msg)
-                        continue
-                        
-                    logging.debug(f"原始数据形状: {df.shape}")
-                    logging.debug(f"原始数据列: {df.columns.tolist()}")
-                    
-                    # 统一的数据处理逻辑
-                    df["time"] = pd.to_datetime(df["time"].astype(float), unit='ms') + pd.Timedelta(hours=8)
-                    logging.debug(f"时间列转换后的前5行:\n{df['time'].head()}")
+        # 指数数据通过 get_market_data_ex 读取，普通股票读取本地数据
+        index_codes = {"000001.SH", "399001.SZ", "399006.SZ", "000688.SH",
+                       "000300.SH", "000905.SH", "000852.SH"}
+        read_fields = ['time'] + field_list
 
-                    if period_type == '1d':
-                        df["date"] = df["time"].dt.strftime("%Y-%m-%d")
-                        df = df[["date"] + field_list]
-                    else:
-                        if time_range != 'all':
-                            start_time, end_time = time_range.split('-')
-                            start_time = datetime.strptime(start_time, "%H:%M").time()
-                            end_time = datetime.strptime(end_time, "%H:%M").time()
-                            df["time_obj"] = df["time"].dt.time
-                            mask = (df["time_obj"] >= start_time) & (df["time_obj"] <= end_time)
-                            df = df.loc[mask].copy()
-                            df.drop(columns=["time_obj"], inplace=True)
-                        
-                        df["date"] = df["time"].dt.strftime("%Y-%m-%d")
-                        df["time"] = df["time"].dt.strftime("%H:%M:%S")
-                        df = df[["date", "time"] + field_list]
-
-                    # 检查中断
-                    if check_interrupt and check_interrupt():
-                        logging.info("下载过程被中断")
-                        raise InterruptedError("下载过程被用户中断")
-                        
-                    # 保存数据
-                    logging.debug(f"准备保存数据 - 股票代码: {stock}")
-                    logging.debug(f"处理后数据形状: {df.shape}")
-                    logging.debug(f"处理后数据列: {df.columns.tolist()}")
-                    logging.debug(f"处理后前5行数据:\n{df.head()}")
-                    
-                    if not df.empty:
-                        time_range_filename = time_range.replace(":", "_")
-                        # 在文件名中添加复权信息
-                        file_name = f"{stock}_{period_type}_{start_date}_{end_date}_{time_range_filename}_{dividend_type}.csv"
-                        file_path = os.path.join(local_data_path, file_name)
-                        
-                        logging.info(f"保存文件 - 路径: {file_path}")
-                        df.to_csv(file_path, index=False)
-                        logging.info(f"文件保存成功: {file_path}")
-                        
-                        # 验证文件是否成功保存并获取更多信息
-                        if os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
-                            # 获取文件大小的可读形式
-                            if file_size < 1024:
-                                readable_size = f"{file_size} 字节"
-                            elif file_size < 1024 * 1024:
-                                readable_size = f"{file_size/1024:.2f} KB"
-                            else:
-                                readable_size = f"{file_size/(1024*1024):.2f} MB"
-                                
-                            # 获取行数和列数信息
-                            rows_count = len(df)
-                            cols_count = len(df.columns)
-                            
-                            logging.info(f"已保存文件信息: 大小={readable_size}, 行数={rows_count}, 列数={cols_count}")
-                            
-                            # 通过log_callback提供详细信息
-                            if log_callback:
-                                file_info = f"{stock} {period_type} 数据已存储: 文件大小={readable_size}, 行数={rows_count}, 列数={cols_count}, 路径: {file_path}"
-                                log_callback(file_info)
-                        else:
-                            logging.error(f"文件保存失败: {file_path}")
-                            if log_callback:
-                                log_callback(f"保存失败: {file_path}")
-                    else:
-                        logging.warning(f"股票 {stock} 的数据为空，跳过保存")
-                        if log_callback:
-                            log_callback(f"股票 {stock} 的数据为空，跳过保存")
-
-                except InterruptedError:
-                    logging.info(f"处理{stock}时被中断")
-                    raise
-                except Exception as e:
-                    logging.error(f"处理{stock}时出错: {str(e)}", exc_info=True)
-                    raise
+        def fetch(codes):
+            """下载并读取一批股票的数据"""
+            if check_interrupt and check_interrupt():
+                raise InterruptedError("下载过程被用户中断")
+            logging.info(f"下载 {codes[0]} 等{len(codes)}只股票的数据")
+            download_history_batch(xtdata, codes, period_type, start_date, end_date)
+            if check_interrupt and check_interrupt():
+                raise InterruptedError("下载过程被用户中断")
 
-                if progress_callback:
-                    progress_callback(int(index / total_stocks * 100))
-                
-                # 检查中断
-                if check_interrupt and check_interrupt():
-                    logging.info("下载过程被中断")
-                    raise InterruptedError("下载过程被用户中断")
-                    
-                time.sleep(1)  # 添加延迟避免请求过快
+            data = {}
+            batch_index = [code for code in codes if code in index_codes]
+            batch_stocks = [code for code in codes if code not in index_codes]
+            if batch_index:
+                data.update(xtdata.get_market_data_ex(
+                    field_list=read_fields,
+                    stock_list=batch_index,
+                    period=period_type,
+                    start_time=start_date,
+                    end_time=end_date,
+                    count=-1,
+                    dividend_type=dividend_type,  # 添加复权参数
+                    fill_data=True
+                ) or {})
+            if batch_stocks:
+                data.update(xtdata.get_local_data(
+                    field_list=read_fields,
+                    stock_list=batch_stocks,
+                    period=period_type,
+                    start_time=start_date,
+                    end_time=end_date,
+                    dividend_type=dividend_type,  # 添加复权参数
+                    fill_data=True
+                ) or {})
+            return data
+
+        def store(stock, df):
+            """转换并保存一只股票的数据，返回保存的行数"""
+            if df is None:
+                raise ValueError(f"未能获取数据: {stock}")
+            # 检查df是否为DataFrame类型
+            if not isinstance(df, pd.DataFrame):
+                error_msg = f"处理 {stock} 数据失败: 返回的数据不是DataFrame格式"
+                logging.error(error_msg)
+                if log_callback:
+                    log_callback(error_msg)
+                return 0
+            if lake is not None:
+                # 写入列式数据湖：时间保持为int64毫秒时间戳
+                rows_count = _store_to_data_lake(lake, stock, period_type, df, field_list, time_range)
+                if log_callback:
+                    log_callback(f"{stock} {period_type} 数据已写入数据湖: 行数={rows_count}, 路径: {local_data_path}")
+                return rows_count
+            return _store_to_csv(local_data_path, stock, df, field_list, period_type, start_date, end_date,
+                                 dividend_type, time_range, log_callback)
+
+        key = task_key(action='download', path=os.path.abspath(local_data_path), stocks=stocks,
+                       fields=field_list, period=period_type, start=start_date, end=end_date,
+                       dividend_type=dividend_type, time_range=time_range, storage_format=storage_format)
+        downloader = BulkDownloader(
+            chunk_size=chunk_size,
+            download_workers=max_workers,
+            write_workers=max_workers,
+            rate_limit=rate_limit,
+            journal_path=os.path.join(local_data_path, '.download_journal.jsonl') if resume else None,
+            task=key,
+            progress_callback=progress_callback,
+            log_callback=log_callback,
+            check_interrupt=check_interrupt
+        )
+        try:
+            downloader.run(stocks, fetch, store)
+        finally:
+            # 中断或出错时也保存已写入股票的清单
+            if lake is not None:
+                lake.save_manifest()
 
-            except InterruptedError:
-                logging.info(f"处理股票 {stock} 时被用户中断")
-                raise
-            except Exception as e:
-                logging.error(f"处理股票 {stock} 时出错: {str(e)}", exc_info=True)
-                raise
-        
         if log_callback:
             log_callback("数据下载和存储完成.")
 
@@ -1280,9 +1373,119 @@ def download_and_store_data(local_data_path, stock_files, field_list, period_typ
         logging.error(f"下载存储数据时出错: {str(e)}", exc_info=True)
         raise
 
-def calculate_intraday_features(file_path, sample_file_name, daily_file_name_pattern, feature_types, output_path, output_file_name, trading_minutes=240):
+def _store_to_csv(local_data_path, stock, df, field_list, period_type, start_date, end_date, dividend_type, time_range, log_callback=None):
+    """将下载的行情转换为CSV格式并保存，返回保存的行数（文件命名规则见 download_and_store_data）"""
+    logging.debug(f"准备处理数据 - 股票代码: {stock}")
+    logging.debug(f"原始数据形状: {df.shape}")
+    logging.debug(f"原始数据列: {df.columns.tolist()}")
+
+    # 统一的数据处理逻辑
+    df["time"] = pd.to_datetime(df["time"].astype(float), unit='ms') + pd.Timedelta(hours=8)
+    logging.debug(f"时间列转换后的前5行:\n{df['time'].head()}")
+
+    if period_type == '1d':
+        df["date"] = df["time"].dt.strftime("%Y-%m-%d")
+        df = df[["date"] + field_list]
+    else:
+        if time_range != 'all':
+            start_time, end_time = time_range.split('-')
+            start_time = datetime.strptime(start_time, "%H:%M").time()
+            end_time = datetime.strptime(end_time, "%H:%M").time()
+            df["time_obj"] = df["time"].dt.time
+            mask = (df["time_obj"] >= start_time) & (df["time_obj"] <= end_time)
+            df = df.loc[mask].copy()
+            df.drop(columns=["time_obj"], inplace=True)
+
+        df["date"] = df["time"].dt.strftime("%Y-%m-%d")
+        df["time"] = df["time"].dt.strftime("%H:%M:%S")
+        df = df[["date", "time"] + field_list]
+
+    # 保存数据
+    logging.debug(f"准备保存数据 - 股票代码: {stock}")
+    logging.debug(f"处理后数据形状: {df.shape}")
+    logging.debug(f"处理后数据列: {df.columns.tolist()}")
+    logging.debug(f"处理后前5行数据:\n{df.head()}")
+
+    if not df.empty:
+        time_range_filename = time_range.replace(":", "_")
+        # 在文件名中添加复权信息
+        file_name = f"{stock}_{period_type}_{start_date}_{end_date}_{time_range_filename}_{dividend_type}.csv"
+        file_path = os.path.join(local_data_path, file_name)
+
+        logging.info(f"保存文件 - 路径: {file_path}")
+        df.to_csv(file_path, index=False)
+        logging.info(f"文件保存成功: {file_path}")
+
+        # 验证文件是否成功保存并获取更多信息
+        if os.path.exists(file_path):
+            file_size = os.path.getsize(file_path)
+            # 获取文件大小的可读形式
+            if file_size < 1024:
+                readable_size = f"{file_size} 字节"
+            elif file_size < 1024 * 1024:
+                readable_size = f"{file_size/1024:.2f} KB"
+            else:
+                readable_size = f"{file_size/(1024*1024):.2f} MB"
+
+            # 获取行数和列数信息
+            rows_count = len(df)
+            cols_count = len(df.columns)
+
+            logging.info(f"已保存文件信息: 大小={readable_size}, 行数={rows_count}, 列数={cols_count}")
+
+            # 通过log_callback提供详细信息
+            if log_callback:
+                file_info = f"{stock} {period_type} 数据已存储: 文件大小={readable_size}, 行数={rows_count}, 列数={cols_count}, 路径: {file_path}"
+                log_callback(file_info)
+        else:
+            logging.error(f"文件保存失败: {file_path}")
+            if log_callback:
+                log_callback(f"保存失败: {file_path}")
+            raise IOError(f"文件保存失败: {file_path}")
+        return len(df)
+
+    logging.warning(f"股票 {stock} 的数据为空，跳过保存")
+    if log_callback:
+        log_callback(f"股票 {stock} 的数据为空，跳过保存")
+    return 0
+
+def _store_to_data_lake(lake, stock, period_type, df, field_list, time_range='all'):
+    """将下载的行情写入数据湖，返回写入行数
+
+    Args:
+        lake: DataLake 实例
+        stock: 股票代码
+        period_type: 周期类型
+        df: xtdata 返回的行情DataFrame，time 列为毫秒时间戳
+        field_list: 要存储的字段列表
+        time_range: 时间段 "HH:MM-HH:MM" 或 "all"，仅对分钟和tick数据有效
+    """
+    from khDataLake import MARKET_UTC_OFFSET_MS
+    times = df["time"].to_numpy(dtype=np.float64).astype(np.int64)
+    mask = None
+    if period_type != '1d' and time_range != 'all':
+        start_time, end_time = time_range.split('-')
+        start_h, start_m = map(int, start_time.split(':'))
+        end_h, end_m = map(int, end_time.split(':'))
+        seconds = ((times + MARKET_UTC_OFFSET_MS) // 1000) % 86400
+        mask = (seconds >= start_h * 3600 + start_m * 60) & (seconds <= end_h * 3600 + end_m * 60)
+
+    columns = {"time": times}
+    for field in field_list:
+        columns[field] = df[field].to_numpy()
+    data = pd.DataFrame(columns)
+    if mask is not None:
+        data = data.loc[mask]
+    if data.empty:
+        logging.warning(f"股票 {stock} 的数据为空，跳过保存")
+        return 0
+    # 批量下载时清单在全部写入后统一保存，见 download_and_store_data
+    return lake.write(stock, period_type, data, save_manifest=False)
+
+def calculate_intraday_features(file_path, sample_file_name, daily_file_name_pattern, feature_types, output_path, output_file_name, trading_minutes=240,
+                                max_workers=None, incremental=True):
     """
-    计算股票的日内特征,并将结果保存到csv文件中。
+    计算股票的日内特征,并将结果保存到文件中。
 
     参数:
     - file_path: str
@@ -1295,107 +1498,33 @@ def calculate_intraday_features(file_path, sample_file_name, daily_file_name_pat
         日数据文件名的模式,用构造与分钟数据对应的日数据文件名。
         模式中应该包含股票代码的占位符,例如: "000001.SZ_1d_20240101_20240430_all.csv"
     - feature_types: list
-        要计算的特征类型列表,可选值包括: 'volume_ratio', 'return_rate'。
+        要计算的特征类型列表,可选值见 khFeatures.FEATURE_REGISTRY,内置 'volume_ratio', 'return_rate'。
     - output_path: str
         输出文件的目录路径。
     - output_file_name: str
-        输出文件名。
+        输出文件名。扩展名决定格式: .csv(默认格式) / .parquet / .feather / .npz
     - trading_minutes: int, 可选, 默认为240
         每个交易日的交易分钟数,用于计算成交量比例。默认为240分钟(4小时)
+    - max_workers: int, 可选
+        并行计算的进程数,默认为CPU核数
+    - incremental: bool, 可选, 默认为True
+        是否增量计算。为True时只计算源文件有变化的股票的新增日期
 
     函数功能:
-    1. 根据样本文件名提取周期类型、起始日期和结束日期。
-    2. 获取与样本文件名格式相同的所有文件。
-    3. 对每个文件:
-       - 从文件路径中提取股票代码。
-       - 读取逐分钟数据文件。
-       - 构造正确的日数据文件名,并读取日数据文件。
-       - 计算过去5天的平均交易量。
-       - 获取前一天的收盘价。
-       - 将分钟数据和日数据按日期合并。
-       - 根据指定的特征类型计算相应的特征值。
-       - 删除不要的列,并添加股票代码列。
-       - 去掉前5天(包括第5天)和最后一天的数据。
-    4. 如果输出路径不存在,则创建文件夹。
-    5. 将计算结果保存到csv文件中,如果文件已经存在,则追加数据。
+    1. 根据样本文件名提取周期类型、起始日期和结束日期,获取与样本文件名格式相同的所有文件。
+    2. 按股票并行读取分钟数据和日数据,按列向量化计算特征(见 khFeatures.FeaturePipeline)。
+    3. 去掉前6天(包括第6天)和最后一天的数据,添加股票代码列。
+    4. 将全部结果一次写入输出文件。
 
     返回值:
     无返回值,计算结果直接保存到指定的输出文件中。
     """
+    FeaturePipeline(file_path, sample_file_name, daily_file_name_pattern, feature_types, output_path, output_file_name,
+                    trading_minutes=trading_minutes, max_workers=max_workers, incremental=incremental).run()
 
-    # 从样本文件名中提取周期类型、起始日期和结束日期
-    file_name_parts = sample_file_name.split('_')
-    data_type = file_name_parts[1]
-    start_date = file_name_parts[2]
-    end_date = file_name_parts[3]
-
-    # 获取与样本文件名格式相同的所有文件
-    file_pattern = f"*_{data_type}_{start_date}_{end_date}_*.csv"
-    file_list = glob.glob(os.path.join(file_path, file_pattern))
-
-    # 理每文件
-    for idx, minute_file_path in enumerate(file_list):
-        # 从文件路径中提取股票代码
-        stock_code = os.path.basename(minute_file_path).split('_')[0]
-
-        # 读取逐分钟数据文件
-        minute_data = pd.read_csv(minute_file_path)
-
-        # 构造正确的日数据文件名
-        stock_code_example = daily_file_name_pattern.split('_')[0]
-        daily_file_name = daily_file_name_pattern.replace(stock_code_example, stock_code)
-        daily_file_path = os.path.join(file_path, daily_file_name)
-        daily_data = pd.read_csv(daily_file_path)
-
-        # 计算过去5天的平均交易量
-        daily_data['past_avg_volume'] = daily_data['volume'].rolling(window=5).mean().shift(1)
-
-        # 获取前一天的收盘价
-        daily_data['prev_close'] = daily_data['close'].shift(1)
-
-        minute_data['date'] = pd.to_datetime(minute_data['date'])
-        daily_data['date'] = pd.to_datetime(daily_data['date'])
-
-        # 检查分钟数据否有 'close' 列,如果没有,则使用 'price' 列
-        if 'close' not in minute_data.columns:
-            minute_data['price'] = minute_data['price']
-        else:
-            minute_data['price'] = minute_data['close']
-
-        # 按日期合并分钟据和日数据
-        merged_data = pd.merge(minute_data, daily_data[['date', 'past_avg_volume', 'prev_close']], on='date', how='left')
-
-        eps = 1e-8  # 添加一个小的常数
-
-        # 计算特征
-        for feature_type in feature_types:
-            if feature_type == 'volume_ratio':
-                merged_data['volume_ratio'] = merged_data.apply(lambda x: x['volume'] / (x['past_avg_volume'] / trading_minutes + eps) if pd.notna(x['past_avg_volume']) else np.nan, axis=1)
-            elif feature_type == 'return_rate':
-                merged_data['return_rate'] = merged_data.apply(lambda x: (x['price'] - x['prev_close']) / x['prev_close'] if pd.notna(x['prev_close']) else np.nan, axis=1)
-
-        # 删除不要的列
-        merged_data = merged_data[['date', 'time'] + feature_types]
-        merged_data['stock_code'] = stock_code  # 添加股票代码列
-
-        # 去掉前6天(包括第6天)和最后一天的数据
-        min_date = merged_data['date'].min()
-        max_date = merged_data['date'].max()
-        merged_data = merged_data[(merged_data['date'] > min_date + pd.Timedelta(days=6)) & (merged_data['date'] < max_date)]
-
-        # 如果输出路径不存在,则创建文件夹
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-
-        # 保存结果到csv文件,如果文件已经存在,则追加数据
-        output_file_path = os.path.join(output_path, output_file_name)
-        header = idx == 0  # 如果是第一个文件,则写入表头,否则不写入
-        mode = 'w' if idx == 0 else 'a'  # 如果是第一个文件,则写入模式为'w',否则为'a'(追加)
-        merged_data.to_csv(output_file_path, index=False, header=header, mode=mode)
-
-def calculate_next_day_return(file_path, sample_file_name, feature_types, output_path, output_file_name):
+def calculate_next_day_return(file_path, sample_file_name, feature_types, output_path, output_file_name, label_dir=None):
     """
-    计算股票的下一个交易日收益率,并将结果保存到csv文件中。
+    计算股票的下一个交易日收益率,并将结果保存到文件中。
 
     参数:
     - file_path: str
@@ -1405,72 +1534,102 @@ def calculate_next_day_return(file_path, sample_file_name, feature_types, output
         样本文件名应该遵循以下格式: "股票代码_1d_起始日期_结束日期_all.csv"
         例如: "000001.SZ_1d_20240101_20240430_all.csv"
     - feature_types: list
-        要计算的特征类型列表,目前支持: 'next_day_return_rate' (下一个交易日收益率)。
+        输出的特征列表: 'next_day_return_rate' (下一个交易日收益率) 以及日线文件中的
+        其他列 (如 'close'、'volume'),后者原样输出,日线文件中没有的列忽略。
     - output_path: str
         输出文件的目录路径。
     - output_file_name: str
-        输出文件名。
+        输出文件名。扩展名决定格式: .csv / .parquet / .feather / .npz
+    - label_dir: str, 可选
+        收盘价矩阵的存储目录,默认为输出目录下的 .return_labels。
+        再次运行时只读取有变化的日线文件,见 khLabels.ReturnLabelBuilder
 
     函数功能:
-    1. 根据样本文件名提取起始日期和结束日期
-    2. 获取与样本文件名格式相同的所有文件。
-    3. 对每个文件:
-       - 从文件路径中提取股票代码。
-       - 取日数据文件。
-       - 将期列转换为日期时间类型。
+    1. 获取与样本文件名格式相同的所有文件,增量更新 (交易日 × 股票) 收盘价矩阵。
+    2. 在起始日期和结束日期范围内,对每只股票:
        - 如果 'next_day_return_rate' 在特征类型列表中,计算下一个交易日的收盘价收益率,并将其记录到当前交易日。
-       - 提取日级别的数据,每个日期只保留一条记录,包括日期和指定的特征。
-       - 添加股票代码列。
+         收盘价缺失 (NaN) 的交易日视同停牌跳过: 该日不输出,前一日的收益率计算到下一个有收盘价的交易日。
+       - 特征列表中的其他列从日线文件读取 (close 直接取自收盘价矩阵)。
+       - 每个日期只保留一条记录,包括日期和指定的特征 (任一特征缺失的记录去掉),添加股票代码列。
        - 去掉前6天(包括第6天)和最后一天的数据。
-    4. 如果输出路径不存在,则创建文件夹。
-    5. 将计算结果保存到csv文件中,如果文件已经存在,则追加数据。
+    3. 将计算结果一次写入输出文件。
 
     返回值:
     无返回值,计算结果直接保存到指定的输出文件中。
     """
+    builder = ReturnLabelBuilder(label_dir or os.path.join(output_path, '.return_labels'))
+    builder.update(file_path, sample_file_name)
+
     # 从样本文件名中提取起始日期和结束日期
     file_name_parts = sample_file_name.split('_')
-    start_date = file_name_parts[2]
-    end_date = file_name_parts[3]
-
-    # 获取与样本文件名格式相同的所有文件
-    file_pattern = f"*_1d_{start_date}_{end_date}_all.csv"
-    file_list = glob.glob(os.path.join(file_path, file_pattern))
-
-    # 处理每个文件
-    for idx, daily_file_path in enumerate(file_list):
-        # 从文路径中提取股票代码
-        stock_code = os.path.basename(daily_file_path).split('_')[0]
-
-        # 读取日数据文件
-        daily_data = pd.read_csv(daily_file_path)
-
-        # 将日期列转换为日期时间类型
-        daily_data['date'] = pd.to_datetime(daily_data['date'])
+    start_date = int(file_name_parts[2])
+    end_date = int(file_name_parts[3])
+    codes = [code for code, _ in matching_files(file_path, sample_file_name)]
+    column_of = {code: i for i, code in enumerate(builder.symbols)}
+    codes = [code for code in codes if code in column_of]
+
+    row_mask = (builder.dates >= start_date) & (builder.dates <= end_date)
+    dates = pd.to_datetime(builder.dates[row_mask].astype(str), format='%Y%m%d')
+    closes = np.asarray(builder.closes[row_mask][:, [column_of[code] for code in codes]])
+
+    daily_fields = [f for f in dict.fromkeys(feature_types) if f not in ('next_day_return_rate', 'date', 'close')]
+    daily_columns = _read_daily_columns(file_path, sample_file_name, codes, daily_fields,
+                                        builder.dates[row_mask]) if daily_fields else {}
+
+    columns = {}
+    valid = ~np.isnan(closes)
+    for feature in dict.fromkeys(feature_types):
+        if feature == 'next_day_return_rate':
+            # 下一个有收盘价的交易日的收盘价: 日线文件中缺少的日期 (停牌) 被跳过,与逐只股票
+            # pct_change().shift(-1) 一致; 收盘价为 NaN 的行本身去掉,其前一日的收益率计算到
+            # 下一个有效收盘价 (逐文件 pct_change 会把前一日也记为缺失并去掉)
+            next_close = pd.DataFrame(closes).bfill().shift(-1).to_numpy()
+            values = next_close / closes - 1
+        elif feature == 'close':
+            values = closes
+        elif feature in daily_columns:
+            values = daily_columns[feature]
+        else:
+            continue
+        valid &= ~pd.isna(values)
+        columns[feature] = values
 
-        # 计算第二天的收盘收益率,并将其记录到当天
-        if 'next_day_return_rate' in feature_types:
-            daily_data['next_day_return_rate'] = daily_data['close'].pct_change().shift(-1)
+    # 去掉前6天(包括第6天)的数据
+    if len(dates):
+        first_date = dates.to_numpy()[valid.argmax(axis=0)]
+        valid &= dates.to_numpy()[:, None] > (first_date + np.timedelta64(6, 'D'))[None, :]
 
-        # 提取日级别的数据,每个日期只保留一条记录
-        daily_data = daily_data[['date'] + [feature for feature in feature_types if feature in daily_data.columns]].dropna().drop_duplicates(subset='date')
-        daily_data['stock_code'] = stock_code  # 添加股票代码列
+    # 按股票依次排列,与逐个文件追加的输出顺序一致
+    symbol_index, date_index = np.nonzero(valid.T)
+    result = pd.DataFrame({'date': dates[date_index]})
+    for name, values in columns.items():
+        result[name] = values.T[valid.T]
+    result['stock_code'] = np.asarray(codes, dtype=object)[symbol_index]
 
-        # 去掉前6天(包括第6天)和最后一天的数据
-        min_date = daily_data['date'].min()
-        max_date = daily_data['date'].max()
-        second_last_date = max_date  
-        daily_data = daily_data[(daily_data['date'] > min_date + pd.Timedelta(days=6)) & (daily_data['date'] <= second_last_date)]
+    write_frame(result, os.path.join(output_path, output_file_name))
 
-        # 如果输出路径不存在,则创建文件夹
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
+def _read_daily_columns(file_path, sample_file_name, codes, fields, dates):
+    """读取日线文件中除收盘价以外的特征列,整理为与收盘价矩阵对齐的 (交易日 × 股票) 矩阵
 
-        # 保存结果到csv文件,如果文件已经存在,则追加数据
-        output_file_path = os.path.join(output_path, output_file_name)
-        header = idx == 0  # 如果是第一个文件,则写入表头,否则不写入
-        mode = 'w' if idx == 0 else 'a'  # 如果是第一个文件,则写入模式为'w',否则为'a'(追加)
-        daily_data.to_csv(output_file_path, index=False, header=header, mode=mode)
+    返回 {列名: 矩阵},所有文件中都没有的列不包含在内。
+    """
+    paths = dict(matching_files(file_path, sample_file_name))
+    date_index = pd.Index(dates)
+    matrices = {}
+    for column, code in enumerate(codes):
+        data = pd.read_csv(paths[code], usecols=lambda name: name == 'date' or name in fields)
+        data = data.dropna(subset=['date']).drop_duplicates(subset='date', keep='last')
+        rows = date_index.get_indexer(date_to_int(data['date']))
+        found = rows >= 0
+        for field in fields:
+            if field not in data.columns:
+                continue
+            values = data[field].to_numpy()
+            if field not in matrices:
+                dtype = np.float64 if np.issubdtype(values.dtype, np.number) else object
+                matrices[field] = np.full((len(dates), len(codes)), np.nan, dtype=dtype)
+            matrices[field][rows[found], column] = values[found]
+    return matrices
 
 def get_available_sectors():
     """获取所有可用的板块代码"""
@@ -2433,7 +2592,7 @@ else:
                     f.write(f"{stock['code']},{stock['name']}\n")
             logger.info(f"[更新进度] {board_names[board]}列表保存完成，共 {len(stocks)} 只证券")
 
-def supplement_history_data(stock_files, field_list, period_type, start_date, end_date, dividend_type='none', time_range='all', progress_callback=None, log_callback=None, check_interrupt=None):
+def supplement_history_data(stock_files, field_list, period_type, start_date, end_date, dividend_type='none', time_range='all', progress_callback=None, log_callback=None, check_interrupt=None, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_DOWNLOAD_WORKERS, rate_limit=DEFAULT_RATE_LIMIT, resume=True, journal_dir=None):
     """
     补充历史行情数据。
 
@@ -2455,6 +2614,11 @@ def supplement_history_data(stock_files, field_list, period_type, start_date, en
     - check_interrupt (function, optional): 中断检查函数
         - 该函数用于检查是否需要中断数据补充过程
         - 返回True表示需要中断，返回False表示继续执行
+    - chunk_size (int): 每批下载请求的股票数量，默认20
+    - max_workers (int): 并发下载请求数，默认2
+    - rate_limit (float): 下载请求速率上限（批次/秒），默认2，None 表示不限速
+    - resume (bool): 是否断点续传，默认True；中断后以相同参数再次运行时跳过已完成的股票
+    - journal_dir (str): 检查点日志目录，默认为用户数据目录下的 download_journal
     """
     # 在函数开始时设置环境变量，防止意外启动Qt应用（仅在子进程中）
     if is_subprocess():
@@ -2479,102 +2643,84 @@ def supplement_history_data(stock_files, field_list, period_type, start_date, en
                 log_callback("没有找到需要补充数据的股票")
             return
 
-        total_stocks = len(stocks)
-        for index, stock in enumerate(stocks, 1):
-            try:
-                # 检查是否需要中断
-                if check_interrupt and check_interrupt():
-                    logging.info("补充数据过程被中断")
-                    raise InterruptedError("补充数据过程被用户中断")
-                    
+        def fetch(codes):
+            """增量下载并读取一批股票的数据"""
+            if check_interrupt and check_interrupt():
+                raise InterruptedError("补充数据过程被用户中断")
+            if log_callback:
+                log_callback(f"正在补充 {codes[0]} 等{len(codes)}只股票的数据")
+
+            # 调用download_history_data进行数据补充
+            download_history_batch(xtdata, codes, period_type, start_date, end_date, incrementally=True)
+
+            if check_interrupt and check_interrupt():
+                raise InterruptedError("补充数据过程被用户中断")
+
+            # 获取数据（带复权参数）
+            return xtdata.get_market_data_ex(
+                field_list=field_list,
+                stock_list=codes,
+                period=period_type,
+                start_time=start_date,
+                end_time=end_date,
+                dividend_type=dividend_type,
+                fill_data=True
+            ) or {}
+
+        def store(stock, df):
+            """输出一只股票的补充结果，返回获取的行数"""
+            # 添加更详细的数据信息
+            if df is None:
                 if log_callback:
-                    log_callback(f"正在补充 {stock} 的数据 ({index}/{total_stocks})")
+                    log_callback(f"未能获取 {stock} 的数据")
+                return 0
 
-                # 检查是否需要中断
-                if check_interrupt and check_interrupt():
-                    logging.info("补充数据过程被中断")
-                    raise InterruptedError("补充数据过程被用户中断")
-                    
-                # 调用download_history_data进行数据补充
-                xtdata.download_history_data(
-                    stock,
-                    period=period_type,
-                    start_time=start_date,
-                    end_time=end_date,
-                    incrementally=True
-                )
+            # 检查df是否为DataFrame类型
+            is_dataframe = isinstance(df, pd.DataFrame)
 
-                # 检查是否需要中断
-                if check_interrupt and check_interrupt():
-                    logging.info("补充数据过程被中断")
-                    raise InterruptedError("补充数据过程被用户中断")
-                    
-                    
-                # 获取数据（带复权参数）
-                data = xtdata.get_market_data_ex(
-                    field_list=field_list,
-                    stock_list=[stock],
-                    period=period_type,
-                    start_time=start_date,
-                    end_time=end_date,
-                    dividend_type=dividend_type,
-                    fill_data=True
-                )
+            # 获取数据信息
+            rows_count = len(df)
+            cols_count = len(df.columns) if is_dataframe else 0
 
-                # 添加更详细的数据信息
-                if stock in data and data[stock] is not None:
-                    df = data[stock]
-                    
-                    # 检查df是否为DataFrame类型
-                    is_dataframe = isinstance(df, pd.DataFrame)
-                    
-                    # 获取数据信息
-                    rows_count = len(df) if df is not None else 0
-                    cols_count = len(df.columns) if is_dataframe else 0
-                    
-                    if rows_count > 0:
-                        # 计算时间跨度
-                        if is_dataframe and 'time' in df.columns:
-                            try:
-                                times = pd.to_datetime(df['time'].astype(float), unit='ms')
-                                min_time = times.min()
-                                max_time = times.max()
-                                time_span = f"{min_time.strftime('%Y-%m-%d')} 至 {max_time.strftime('%Y-%m-%d')}"
-                                
-                                # 输出详细信息
-                                if log_callback:
-                                    data_info = f"补充 {stock} 数据成功: 获取 {rows_count} 行, {cols_count} 列, 时间跨度: {time_span}"
-                                    log_callback(data_info)
-                            except Exception as e:
-                                if log_callback:
-                                    log_callback(f"补充 {stock} 数据完成，但获取详细信息时出错: {str(e)}")
-                        else:
-                            if log_callback:
-                                log_callback(f"补充 {stock} 数据成功: 获取 {rows_count} 行, {cols_count} 列")
-                    else:
+            if rows_count > 0:
+                # 计算时间跨度
+                if is_dataframe and 'time' in df.columns:
+                    try:
+                        times = df['time'].to_numpy(dtype=np.float64)
+                        min_time = pd.to_datetime(times.min(), unit='ms')
+                        max_time = pd.to_datetime(times.max(), unit='ms')
+                        time_span = f"{min_time.strftime('%Y-%m-%d')} 至 {max_time.strftime('%Y-%m-%d')}"
+
+                        # 输出详细信息
+                        if log_callback:
+                            data_info = f"补充 {stock} 数据成功: 获取 {rows_count} 行, {cols_count} 列, 时间跨度: {time_span}"
+                            log_callback(data_info)
+                    except Exception as e:
                         if log_callback:
-                            log_callback(f"补充 {stock} 数据成功，但数据为空")
+                            log_callback(f"补充 {stock} 数据完成，但获取详细信息时出错: {str(e)}")
                 else:
                     if log_callback:
-                        log_callback(f"未能获取 {stock} 的数据")
-
-                if progress_callback:
-                    progress = int((index / total_stocks) * 100)
-                    progress_callback(progress)
-
-                # 检查是否需要中断
-                if check_interrupt and check_interrupt():
-                    logging.info("补充数据过程被中断")
-                    raise InterruptedError("补充数据过程被用户中断")
-
-            except InterruptedError:
-                logging.info(f"补充 {stock} 数据时被中断")
-                raise
-            except Exception as e:
-                error_msg = f"补充 {stock} 数据时出错: {str(e)}"
-                logging.error(error_msg)
+                        log_callback(f"补充 {stock} 数据成功: 获取 {rows_count} 行, {cols_count} 列")
+            else:
                 if log_callback:
-                    log_callback(error_msg)
+                    log_callback(f"补充 {stock} 数据成功，但数据为空")
+            return rows_count
+
+        key = task_key(action='supplement', stocks=stocks, fields=field_list, period=period_type,
+                       start=start_date, end=end_date, dividend_type=dividend_type)
+        journal_path = os.path.join(journal_dir or default_journal_dir(), f"supplement_{key}.jsonl") if resume else None
+        downloader = BulkDownloader(
+            chunk_size=chunk_size,
+            download_workers=max_workers,
+            write_workers=1,
+            rate_limit=rate_limit,
+            journal_path=journal_path,
+            task=key,
+            progress_callback=progress_callback,
+            log_callback=log_callback,
+            check_interrupt=check_interrupt
+        )
+        downloader.run(stocks, fetch, store)
 
     except InterruptedError:
         logging.info("补充数据过程被用户中断")
@@ -2613,6 +2759,33 @@ def get_stock_names(stock_codes, stock_list_file):
     
     return stock_names
 
+@lru_cache(maxsize=4096)
+def _parse_history_time(current_time: str) -> datetime:
+    """解析 khHistory / khMA 的时间参数
+
+    Args:
+        current_time: 'YYYYMMDD'、'YYYY-MM-DD'、'YYYYMMDD HHMMSS' 或 'YYYY-MM-DD HH:MM:SS'
+
+    Returns:
+        datetime: 解析后的时间
+
+    Raises:
+        ValueError: 无法解析时抛出
+    """
+    time_formats = [
+        '%Y%m%d %H%M%S',     # YYYYMMDD HHMMSS
+        '%Y-%m-%d %H:%M:%S', # YYYY-MM-DD HH:MM:SS
+        '%Y%m%d',            # YYYYMMDD
+        '%Y-%m-%d'           # YYYY-MM-DD
+    ]
+    for fmt in time_formats:
+        try:
+            return datetime.strptime(current_time, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间格式: {current_time}，支持的格式: YYYYMMDD, YYYY-MM-DD, YYYYMMDD HHMMSS, YYYY-MM-DD HH:MM:SS")
+
+
 def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_paused=False, fq='pre', force_download=False):
     """
     获取股票历史数据（不包含当前时间点）
@@ -2634,6 +2807,7 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
         dict: {股票代码: DataFrame}，DataFrame包含time列和指定的数据字段
         
     注意: 返回的数据不包含current_time这个时间点，确保回测逻辑正确
+          回测运行中由回测历史数据缓存直接应答，不再逐次请求行情接口
     """
     
     # 导入必要的模块
@@ -2670,26 +2844,7 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
     else:
         # 解析输入的时间格式
         if isinstance(current_time, str):
-            current_time = current_time.strip()
-            
-            # 尝试解析不同的时间格式
-            time_formats = [
-                '%Y%m%d %H%M%S',     # YYYYMMDD HHMMSS
-                '%Y-%m-%d %H:%M:%S', # YYYY-MM-DD HH:MM:SS
-                '%Y%m%d',            # YYYYMMDD
-                '%Y-%m-%d'           # YYYY-MM-DD
-            ]
-            
-            for fmt in time_formats:
-                try:
-                    current_datetime = datetime.strptime(current_time, fmt)
-                    break
-                except ValueError:
-                    continue
-            
-            if current_datetime is None:
-                raise ValueError(f"无法解析时间格式: {current_time}，支持的格式: YYYYMMDD, YYYY-MM-DD, YYYYMMDD HHMMSS, YYYY-MM-DD HH:MM:SS")
-            
+            current_datetime = _parse_history_time(current_time.strip())
             current_date_str = current_datetime.strftime('%Y%m%d')
         else:
             raise ValueError("current_time必须是字符串格式")
@@ -2716,6 +2871,12 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
     result = {}
     
     try:
+        # 回测运行中：直接由已加载的历史数据缓存应答
+        cache = None if force_download else get_active_history_cache(current_datetime)
+        if cache is not None:
+            return cache.history(stock_codes, fields, bar_count, period, dividend_type,
+                                 current_datetime, skip_paused)
+        
         if force_download:
             # 强制下载模式：先下载最新数据到指定时间，再获取
             logger.info(f"强制下载模式：基于时间 {current_date_str} 下载最新数据")
@@ -2723,18 +2884,8 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
             # 根据当前时间和bar_count计算开始时间
             start_date = None
             try:
-                # 根据数据类型确定需要的历史天数
-                if period == 'tick':
-                    # tick数据只需要当天的数据，但要向前多取一些天以防当天无数据
-                    target_days = 3
-                elif period in ['1m', '5m']:
-                    # 分钟数据，计算需要的天数，增加缓冲
-                    target_days = max(10, (bar_count * 10 + 1439) // 1440)  # 增加缓冲
-                elif period in ['1d']:
-                    # 日线数据，增加缓冲天数
-                    target_days = bar_count * 5  # 增加缓冲
-                else:
-                    target_days = bar_count * 3
+                # 根据数据类型确定需要的历史天数（含缓冲）
+                target_days = history_lookback_days(period, bar_count)
                 
                 # 计算开始日期（往前推target_days天）
                 start_dt = current_datetime - timedelta(days=target_days)
@@ -2769,17 +2920,7 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
         
         # 计算实际的数据获取范围
         # 根据频率确定往前推算的天数，增加缓冲以确保有足够的历史数据
-        if period == 'tick':
-            # tick数据只获取当天的，但向前多取几天
-            lookback_days = 3
-        elif period in ['1m', '5m']:
-            # 分钟数据，往前推算较多天数以确保有足够数据
-            lookback_days = max(10, (bar_count * 10 + 1439) // 1440)  # 增加缓冲
-        elif period in ['1d']:
-            # 日线数据，往前推算更多天数以确保有足够的交易日
-            lookback_days = bar_count * 5  # 增加缓冲
-        else:
-            lookback_days = bar_count * 3
+        lookback_days = history_lookback_days(period, bar_count)
         
         start_dt = current_datetime - timedelta(days=lookback_days)
         start_time = start_dt.strftime('%Y%m%d')
@@ -3070,16 +3211,7 @@ def _get_year_first_trade_day(year: int) -> datetime:
 
 def _get_trade_days_list(start_date: datetime, end_date: datetime) -> List[datetime]:
     """获取指定日期范围内的所有交易日列表"""
-    trade_days = []
-    current = start_date
-    
-    while current <= end_date:
-        date_str = current.strftime('%Y-%m-%d')
-        if is_trade_day(date_str):
-            trade_days.append(current)
-        current += timedelta(days=1)
-    
-    return trade_days
+    return get_trading_calendar().range(start_date, end_date)
 
 
 def _process_930_data(df: pd.DataFrame, fields: List[str]) -> pd.DataFrame:
@@ -11,7 +11,7 @@ import sys
 import json
 import logging
 import datetime
-from datetime import datetime as dt, date, timedelta
+from datetime import datetime as dt, date, timedelta, time as dtime
 from typing import Dict, List, Optional, Union, Tuple, Any
 
 # ===== 数据处理库 =====
@@ -221,6 +221,10 @@ class TimeInfo:
     @property
     def date_num(self) -> str:
         """返回数字日期格式: 20240603"""
+        # 回测框架会预先计算数字日期，直接复用
+        date_num = self._current_time.get("date_num")
+        if date_num:
+            return date_num
         date_str = self.date_str
         if date_str:
             return date_str.replace("-", "")
@@ -249,6 +253,14 @@ class TimeInfo:
     @property
     def datetime_obj(self) -> Optional[dt]:
         """返回datetime对象"""
+        # 回测框架提供日期序数时，直接由序数和时间字符串组合，避免strptime解析
+        day_ordinal = self._current_time.get("day_ordinal")
+        if day_ordinal and self.time_str:
+            try:
+                h, m, s = map(int, self.time_str.split(":"))
+                return dt.combine(date.fromordinal(day_ordinal), dtime(h, m, s))
+            except (ValueError, TypeError):
+                pass
         if self.datetime_str:
             try:
                 return dt.strptime(self.datetime_str, "%Y-%m-%d %H:%M:%S")
@@ -18,7 +18,7 @@ import time
 import json
 import threading
 import logging
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, Tuple
 from datetime import datetime, timedelta
 
 # ===== 第三方库导入 =====
@@ -67,6 +67,8 @@ class RealtimeTrader:
                 - stock_list: 股票池列表
                 - period: K线周期（默认'5m'）
                 - auto_reconnect: 是否自动重连
+                - subscribe_mode: 订阅方式，'whole' 全推行情一次订阅整个股票池，
+                  'kline' 按股票订阅K线，'auto'（默认）在 period 为 'tick' 时使用全推
             strategy_file: 策略文件路径
             alert_manager: 提醒管理器实例
             user_callback: 用户自定义回调函数
@@ -86,11 +88,27 @@ class RealtimeTrader:
         self.stock_list = config.get("stock_list", [])
         self.period = config.get("period", "5m")
         self.auto_reconnect = config.get("auto_reconnect", True)
+        self.subscribe_mode = config.get("subscribe_mode", "auto")
+        self._stock_set = set(self.stock_list)
+        self._subscribe_ids: Dict[str, int] = {}   # 股票代码（全推为 "__whole__"）-> 订阅号
 
         # 实时数据缓存: {stock_code: {field: value}}
         self.quote_data: Dict[str, Dict] = {}
         self.quote_lock = threading.Lock()
 
+        # 账户与持仓缓存，启动时查询一次，之后由交易回调推送（on_asset / on_position / on_trade）
+        # 原地更新，策略执行时不再逐笔查询交易接口
+        self.asset_cache: Dict[str, float] = {}
+        self.position_cache: Dict[str, Dict] = {}
+        self.cache_lock = threading.Lock()
+        self._cache_stale = True        # 需要从交易接口重新同步（启动、重连后）
+        self._positions_version = 0     # 持仓缓存版本，变化时刷新上下文中的持仓字段
+
+        # 按股票复用的策略上下文
+        self._contexts: Dict[str, Dict] = {}
+        # 各上下文已写入的持仓版本和持仓字段名，与策略可见的上下文分开保存
+        self._context_positions: Dict[str, Tuple[int, List[str]]] = {}
+
         # 策略函数
         self.init_func = None
         self.handle_func = None
@@ -150,6 +168,8 @@ class RealtimeTrader:
 
             if self.trader.start():
                 self.logger.info("交易接口启动成功")
+                # 断线期间可能错过推送，下次执行策略前重新同步账户持仓
+                self._cache_stale = True
                 return True
             else:
                 self.logger.error("交易接口启动失败")
@@ -159,48 +179,95 @@ class RealtimeTrader:
             self.logger.error(f"初始化交易接口异常: {e}")
             return False
 
+    def _use_whole_quote(self) -> bool:
+        """是否使用全推行情订阅"""
+        if self.subscribe_mode == "auto":
+            return self.period == "tick"
+        return self.subscribe_mode == "whole"
+
     def _subscribe_quotes(self):
-        """订阅实时行情"""
+        """订阅实时行情
+
+        全推模式下整个股票池只订阅一次（subscribe_whole_quote），一次推送包含多只股票；
+        K线模式下xtdata只能按股票订阅，记录各订阅号以便取消订阅。
+        """
         if not self.stock_list:
             self.logger.warning("股票池为空")
             return
 
         try:
-            for stock_code in self.stock_list:
-                # 订阅5分钟K线
-                xtdata.subscribe_quote(
-                    stock_code=stock_code,
-                    period=self.period,
-                    on_push=self._on_quote_callback
-                )
-                self.logger.debug(f"已订阅: {stock_code} {self.period}")
+            if self._use_whole_quote():
+                seq = xtdata.subscribe_whole_quote(list(self.stock_list), callback=self._on_quote_callback)
+                self._subscribe_ids["__whole__"] = seq
+                self.logger.info(f"已订阅全推行情: {len(self.stock_list)} 只股票")
+            else:
+                for stock_code in self.stock_list:
+                    self._subscribe_ids[stock_code] = self._subscribe_kline(stock_code)
+                self.logger.info(f"已订阅K线行情: {len(self.stock_list)} 只股票 {self.period}")
 
         except Exception as e:
             self.logger.error(f"订阅行情失败: {e}")
 
+    def _subscribe_kline(self, stock_code: str) -> int:
+        """按股票订阅K线行情，返回订阅号"""
+        seq = xtdata.subscribe_quote(
+            stock_code=stock_code,
+            period=self.period,
+            callback=self._on_quote_callback
+        )
+        self.logger.debug(f"已订阅: {stock_code} {self.period}")
+        return seq
+
+    def _unsubscribe_quotes(self):
+        """取消全部行情订阅"""
+        for seq in self._subscribe_ids.values():
+            try:
+                xtdata.unsubscribe_quote(seq)
+            except Exception as e:
+                self.logger.error(f"取消订阅失败: {e}")
+        self._subscribe_ids = {}
+
+    def _resubscribe(self):
+        """股票池变化后重新订阅（全推模式）"""
+        self._unsubscribe_quotes()
+        self._subscribe_quotes()
+
     def _on_quote_callback(self, data: Dict):
         """
         行情回调函数
 
         Args:
-            data: 包含 stock_code, time, open, high, low, close, volume 等字段
+            data: 推送数据，{stock_code: 行情字典或K线列表}；
+                  兼容单只股票的 {stock_code: ..., time: ..., close: ...} 格式
         """
         if not self.running:
             return
 
         try:
-            stock_code = data.get("stock_code", "")
-
-            # 更新本地缓存
-            with self.quote_lock:
-                self.quote_data[stock_code] = data
+            if "stock_code" in data:
+                quotes = {data["stock_code"]: data}
+            else:
+                quotes = data
 
-            # 记录时间
+            # 一次加锁更新本次推送的全部股票
+            updated = []
             current_time = time.time()
-            self.last_tick_time[stock_code] = current_time
+            stock_set = self._stock_set
+            with self.quote_lock:
+                for stock_code, quote in quotes.items():
+                    if stock_code not in stock_set:
+                        continue
+                    if isinstance(quote, list):
+                        if not quote:
+                            continue
+                        quote = quote[-1]
+                    self.quote_data[stock_code] = quote
+                    self.last_tick_time[stock_code] = current_time
+                    updated.append(stock_code)
 
             # 执行策略
-            self._run_strategy(stock_code)
+            for stock_code in updated:
+                self._run_strategy(stock_code)
 
         except Exception as e:
             self.logger.error(f"处理行情回调失败: {e}")
@@ -209,6 +276,9 @@ class RealtimeTrader:
         """
         构建策略执行上下文
 
+        每只股票的上下文字典在首次构建后复用，之后只原地更新行情、时间、账户和持仓字段；
+        账户与持仓取自推送维护的缓存，不再逐笔查询交易接口。
+
         Args:
             stock_code: 股票代码
 
@@ -219,57 +289,151 @@ class RealtimeTrader:
         with self.quote_lock:
             quote = self.quote_data.get(stock_code, {})
 
+        if self._cache_stale:
+            self._sync_account_cache()
+
+        context = self._contexts.get(stock_code)
+        if context is None:
+            context = {"stock_code": stock_code}
+            self._contexts[stock_code] = context
+            self._context_positions[stock_code] = (-1, [])
+
         # 获取时间信息
         quote_time = quote.get("time", 0)
-        if isinstance(quote_time, (int, float)):
+        if isinstance(quote_time, (int, float)) and quote_time:
             dt = datetime.fromtimestamp(quote_time / 1000)
-            date_str = dt.strftime("%Y-%m-%d")
-            time_str = dt.strftime("%H:%M:%S")
-            date_num = int(dt.strftime("%Y%m%d"))
         else:
-            date_str = date_str = datetime.now().strftime("%Y-%m-%d")
-            time_str = datetime.now().strftime("%H:%M:%S")
-            date_num = int(datetime.now().strftime("%Y%m%d"))
-
-        # 构建上下文
-        context = {
-            "date_str": date_str,
-            "time_str": time_str,
-            "datetime_str": f"{date_str} {time_str}",
-            "date_num": str(date_num),
-            "stock_code": stock_code,
-        }
-
-        # 添加价格数据
+            dt = datetime.now()
+        datetime_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+        context["date_str"] = datetime_str[:10]
+        context["time_str"] = datetime_str[11:]
+        context["datetime_str"] = datetime_str
+        context["date_num"] = datetime_str[:10].replace("-", "")
+
+        # 添加价格数据（全推行情以最新价作为收盘价）
         for field in ["open", "high", "low", "close", "volume"]:
             context[field] = quote.get(field, 0)
+        if "close" not in quote and "lastPrice" in quote:
+            context["close"] = quote["lastPrice"]
 
         # 添加账户信息
-        if self.trader:
-            account_status = self.trader.query_account_status()
-            if account_status:
-                context["cash"] = account_status.get("cash", 0)
-                context["total_asset"] = account_status.get("total_asset", 0)
-                context["market_value"] = account_status.get("market_value", 0)
+        with self.cache_lock:
+            asset = self.asset_cache
+            if asset:
+                context["cash"] = asset.get("cash", 0)
+                context["total_asset"] = asset.get("total_asset", 0)
+                context["market_value"] = asset.get("market_value", 0)
+
+            # 持仓变化后刷新持仓字段
+            version, position_keys = self._context_positions[stock_code]
+            if version != self._positions_version:
+                for key in position_keys:
+                    context.pop(key, None)
+                keys = []
+                for pos_code, pos in self.position_cache.items():
+                    context[f"has_{pos_code}"] = True
+                    context[f"position_{pos_code}"] = pos
+                    keys.extend((f"has_{pos_code}", f"position_{pos_code}"))
+                self._context_positions[stock_code] = (self._positions_version, keys)
 
         # 添加股票池
         context["stocks"] = self.stock_list
         context["first_stock"] = self.stock_list[0] if self.stock_list else ""
 
-        # 添加持仓信息
-        if self.trader:
-            positions = self.trader.query_positions()
-            if positions:
-                for pos in positions:
-                    pos_code = pos.get("stock_code", "")
-                    context[f"has_{pos_code}"] = True
-                    context[f"position_{pos_code}"] = pos
-
         # 标记是否为实盘模式
         context["_is_realtime"] = True
 
         return context
 
+    # ------------------ 账户与持仓缓存 ------------------
+
+    @staticmethod
+    def _to_dict(obj, fields=None) -> Dict:
+        """将交易接口返回的对象（或字典）转换为字典"""
+        if isinstance(obj, dict):
+            return obj
+        if fields is None:
+            fields = [name for name in dir(obj) if not name.startswith("_")]
+        result = {}
+        for name in fields:
+            value = getattr(obj, name, None)
+            if value is not None and not callable(value):
+                result[name] = value
+        return result
+
+    def _sync_account_cache(self):
+        """从交易接口同步一次账户与持仓缓存（启动及重连后调用）"""
+        self._cache_stale = False
+        if not self.trader:
+            return
+        try:
+            account_status = self.trader.query_account_status()
+            if account_status:
+                self.update_asset(account_status)
+            positions = self.trader.query_positions()
+            if positions is not None:
+                with self.cache_lock:
+                    self.position_cache = {}
+                    for pos in positions:
+                        pos = self._to_dict(pos)
+                        if pos.get("stock_code") and pos.get("volume", 1) > 0:
+                            self.position_cache[pos["stock_code"]] = pos
+                    self._positions_version += 1
+        except Exception as e:
+            self.logger.error(f"同步账户持仓失败: {e}")
+
+    def update_asset(self, asset):
+        """用资产推送更新账户缓存"""
+        asset = self._to_dict(asset, ("cash", "frozen_cash", "market_value", "total_asset"))
+        with self.cache_lock:
+            self.asset_cache.update(asset)
+
+    def update_position(self, position):
+        """用持仓推送更新持仓缓存"""
+        position = self._to_dict(position)
+        stock_code = position.get("stock_code")
+        if not stock_code:
+            return
+        with self.cache_lock:
+            if position.get("volume", 1) > 0:
+                self.position_cache[stock_code] = position
+            else:
+                self.position_cache.pop(stock_code, None)
+            self._positions_version += 1
+
+    def on_trade_fill(self, trade):
+        """成交推送：按成交数量和金额原地调整持仓与资金缓存
+
+        不再标记缓存失效，避免每笔成交后整体重新查询交易接口；手续费、持仓成本等
+        以随后到达的 on_asset / on_position 推送为准。
+        """
+        trade = self._to_dict(trade, ("stock_code", "traded_volume", "traded_price", "traded_amount", "order_type"))
+        stock_code = trade.get("stock_code")
+        volume = trade.get("traded_volume", 0)
+        if not stock_code or not volume:
+            return
+        is_buy = trade.get("order_type") == xtconstant.STOCK_BUY
+        sign = 1 if is_buy else -1
+        amount = trade.get("traded_amount") or volume * trade.get("traded_price", 0)
+        with self.cache_lock:
+            position = dict(self.position_cache.get(stock_code, {"stock_code": stock_code, "volume": 0}))
+            position["volume"] = position.get("volume", 0) + sign * volume
+            if not is_buy and "can_use_volume" in position:
+                # 买入当日不可卖出，只有卖出减少可用数量
+                position["can_use_volume"] = max(position["can_use_volume"] - volume, 0)
+            if "market_value" in position:
+                position["market_value"] = position["market_value"] + sign * amount
+            if position["volume"] > 0:
+                self.position_cache[stock_code] = position
+            else:
+                self.position_cache.pop(stock_code, None)
+            self._positions_version += 1
+
+            if "cash" in self.asset_cache:
+                self.asset_cache["cash"] -= sign * amount
+            if "market_value" in self.asset_cache:
+                self.asset_cache["market_value"] += sign * amount
+
     def _run_strategy(self, stock_code: str):
         """执行策略逻辑"""
         if not self.handle_func:
@@ -378,6 +542,9 @@ class RealtimeTrader:
             except Exception as e:
                 self.logger.error(f"策略初始化失败: {e}")
 
+        # 同步账户与持仓缓存
+        self._sync_account_cache()
+
         # 订阅行情
         self._subscribe_quotes()
 
@@ -396,11 +563,9 @@ class RealtimeTrader:
         self.running = False
 
         # 取消订阅
-        try:
-            for stock_code in self.stock_list:
-                xtdata.unsubscribe_quote(stock_code, self.period)
-        except Exception as e:
-            self.logger.error(f"取消订阅失败: {e}")
+        self._unsubscribe_quotes()
+        self._contexts.clear()
+        self._context_positions.clear()
 
         # 停止交易接口
         if self.trader:
@@ -413,20 +578,26 @@ class RealtimeTrader:
         """添加股票到监控列表"""
         if stock_code not in self.stock_list:
             self.stock_list.append(stock_code)
+            self._stock_set.add(stock_code)
             if self.running:
-                xtdata.subscribe_quote(
-                    stock_code=stock_code,
-                    period=self.period,
-                    on_push=self._on_quote_callback
-                )
+                if self._use_whole_quote():
+                    self._resubscribe()
+                else:
+                    self._subscribe_ids[stock_code] = self._subscribe_kline(stock_code)
             self.logger.info(f"添加监控股票: {stock_code}")
 
     def remove_stock(self, stock_code: str):
         """从监控列表移除股票"""
         if stock_code in self.stock_list:
             self.stock_list.remove(stock_code)
+            self._stock_set.discard(stock_code)
+            self._contexts.pop(stock_code, None)
+            self._context_positions.pop(stock_code, None)
             if self.running:
-                xtdata.unsubscribe_quote(stock_code, self.period)
+                if self._use_whole_quote():
+                    self._resubscribe()
+                elif stock_code in self._subscribe_ids:
+                    xtdata.unsubscribe_quote(self._subscribe_ids.pop(stock_code))
             self.logger.info(f"移除监控股票: {stock_code}")
 
     def get_quote(self, stock_code: str) -> Optional[Dict]:
@@ -477,14 +648,17 @@ class _TraderCallback(XtQuantTraderCallback):
     def on_trade(self, trade):
         """成交回调"""
         self.logger.info(f"成交记录: {trade}")
+        self.trader.on_trade_fill(trade)
 
     def on_position(self, position):
         """持仓回调"""
         self.logger.debug(f"持仓更新: {position}")
+        self.trader.update_position(position)
 
     def on_asset(self, asset):
         """资产回调"""
         self.logger.debug(f"资产更新: {asset}")
+        self.trader.update_asset(asset)
 
 
 # =============================================================================
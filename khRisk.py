@@ -19,7 +19,17 @@ import datetime
 import logging
 from typing import Dict, List, Tuple, Optional, Any
 
-logger = logging.getLogger('OsKhQuant.risk')
+import numpy as np
+
+from khPortfolio import PortfolioLedger
+from logging_config import LazyLogger, RateLimitedLog
+
+logger = LazyLogger(logging.getLogger('OsKhQuant.risk'))
+
+# 风控事件和拦截日志的汇总周期：每类事件首次出现立即输出，之后每个周期汇总一条。
+# 回测按检查次数汇总，实盘/模拟按时间（秒）汇总
+RISK_LOG_SUMMARY_CHECKS = 240
+RISK_LOG_SUMMARY_SECONDS = 60
 
 
 class RiskEventType:
@@ -57,10 +67,12 @@ class KhRiskManager:
                 - order_limit: 日委托次数限制 (默认100)
                 - loss_limit: 累计亏损止损比例 (默认0.1)
                 - init_capital: 初始资金 (默认1000000)
-            trade_manager: 交易管理器实例（可选）
+            trade_manager: 交易管理器实例（可选），传入时订阅其成交事件
         """
         self.config = config
         self.trade_manager = trade_manager
+        if trade_manager is not None and hasattr(trade_manager, 'risk_manager'):
+            trade_manager.risk_manager = self
 
         # 风控参数 - 从配置读取，添加默认值保护
         self.position_limit = getattr(config, 'position_limit', 0.95)
@@ -76,14 +88,35 @@ class KhRiskManager:
         self.peak_equity = 0.0
         self.risk_events: List[Dict] = []
 
-        # 初始化峰值权益
-        if trade_manager and hasattr(trade_manager, 'assets'):
-            cash = trade_manager.assets.get('cash', 0) if isinstance(trade_manager.assets, dict) else 0
-            self.peak_equity = cash
+        # 增量风控状态：由成交/盯市事件更新，各项检查直接读取
+        self.cash = 0.0
+        self.position_value = 0.0
+        self.equity = 0.0
+        self.drawdown = 0.0
+        self.position_ratio = 0.0
+
+        # 初始化权益：关联交易管理器时从其账户同步，否则以初始资金为起点
+        if trade_manager is not None:
+            self.sync(reset_peak=True)
+        else:
+            self.cash = float(getattr(config, 'init_capital', 1000000))
+            self._update_equity()
 
         # 线程锁 - 保护并发访问
         self._lock = threading.Lock()
 
+        # 拦截条件可能连续多根K线/多次推送成立：回测按检查次数汇总，实盘按时间汇总
+        if getattr(config, 'run_mode', 'backtest') == 'backtest':
+            window, summary = {'every': RISK_LOG_SUMMARY_CHECKS}, "最近 {periods} 次检查中"
+        else:
+            window, summary = {'interval': RISK_LOG_SUMMARY_SECONDS}, "最近 {seconds} 秒内"
+        self._event_log = RateLimitedLog(
+            logger.warning, "[风控拦截] " + summary + "触发 {events} 次: {samples}",
+            max_samples=3, first_template="[风控拦截] {sample}", **window)
+        self._blocked_log = RateLimitedLog(
+            logger.info, "[风控] " + summary + "拦截 {count} 笔交易，限制类型: {samples}",
+            first_template="[风控] 交易被拦截 - {sample}", **window)
+
         # 统计信息
         self.stats = {
             'total_checks': 0,
@@ -96,15 +129,16 @@ class KhRiskManager:
             'daily_loss_violations': 0
         }
 
-        logger.info(f"风控模块初始化完成 - 持仓限制:{self.position_limit:.0%}, "
-                   f"委托限制:{self.order_limit}, 止损:{self.loss_limit:.0%}, "
-                   f"回撤:{self.drawdown_limit:.0%}")
+        logger.info("风控模块初始化完成 - 持仓限制:%.0f%%, 委托限制:%s, 止损:%.0f%%, 回撤:%.0f%%",
+                    self.position_limit * 100, self.order_limit, self.loss_limit * 100,
+                    self.drawdown_limit * 100)
 
     def check_risk(self, signal: Dict = None) -> Tuple[bool, str]:
         """统一风控检查入口
 
         对交易信号进行全面的风控检查，包括持仓限制、委托频率、
-        单笔委托和亏损回撤等。
+        单笔委托和亏损回撤等。各项检查直接读取增量维护的风控状态，
+        不再遍历持仓。
 
         Args:
             signal: 交易信号字典，可包含：
@@ -117,6 +151,7 @@ class KhRiskManager:
             Tuple[是否通过, 拒绝原因]
         """
         self.stats['total_checks'] += 1
+        self._tick_logs()
 
         # 1. 持仓限制检查
         passed, msg = self._check_position()
@@ -145,63 +180,172 @@ class KhRiskManager:
 
         return True, ""
 
-    def _check_position(self) -> Tuple[bool, str]:
-        """检查持仓比例限制
+    def check_signals_batch(self, signals: List[Dict]) -> Tuple[np.ndarray, List[str]]:
+        """批量风控预检查（向量化）
 
-        计算当前总持仓比例，与配置的限制进行比较。
+        结果与对每个信号依次调用一次 check_risk 相同（批内不计入尚未成交的委托）：
+        持仓比例、委托频率和亏损回撤为账户级检查，对整批只判断一次；单笔委托金额
+        按数组一次计算。由 KhTradeManager.process_signals_batch 在开启
+        backtest.batch_risk_check 时调用。
+
+        Args:
+            signals: 交易信号列表
 
         Returns:
-            Tuple[是否通过, 拒绝原因]
+            Tuple[各信号是否通过的布尔数组, 各信号的拒绝原因（通过为空字符串）]
+        """
+        n = len(signals)
+        self.stats['total_checks'] += n
+        self._tick_logs(n)
+        passed = np.ones(n, dtype=bool)
+        reasons = [""] * n
+        if n == 0:
+            return passed, reasons
+
+        # 账户级检查：对整批信号结果相同
+        for limit_type, check, stat in (("POSITION_LIMIT", self._check_position, 'position_violations'),
+                                        ("ORDER_LIMIT", self._check_order, 'order_rate_violations')):
+            ok, msg = check()
+            if not ok:
+                self.stats[stat] += n - 1
+                self._log_blocked(limit_type, msg, count=n)
+                return np.zeros(n, dtype=bool), [msg] * n
+
+        # 单笔委托金额
+        volumes = np.array([signal.get('volume', 0) for signal in signals], dtype=np.float64)
+        prices = np.array([signal.get('price', 0) for signal in signals], dtype=np.float64)
+        order_values = volumes * prices
+        too_large = np.zeros(n, dtype=bool)
+        if self.equity > 0:
+            too_large = (order_values > 0) & (order_values / self.equity > self.single_order_limit)
+        large_idx = np.flatnonzero(too_large).tolist()
+        if large_idx:
+            self.stats['single_order_violations'] += len(large_idx)
+            first = large_idx[0]
+            self._log_event(
+                RiskEventType.SINGLE_ORDER_LIMIT,
+                f"单笔委托 {order_values[first]:.2f} 占比 {order_values[first] / self.equity:.2%} "
+                f"超过限制 {self.single_order_limit:.2%}"
+            )
+            for i in large_idx:
+                reasons[i] = f"单笔委托金额 {order_values[i]:.2f} 超过资产比例限制"
+            passed[large_idx] = False
+            self._log_blocked("SINGLE_ORDER", reasons[first], count=len(large_idx))
+
+        # 亏损/回撤：只对通过单笔检查的信号判断
+        remaining = int(passed.sum())
+        if remaining:
+            stats_before = dict(self.stats)
+            ok, msg = self._check_loss()
+            if not ok:
+                for key, value in self.stats.items():
+                    if value != stats_before[key]:
+                        self.stats[key] += (value - stats_before[key]) * (remaining - 1)
+                for i in np.flatnonzero(passed).tolist():
+                    reasons[i] = msg
+                passed[:] = False
+                self._log_blocked("LOSS_LIMIT", msg, count=remaining)
+        return passed, reasons
+
+    # ------------------ 增量风控状态 ------------------
+
+    def sync(self, reset_peak: bool = False):
+        """从交易管理器完整同步一次现金和持仓市值
+
+        需要遍历持仓（PortfolioLedger 为一次 O(n) 的数组求和），只在账户初始化和
+        每日重置时调用；其余时间状态由 on_fill / on_mark_to_market 事件增量维护。
+
+        Args:
+            reset_peak: 是否以同步后的权益作为新的峰值权益
         """
         if not self.trade_manager:
-            return True, ""
+            return
+
+        cash = 0
+        assets = getattr(self.trade_manager, 'assets', None)
+        if isinstance(assets, dict):
+            cash = assets.get('cash', 0)
+        elif hasattr(assets, 'cash'):
+            cash = assets.cash
+
+        position_value = 0.0
+        positions = getattr(self.trade_manager, 'positions', None)
+        if isinstance(positions, PortfolioLedger):
+            position_value = positions.exposure()
+        elif isinstance(positions, dict):
+            for pos in positions.values():
+                if isinstance(pos, dict):
+                    mv = pos.get('market_value', 0)
+                    position_value += mv or (pos.get('current_price', 0) * pos.get('volume', 0))
+                else:
+                    position_value += getattr(pos, 'market_value', 0)
+
+        self.cash = cash
+        self.position_value = position_value
+        if reset_peak:
+            self.peak_equity = 0.0
+        self._update_equity()
+
+    def _update_equity(self):
+        """由现金和持仓市值更新权益、峰值权益、回撤和持仓比例"""
+        self.equity = self.cash + self.position_value
+        if self.equity > self.peak_equity:
+            self.peak_equity = self.equity
+        self.drawdown = (self.peak_equity - self.equity) / self.peak_equity if self.peak_equity > 0 else 0.0
+        self.position_ratio = self.position_value / self.equity if self.equity > 0 else 0.0
+
+    def on_mark_to_market(self, cash: float, position_value: float):
+        """盯市事件：按最新现金和持仓总市值更新风控状态
 
-        try:
-            # 获取现金
-            cash = 0
-            if hasattr(self.trade_manager, 'assets'):
-                assets = self.trade_manager.assets
-                if isinstance(assets, dict):
-                    cash = assets.get('cash', 0)
-                elif hasattr(assets, 'cash'):
-                    cash = assets.cash
-
-            # 计算持仓市值
-            position_value = 0.0
-            if hasattr(self.trade_manager, 'positions'):
-                positions = self.trade_manager.positions
-                if isinstance(positions, dict):
-                    for code, pos in positions.items():
-                        if isinstance(pos, dict):
-                            mv = pos.get('market_value', 0)
-                            cp = pos.get('current_price', 0)
-                            vol = pos.get('volume', 0)
-                            position_value += mv or (cp * vol)
-                        else:
-                            # 对象属性访问
-                            mv = getattr(pos, 'market_value', 0)
-                            position_value += mv
-
-            total_asset = cash + position_value
-
-            if total_asset <= 0:
-                return True, ""
+        Args:
+            cash: 当前现金
+            position_value: 当前持仓总市值
+        """
+        with self._lock:
+            self.cash = cash
+            self.position_value = position_value
+            self._update_equity()
 
-            position_ratio = position_value / total_asset
+    def on_fill(self, action: str, amount: float, trade_cost: float = 0.0, count: int = 1):
+        """成交事件：按成交金额增量更新现金、持仓市值和今日委托计数
 
-            if position_ratio > self.position_limit:
-                self.stats['position_violations'] += 1
-                self._log_event(
-                    RiskEventType.POSITION_LIMIT_EXCEEDED,
-                    f"持仓比例 {position_ratio:.2%} 超过限制 {self.position_limit:.2%}"
-                )
-                return False, f"持仓比例 {position_ratio:.2%} 超过限制 {self.position_limit:.2%}"
+        Args:
+            action: 交易方向 'buy' 或 'sell'
+            amount: 成交金额（成交价 × 数量），批量成交时为合计金额
+            trade_cost: 交易成本，批量成交时为合计成本
+            count: 成交笔数
+        """
+        with self._lock:
+            if action == 'buy':
+                self.cash -= amount + trade_cost
+                self.position_value += amount
+            else:
+                self.cash += amount - trade_cost
+                self.position_value -= amount
+            self.order_count_today += count
+            self._update_equity()
+
+    def _check_position(self) -> Tuple[bool, str]:
+        """检查持仓比例限制
+
+        使用增量维护的持仓比例，与配置的限制进行比较。
 
+        Returns:
+            Tuple[是否通过, 拒绝原因]
+        """
+        if self.equity <= 0:
             return True, ""
 
-        except Exception as e:
-            logger.error(f"持仓检查异常: {e}", exc_info=True)
-            return True, ""  # 异常时放行，避免阻塞交易
+        position_ratio = self.position_ratio
+        if position_ratio > self.position_limit:
+            self.stats['position_violations'] += 1
+            self._log_event(
+                RiskEventType.POSITION_LIMIT_EXCEEDED,
+                f"持仓比例 {position_ratio:.2%} 超过限制 {self.position_limit:.2%}"
+            )
+            return False, f"持仓比例 {position_ratio:.2%} 超过限制 {self.position_limit:.2%}"
+
+        return True, ""
 
     def _check_order(self) -> Tuple[bool, str]:
         """检查委托频率限制
@@ -235,41 +379,23 @@ class KhRiskManager:
             price = signal.get('price', 0)
             order_value = volume * price
 
-            if order_value <= 0:
+            if order_value <= 0 or self.equity <= 0:
                 return True, ""
 
-            if self.trade_manager and hasattr(self.trade_manager, 'assets'):
-                # 获取总资产
-                assets = self.trade_manager.assets
-                cash = 0
-                position_value = 0.0
-
-                if isinstance(assets, dict):
-                    cash = assets.get('cash', 0)
-                    if hasattr(self.trade_manager, 'positions'):
-                        for pos in self.trade_manager.positions.values():
-                            if isinstance(pos, dict):
-                                mv = pos.get('market_value', 0)
-                                position_value += mv or 0
-
-                total_asset = cash + position_value
-
-                if total_asset > 0:
-                    order_ratio = order_value / total_asset
-
-                    if order_ratio > self.single_order_limit:
-                        self.stats['single_order_violations'] += 1
-                        self._log_event(
-                            RiskEventType.SINGLE_ORDER_LIMIT,
-                            f"单笔委托 {order_value:.2f} 占比 {order_ratio:.2%} "
-                            f"超过限制 {self.single_order_limit:.2%}"
-                        )
-                        return False, f"单笔委托金额 {order_value:.2f} 超过资产比例限制"
+            order_ratio = order_value / self.equity
+            if order_ratio > self.single_order_limit:
+                self.stats['single_order_violations'] += 1
+                self._log_event(
+                    RiskEventType.SINGLE_ORDER_LIMIT,
+                    f"单笔委托 {order_value:.2f} 占比 {order_ratio:.2%} "
+                    f"超过限制 {self.single_order_limit:.2%}"
+                )
+                return False, f"单笔委托金额 {order_value:.2f} 超过资产比例限制"
 
             return True, ""
 
         except Exception as e:
-            logger.error(f"单笔委托检查异常: {e}", exc_info=True)
+            logger.error("单笔委托检查异常: %s", e, exc_info=True)
             return True, ""
 
     def _check_loss(self) -> Tuple[bool, str]:
@@ -280,76 +406,48 @@ class KhRiskManager:
         Returns:
             Tuple[是否通过, 拒绝原因]
         """
-        if not self.trade_manager:
+        if self.peak_equity <= 0:
+            # 账户尚无资金
             return True, ""
 
-        try:
-            # 计算当前权益
-            cash = 0
-            position_value = 0.0
-
-            if hasattr(self.trade_manager, 'assets'):
-                assets = self.trade_manager.assets
-                if isinstance(assets, dict):
-                    cash = assets.get('cash', 0)
-
-            if hasattr(self.trade_manager, 'positions'):
-                positions = self.trade_manager.positions
-                if isinstance(positions, dict):
-                    for pos in positions.values():
-                        if isinstance(pos, dict):
-                            mv = pos.get('market_value', 0)
-                            position_value += mv or 0
-
-            current_equity = cash + position_value
-
-            # 更新峰值权益
-            if current_equity > self.peak_equity:
-                self.peak_equity = current_equity
-
-            # 回撤检查
-            if self.peak_equity > 0:
-                drawdown = (self.peak_equity - current_equity) / self.peak_equity
-
-                if drawdown > self.drawdown_limit:
-                    self.stats['drawdown_violations'] += 1
-                    self._log_event(
-                        RiskEventType.DRAWDOWN_LIMIT_EXCEEDED,
-                        f"当前回撤 {drawdown:.2%} 超过限制 {self.drawdown_limit:.2%}"
-                    )
-                    return False, f"最大回撤 {drawdown:.2%} 超过限制 {self.drawdown_limit:.2%}"
-
-            # 累计亏损检查
-            init_capital = getattr(self.config, 'init_capital', 1000000)
-            if init_capital > 0:
-                loss_ratio = (init_capital - current_equity) / init_capital
-
-                if loss_ratio >= self.loss_limit:
-                    self.stats['loss_violations'] += 1
-                    self._log_event(
-                        RiskEventType.LOSS_LIMIT_TRIGGERED,
-                        f"累计亏损 {loss_ratio:.2%} 达到止损线 {self.loss_limit:.2%}"
-                    )
-                    return False, f"累计亏损 {abs(loss_ratio):.2%} 达到止损线 {self.loss_limit:.2%}"
-
-            # 今日亏损检查
-            if self.daily_pnl < 0:
-                init_equity = self.peak_equity if self.peak_equity > 0 else init_capital
-                daily_loss_ratio = abs(self.daily_pnl) / init_equity if init_equity > 0 else 0
-
-                if daily_loss_ratio >= self.daily_loss_limit:
-                    self.stats['daily_loss_violations'] += 1
-                    self._log_event(
-                        RiskEventType.DAILY_LOSS_LIMIT,
-                        f"今日亏损 {daily_loss_ratio:.2%} 超过限制 {self.daily_loss_limit:.2%}"
-                    )
-                    return False, f"今日亏损超限"
+        current_equity = self.equity
 
-            return True, ""
+        # 回撤检查
+        if self.drawdown > self.drawdown_limit:
+            self.stats['drawdown_violations'] += 1
+            self._log_event(
+                RiskEventType.DRAWDOWN_LIMIT_EXCEEDED,
+                f"当前回撤 {self.drawdown:.2%} 超过限制 {self.drawdown_limit:.2%}"
+            )
+            return False, f"最大回撤 {self.drawdown:.2%} 超过限制 {self.drawdown_limit:.2%}"
 
-        except Exception as e:
-            logger.error(f"亏损检查异常: {e}", exc_info=True)
-            return True, ""
+        # 累计亏损检查
+        init_capital = getattr(self.config, 'init_capital', 1000000)
+        if init_capital > 0:
+            loss_ratio = (init_capital - current_equity) / init_capital
+
+            if loss_ratio >= self.loss_limit:
+                self.stats['loss_violations'] += 1
+                self._log_event(
+                    RiskEventType.LOSS_LIMIT_TRIGGERED,
+                    f"累计亏损 {loss_ratio:.2%} 达到止损线 {self.loss_limit:.2%}"
+                )
+                return False, f"累计亏损 {abs(loss_ratio):.2%} 达到止损线 {self.loss_limit:.2%}"
+
+        # 今日亏损检查
+        if self.daily_pnl < 0:
+            init_equity = self.peak_equity if self.peak_equity > 0 else init_capital
+            daily_loss_ratio = abs(self.daily_pnl) / init_equity if init_equity > 0 else 0
+
+            if daily_loss_ratio >= self.daily_loss_limit:
+                self.stats['daily_loss_violations'] += 1
+                self._log_event(
+                    RiskEventType.DAILY_LOSS_LIMIT,
+                    f"今日亏损 {daily_loss_ratio:.2%} 超过限制 {self.daily_loss_limit:.2%}"
+                )
+                return False, f"今日亏损超限"
+
+        return True, ""
 
     def increment_order_count(self, count: int = 1):
         """增加委托计数
@@ -380,19 +478,12 @@ class KhRiskManager:
             self.daily_pnl = 0.0
 
             # 更新峰值权益为当前权益
-            if self.trade_manager and hasattr(self.trade_manager, 'assets'):
-                assets = self.trade_manager.assets
-                if isinstance(assets, dict):
-                    cash = assets.get('cash', 0)
-                    position_value = sum(
-                        pos.get('market_value', 0)
-                        for pos in getattr(self.trade_manager, 'positions', {}).values()
-                    )
-                    self.peak_equity = cash + position_value
-                elif hasattr(assets, 'cash'):
-                    self.peak_equity = assets.cash
-
-            logger.info("风控日计数器已重置")
+            self.sync()
+            if self.equity > 0:
+                self.peak_equity = self.equity
+                self.drawdown = 0.0
+
+            logger.debug("风控日计数器已重置")
 
     def _log_event(self, event_type: str, message: str):
         """记录风控事件
@@ -413,17 +504,28 @@ class KhRiskManager:
         if len(self.risk_events) > 100:
             self.risk_events = self.risk_events[-100:]
 
-        logger.warning(f"[风控拦截] {event_type}: {message}")
+        self._event_log.add(samples=(f"{event_type}: {message}",), key=event_type)
 
-    def _log_blocked(self, limit_type: str, message: str):
+    def _log_blocked(self, limit_type: str, message: str, count: int = 1):
         """记录被拦截的交易
 
         Args:
             limit_type: 限制类型
             message: 拦截原因
+            count: 拦截笔数（批量检查时）
         """
-        self.stats['blocked_orders'] += 1
-        logger.info(f"[风控] 交易被拦截 - {limit_type}: {message}")
+        self.stats['blocked_orders'] += count
+        self._blocked_log.add(count=count, samples=(limit_type,), key=limit_type)
+
+    def _tick_logs(self, checks: int = 1):
+        """推进风控日志的汇总周期"""
+        self._event_log.tick(checks)
+        self._blocked_log.tick(checks)
+
+    def flush_logs(self):
+        """输出尚未汇总的风控事件和拦截日志，回测结束或停止运行时调用"""
+        self._event_log.flush()
+        self._blocked_log.flush()
 
     def get_risk_report(self) -> Dict:
         """获取风控报告
@@ -0,0 +1,327 @@
+# coding: utf-8
+"""
+行情快照模块
+
+参数优化需要对同一段行情重复执行几十上百次回测，每次回测都会重新向 xtdata 请求
+基准指数、股票池历史数据、日线收盘价矩阵等。MarketSnapshot 在主进程中记录一次完整回测
+发出的全部 get_market_data / get_market_data_ex 响应，之后的回测通过 SnapshotDataSource
+直接从快照中取数：
+
+- 请求参数完全一致时直接返回记录的结果；
+- 否则在周期、复权方式等相同、字段和股票包含所请求字段和股票的已记录请求中，
+  找出时间范围首尾相接、合起来覆盖请求区间的若干段，按时间截取后拼接返回。
+  因此回测开始前的预热数据与回测区间内的数据分别记录时，也能服务滚动优化中
+  各个子区间（及其预热区间）的请求；
+- 快照中没有的请求回退到原始的 xtdata 接口并计入 misses；strict 模式下抛出
+  SnapshotMiss，避免工作进程访问实时行情连接。
+
+快照在创建进程池之前放入模块全局变量，使用 fork 启动的工作进程直接共享父进程中的
+内存页；不支持 fork 的平台（Windows）由工作进程从 save() 写出的文件中加载一次。
+
+@author: OsKhQuant
+@version: 1.0
+"""
+
+import os
+import pickle
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from logging_config import get_module_logger
+
+logger = get_module_logger(__name__)
+
+# 行情请求的参数顺序及默认值（与 xtquant.xtdata 一致）
+REQUEST_ARGS = ('field_list', 'stock_list', 'period', 'start_time', 'end_time',
+                'count', 'dividend_type', 'fill_data')
+REQUEST_DEFAULTS = {'field_list': [], 'stock_list': [], 'period': '1d', 'start_time': '',
+                    'end_time': '', 'count': -1, 'dividend_type': 'none', 'fill_data': True}
+
+
+def normalize_request(args: tuple, kwargs: Dict) -> Dict:
+    """按 xtdata 的参数顺序将位置参数和关键字参数合并为完整的请求参数"""
+    request = dict(REQUEST_DEFAULTS)
+    request.update(zip(REQUEST_ARGS, args))
+    request.update({k: v for k, v in kwargs.items() if k in REQUEST_DEFAULTS})
+    request['field_list'] = tuple(request['field_list'] or ())
+    request['stock_list'] = tuple(request['stock_list'] or ())
+    request['start_time'] = str(request['start_time'] or '')
+    request['end_time'] = str(request['end_time'] or '')
+    return request
+
+
+# 空结束时间表示不限，比较时视为最大值
+_OPEN_END = '\uffff'
+
+
+class SnapshotMiss(LookupError):
+    """strict 模式下快照中没有请求的行情"""
+
+
+def _request_key(method: str, request: Dict) -> Tuple:
+    return (method,) + tuple(request[name] for name in REQUEST_ARGS)
+
+
+def _series_key(method: str, request: Dict) -> Tuple:
+    """去掉字段、股票和时间范围后的请求标识，用于查找可截取拼接的记录"""
+    return (method, request['period'], request['count'], request['dividend_type'], request['fill_data'])
+
+
+def _contains(recorded: Dict, request: Dict, stocks: Tuple) -> bool:
+    """记录的请求是否包含所需的字段和股票（空字段列表表示全部字段，只与空字段列表匹配）"""
+    if not request['field_list']:
+        if recorded['field_list']:
+            return False
+    elif not set(request['field_list']) <= set(recorded['field_list']):
+        return False
+    return set(stocks) <= set(recorded['stock_list'])
+
+
+def _covering_pieces(candidates: list, start_time: str, end_time: str) -> Optional[list]:
+    """从已记录的请求中选出首尾相接、覆盖 [start_time, end_time] 的若干段
+
+    Returns:
+        Optional[list]: 按开始时间排列的 (请求参数, 响应)，无法覆盖时为None
+    """
+    need_end = end_time or _OPEN_END
+    covered = start_time
+    chosen = []
+    for recorded, result in sorted(candidates, key=lambda item: item[0]['start_time']):
+        if recorded['start_time'] > covered:
+            # 与已覆盖的部分之间有空档
+            break
+        recorded_end = recorded['end_time'] or _OPEN_END
+        if recorded_end < covered or (chosen and recorded_end == covered):
+            continue
+        chosen.append((recorded, result))
+        covered = recorded_end
+        if covered >= need_end:
+            return chosen
+    return None
+
+
+def _time_mask(labels: pd.Index, start_time: str, end_time: str) -> np.ndarray:
+    """时间标签（YYYYMMDD 或 YYYYMMDDHHMMSS）落在请求范围内的掩码"""
+    labels = labels.astype(str)
+    mask = np.ones(len(labels), dtype=bool)
+    if start_time:
+        mask &= labels.to_numpy() >= start_time
+    if end_time:
+        mask &= labels.str.slice(0, len(end_time)).to_numpy() <= end_time
+    return mask
+
+
+def _copy_result(result: Any) -> Any:
+    """复制记录的结果，避免调用方修改快照中的数据"""
+    if isinstance(result, dict):
+        return {key: value.copy() if isinstance(value, pd.DataFrame) else value for key, value in result.items()}
+    return result
+
+
+def _select(method: str, result: Any, fields: Tuple, stocks: Tuple) -> Any:
+    """从记录的结果中取出所需的字段和股票"""
+    if method == 'get_market_data_ex':
+        return {code: result[code][[f for f in fields if f in result[code].columns]] if fields else result[code]
+                for code in stocks if code in result}
+    return {field: frame.reindex(list(stocks)) if isinstance(frame, pd.DataFrame) else frame
+            for field, frame in result.items() if not fields or field in fields}
+
+
+def _concat_results(method: str, pieces: list) -> Dict:
+    """按时间拼接多段结果，重叠的时间点保留先出现的一段"""
+    merged = {}
+    for key in pieces[0]:
+        frames = [piece[key] for piece in pieces if key in piece]
+        if method == 'get_market_data_ex':
+            frame = pd.concat(frames)
+            frame = frame[~frame.index.duplicated(keep='first')].sort_index()
+        else:
+            frame = pd.concat(frames, axis=1)
+            frame = frame.loc[:, ~frame.columns.duplicated(keep='first')].sort_index(axis=1)
+        merged[key] = frame
+    return merged
+
+
+def _slice_result(method: str, result: Any, start_time: str, end_time: str) -> Any:
+    """按时间范围截取记录的结果
+
+    get_market_data_ex 返回 {股票代码: DataFrame(行为时间)}，
+    get_market_data 返回 {字段: DataFrame(行为股票代码, 列为时间)}。
+    """
+    if not isinstance(result, dict):
+        return result
+    sliced = {}
+    for key, frame in result.items():
+        if not isinstance(frame, pd.DataFrame):
+            sliced[key] = frame
+        elif method == 'get_market_data_ex':
+            sliced[key] = frame.loc[_time_mask(frame.index, start_time, end_time)].copy()
+        else:
+            sliced[key] = frame.loc[:, _time_mask(frame.columns, start_time, end_time)].copy()
+    return sliced
+
+
+class MarketSnapshot:
+    """行情请求与响应的快照
+
+    Attributes:
+        responses: 完整请求参数 -> 响应
+        series: 去掉字段、股票和时间范围的请求标识 -> [(请求参数, 响应), ...]，用于截取拼接
+    """
+
+    def __init__(self):
+        self.responses: Dict[Tuple, Any] = {}
+        self.series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, method: str, request: Dict, result: Any):
+        key = _request_key(method, request)
+        with self._lock:
+            if key in self.responses:
+                return
+            self.responses[key] = result
+            self.series.setdefault(_series_key(method, request), []).append((request, result))
+
+    def lookup(self, method: str, request: Dict) -> Tuple[bool, Any]:
+        """查找请求的响应
+
+        Returns:
+            Tuple[bool, Any]: (是否命中, 响应的副本)
+        """
+        key = _request_key(method, request)
+        if key in self.responses:
+            return True, _copy_result(self.responses[key])
+        stocks = request['stock_list']
+        if request['count'] != -1 or not stocks:
+            return False, None
+        series = self.series.get(_series_key(method, request), ())
+        if method == 'get_market_data_ex':
+            # 各股票的数据可能来自不同的记录，逐只拼接
+            result = {}
+            for code in stocks:
+                piece = self._assemble(method, request, series, (code,))
+                if piece is None:
+                    return False, None
+                result.update(piece)
+            return True, result
+        result = self._assemble(method, request, series, stocks)
+        return (False, None) if result is None else (True, result)
+
+    def _assemble(self, method: str, request: Dict, series, stocks: Tuple) -> Optional[Dict]:
+        """由覆盖请求区间的若干段记录截取、拼接出所需股票的结果"""
+        candidates = [item for item in series if item[0]['count'] == -1 and _contains(item[0], request, stocks)]
+        chosen = _covering_pieces(candidates, request['start_time'], request['end_time'])
+        if chosen is None:
+            return None
+        pieces = [_select(method, _slice_result(method, result, request['start_time'], request['end_time']),
+                          request['field_list'], stocks)
+                  for _, result in chosen]
+        return pieces[0] if len(pieces) == 1 else _concat_results(method, pieces)
+
+    def requests(self, method: str):
+        """已记录的某接口的请求参数"""
+        for (recorded_method, *_), items in self.series.items():
+            if recorded_method == method:
+                for request, _ in items:
+                    yield request
+
+    def save(self, path: str):
+        """写出快照文件，供无法 fork 的工作进程加载"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'MarketSnapshot':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class RecordingDataSource:
+    """记录行情响应的数据接口代理，其余接口直接转发给 xtdata"""
+
+    def __init__(self, xtdata_module, snapshot: Optional[MarketSnapshot] = None):
+        self._xtdata = xtdata_module
+        self.snapshot = snapshot if snapshot is not None else MarketSnapshot()
+
+    def _request(self, method: str, args: tuple, kwargs: Dict):
+        result = getattr(self._xtdata, method)(*args, **kwargs)
+        self.snapshot.record(method, normalize_request(args, kwargs), result)
+        return _copy_result(result)
+
+    def get_market_data(self, *args, **kwargs):
+        return self._request('get_market_data', args, kwargs)
+
+    def get_market_data_ex(self, *args, **kwargs):
+        return self._request('get_market_data_ex', args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._xtdata, name)
+
+
+class SnapshotDataSource:
+    """从快照读取行情的数据接口，快照中没有的请求回退到 xtdata
+
+    Attributes:
+        hits: 快照命中次数
+        misses: 快照未命中的次数
+        strict: 为True时未命中抛出 SnapshotMiss 而不回退到 xtdata
+    """
+
+    def __init__(self, snapshot: MarketSnapshot, fallback=None, strict: bool = False):
+        self.snapshot = snapshot
+        self._fallback = fallback
+        self.strict = strict
+        self.hits = 0
+        self.misses = 0
+
+    def _fallback_module(self):
+        if self._fallback is None:
+            from xtquant import xtdata
+            self._fallback = xtdata
+        return self._fallback
+
+    def _request(self, method: str, args: tuple, kwargs: Dict):
+        request = normalize_request(args, kwargs)
+        found, result = self.snapshot.lookup(method, request)
+        if found:
+            self.hits += 1
+            return result
+        self.misses += 1
+        if self.strict:
+            raise SnapshotMiss(
+                f"行情快照中没有该请求: {method} {request['period']} {','.join(request['stock_list'][:5])} "
+                f"{request['start_time']}-{request['end_time']}")
+        return getattr(self._fallback_module(), method)(*args, **kwargs)
+
+    def get_market_data(self, *args, **kwargs):
+        return self._request('get_market_data', args, kwargs)
+
+    def get_market_data_ex(self, *args, **kwargs):
+        return self._request('get_market_data_ex', args, kwargs)
+
+    def download_history_data(self, *args, **kwargs):
+        """快照记录时已下载过，回放时不再下载"""
+
+    def download_history_data2(self, *args, **kwargs):
+        """快照记录时已下载过，回放时不再下载"""
+
+    def __getattr__(self, name):
+        return getattr(self._fallback_module(), name)
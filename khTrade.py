@@ -1,16 +1,19 @@
 # coding: utf-8
 import logging
-from logging_config import get_module_logger
+from logging_config import get_lazy_logger
 from typing import Dict, List, Optional
 import datetime
 from types import SimpleNamespace
 
-# 日志系统
-logger = get_module_logger(__name__)
+import numpy as np
+
+# 日志系统（延迟构造消息：级别关闭时不格式化信号和持仓）
+logger = get_lazy_logger(__name__)
 
 
 from xtquant.xttrader import XtQuantTraderCallback
 from xtquant import xtconstant
+from khPortfolio import PortfolioLedger
 
 class KhTradeManager:
     """交易管理类"""
@@ -21,11 +24,14 @@ class KhTradeManager:
         self.orders = {}  # 订单管理
         self.assets = {}  # 资产管理
         self.trades = {}  # 成交管理
-        self.positions = {}  # 持仓管理
+        self.positions = PortfolioLedger()  # 持仓管理（NumPy数组账本，兼容字典访问）
 
         # 提醒管理器（可选）
         self.alert_manager = None
         
+        # 风控管理器（可选），成交后推送成交事件以增量更新风控状态
+        self.risk_manager = None
+        
         # 获取交易成本配置
         trade_cost = self.config.config_dict.get("backtest", {}).get("trade_cost", {})
         
@@ -50,6 +56,23 @@ class KhTradeManager:
         
         # T+0交易模式标识（默认关闭）
         self.t0_mode = False
+        
+        # 回测中单批信号数达到该值时走批量执行路径（整批按先卖后买排序后执行，0表示关闭）
+        self.batch_order_threshold = self.config.config_dict.get("backtest", {}).get("batch_order_threshold", 100)
+        # 批量执行前是否用风控管理器对整批信号做向量化预检查（默认关闭）
+        self.batch_risk_check = bool(self.config.config_dict.get("backtest", {}).get("batch_risk_check", False))
+        # 回测逐笔成交时是否向GUI日志输出交易成本明细（默认开启，关闭后不再构造该消息）
+        self.gui_trade_log = bool(self.config.config_dict.get("backtest", {}).get("gui_trade_log", True))
+
+    @property
+    def positions(self) -> PortfolioLedger:
+        """持仓账本"""
+        return self._positions
+
+    @positions.setter
+    def positions(self, value):
+        # 兼容直接赋值普通字典（如 positions = {}），统一转换为持仓账本
+        self._positions = value if isinstance(value, PortfolioLedger) else PortfolioLedger(value)
 
     def set_alert_manager(self, alert_manager):
         """
@@ -176,42 +199,181 @@ class KhTradeManager:
         """计算流量费（每笔交易固定收取）"""
         return self.flow_fee
 
-    def calculate_trade_cost(self, price, volume, direction, stock_code):
+    def calculate_fee_breakdown(self, price, volume, direction, stock_code, apply_slippage=True):
         """
-        计算交易成本
+        一次性计算交易成本明细
         
         Args:
-            price: float, 交易价格
+            price: float, 交易价格（apply_slippage为False时视为已含滑点的成交价）
             volume: int, 交易数量
             direction: str, 交易方向 'buy' 或 'sell'
             stock_code: str, 股票代码
+            apply_slippage: bool, 是否对价格计算滑点
             
         Returns:
-            tuple: (实际成交价格, 总交易成本)
+            dict: 成本明细，包含 actual_price(实际成交价格)、commission(佣金)、stamp_tax(印花税)、
+                transfer_fee(过户费)、flow_fee(流量费)、total_cost(总交易成本)
         """
         # 如果数量为0，不产生交易成本
         if volume <= 0:
-            return price, 0.0
-            
+            return {
+                "actual_price": price,
+                "commission": 0.0,
+                "stamp_tax": 0.0,
+                "transfer_fee": 0.0,
+                "flow_fee": 0.0,
+                "total_cost": 0.0
+            }
+        
         # 计算滑点后的价格
-        actual_price = self.calculate_slippage(price, direction)
+        actual_price = self.calculate_slippage(price, direction) if apply_slippage else price
         
-        # 计算佣金
         commission = self.calculate_commission(actual_price, volume)
-        
-        # 计算印花税（只收取卖出印花税）
+        # 印花税只收取卖出
         stamp_tax = self.calculate_stamp_tax(actual_price, volume, direction)
-        
-        # 计算过户费（沪市股票）
+        # 过户费（沪市股票）
         transfer_fee = self.calculate_transfer_fee(stock_code, actual_price, volume)
-        
-        # 计算流量费（每笔交易固定收取）
+        # 流量费（每笔交易固定收取）
         flow_fee = self.calculate_flow_fee()
         
-        # 总交易成本
-        total_cost = commission + stamp_tax + transfer_fee + flow_fee
+        return {
+            "actual_price": actual_price,
+            "commission": commission,
+            "stamp_tax": stamp_tax,
+            "transfer_fee": transfer_fee,
+            "flow_fee": flow_fee,
+            "total_cost": commission + stamp_tax + transfer_fee + flow_fee
+        }
+
+    def calculate_fee_breakdown_batch(self, prices, volumes, directions, stock_codes, apply_slippage=True):
+        """
+        批量计算交易成本明细（向量化），用于对大量候选委托打分
+        
+        各元素的计算结果与逐笔调用 calculate_fee_breakdown 完全一致。
+        
+        Args:
+            prices: 交易价格数组
+            volumes: 交易数量数组
+            directions: 交易方向数组（'buy'/'sell'），或单个方向字符串
+            stock_codes: 股票代码数组，或单个股票代码
+            apply_slippage: bool, 是否对价格计算滑点
+            
+        Returns:
+            dict: 与 calculate_fee_breakdown 相同的键，值为等长的NumPy数组
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        volumes = np.asarray(volumes)
+        n = len(prices)
+        directions = np.asarray(directions)
+        is_buy = np.broadcast_to(directions == "buy", (n,))
+        is_sell = np.broadcast_to(directions == "sell", (n,))
+        if isinstance(stock_codes, str):
+            is_sh = np.full(n, stock_codes.startswith("sh."))
+        else:
+            is_sh = np.array([code.startswith("sh.") for code in stock_codes], dtype=bool)
+        traded = volumes > 0
         
-        return actual_price, total_cost
+        actual_prices = prices.copy()
+        if apply_slippage:
+            decimals = self.price_decimals
+            slippage_type = self.slippage["type"]
+            if slippage_type == "tick":
+                slippage = self.slippage["tick_size"] * self.slippage["tick_count"]
+                raw = np.where(is_buy, prices + slippage, prices - slippage)
+            elif slippage_type == "ratio":
+                ratio = self.slippage["ratio"] / 2
+                raw = np.where(is_buy, prices * (1 + ratio), prices * (1 - ratio))
+            else:
+                raw = prices
+            # 逐个使用内置round，保证与逐笔计算的舍入结果一致
+            rounded = np.array([round(p, decimals) for p in raw.tolist()], dtype=np.float64)
+            actual_prices = np.where(traded, rounded, prices)
+        
+        amount = actual_prices * volumes
+        zeros = np.zeros(n, dtype=np.float64)
+        commission = np.where(traded, np.maximum(amount * self.commission_rate, self.min_commission), zeros)
+        stamp_tax = np.where(traded & is_sell, amount * self.stamp_tax_rate, zeros)
+        transfer_fee = np.where(traded & is_sh, amount * 0.00001, zeros)
+        flow_fee = np.where(traded, float(self.calculate_flow_fee()), zeros)
+        
+        return {
+            "actual_price": actual_prices,
+            "commission": commission,
+            "stamp_tax": stamp_tax,
+            "transfer_fee": transfer_fee,
+            "flow_fee": flow_fee,
+            "total_cost": commission + stamp_tax + transfer_fee + flow_fee
+        }
+
+    def calculate_trade_cost(self, price, volume, direction, stock_code):
+        """
+        计算交易成本
+        
+        Args:
+            price: float, 交易价格
+            volume: int, 交易数量
+            direction: str, 交易方向 'buy' 或 'sell'
+            stock_code: str, 股票代码
+            
+        Returns:
+            tuple: (实际成交价格, 总交易成本)
+        """
+        fees = self.calculate_fee_breakdown(price, volume, direction, stock_code)
+        return fees["actual_price"], fees["total_cost"]
+
+    def get_signal_fees(self, signal: Dict):
+        """
+        获取信号的交易成本明细，优先复用 process_signals 中已计算并附加到信号上的结果，
+        否则按信号中的实际成交价（没有时用委托价）计算
+        
+        Args:
+            signal: 交易信号
+            
+        Returns:
+            dict: 成本明细，见 calculate_fee_breakdown
+        """
+        fees = signal.get("fee_breakdown")
+        if fees is None:
+            fees = self.calculate_fee_breakdown(
+                signal.get("actual_price", signal["price"]),
+                signal["volume"],
+                signal["action"],
+                signal["code"],
+                apply_slippage=False
+            )
+        return fees
+
+    def split_trade_cost(self, signal: Dict):
+        """
+        按各项费用占比拆分信号的总交易成本，用于成交记录
+        
+        Args:
+            signal: 交易信号（已包含 trade_cost 时按占比拆分，否则直接使用各项费用）
+            
+        Returns:
+            dict: commission、stamp_tax、transfer_fee、flow_fee
+        """
+        fees = self.get_signal_fees(signal)
+        commission = fees["commission"]
+        stamp_tax = fees["stamp_tax"]
+        transfer_fee = fees["transfer_fee"]
+        flow_fee = fees["flow_fee"]
+        if "trade_cost" not in signal:
+            return {
+                "commission": commission,
+                "stamp_tax": stamp_tax,
+                "transfer_fee": transfer_fee,
+                "flow_fee": flow_fee
+            }
+        
+        trade_cost = signal["trade_cost"]
+        total = commission + stamp_tax + transfer_fee + flow_fee
+        return {
+            "commission": trade_cost * (commission / total),
+            "stamp_tax": trade_cost * (stamp_tax / total) if signal["action"] == "sell" else stamp_tax,
+            "transfer_fee": trade_cost * (transfer_fee / total) if signal["code"].startswith("sh.") else transfer_fee,
+            "flow_fee": trade_cost * (flow_fee / total)
+        }
 
     def process_signals(self, signals: List[Dict], is_realtime: bool = False):
         """处理交易信号
@@ -233,6 +395,10 @@ class KhTradeManager:
             }
             is_realtime: 是否为实盘模式（触发提醒）
         """
+        if not is_realtime and self._can_batch(signals):
+            self.process_signals_batch(signals)
+            return
+        
         for signal in signals:
             # 跳过数量为0的交易信号
             if signal["volume"] <= 0:
@@ -254,9 +420,9 @@ class KhTradeManager:
                 }
                 self.alert_manager.on_signal(alert_signal)
                 
-            # 计算交易成本
+            # 计算交易成本明细（下单、成交记录和日志均复用该结果）
             direction = "buy" if signal["action"].lower() == "buy" else "sell"
-            actual_price, trade_cost = self.calculate_trade_cost(
+            fees = self.calculate_fee_breakdown(
                 signal["price"],
                 signal["volume"],
                 direction,
@@ -264,12 +430,289 @@ class KhTradeManager:
             )
             
             # 添加交易成本信息
-            signal["trade_cost"] = trade_cost
-            signal["actual_price"] = actual_price
+            signal["fee_breakdown"] = fees
+            signal["trade_cost"] = fees["total_cost"]
+            signal["actual_price"] = fees["actual_price"]
             
             # 执行下单
             self.place_order(signal)
             
+    def _can_batch(self, signals: List[Dict]) -> bool:
+        """判断一批信号是否走批量执行路径
+        
+        仅限回测模式、信号数达到阈值且动作均为 buy/sell。批量路径先将整批信号按"先卖后买"
+        稳定排序再执行，因此卖出与买入交错的调仓信号同样走批量路径，成交结果与按排序后的顺序
+        逐笔执行完全一致。
+        """
+        threshold = self.batch_order_threshold
+        if not threshold or len(signals) < threshold:
+            return False
+        if getattr(self.config, "run_mode", "backtest") in ("live", "simulate"):
+            return False
+        return all(signal.get("action") in ("buy", "sell") for signal in signals)
+
+    def process_signals_batch(self, signals: List[Dict]):
+        """批量执行回测交易信号（用于调仓等单个时间点大量信号的场景）
+        
+        整批信号先按"先卖后买"稳定排序，卖出回笼的资金可用于同批买入。交易成本、
+        资金和可用持仓检查以及持仓账本更新均按数组批量计算，检查规则、T+1可用数量规则和
+        成交结果与逐笔执行相同；委托和成交记录照常写入 orders/trades，但整批只触发一次
+        on_stock_batch 汇总回调并输出一条日志，不再逐笔触发委托/成交/持仓回调；被拒绝的信号
+        汇总为一次 on_order_error 回调（error_id=-3，rejected 属性为(股票代码, 原因)列表）。
+        配置 backtest.batch_risk_check 为 true 且关联了风控管理器时，先以
+        KhRiskManager.check_signals_batch 对整批信号做风控预检查，未通过的信号不执行。
+        
+        Args:
+            signals: 交易信号列表，格式同 process_signals
+            
+        Returns:
+            dict: 执行汇总，包含 executed(成交笔数)、rejected(被拒绝的(股票代码, 原因)列表)、
+                sell_amount/buy_amount(卖出/买入成交金额)、total_cost(总交易成本)、cash(执行后现金)
+        """
+        summary = {"executed": 0, "rejected": [], "sell_amount": 0.0, "buy_amount": 0.0,
+                   "total_cost": 0.0, "cash": self.assets.get("cash", 0.0)}
+        try:
+            ignored = [signal for signal in signals if signal["volume"] <= 0]
+            if ignored:
+                error_msg = f"忽略 {len(ignored)} 个交易数量为0或负数的信号: {', '.join(s['code'] for s in ignored[:10])}"
+                logger.error(f"[WARNING] {error_msg}")
+                if self.callback:
+                    self.callback.gui.log_message(error_msg, "WARNING")
+            
+            valid = [signal for signal in signals if signal["volume"] > 0]
+            risk_rejected = []
+            if self.batch_risk_check and self.risk_manager is not None and valid:
+                passed, reasons = self.risk_manager.check_signals_batch(valid)
+                risk_rejected = [(signal["code"], f"风控拦截: {reason}")
+                                 for signal, ok, reason in zip(valid, passed.tolist(), reasons) if not ok]
+                valid = [signal for signal, ok in zip(valid, passed.tolist()) if ok]
+                summary["rejected"] = risk_rejected
+            is_buy = [signal["action"].lower() == "buy" for signal in valid]
+            sells = [signal for signal, buy in zip(valid, is_buy) if not buy]
+            buys = [signal for signal, buy in zip(valid, is_buy) if buy]
+            ordered = sells + buys
+            if not ordered:
+                return summary
+            n_sell = len(sells)
+            
+            # 1. 一次性计算整批交易成本，并附加到信号上供成交记录复用
+            codes = [signal["code"] for signal in ordered]
+            volumes = np.array([signal["volume"] for signal in ordered], dtype=np.int64)
+            directions = np.array(["sell"] * n_sell + ["buy"] * len(buys))
+            fees = self.calculate_fee_breakdown_batch(
+                [signal["price"] for signal in ordered], volumes, directions, codes
+            )
+            fee_lists = {key: values.tolist() for key, values in fees.items()}
+            for i, signal in enumerate(ordered):
+                breakdown = {key: values[i] for key, values in fee_lists.items()}
+                signal["fee_breakdown"] = breakdown
+                signal["trade_cost"] = breakdown["total_cost"]
+                signal["actual_price"] = breakdown["actual_price"]
+            actual_prices = fees["actual_price"]
+            trade_costs = fees["total_cost"]
+            
+            # 2. 卖出：检查可用持仓、回笼资金并批量扣减持仓
+            sell_ok = self._check_batch_sells(codes[:n_sell], volumes[:n_sell])
+            sell_idx = np.flatnonzero(sell_ok)
+            cash_flow = actual_prices[sell_idx] * volumes[sell_idx] - trade_costs[sell_idx]
+            cash = float(np.cumsum(np.concatenate(([self.assets["cash"]], cash_flow)))[-1])
+            self._apply_batch_sells([codes[i] for i in sell_idx], volumes[sell_idx], actual_prices[sell_idx])
+            
+            # 3. 买入：按顺序检查资金（资金不足的信号不占用资金）并批量更新持仓
+            buy_volumes = volumes[n_sell:]
+            buy_prices = actual_prices[n_sell:]
+            required = buy_prices * buy_volumes + trade_costs[n_sell:]
+            buy_ok, cash = self._check_batch_buys(cash, required)
+            buy_idx = np.flatnonzero(buy_ok)
+            self._apply_batch_buys([codes[n_sell + i] for i in buy_idx], buy_volumes[buy_idx], buy_prices[buy_idx])
+            self.assets["cash"] = cash
+            
+            sell_amount = float((actual_prices[sell_idx] * volumes[sell_idx]).sum())
+            buy_amount = float((buy_prices[buy_idx] * buy_volumes[buy_idx]).sum())
+            if self.risk_manager:
+                # 推送汇总成交事件，增量更新风控状态
+                self.risk_manager.on_fill("sell", sell_amount, float(trade_costs[sell_idx].sum()), count=len(sell_idx))
+                self.risk_manager.on_fill("buy", buy_amount, float(trade_costs[n_sell + buy_idx].sum()), count=len(buy_idx))
+            
+            # 4. 逐笔写入委托和成交记录
+            executed = np.concatenate((sell_idx, n_sell + buy_idx))
+            orders, trades = [], []
+            for i in executed.tolist():
+                order, trade = self._record_backtest_fill(len(self.orders) + 1, ordered[i], fee_lists["actual_price"][i])
+                orders.append(order)
+                trades.append(trade)
+            
+            rejected = risk_rejected + [(codes[i], "可用持仓不足") for i in np.flatnonzero(~sell_ok).tolist()]
+            rejected += [(codes[n_sell + i], "资金不足") for i in np.flatnonzero(~buy_ok).tolist()]
+            summary.update({
+                "executed": len(executed),
+                "rejected": rejected,
+                "sell_amount": sell_amount,
+                "buy_amount": buy_amount,
+                "total_cost": float(trade_costs[executed].sum()),
+                "cash": cash
+            })
+            
+            decimals = self.price_decimals
+            logger.info(lambda: (
+                f"批量下单完成: 信号 {len(signals)} 个, 成交 {summary['executed']} 笔 "
+                f"(卖出 {len(sell_idx)} / 买入 {len(buy_idx)}), 拒绝 {len(rejected)} 笔, "
+                f"卖出金额 {summary['sell_amount']:.{decimals}f}, 买入金额 {summary['buy_amount']:.{decimals}f}, "
+                f"交易成本 {summary['total_cost']:.2f}, 现金 {cash:.{decimals}f}, 持仓 {len(self.positions)} 只"
+            ))
+            
+            # 被拒绝的信号汇总为一次委托错误回调
+            if rejected and self.callback:
+                self._batch_order_error(rejected)
+            
+            # 整批只触发一次汇总回调
+            on_batch = getattr(self.callback, "on_stock_batch", None) if self.callback else None
+            if on_batch:
+                on_batch(SimpleNamespace(orders=orders, trades=trades, **summary))
+                
+        except Exception as e:
+            logger.exception(f"批量下单异常: {str(e)}")
+            if self.callback:
+                self.callback.gui.log_message(f"批量下单执行异常: {str(e)}", "ERROR")
+        return summary
+
+    def _batch_order_error(self, rejected: List[tuple]):
+        """批量执行中被拒绝的信号汇总为一次委托错误回调和一条GUI日志
+        
+        Args:
+            rejected: (股票代码, 原因) 列表
+        """
+        codes = list(dict.fromkeys(code for code, _ in rejected))
+        error_msg = f"批量执行拒绝 {len(rejected)} 笔: " + ", ".join(
+            f"{code}({reason})" for code, reason in rejected[:10])
+        if len(rejected) > 10:
+            error_msg += f" 等{len(rejected)}笔"
+        logger.error("[ERROR] %s", error_msg)
+        self.callback.gui.log_message(error_msg, "ERROR")
+        self.callback.on_order_error(SimpleNamespace(
+            stock_code=",".join(codes),
+            error_id=-3,  # 自定义错误代码，表示批量执行中被拒绝
+            error_msg=error_msg,
+            order_remark="批量执行拒绝",
+            rejected=rejected
+        ))
+
+    def _check_batch_sells(self, codes: List[str], volumes: np.ndarray) -> np.ndarray:
+        """批量检查卖出信号的可用持仓
+        
+        Returns:
+            np.ndarray: 布尔数组，True表示可成交
+        """
+        positions = self.positions
+        slots = positions.slots_of(codes)
+        available = np.where(slots >= 0, positions.can_use_volume[slots], 0)
+        if len(set(codes)) == len(codes):
+            return available >= volumes
+        
+        # 同一股票多次卖出：按顺序扣减可用数量
+        ok = np.zeros(len(codes), dtype=bool)
+        remaining = {}
+        for i, (code, avail, volume) in enumerate(zip(codes, available.tolist(), volumes.tolist())):
+            avail = remaining.get(code, avail)
+            if avail >= volume:
+                ok[i] = True
+                avail -= volume
+            remaining[code] = avail
+        return ok
+
+    def _apply_batch_sells(self, codes: List[str], volumes: np.ndarray, actual_prices: np.ndarray):
+        """批量扣减卖出成交的持仓，持仓为0的记录删除"""
+        if not codes:
+            return
+        positions = self.positions
+        decimals = self.price_decimals
+        slots = positions.slots_of(codes)
+        np.subtract.at(positions.volume, slots, volumes)
+        np.subtract.at(positions.can_use_volume, slots, volumes)
+        positions.current_price[slots] = [round(price, decimals) for price in actual_prices.tolist()]
+        positions.mark_dirty()
+        for code in dict.fromkeys(codes):
+            if positions[code]["volume"] == 0:
+                del positions[code]
+
+    @staticmethod
+    def _check_batch_buys(cash: float, required: np.ndarray):
+        """按顺序检查买入信号的资金是否足够
+        
+        先假设全部可成交，用累计资金找到第一笔资金不足的信号；其后的信号逐笔判断，
+        资金不足的信号不扣减资金，与逐笔执行的结果一致。
+        
+        Returns:
+            tuple: (布尔数组, 扣除成交资金后的现金)
+        """
+        n = len(required)
+        running = np.cumsum(np.concatenate(([cash], -required)))
+        short = running[:-1] < required
+        if not short.any():
+            return np.ones(n, dtype=bool), float(running[-1])
+        
+        first = int(np.argmax(short))
+        ok = np.zeros(n, dtype=bool)
+        ok[:first] = True
+        cash = float(running[first])
+        for i in range(first, n):
+            need = float(required[i])
+            if not cash < need:
+                ok[i] = True
+                cash -= need
+        return ok, cash
+
+    def _apply_batch_buys(self, codes: List[str], volumes: np.ndarray, actual_prices: np.ndarray):
+        """批量更新买入成交的持仓：已有持仓加仓并重算均价，新股票批量建仓"""
+        if not codes:
+            return
+        positions = self.positions
+        decimals = self.price_decimals
+        if len(set(codes)) != len(codes):
+            # 同一股票多次买入：均价需按顺序逐笔舍入
+            for code, volume, price in zip(codes, volumes.tolist(), actual_prices.tolist()):
+                self._apply_batch_buys([code], np.array([volume]), np.array([price]))
+            return
+        
+        rounded = np.array([round(price, decimals) for price in actual_prices.tolist()], dtype=np.float64)
+        slots = positions.slots_of(codes)
+        held = slots >= 0
+        if held.any():
+            s = slots[held]
+            volume = volumes[held]
+            price = actual_prices[held]
+            old_volume = positions.volume[s]
+            total_volume = old_volume + volume
+            total_cost_value = positions.avg_price[s] * old_volume + price * volume
+            positions.avg_price[s] = [round(v, decimals) for v in (total_cost_value / total_volume).tolist()]
+            positions.volume[s] = total_volume
+            if self.t0_mode:
+                positions.can_use_volume[s] += volume
+            positions.market_value[s] = [round(v, decimals) for v in (total_volume * price).tolist()]
+            positions.current_price[s] = rounded[held]
+            positions.mark_dirty()
+        
+        new = np.flatnonzero(~held)
+        if len(new):
+            volume = volumes[new]
+            price = rounded[new]
+            positions.open_many(
+                [codes[i] for i in new.tolist()],
+                {
+                    "volume": volume,
+                    "can_use_volume": volume if self.t0_mode else 0,
+                    "open_price": price,
+                    "market_value": [round(v, decimals) for v in (actual_prices[new] * volume).tolist()],
+                    "avg_price": price,
+                    "current_price": price
+                },
+                extras={
+                    "account_type": xtconstant.SECURITY_ACCOUNT,
+                    "account_id": self.config.account_id,
+                    "direction": xtconstant.DIRECTION_FLAG_LONG
+                }
+            )
+
     def place_order(self, signal: Dict):
         """下单
         
@@ -287,29 +730,87 @@ class KhTradeManager:
     def _place_order_live(self, signal: Dict):
         """实盘下单逻辑"""
         # 调用miniQMT的交易接口
-        logger.info(f"实盘下单信号: {signal}")
+        logger.info("实盘下单信号: %s", signal)
         # 这里需要调用实际的交易接口
         
     def _place_order_simulate(self, signal: Dict):
         """模拟下单逻辑"""
         # 模拟下单逻辑
-        logger.info(f"模拟下单信号: {signal}")
+        logger.info("模拟下单信号: %s", signal)
         # 更新模拟数据字典
         self.update_dic(signal)
         
+    def _record_backtest_fill(self, order_id: int, signal: Dict, actual_price: float):
+        """创建回测委托订单和成交记录（回测假设全部立即成交）
+        
+        Args:
+            order_id: 订单ID
+            signal: 交易信号
+            actual_price: 考虑滑点后的实际成交价格
+            
+        Returns:
+            tuple: (委托字典, 成交字典)
+        """
+        decimals = self.price_decimals
+        is_buy = signal["action"] == "buy"
+        order = {
+            "account_type": xtconstant.SECURITY_ACCOUNT,
+            "account_id": self.config.account_id,
+            "stock_code": signal["code"],
+            "order_id": order_id,
+            "order_sysid": str(order_id),  # 模拟柜台编号
+            "order_time": signal.get("timestamp", int(datetime.datetime.now().timestamp())), # 使用回测时间戳
+            "order_type": xtconstant.STOCK_BUY if is_buy else xtconstant.STOCK_SELL,
+            "order_volume": signal["volume"],
+            "price_type": xtconstant.FIX_PRICE,  # 默认限价单
+            "price": round(signal["price"], decimals), # 委托价格使用信号中的价格
+            "traded_volume": signal["volume"],  # 回测假设全部成交
+            "traded_price": round(actual_price, decimals), # 成交价格使用计算出的实际价格
+            "order_status": xtconstant.ORDER_SUCCEEDED,  # 回测假设立即成交
+            "status_msg": signal.get("reason", "策略交易"),
+            "strategy_name": signal.get("strategy_name", "backtest"),
+            "order_remark": signal.get("remark", ""),
+            "direction": xtconstant.DIRECTION_FLAG_LONG,  # 股票默认多头
+            "offset_flag": xtconstant.OFFSET_FLAG_OPEN if is_buy else xtconstant.OFFSET_FLAG_CLOSE
+        }
+        self.orders[order_id] = order
+        
+        trade = {
+            "account_type": xtconstant.SECURITY_ACCOUNT,
+            "account_id": self.config.account_id,
+            "stock_code": signal["code"],
+            "order_type": order["order_type"],
+            "traded_id": f"T{order_id}",
+            "traded_time": order["order_time"],  # 使用相同的时间戳
+            "traded_price": round(actual_price, decimals),  # 使用考虑了滑点的实际价格
+            "traded_volume": signal["volume"],
+            "traded_amount": round(actual_price * signal["volume"], decimals),  # 使用实际价格计算成交金额
+            "order_id": order_id,
+            "order_sysid": order["order_sysid"],
+            "strategy_name": order["strategy_name"],
+            "order_remark": order["order_remark"],
+            "direction": order["direction"],
+            "offset_flag": order["offset_flag"]
+        }
+        self.trades[trade["traded_id"]] = trade
+        return order, trade
+
     def _place_order_backtest(self, signal: Dict):
         """回测下单逻辑"""
         try:
             # 生成订单ID
             order_id = len(self.orders) + 1
             
-            # -- 提前计算交易成本和实际价格 --
-            actual_price, trade_cost = self.calculate_trade_cost(
-                signal["price"],
-                signal["volume"],
-                signal["action"],
-                signal["code"]
-            )
+            # -- 交易成本和实际价格：复用 process_signals 中已计算的成本明细 --
+            fees = signal.get("fee_breakdown")
+            if fees is None:
+                fees = self.calculate_fee_breakdown(
+                    signal["price"],
+                    signal["volume"],
+                    signal["action"],
+                    signal["code"]
+                )
+            actual_price, trade_cost = fees["actual_price"], fees["total_cost"]
             
             # 计算买入所需的总资金（包括交易成本）
             if signal["action"] == "buy":
@@ -358,53 +859,9 @@ class KhTradeManager:
             
             # -- 资金/持仓检查通过后，继续执行交易 --
             
-            # 创建委托订单 (使用原始信号价格作为委托价)
+            # 创建委托订单和成交记录 (使用原始信号价格作为委托价)
             decimals = self.price_decimals
-            order = {
-                "account_type": xtconstant.SECURITY_ACCOUNT,
-                "account_id": self.config.account_id,
-                "stock_code": signal["code"],
-                "order_id": order_id,
-                "order_sysid": str(order_id),  # 模拟柜台编号
-                "order_time": signal.get("timestamp", int(datetime.datetime.now().timestamp())), # 使用回测时间戳
-                "order_type": xtconstant.STOCK_BUY if signal["action"] == "buy" else xtconstant.STOCK_SELL,
-                "order_volume": signal["volume"],
-                "price_type": xtconstant.FIX_PRICE,  # 默认限价单
-                "price": round(signal["price"], decimals), # 委托价格使用信号中的价格
-                "traded_volume": signal["volume"],  # 回测假设全部成交
-                "traded_price": round(actual_price, decimals), # 成交价格使用计算出的实际价格
-                "order_status": xtconstant.ORDER_SUCCEEDED,  # 回测假设立即成交
-                "status_msg": signal.get("reason", "策略交易"),
-                "strategy_name": signal.get("strategy_name", "backtest"),
-                "order_remark": signal.get("remark", ""),
-                "direction": xtconstant.DIRECTION_FLAG_LONG,  # 股票默认多头
-                "offset_flag": xtconstant.OFFSET_FLAG_OPEN if signal["action"] == "buy" else xtconstant.OFFSET_FLAG_CLOSE
-            }
-            
-            # 更新委托字典
-            self.orders[order_id] = order
-            
-            # 创建成交记录
-            trade = {
-                "account_type": xtconstant.SECURITY_ACCOUNT,
-                "account_id": self.config.account_id,
-                "stock_code": signal["code"],
-                "order_type": order["order_type"],
-                "traded_id": f"T{order_id}",
-                "traded_time": order["order_time"],  # 使用相同的时间戳
-                "traded_price": round(actual_price, decimals),  # 使用考虑了滑点的实际价格
-                "traded_volume": signal["volume"],
-                "traded_amount": round(actual_price * signal["volume"], decimals),  # 使用实际价格计算成交金额
-                "order_id": order_id,
-                "order_sysid": order["order_sysid"],
-                "strategy_name": order["strategy_name"],
-                "order_remark": order["order_remark"],
-                "direction": order["direction"],
-                "offset_flag": order["offset_flag"]
-            }
-            
-            # 更新成交字典
-            self.trades[trade["traded_id"]] = trade
+            order, trade = self._record_backtest_fill(order_id, signal, actual_price)
             
             # 更新资产
             if signal["action"] == "buy":
@@ -486,37 +943,34 @@ class KhTradeManager:
                 if pos["volume"] == 0:
                     del self.positions[signal["code"]]
             
+            # 推送成交事件，增量更新风控状态
+            if self.risk_manager:
+                self.risk_manager.on_fill(signal["action"], actual_price * signal["volume"], trade_cost)
+            
             # 更新总资产 (总资产 = 现金 + 持仓市值)
             # 持仓市值会在 record_results 中根据最新价格更新，这里暂时不计算以避免重复
             # self.assets["total_asset"] = self.assets["cash"] + self.assets["market_value"]
             # 仅在成交回报后，让 record_results 去计算最新的总资产
             
-            # 输出交易成本信息到GUI日志
-            if self.callback:
-                commission = self.calculate_commission(actual_price, signal["volume"])
-                stamp_tax = self.calculate_stamp_tax(actual_price, signal["volume"], signal["action"])
-                transfer_fee = self.calculate_transfer_fee(signal["code"], actual_price, signal["volume"])
-                flow_fee = self.calculate_flow_fee()
-                
-                cost_msg = (
-                    f"交易成本 - "
-                    f"股票代码: {signal['code']} | "
-                    f"交易方向: {'买入' if signal['action'] == 'buy' else '卖出'} | "
-                    f"成交数量: {signal['volume']} | "
-                    f"成交价格: {actual_price:.{decimals}f} | "
-                    f"交易金额: {actual_price * signal['volume']:.{decimals}f} | "
-                    f"佣金: {commission:.2f} | "
-                    f"印花税: {stamp_tax:.2f} | "
-                    f"过户费: {transfer_fee:.2f} | "
-                    f"流量费: {flow_fee:.2f} | "
-                    f"总成本: {trade_cost:.2f}"
-                )
-                self.callback.gui.log_message(cost_msg, "TRADE")
+            # 输出交易成本信息到GUI日志，消息仅在开启时构造
+            self._gui_trade_log(lambda: (
+                f"交易成本 - "
+                f"股票代码: {signal['code']} | "
+                f"交易方向: {'买入' if signal['action'] == 'buy' else '卖出'} | "
+                f"成交数量: {signal['volume']} | "
+                f"成交价格: {actual_price:.{decimals}f} | "
+                f"交易金额: {actual_price * signal['volume']:.{decimals}f} | "
+                f"佣金: {fees['commission']:.2f} | "
+                f"印花税: {fees['stamp_tax']:.2f} | "
+                f"过户费: {fees['transfer_fee']:.2f} | "
+                f"流量费: {fees['flow_fee']:.2f} | "
+                f"总成本: {trade_cost:.2f}"
+            ))
             
-            logger.info(f"回测下单完成: {signal}")
-            logger.info(f"交易成本: {trade_cost:.2f}")
-            logger.info(f"当前资产 (现金): {self.assets['cash']:.{decimals}f}")
-            logger.info(f"当前持仓: {self.positions}")
+            logger.info("回测下单完成: %s", signal)
+            logger.info("交易成本: %.2f", trade_cost)
+            logger.info("当前资产 (现金): %.*f", decimals, self.assets['cash'])
+            logger.info("当前持仓: %s", self.positions)
             
             # 触发回调 (委托和成交)
             if self.callback:
@@ -536,32 +990,41 @@ class KhTradeManager:
                     order_remark=signal.get("remark", "")
                 ))
         
+    def _gui_trade_log(self, message_factory):
+        """向GUI日志输出交易信息
+
+        Args:
+            message_factory: 返回消息字符串的可调用对象，仅在有回调且开启 gui_trade_log 时调用
+        """
+        if self.callback and self.gui_trade_log:
+            self.callback.gui.log_message(message_factory(), "TRADE")
+
     def update_dic(self, signal: Dict):
         """更新数据字典"""
         # 更新资产、委托、成交和持仓数据字典
-        logger.info(f"更新数据字典: {signal}")
+        logger.info("更新数据字典: %s", signal)
         
     def on_order(self, order):
         """委托回报处理"""
-        logger.info(f"委托回报: {order}")
+        logger.info("委托回报: %s", order)
         self.orders[order.order_id] = order
         
     def on_trade(self, trade):
         """成交回报处理"""
-        logger.info(f"成交回报: {trade}")
+        logger.info("成交回报: %s", trade)
         self.trades[trade.trade_id] = trade
         
     def on_order_error(self, error):
         """委托错误处理"""
-        logger.error(f"[ERROR] Order Error: {error.error_msg}")
+        logger.error("[ERROR] Order Error: %s", error.error_msg)
         
     def on_cancel_error(self, cancel_error):
         """撤单错误处理"""
-        logger.error(f"[ERROR] Cancel Error: {cancel_error.error_msg}")
+        logger.error("[ERROR] Cancel Error: %s", cancel_error.error_msg)
         
     def on_order_stock_async_response(self, response):
         """异步下单回报处理"""
-        logger.info(f"异步下单回报: {response}")
+        logger.info("异步下单回报: %s", response)
 
     def process_trade_signal(self, signal):
         """处理交易信号"""
@@ -13,8 +13,9 @@ import logging
 import logging.handlers
 import os
 import sys
+import time
 from datetime import datetime
-from typing import Optional, Union
+from typing import Callable, Iterable, Optional, Union
 
 # 默认日志级别
 DEFAULT_LOG_LEVEL = logging.DEBUG
@@ -142,6 +143,173 @@ def get_module_logger(module_name: str, log_level: int = DEFAULT_LOG_LEVEL) -> l
     return logger
 
 
+# Python 3.8 起支持 stacklevel，使日志中的文件名和行号指向调用方而不是 LazyLogger
+_CALLER_KWARGS = {'stacklevel': 3} if sys.version_info >= (3, 8) else {}
+
+
+class LazyLogger:
+    """延迟构造消息的日志门面
+
+    回测循环中每根K线都可能输出日志，f-string 在调用 logger.info 之前就已完成格式化，
+    即使该级别被关闭也要付出拼接字符串（以及 str(dict) 等）的开销。LazyLogger 先做级别检查
+    （logging.Logger.isEnabledFor 带缓存，setLevel 时自动失效），通过后才构造消息：
+
+        logger = get_lazy_logger(__name__)
+        logger.info("买入 %s %d股", code, volume)            # %-参数，由 logging 延迟格式化
+        logger.debug(lambda: f"持仓: {positions}")            # 消息工厂，仅在级别开启时调用
+
+    其余属性（handlers、setLevel 等）直接转发给被包装的 logging.Logger，
+    因此可以替换模块中原有的 logger 而不修改其他调用。
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg, args: tuple, kwargs: dict):
+        if not self.logger.isEnabledFor(level):
+            return
+        if callable(msg) and not args:
+            msg = msg()
+        for key, value in _CALLER_KWARGS.items():
+            kwargs.setdefault(key, value)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def log(self, level: int, msg, *args, **kwargs):
+        """级别开启时输出日志；msg 为可调用对象且没有参数时作为消息工厂调用"""
+        self._log(level, msg, args, kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self._log(logging.DEBUG, msg, args, kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._log(logging.INFO, msg, args, kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._log(logging.WARNING, msg, args, kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self._log(logging.ERROR, msg, args, kwargs)
+
+    def exception(self, msg, *args, exc_info=True, **kwargs):
+        kwargs['exc_info'] = exc_info
+        self._log(logging.ERROR, msg, args, kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        self._log(logging.CRITICAL, msg, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+
+def get_lazy_logger(module_name: str, log_level: int = DEFAULT_LOG_LEVEL) -> LazyLogger:
+    """获取延迟构造消息的模块日志器
+
+    Args:
+        module_name: 模块名称，建议使用 __name__
+        log_level: 日志级别
+
+    Returns:
+        LazyLogger: 包装 get_module_logger 返回的日志器
+    """
+    return LazyLogger(get_module_logger(module_name, log_level))
+
+
+class RateLimitedLog:
+    """按周期汇总的重复告警
+
+    回测中同一类告警（某根K线的股票数据为空、风控拦截等）可能每根K线出现一次，
+    逐条输出既拖慢回测也淹没其他日志。RateLimitedLog 只累计次数并保留少量样例，
+    每经过 every 个周期汇总输出一条，如 "最近 240 根K线中 12 根有股票数据为空"。
+
+    设置 first_template 时，每一类（add 的 key）在一段安静期之后的第一次出现立即单独输出，
+    后续重复才汇总，实盘中不会因为等待周期结束而延迟首条告警，也不会因为另一类告警
+    正在汇总而压下新出现的一类。
+
+    设置 interval 时按时间（秒）而不是周期数汇总，用于周期间隔不固定的实盘。
+
+    Args:
+        emit: 输出函数，接收格式化后的消息
+        template: 汇总消息模板，可用字段 events（出现次数）、count（累计数量）、
+            periods（周期数）、seconds（汇总时长，秒）和 samples（样例，逗号分隔）
+        every: 汇总周期数
+        max_samples: 最多保留的样例数
+        first_template: 首次出现时的消息模板，可用字段 sample，为None时不单独输出
+        interval: 汇总间隔（秒），为None时按 every 个周期汇总
+    """
+
+    def __init__(self, emit: Callable[[str], None], template: str, every: int = 100,
+                 max_samples: int = 5, first_template: Optional[str] = None,
+                 interval: Optional[float] = None):
+        self.emit = emit
+        self.template = template
+        self.every = max(int(every), 1)
+        self.max_samples = max_samples
+        self.first_template = first_template
+        self.interval = interval
+        self.events = 0
+        self.count = 0
+        self.periods = 0
+        self.samples = []
+        self._started = time.monotonic()
+        self._seen = set()          # 已单独输出过首条、尚未经过安静期的类别
+        self._period_keys = set()   # 本周期内出现过的类别
+
+    def _due(self) -> bool:
+        if self.interval is not None:
+            return time.monotonic() - self._started >= self.interval
+        return self.periods >= self.every
+
+    def add(self, count: int = 1, samples: Iterable = (), key=None):
+        """记录一次出现
+
+        Args:
+            count: 本次涉及的数量（如空数据股票数）
+            samples: 样例，仅在样例未满时读取
+            key: 类别，每一类的首次出现单独输出
+        """
+        if self.interval is not None and self._due():
+            self.flush()
+        self._period_keys.add(key)
+        if self.first_template is not None and key not in self._seen:
+            self._seen.add(key)
+            sample = next(iter(samples), '')
+            self.emit(self.first_template.format(sample=sample))
+            return
+        self.events += 1
+        self.count += count
+        if len(self.samples) < self.max_samples:
+            for sample in samples:
+                if sample not in self.samples:
+                    self.samples.append(sample)
+                    if len(self.samples) >= self.max_samples:
+                        break
+
+    def tick(self, periods: int = 1):
+        """开始新的周期：之前已累计满 every 个周期（或 interval 秒）时先汇总输出，再计入本周期"""
+        if self._due():
+            self.flush()
+        self.periods += periods
+
+    def flush(self):
+        """输出当前汇总（没有出现时不输出）并开始新的周期"""
+        if self.events:
+            self.emit(self.template.format(
+                events=self.events, count=self.count, periods=self.periods,
+                seconds=int(time.monotonic() - self._started),
+                samples=', '.join(str(sample) for sample in self.samples)))
+        # 整个周期没有再出现的类别，下一次出现重新单独输出
+        self._seen &= self._period_keys
+        self._period_keys = set()
+        self._started = time.monotonic()
+        self.events = 0
+        self.count = 0
+        self.periods = 0
+        self.samples = []
+
+
 class LoggerMixin:
     """日志混入类
 
@@ -0,0 +1,104 @@
+# coding: utf-8
+"""
+MyTT 流式指标测试
+
+覆盖流式指标与批量函数的一致性（单只股票与多股票、含缺失值和停牌不变的区间），
+以及流式基类要求子类实现 _step。
+"""
+
+import numpy as np
+import pytest
+
+from MyTT import (BOLL, HHV, KDJ, LLV, MA, STD, StreamingBOLL, StreamingHHV, StreamingKDJ, StreamingLLV,
+                  StreamingMA, StreamingSTD, _Streaming)
+
+
+def make_series(shape, seed=0):
+    """随机游走价格，含缺失值和一段不变的价格（模拟停牌）"""
+    rng = np.random.default_rng(seed)
+    data = 10 + np.cumsum(rng.normal(0, 0.1, shape), axis=0)
+    data[[50, 51, 250]] = np.nan
+    data[100:130] = 11.0
+    return data
+
+
+def exact_std(values, N):
+    """逐窗口两遍法计算的总体标准差，窗口含缺失值或未满时为nan"""
+    result = np.full(values.shape, np.nan)
+    for i in range(N - 1, len(values)):
+        result[i] = np.std(values[i - N + 1:i + 1], axis=0)
+    return result
+
+
+@pytest.mark.unit
+class TestStreamingBase:
+    """流式基类测试"""
+
+    def test_step_is_abstract(self):
+        """未实现 _step 的子类不能实例化"""
+        class Incomplete(_Streaming):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+
+@pytest.mark.unit
+class TestStreamingWindow:
+    """窗口类流式指标与批量函数一致性测试"""
+
+    @pytest.mark.parametrize('N', [1, 2, 5, 20, 60])
+    def test_hhv_llv_match_batch(self, N):
+        """HHV/LLV 与批量函数逐位一致，窗口含缺失值时为nan"""
+        single = make_series(1000)
+        multi = make_series((400, 6), seed=1)
+        for streaming, batch in ((StreamingHHV, HHV), (StreamingLLV, LLV)):
+            np.testing.assert_array_equal(streaming(N).extend(single), batch(single, N))
+            np.testing.assert_array_equal(streaming(N, size=6).extend(multi), batch(multi, N))
+
+    @pytest.mark.parametrize('N', [1, 2, 5, 20, 60])
+    def test_std_matches_batch(self, N):
+        """STD 与批量函数的缺失位置相同，与两遍法相差在浮点误差范围内，长序列上不累积误差，价格不变的窗口为0"""
+        single = make_series(5000)
+        result = StreamingSTD(N).extend(single)
+        np.testing.assert_array_equal(np.isnan(result), np.isnan(STD(single, N)))
+        np.testing.assert_allclose(result, exact_std(single, N), rtol=0, atol=1e-12)
+        assert (result[100 + N - 1:130] == 0).all()
+
+        # pandas 的滚动方差在价格不变的窗口上可能残留浮点误差，与两遍法结果比较
+        multi = make_series((400, 6), seed=1)
+        np.testing.assert_allclose(StreamingSTD(N, size=6).extend(multi), exact_std(multi, N), rtol=0, atol=1e-12)
+
+    def test_scalar_and_multi_agree(self):
+        """多股票模式每列与单只股票逐一计算的结果相同（STD 的窗口重算按列求和，可能相差末位）"""
+        multi = make_series((300, 4), seed=2)
+        for streaming in (StreamingHHV, StreamingLLV, StreamingMA):
+            combined = streaming(10, size=4).extend(multi)
+            for column in range(4):
+                np.testing.assert_array_equal(combined[:, column], streaming(10).extend(multi[:, column]))
+        combined = StreamingSTD(10, size=4).extend(multi)
+        for column in range(4):
+            np.testing.assert_allclose(combined[:, column], StreamingSTD(10).extend(multi[:, column]),
+                                       rtol=1e-12, atol=0)
+
+
+@pytest.mark.unit
+class TestStreamingComposite:
+    """组合指标测试"""
+
+    def test_boll_and_kdj(self):
+        """BOLL 与 KDJ 的流式结果与批量函数一致"""
+        rng = np.random.default_rng(3)
+        close = 10 + np.cumsum(rng.normal(0, 0.1, 500))
+        high = close + rng.uniform(0, 0.2, 500)
+        low = close - rng.uniform(0, 0.2, 500)
+
+        upper, mid, lower = StreamingBOLL(20, 2).extend(close)
+        for streamed, batch in zip((upper, mid, lower), BOLL(close, 20, 2)):
+            np.testing.assert_allclose(streamed, batch, rtol=0, atol=1e-3, equal_nan=True)
+        np.testing.assert_array_equal(mid, np.round(MA(close, 20), 3))
+
+        kdj = StreamingKDJ(9, 3, 3)
+        streamed = np.array([kdj.update(c, h, l) for c, h, l in zip(close, high, low)])
+        for column, batch in enumerate(KDJ(close, high, low, 9, 3, 3)):
+            np.testing.assert_allclose(streamed[:, column], batch, rtol=1e-9, equal_nan=True)
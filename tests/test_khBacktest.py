@@ -0,0 +1,134 @@
+# coding: utf-8
+"""
+khBacktest 模块测试
+
+覆盖 JsonLinesSink 的序列化，以及 run_backtest / run_headless 在合成行情上无界面执行回测时
+输出的事件序列和结果文件。
+"""
+
+import datetime
+import importlib.util
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from khBacktest import JsonLinesSink, main, run_backtest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STRATEGY = os.path.join(REPO_ROOT, 'strategies', '双均线精简_使用khMA函数.py')
+CONFIG = os.path.join(REPO_ROOT, 'strategies', '双均线精简_使用khMA函数.kh')
+
+
+def read_events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.unit
+class TestJsonLinesSink:
+    """JsonLinesSink 测试"""
+
+    def test_one_object_per_line(self):
+        """每条事件一行，附加时间戳，numpy 标量和日期时间可序列化，中文不转义"""
+        stream = io.StringIO()
+        sink = JsonLinesSink(stream)
+        sink.emit({'event': 'trade', 'price': np.float64(10.5), 'volume': np.int64(100), 'remark': '买入'})
+        sink.emit({'event': 'start', 'at': datetime.datetime(2024, 1, 2, 9, 30), 'day': datetime.date(2024, 1, 2)})
+
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 2 and '买入' in lines[0]
+        trade, start = read_events(stream)
+        assert trade['price'] == 10.5 and trade['volume'] == 100
+        assert start['at'] == '2024-01-02 09:30:00' and start['day'] == '2024-01-02'
+        assert isinstance(trade['ts'], float)
+
+
+@pytest.fixture
+def headless_env(tmp_path, monkeypatch):
+    """以合成行情替代 xtdata，回测配置写入临时目录"""
+    pytest.importorskip('xtquant')
+    import khFrame
+    from benchmarks.synthetic_market import SyntheticMarket
+
+    def load_strategy(self, strategy_file):
+        # 仓库自带的示例策略直接加载，跳过面向用户策略文件的安全校验
+        spec = importlib.util.spec_from_file_location('headless_strategy', strategy_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    # xtdata 时间戳按北京时间解释
+    monkeypatch.setenv('TZ', 'Asia/Shanghai')
+    if hasattr(time, 'tzset'):
+        time.tzset()
+    monkeypatch.setattr(khFrame, 'xtdata', SyntheticMarket('20231001', '20240329', seed=1))
+    monkeypatch.setattr(khFrame.KhQuantFramework, 'load_strategy', load_strategy)
+
+    with open(CONFIG, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config['strategy_file'] = STRATEGY
+    config['backtest']['start_time'] = '20240102'
+    config['backtest']['end_time'] = '20240329'
+    config['data']['stock_list'] = ['000001.SZ', '600000.SH']
+    config_path = str(tmp_path / 'headless.kh')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    monkeypatch.chdir(tmp_path)
+    yield config_path, str(tmp_path / 'results')
+    monkeypatch.undo()
+    if hasattr(time, 'tzset'):
+        time.tzset()
+
+
+@pytest.mark.unit
+class TestRunBacktest:
+    """无界面回测测试"""
+
+    def test_events_and_result_files(self, headless_env):
+        """依次输出 start、progress、trade 和 finished 事件，成交事件与回测记录一致，结果文件写入指定目录"""
+        config_path, output_dir = headless_env
+        stream = io.StringIO()
+        result = run_backtest(config_path, output_dir=output_dir, event_sink=JsonLinesSink(stream))
+
+        events = read_events(stream)
+        kinds = [event['event'] for event in events]
+        assert kinds[0] == 'start' and kinds[-1] == 'finished'
+        assert 'error' not in kinds and 'progress' in kinds
+        assert events[0]['stock_count'] == 2
+
+        percents = [event['percent'] for event in events if event['event'] == 'progress']
+        assert percents == sorted(percents) and percents[-1] <= 100
+
+        records = result['records']
+        trades = [event for event in events if event['event'] == 'trade']
+        assert len(trades) == len(records['trades']) > 0
+        for event, record in zip(trades, records['trades']):
+            assert (event['code'], event['action'], event['volume']) == \
+                (record['code'], record['action'], record['volume'])
+            assert event['price'] == pytest.approx(record['price'])
+
+        finished = events[-1]
+        assert finished['trade_count'] == len(records['trades'])
+        assert finished['trade_days'] == len(records['daily_stats'])
+        assert finished['backtest_dir'] == result['backtest_dir']
+        assert os.path.commonpath([result['backtest_dir'], output_dir]) == output_dir
+        for name in ('trades.csv', 'daily_stats.csv', 'config.csv'):
+            assert os.path.exists(os.path.join(result['backtest_dir'], name))
+
+    def test_main_exit_codes(self, headless_env, tmp_path):
+        """命令行回测完成时退出码为0并写出事件文件，未指定策略文件时为1"""
+        config_path, output_dir = headless_env
+        events_path = str(tmp_path / 'events.jsonl')
+        assert main(['--config', config_path, '--output-dir', output_dir, '--events', events_path]) == 0
+        with open(events_path, 'r', encoding='utf-8') as f:
+            assert json.loads(f.readlines()[-1])['event'] == 'finished'
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config.pop('strategy_file')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+        assert main(['--config', config_path]) == 1
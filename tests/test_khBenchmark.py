@@ -0,0 +1,121 @@
+# coding: utf-8
+"""
+khBenchmark 模块测试
+
+覆盖基准指数设置解析、多个基准指数按交易日轴对齐与逐基准收益率，以及结果文件的写出与读取。
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khBenchmark import BenchmarkSeries, ordinals_to_date_nums, parse_benchmark_codes
+
+CODES = ['000300.SH', '000905.SH']
+DATES = np.array([20240102, 20240103, 20240104, 20240105, 20240108])
+CLOSES = np.array([
+    [3400.0, 5300.0],
+    [3420.0, np.nan],
+    [3390.0, 5250.0],
+    [3450.0, 5320.0],
+    [3460.0, 5310.0],
+])
+
+
+@pytest.fixture
+def series():
+    return BenchmarkSeries(CODES, DATES, CLOSES, np.array([3380.0, np.nan]))
+
+
+@pytest.mark.unit
+class TestParseBenchmarkCodes:
+    """parse_benchmark_codes 测试"""
+
+    def test_formats(self):
+        """逗号/空格分隔、"sh.000300" 形式转换、去重并保持顺序"""
+        assert parse_benchmark_codes('sh.000300, 000905.SH，sz.399006 000300.SH') == \
+            ['000300.SH', '000905.SH', '399006.SZ']
+        assert parse_benchmark_codes(['000905.SH', 'sh.000300']) == ['000905.SH', '000300.SH']
+        assert parse_benchmark_codes('') == parse_benchmark_codes(None) == []
+
+
+@pytest.mark.unit
+class TestBenchmarkSeries:
+    """BenchmarkSeries 多基准测试"""
+
+    def test_ordinals_to_date_nums(self):
+        """公历序数转换为 YYYYMMDD，与 datetime 一致"""
+        days = pd.date_range('2023-12-25', '2024-03-05')
+        ordinals = np.array([d.toordinal() for d in days])
+        np.testing.assert_array_equal(ordinals_to_date_nums(ordinals), days.strftime('%Y%m%d').astype(int))
+
+    def test_align_multiple_benchmarks(self, series):
+        """按回测交易日轴对齐：每列对应一个基准，缺失日期和基准缺失值为NaN"""
+        axis = np.array([20240101, 20240103, 20240105, 20240106, 20240108, 20240110])
+        aligned = series.align(axis)
+        assert aligned.shape == (len(axis), len(CODES))
+        expected = np.array([
+            [np.nan, np.nan],
+            [3420.0, np.nan],
+            [3450.0, 5320.0],
+            [np.nan, np.nan],
+            [3460.0, 5310.0],
+            [np.nan, np.nan],
+        ])
+        np.testing.assert_array_equal(aligned, expected)
+        # 每列与按代码逐日查询的收盘价一致
+        for code in CODES:
+            column = aligned[:, series.column(code)]
+            np.testing.assert_array_equal(column, [series.close(date, code) for date in axis])
+
+    def test_align_empty_series(self):
+        """没有基准数据时全部为NaN"""
+        empty = BenchmarkSeries(CODES, np.empty(0, dtype=np.int64), np.empty((0, 2)))
+        assert np.isnan(empty.align(DATES)).all()
+
+    def test_returns_per_benchmark(self, series):
+        """主基准首日相对前收盘价计算；前收盘价未知的基准首日为NaN，缺失值前后的收益率为NaN"""
+        primary = np.r_[3380.0, CLOSES[:, 0]]
+        np.testing.assert_allclose(series.returns(), np.diff(primary) / primary[:-1])
+        second = series.returns('000905.SH')
+        assert np.isnan(second[:3]).all()
+        np.testing.assert_allclose(second[3:], [5320.0 / 5250.0 - 1, 5310.0 / 5320.0 - 1])
+        assert series.code == series.codes[series.column()] == '000300.SH'
+
+    def test_save_and_load(self, series, tmp_path):
+        """benchmarks.npz 保存全部基准，benchmark.csv 只保存主基准且格式不变"""
+        series.save(str(tmp_path))
+        loaded = BenchmarkSeries.load_file(str(tmp_path))
+        assert loaded.codes == CODES
+        np.testing.assert_array_equal(loaded.dates, DATES)
+        np.testing.assert_array_equal(loaded.closes, CLOSES)
+        np.testing.assert_array_equal(loaded.prev_closes, series.prev_closes)
+
+        frame = pd.read_csv(str(tmp_path / 'benchmark.csv'))
+        assert list(frame.columns) == ['date', 'close']
+        np.testing.assert_array_equal(frame['close'], CLOSES[:, 0])
+
+        # 旧的回测结果只有 benchmark.csv
+        (tmp_path / 'benchmarks.npz').unlink()
+        legacy = BenchmarkSeries.load_file(str(tmp_path))
+        assert legacy.codes == ['benchmark']
+        np.testing.assert_array_equal(legacy.dates, DATES)
+        assert np.isnan(legacy.prev_closes).all()
+
+    def test_load_from_market_data(self):
+        """一次请求全部基准，按日期排序，回测开始前最后一个有效收盘价作为前收盘价"""
+        columns = ['20231228', '20231229', '20240102', '20240103']
+        frame = pd.DataFrame([[3300.0, 3310.0, 3400.0, 3420.0],
+                              [5200.0, np.nan, 5300.0, 5290.0]], index=CODES, columns=columns)
+        calls = []
+
+        class XtData:
+            def get_market_data(self, **kwargs):
+                calls.append(kwargs)
+                return {'close': frame[columns[::-1]]}
+
+        loaded = BenchmarkSeries.load(XtData(), CODES, '20240101', '20240103', download=False)
+        assert len(calls) == 1 and calls[0]['stock_list'] == CODES
+        np.testing.assert_array_equal(loaded.dates, [20240102, 20240103])
+        np.testing.assert_array_equal(loaded.closes, [[3400.0, 5300.0], [3420.0, 5290.0]])
+        np.testing.assert_array_equal(loaded.prev_closes, [3310.0, 5200.0])
@@ -0,0 +1,109 @@
+# coding: utf-8
+"""
+khDataLake 模块测试
+
+覆盖写入/读取往返、跨年份分区合并、追加与合并后字段类型保持不变以及各分区字段不一致时的读取。
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khDataLake import DataLake, date_to_ms
+
+
+def make_daily(dates, **fields):
+    """按日期列表构造日线数据，time 为毫秒时间戳"""
+    data = {'time': [date_to_ms(d) for d in dates]}
+    data.update(fields)
+    return pd.DataFrame(data)
+
+
+DATES = ['20231228', '20231229', '20240102', '20240103', '20240104', '20240105']
+
+
+@pytest.fixture
+def lake(tmp_path):
+    return DataLake(str(tmp_path), 'npz')
+
+
+@pytest.mark.unit
+class TestDataLake:
+    """DataLake 测试"""
+
+    def test_write_read_roundtrip(self, lake):
+        """跨年份写入后按原样读回"""
+        df = make_daily(DATES, close=np.arange(6, dtype=float) + 10, volume=np.arange(6) * 100)
+        assert lake.write('000001.SZ', '1d', df) == 6
+
+        result = lake.read('000001.SZ', '1d')
+        assert result['time'].tolist() == df['time'].tolist()
+        np.testing.assert_allclose(result['close'], df['close'])
+        np.testing.assert_array_equal(result['volume'], df['volume'])
+        assert lake.manifest['1d']['000001.SZ']['years'] == [2023, 2024]
+
+    def test_read_date_range_and_fields(self, lake):
+        """按日期范围和字段读取"""
+        lake.write('000001.SZ', '1d', make_daily(DATES, close=np.arange(6, dtype=float), volume=np.arange(6)))
+
+        result = lake.read('000001.SZ', '1d', start='20231229', end='20240103', fields=['close'])
+        assert list(result.columns) == ['time', 'close']
+        assert result['close'].tolist() == [1.0, 2.0, 3.0]
+
+    def test_write_merges_and_overwrites(self, lake):
+        """重复时间以新数据为准，新时间追加"""
+        lake.write('000001.SZ', '1d', make_daily(DATES[:4], close=[1.0, 2.0, 3.0, 4.0]))
+        lake.write('000001.SZ', '1d', make_daily(DATES[3:], close=[40.0, 50.0, 60.0]))
+
+        result = lake.read('000001.SZ', '1d')
+        assert result['close'].tolist() == [1.0, 2.0, 3.0, 40.0, 50.0, 60.0]
+        assert lake.manifest['1d']['000001.SZ']['rows'] == 6
+
+    def test_dtypes_survive_append_and_merge(self, lake):
+        """追加新行、覆盖部分字段后整数字段保持原类型，旧值保留"""
+        volume = np.arange(6, dtype=np.int64) * 100
+        lake.write('000001.SZ', '1d', make_daily(DATES[:4], close=np.arange(4, dtype=float), volume=volume[:4]))
+        lake.write('000001.SZ', '1d', make_daily(DATES[2:], close=np.arange(4, dtype=float), volume=volume[2:]))
+        # 只补写 open 字段，同一时间的 volume 保留旧值
+        lake.write('000001.SZ', '1d', make_daily(DATES, open=np.ones(6)))
+
+        result = lake.read('000001.SZ', '1d')
+        assert result['time'].dtype == np.int64
+        assert result['volume'].dtype == np.int64
+        assert result['volume'].tolist() == volume.tolist()
+        assert result['close'].dtype == np.float64
+        assert lake.read('000001.SZ', '1d', start='20240102', fields=['volume'])['volume'].dtype == np.int64
+
+    def test_missing_int_field_becomes_float(self, lake):
+        """追加的新行缺少整数字段时升为 float64 并填NaN"""
+        lake.write('000001.SZ', '1d', make_daily(DATES[2:4], volume=np.array([100, 200])))
+        lake.write('000001.SZ', '1d', make_daily(DATES[4:], close=[1.0, 2.0]))
+
+        result = lake.read('000001.SZ', '1d')
+        assert result['volume'].iloc[:2].tolist() == [100.0, 200.0]
+        assert result['volume'].iloc[2:].isna().all()
+
+    def test_read_partitions_with_different_fields(self, lake):
+        """只有部分年份分区补写了字段时，缺失部分填NaN"""
+        lake.write('000001.SZ', '1d', make_daily(DATES, close=np.arange(6, dtype=float), volume=np.arange(6)))
+        lake.write('000001.SZ', '1d', make_daily(DATES[:2], open=[9.5, 9.6]))
+
+        result = lake.read('000001.SZ', '1d')
+        assert len(result) == 6
+        assert result['close'].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+        assert result['open'].iloc[:2].tolist() == [9.5, 9.6]
+        assert result['open'].iloc[2:].isna().all()
+
+        result = lake.read('000001.SZ', '1d', fields=['open'])
+        assert list(result.columns) == ['time', 'open']
+        assert len(result) == 6
+
+    def test_manifest_saved_explicitly(self, tmp_path):
+        """批量写入时延迟保存清单，保存后可由新实例读取"""
+        lake = DataLake(str(tmp_path), 'npz')
+        lake.write('000001.SZ', '1d', make_daily(DATES, close=np.ones(6)), save_manifest=False)
+        lake.write('000002.SZ', '1d', make_daily(DATES, close=np.ones(6)), save_manifest=False)
+        assert DataLake(str(tmp_path), 'npz').symbols('1d') == []
+
+        lake.save_manifest()
+        assert sorted(DataLake(str(tmp_path), 'npz').symbols('1d')) == ['000001.SZ', '000002.SZ']
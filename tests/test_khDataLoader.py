@@ -0,0 +1,137 @@
+# coding: utf-8
+"""
+khDataLoader 模块测试
+
+使用桩 xtdata 模块覆盖按股票列表分批请求、结果与逐只请求一致、失败批次的处理
+以及并发加载时的进度汇总。
+"""
+
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khDataLoader import BacktestDataLoader, chunk_list
+
+CODES = [f'{i:06d}.SZ' for i in range(1, 24)]
+FIELDS = ['time', 'close']
+
+
+class StubXtdata:
+    """只实现 get_market_data_ex 的桩 xtdata 模块
+
+    每只股票的数据由代码确定，fail_codes 中的股票所在批次抛出异常，
+    delay 为每次请求的最大随机延迟（秒），使并发请求乱序完成。
+    """
+
+    def __init__(self, fail_codes=(), delay=0.0):
+        self.fail_codes = set(fail_codes)
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get_market_data_ex(self, field_list=None, stock_list=None, period='1d', start_time='', end_time='',
+                           count=-1, dividend_type='none', fill_data=True):
+        with self._lock:
+            self.requests.append({'stock_list': list(stock_list), 'field_list': list(field_list),
+                                  'period': period, 'start_time': start_time, 'end_time': end_time,
+                                  'dividend_type': dividend_type, 'fill_data': fill_data})
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        if self.fail_codes & set(stock_list):
+            raise RuntimeError('stub failure')
+        return {code: self.make_frame(code, field_list) for code in stock_list}
+
+    @staticmethod
+    def make_frame(code, field_list):
+        seed = int(code[:6])
+        index = ['20240102', '20240103', '20240104']
+        data = {'time': np.arange(3) + seed, 'close': np.arange(3, dtype=float) * seed}
+        return pd.DataFrame({field: data[field] for field in field_list}, index=index)
+
+
+def load(loader):
+    return loader.load(CODES, FIELDS, '1d', '20240102', '20240104', dividend_type='front')
+
+
+@pytest.mark.unit
+class TestChunkList:
+    """chunk_list 测试"""
+
+    def test_chunks(self):
+        """按固定大小拆分，最后一批为余数，大小小于1时按1处理"""
+        assert chunk_list(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+        assert chunk_list([], 3) == []
+        assert chunk_list([1, 2], 0) == [[1], [2]]
+
+
+@pytest.mark.unit
+class TestBacktestDataLoader:
+    """BacktestDataLoader 测试"""
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_chunked_by_stock_list(self, max_workers):
+        """每次请求最多 chunk_size 只股票，覆盖全部股票且其余参数原样传递"""
+        stub = StubXtdata()
+        result = load(BacktestDataLoader(stub, chunk_size=5, max_workers=max_workers))
+
+        assert len(stub.requests) == 5
+        assert all(len(request['stock_list']) <= 5 for request in stub.requests)
+        requested = sorted(code for request in stub.requests for code in request['stock_list'])
+        assert requested == CODES
+        assert all(request['dividend_type'] == 'front' and request['period'] == '1d'
+                   for request in stub.requests)
+        assert list(result) == CODES
+
+    def test_matches_per_stock_requests(self):
+        """分批并发加载的结果与逐只请求一致"""
+        stub = StubXtdata(delay=0.005)
+        result = load(BacktestDataLoader(stub, chunk_size=4, max_workers=4))
+        for code in CODES:
+            expected = StubXtdata().get_market_data_ex(FIELDS, [code], '1d', '20240102', '20240104')[code]
+            pd.testing.assert_frame_equal(result[code], expected)
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_failed_chunk(self, max_workers):
+        """失败批次的股票记入 failed_codes，其他批次照常返回"""
+        stub = StubXtdata(fail_codes={CODES[7]})
+        loader = BacktestDataLoader(stub, chunk_size=5, max_workers=max_workers)
+        result = load(loader)
+
+        assert sorted(loader.failed_codes) == CODES[5:10]
+        assert list(result) == CODES[:5] + CODES[10:]
+
+        # 再次加载时重置失败列表
+        stub.fail_codes = set()
+        assert list(load(loader)) == CODES
+        assert loader.failed_codes == []
+
+    def test_progress_aggregated_under_concurrency(self):
+        """并发加载时进度在调用线程中汇总报告，单调递增并以总数结束"""
+        progress = []
+        threads = set()
+
+        def on_progress(done, total):
+            progress.append((done, total))
+            threads.add(threading.current_thread())
+
+        stub = StubXtdata(delay=0.01)
+        load(BacktestDataLoader(stub, chunk_size=3, max_workers=4, progress_callback=on_progress))
+
+        assert len(progress) == len(chunk_list(CODES, 3))
+        assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+        assert progress[-1] == (len(CODES), len(CODES))
+        assert all(total == len(CODES) for _, total in progress)
+        assert threads == {threading.current_thread()}
+
+    def test_should_stop(self):
+        """中止后不再发起新的请求"""
+        stub = StubXtdata()
+        loader = BacktestDataLoader(stub, chunk_size=5, max_workers=1,
+                                    should_stop=lambda: len(stub.requests) >= 2)
+        result = load(loader)
+        assert len(stub.requests) == 2
+        assert list(result) == CODES[:10]
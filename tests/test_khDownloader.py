@@ -0,0 +1,132 @@
+# coding: utf-8
+"""
+khDownloader 模块测试
+
+覆盖令牌桶限速器的请求速率与中断，以及批量下载部分失败后按检查点日志续传。
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from khDownloader import BulkDownloader, DownloadJournal, RateLimiter, task_key
+
+STOCKS = [f'{i:06d}.SZ' for i in range(10)]
+
+
+class Source:
+    """记录请求的下载与写入替身，fail 中的股票在写入时抛出异常"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.fetched = []
+        self.stored = []
+        self._lock = threading.Lock()
+
+    def fetch(self, codes):
+        with self._lock:
+            self.fetched.extend(codes)
+        return {code: code for code in codes}
+
+    def store(self, code, data):
+        if code in self.fail:
+            raise IOError('disk full')
+        with self._lock:
+            self.stored.append(code)
+        return 100
+
+
+@pytest.mark.unit
+class TestRateLimiter:
+    """RateLimiter 测试"""
+
+    def test_unlimited(self):
+        """rate 为空或不大于0时不限速"""
+        for rate in (None, 0, -1):
+            limiter = RateLimiter(rate)
+            start = time.monotonic()
+            for _ in range(1000):
+                limiter.acquire()
+            assert time.monotonic() - start < 0.5
+
+    def test_rate_and_burst(self):
+        """突发容量内立即返回，之后按 rate 发放令牌"""
+        limiter = RateLimiter(rate=20, burst=3)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        assert time.monotonic() - start < 0.05
+
+        for _ in range(4):
+            limiter.acquire()
+        elapsed = time.monotonic() - start
+        # 突发之后的4个令牌至少需要 4/20 秒
+        assert 0.18 <= elapsed < 1.0
+
+    def test_should_stop_ends_wait(self):
+        """等待令牌期间中断检查返回True时立即返回"""
+        limiter = RateLimiter(rate=0.01)
+        limiter.acquire()
+        start = time.monotonic()
+        limiter.acquire(lambda: True)
+        assert time.monotonic() - start < 0.5
+
+
+@pytest.mark.unit
+class TestBulkDownloader:
+    """BulkDownloader 断点续传测试"""
+
+    def make_downloader(self, journal_path, task):
+        return BulkDownloader(chunk_size=3, download_workers=2, write_workers=2, rate_limit=None,
+                              journal_path=journal_path, task=task)
+
+    def test_resume_after_partial_failure(self, tmp_path):
+        """部分股票失败时保留日志，再次运行同一任务只重试失败的股票，全部完成后删除日志"""
+        journal_path = str(tmp_path / 'journal.jsonl')
+        task = task_key(period='1d', start='20240101', end='20240630')
+
+        first = Source(fail=STOCKS[4:6])
+        stats = self.make_downloader(journal_path, task).run(STOCKS, first.fetch, first.store)
+        assert (stats['completed'], stats['failed'], stats['skipped']) == (8, 2, 0)
+        assert stats['rows'] == 800
+
+        with open(journal_path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        assert lines[0]['task'] == task
+        assert sorted(record['code'] for record in lines[1:]) == sorted(set(STOCKS) - set(STOCKS[4:6]))
+
+        second = Source()
+        downloader = self.make_downloader(journal_path, task)
+        stats = downloader.run(STOCKS, second.fetch, second.store)
+        assert sorted(second.fetched) == STOCKS[4:6]
+        assert (stats['completed'], stats['failed'], stats['skipped']) == (2, 0, 8)
+        assert downloader.failed_codes == []
+        assert not (tmp_path / 'journal.jsonl').exists()
+
+    def test_other_task_starts_over(self, tmp_path):
+        """任务标识不同时丢弃旧日志，重新下载全部股票"""
+        journal_path = str(tmp_path / 'journal.jsonl')
+        first = Source(fail=STOCKS[:1])
+        self.make_downloader(journal_path, task_key(period='1d')).run(STOCKS, first.fetch, first.store)
+
+        second = Source()
+        stats = self.make_downloader(journal_path, task_key(period='1m')).run(STOCKS, second.fetch, second.store)
+        assert sorted(second.fetched) == STOCKS
+        assert stats['skipped'] == 0
+
+    def test_truncated_journal_line_ignored(self, tmp_path):
+        """中断时留下的不完整最后一行被忽略，之后追加的记录另起一行"""
+        path = str(tmp_path / 'journal.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'task': 'k'}) + '\n')
+            f.write(json.dumps({'code': STOCKS[0], 'rows': 5}) + '\n')
+            f.write('{"code": "' + STOCKS[1])
+        journal = DownloadJournal(path, 'k')
+        assert journal.completed == {STOCKS[0]: 5}
+        journal.mark(STOCKS[1], 7)
+        journal.close()
+        reopened = DownloadJournal(path, 'k')
+        reopened.close()
+        assert reopened.completed == {STOCKS[0]: 5, STOCKS[1]: 7}
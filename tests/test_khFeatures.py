@@ -0,0 +1,102 @@
+# coding: utf-8
+"""
+khFeatures 模块测试
+
+覆盖 FeaturePipeline 在源数据增长后的增量计算与全量计算结果一致，以及源文件未变化时跳过计算。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khFeatures import FeaturePipeline
+
+MINUTE_SAMPLE = '000001.SZ_1m_20240101_20240229_all_none.csv'
+DAILY_SAMPLE = '000001.SZ_1d_20240101_20240229_all_none.csv'
+FEATURES = ['volume_ratio', 'return_rate']
+DATES = pd.bdate_range('2024-01-02', periods=25)
+TIMES = ['09:31:00', '10:30:00', '14:00:00', '15:00:00']
+
+
+def touch(path):
+    """保证修改时间变化，增量计算按源文件修改时间判断是否需要重算"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def write_symbol(directory, code, days, seed):
+    """写出一只股票前 days 个交易日的分钟线和日线CSV，文件名沿用下载数据的命名规则
+
+    同一 seed 生成的完整序列相同，数据增长时已有日期的行情不变。
+    """
+    rng = np.random.default_rng(seed)
+    minute = pd.DataFrame({
+        'date': np.repeat(DATES.strftime('%Y-%m-%d'), len(TIMES)),
+        'time': TIMES * len(DATES),
+        'close': rng.uniform(9, 11, len(DATES) * len(TIMES)),
+        'volume': rng.integers(100, 10000, len(DATES) * len(TIMES)),
+    })
+    daily = pd.DataFrame({
+        'date': DATES.strftime('%Y-%m-%d'),
+        'close': rng.uniform(9, 11, len(DATES)),
+        'volume': rng.integers(10 ** 5, 10 ** 6, len(DATES)),
+    })
+    for frame, sample in ((minute.iloc[:days * len(TIMES)], MINUTE_SAMPLE), (daily.iloc[:days], DAILY_SAMPLE)):
+        path = os.path.join(directory, sample.replace('000001.SZ', code))
+        frame.to_csv(path, index=False)
+        touch(path)
+
+
+def make_pipeline(data_dir, output_dir, incremental=True):
+    return FeaturePipeline(data_dir, MINUTE_SAMPLE, DAILY_SAMPLE, FEATURES, output_dir, 'features.csv',
+                           max_workers=1, incremental=incremental)
+
+
+def normalized(frame):
+    frame = frame.copy()
+    frame['date'] = pd.to_datetime(frame['date']).dt.strftime('%Y-%m-%d')
+    return frame.sort_values(['stock_code', 'date', 'time']).reset_index(drop=True)
+
+
+@pytest.mark.unit
+class TestFeaturePipeline:
+    """FeaturePipeline 增量计算测试"""
+
+    def test_incremental_matches_full(self, tmp_path):
+        """源数据在末尾增长后增量计算，输出与全量重算一致；未增长的股票保持原有结果"""
+        data_dir = str(tmp_path / 'data')
+        os.makedirs(data_dir)
+        for seed, code in enumerate(['000001.SZ', '000002.SZ', '600000.SH']):
+            write_symbol(data_dir, code, 15, seed)
+
+        incremental = make_pipeline(data_dir, str(tmp_path / 'incremental'))
+        first = incremental.run()
+        assert len(first) > 0
+
+        # 两只股票的数据增长，600000.SH 不变
+        for seed, code in enumerate(['000001.SZ', '000002.SZ']):
+            write_symbol(data_dir, code, len(DATES), seed)
+        updated = incremental.run()
+
+        full = make_pipeline(data_dir, str(tmp_path / 'full'), incremental=False).run()
+        pd.testing.assert_frame_equal(normalized(updated), normalized(full), check_dtype=False)
+        # 新增日期已计算，最后一天仍被排除
+        dates = normalized(updated).groupby('stock_code')['date'].max()
+        assert dates['000001.SZ'] == DATES[-2].strftime('%Y-%m-%d')
+        assert dates['600000.SH'] == DATES[13].strftime('%Y-%m-%d')
+
+    def test_unchanged_sources_skipped(self, tmp_path, monkeypatch):
+        """源文件未变化时直接返回已有输出，不再计算"""
+        data_dir = str(tmp_path / 'data')
+        os.makedirs(data_dir)
+        write_symbol(data_dir, '000001.SZ', len(DATES), 0)
+        pipeline = make_pipeline(data_dir, str(tmp_path / 'out'))
+        expected = pipeline.run()
+
+        def fail(task):
+            raise AssertionError('源文件未变化时不应重新计算')
+
+        monkeypatch.setattr('khFeatures._process_symbol', fail)
+        pd.testing.assert_frame_equal(normalized(pipeline.run()), normalized(expected), check_dtype=False)
@@ -0,0 +1,151 @@
+# coding: utf-8
+"""
+khLabels 模块测试
+
+覆盖前瞻收益率的计算、ReturnLabelBuilder 增量更新与全量构建结果一致，以及 calculate_next_day_return 对缺失收盘价的处理。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khLabels import ReturnLabelBuilder, forward_returns
+
+SAMPLE = '000001.SZ_1d_20240101_20240630_all_none.csv'
+DATES = pd.bdate_range('2024-01-01', '2024-03-29')
+
+
+def write_daily(directory, code, dates, seed):
+    """写出一只股票的日线CSV，文件名沿用下载数据的命名规则"""
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'open': rng.uniform(9, 11, len(dates)),
+        'close': rng.uniform(9, 11, len(dates)),
+    })
+    path = os.path.join(directory, SAMPLE.replace('000001.SZ', code))
+    data.to_csv(path, index=False)
+    # 保证修改时间变化，增量更新按 (路径, 修改时间) 判断文件是否变化
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    return data
+
+
+def assert_same_labels(left, right):
+    np.testing.assert_array_equal(left.dates, right.dates)
+    assert left.symbols == right.symbols
+    np.testing.assert_array_equal(np.asarray(left.closes), np.asarray(right.closes))
+    for horizon in left.horizons:
+        np.testing.assert_array_equal(np.asarray(left.returns(horizon)), np.asarray(right.returns(horizon)))
+
+
+@pytest.mark.unit
+class TestForwardReturns:
+    """forward_returns 测试"""
+
+    def test_matches_pct_change(self):
+        """与逐列 pct_change(h).shift(-h) 一致，末尾 h 行为 NaN"""
+        closes = np.random.default_rng(0).uniform(5, 15, (30, 3))
+        closes[10, 1] = np.nan
+        for horizon in (1, 5):
+            expected = (pd.DataFrame(closes).shift(-horizon) / pd.DataFrame(closes) - 1).to_numpy()
+            np.testing.assert_allclose(forward_returns(closes, horizon), expected, equal_nan=True)
+            assert np.isnan(forward_returns(closes, horizon)[-horizon:]).all()
+
+
+@pytest.mark.unit
+class TestReturnLabelBuilder:
+    """ReturnLabelBuilder 增量更新测试"""
+
+    def test_incremental_append_matches_fresh(self, tmp_path):
+        """交易日在末尾增长时，增量更新与全量构建结果一致"""
+        data_dir = str(tmp_path / 'daily')
+        os.makedirs(data_dir)
+        codes = ['000001.SZ', '000002.SZ', '600000.SH']
+        for seed, code in enumerate(codes):
+            write_daily(data_dir, code, DATES[:40], seed)
+
+        incremental = ReturnLabelBuilder(str(tmp_path / 'incremental'), horizons=(1, 5))
+        assert incremental.update(data_dir, SAMPLE) == 40
+        assert incremental.update(data_dir, SAMPLE) == 0
+
+        # 重新下载的文件包含原有历史和新增交易日
+        for seed, code in enumerate(codes):
+            write_daily(data_dir, code, DATES, seed)
+        assert incremental.update(data_dir, SAMPLE) == len(DATES) - 40
+
+        fresh = ReturnLabelBuilder(str(tmp_path / 'fresh'), horizons=(1, 5))
+        fresh.update(data_dir, SAMPLE)
+        assert_same_labels(incremental, fresh)
+
+        # 从存储目录重新打开
+        assert_same_labels(ReturnLabelBuilder(str(tmp_path / 'incremental')), fresh)
+
+    def test_new_symbol_and_inserted_dates_match_fresh(self, tmp_path):
+        """新增股票、中间插入交易日时整体重排，结果与全量构建一致"""
+        data_dir = str(tmp_path / 'daily')
+        os.makedirs(data_dir)
+        write_daily(data_dir, '000001.SZ', DATES[::2], 0)
+
+        incremental = ReturnLabelBuilder(str(tmp_path / 'incremental'), horizons=(1, 5))
+        incremental.update(data_dir, SAMPLE)
+
+        write_daily(data_dir, '000001.SZ', DATES, 0)
+        write_daily(data_dir, '000002.SZ', DATES[5:], 1)
+        incremental.update(data_dir, SAMPLE)
+
+        fresh = ReturnLabelBuilder(None, horizons=(1, 5))
+        fresh.update(data_dir, SAMPLE)
+        assert_same_labels(incremental, fresh)
+        assert np.isnan(np.asarray(incremental.closes)[:5, 1]).all()
+
+    def test_changed_horizons_recomputed(self, tmp_path):
+        """重新打开时周期设置变化，按收盘价矩阵补算缺少的周期"""
+        data_dir = str(tmp_path / 'daily')
+        os.makedirs(data_dir)
+        write_daily(data_dir, '000001.SZ', DATES, 0)
+        store_dir = str(tmp_path / 'labels')
+        ReturnLabelBuilder(store_dir, horizons=(1,)).update(data_dir, SAMPLE)
+
+        reopened = ReturnLabelBuilder(store_dir, horizons=(1, 20))
+        np.testing.assert_array_equal(np.asarray(reopened.returns(20)),
+                                      forward_returns(np.asarray(reopened.closes), 20))
+        with pytest.raises(KeyError):
+            reopened.returns(5)
+
+
+@pytest.mark.unit
+class TestCalculateNextDayReturn:
+    """calculate_next_day_return 测试"""
+
+    def test_missing_and_nan_closes(self, tmp_path):
+        """文件中缺少的日期按逐只 pct_change 跳过；收盘价为 NaN 的行去掉，前一日收益率计算到下一个有效收盘价"""
+        pytest.importorskip('xtquant')
+        from khQTTools import calculate_next_day_return
+
+        data_dir = str(tmp_path / 'daily')
+        os.makedirs(data_dir)
+        full = write_daily(data_dir, '000001.SZ', DATES[:30], 0)
+        # 000002.SZ 缺少第15个交易日的行，第20个交易日收盘价为 NaN
+        gapped = write_daily(data_dir, '000002.SZ', DATES[:30].delete(15), 1)
+        gapped.loc[19, 'close'] = np.nan
+        gapped.to_csv(os.path.join(data_dir, SAMPLE.replace('000001.SZ', '000002.SZ')), index=False)
+
+        calculate_next_day_return(data_dir, SAMPLE, ['next_day_return_rate', 'open'], str(tmp_path), 'labels.csv')
+        result = pd.read_csv(str(tmp_path / 'labels.csv'))
+        assert list(result.columns) == ['date', 'next_day_return_rate', 'open', 'stock_code']
+
+        rows = result[result['stock_code'] == '000002.SZ'].set_index('date')['next_day_return_rate']
+        closes = gapped.set_index('date')['close']
+        # 缺少行的日期前后：与逐只 pct_change().shift(-1) 一致
+        before_gap = gapped['date'][14]
+        assert rows[before_gap] == pytest.approx(closes.iloc[15] / closes.iloc[14] - 1)
+        # 收盘价为 NaN 的日期不输出，前一日收益率计算到下一个有效收盘价
+        assert gapped['date'][19] not in rows.index
+        assert rows[gapped['date'][18]] == pytest.approx(closes.iloc[20] / closes.iloc[18] - 1)
+
+        expected = full['close'].pct_change().shift(-1)
+        full_rows = result[result['stock_code'] == '000001.SZ'].set_index('date')['next_day_return_rate']
+        np.testing.assert_allclose(full_rows.to_numpy(), expected[full['date'].isin(full_rows.index)].to_numpy())
@@ -0,0 +1,112 @@
+# coding: utf-8
+"""
+khLiveDispatch 模块测试
+
+覆盖同一股票多次推送的合并、有界队列满时的丢弃与补处理、快照按股票替换以及处理函数异常。
+"""
+
+import threading
+import time
+
+import pytest
+
+from khLiveDispatch import QuoteDispatcher
+
+
+class Recorder:
+    """记录处理函数调用，expected 次调用后置位事件"""
+
+    def __init__(self, expected=1, fail=False):
+        self.calls = []
+        self.expected = expected
+        self.fail = fail
+        self.done = threading.Event()
+
+    def __call__(self, view, codes, timestamp, earliest):
+        self.calls.append((view, sorted(codes), timestamp))
+        if len(self.calls) >= self.expected:
+            self.done.set()
+        if self.fail:
+            raise RuntimeError('handler failure')
+
+
+def run(dispatcher, recorder):
+    """启动分发器并等待处理函数被调用"""
+    dispatcher.start()
+    try:
+        assert recorder.done.wait(5)
+    finally:
+        dispatcher.stop()
+
+
+@pytest.mark.unit
+class TestQuoteDispatcher:
+    """QuoteDispatcher 测试"""
+
+    def test_coalesce_same_stock(self):
+        """同一股票在处理前的多次推送合并为一次，快照字段按推送顺序合并"""
+        recorder = Recorder()
+        dispatcher = QuoteDispatcher(recorder, coalesce_window=0.01)
+        dispatcher.submit({'000001.SZ': {'lastPrice': 10.0, 'volume': 100}, 'timestamp': 1})
+        dispatcher.submit({'000001.SZ': {'lastPrice': 10.1}, '600000.SH': {'lastPrice': 8.0}, 'timestamp': 2})
+        dispatcher.submit({'000001.SZ': [{'lastPrice': 10.15}, {'lastPrice': 10.2}], 'timestamp': 3})
+        assert dispatcher.queue_depth() == 2
+
+        run(dispatcher, recorder)
+        assert len(recorder.calls) == 1
+        view, codes, timestamp = recorder.calls[0]
+        assert codes == ['000001.SZ', '600000.SH']
+        assert timestamp == 3
+        assert view['000001.SZ'] == {'lastPrice': 10.2, 'volume': 100}
+
+        stats = dispatcher.stats()
+        assert (stats['received'], stats['coalesced'], stats['dispatches']) == (4, 2, 1)
+        assert stats['max_queue_depth'] == 2
+
+    def test_queue_overflow_dropped_but_processed(self):
+        """队列满时新标记被丢弃，但快照已更新，股票在下一次分发中一并处理"""
+        recorder = Recorder()
+        dispatcher = QuoteDispatcher(recorder, coalesce_window=0.01, max_queue=2)
+        codes = [f'{i:06d}.SZ' for i in range(5)]
+        for i, code in enumerate(codes):
+            dispatcher.submit({code: {'lastPrice': float(i)}})
+        assert dispatcher.queue_depth() == 2
+
+        run(dispatcher, recorder)
+        stats = dispatcher.stats()
+        assert stats['dropped'] == 3
+        assert stats['max_queue_depth'] == 2
+        assert len(recorder.calls) == 1
+        view, processed, _ = recorder.calls[0]
+        assert processed == codes
+        assert [view[code]['lastPrice'] for code in codes] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    def test_snapshot_replaced_not_mutated(self):
+        """合并行情时替换该股票的字典，处理函数已持有的快照不受影响"""
+        recorder = Recorder()
+        dispatcher = QuoteDispatcher(recorder, coalesce_window=0.0)
+        dispatcher.submit({'000001.SZ': {'lastPrice': 10.0}})
+        run(dispatcher, recorder)
+
+        held = recorder.calls[0][0]['000001.SZ']
+        dispatcher.submit({'000001.SZ': {'lastPrice': 11.0}})
+        assert held == {'lastPrice': 10.0}
+        assert dispatcher.snapshot['000001.SZ'] == {'lastPrice': 11.0}
+
+    def test_handler_error_counted(self):
+        """处理函数异常计入统计，工作线程继续处理后续推送"""
+        recorder = Recorder(expected=2, fail=True)
+        dispatcher = QuoteDispatcher(recorder, coalesce_window=0.0)
+        dispatcher.start()
+        try:
+            dispatcher.submit({'000001.SZ': {'lastPrice': 10.0}})
+            for _ in range(500):
+                if recorder.calls:
+                    break
+                time.sleep(0.01)
+            dispatcher.submit({'000001.SZ': {'lastPrice': 10.1}})
+            assert recorder.done.wait(5)
+        finally:
+            dispatcher.stop()
+        assert dispatcher.stats()['errors'] == 2
+        assert not dispatcher.running
@@ -0,0 +1,191 @@
+# coding: utf-8
+"""
+khOptimizer 模块测试
+
+覆盖随机抽样的组合序号还原、滚动优化窗口划分、点号路径参数写入配置，
+以及 compute_metrics 与结果窗口公式的一致性。
+"""
+
+import logging
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khBenchmark import BenchmarkSeries
+from khOptimizer import (ParameterOptimizer, apply_params, compute_metrics, grid_schedule,
+                         random_schedule, walk_forward_windows)
+
+GRID = {'SHORT': [3, 5, 10], 'LONG': [20, 30, 60, 120], 'STOP': [0.05, 0.1]}
+
+
+@pytest.mark.unit
+class TestSchedules:
+    """参数组合生成测试"""
+
+    def test_random_schedule_decodes_grid_index(self):
+        """抽取的组合序号按各参数取值个数逐位还原，与网格展开顺序中的同一序号一致"""
+        grid = grid_schedule(GRID)
+        assert len(grid) == 24
+        indices = random.Random(7).sample(range(len(grid)), 10)
+        assert random_schedule(GRID, 10, seed=7) == [grid[i] for i in indices]
+
+    def test_random_schedule_without_replacement(self):
+        """不重复抽取，n_trials 超过组合数时返回全部组合，参数顺序与网格定义一致"""
+        schedule = random_schedule(GRID, 100, seed=1)
+        assert len(schedule) == 24
+        assert sorted(map(str, schedule)) == sorted(map(str, grid_schedule(GRID)))
+        assert all(list(params) == list(GRID) for params in schedule)
+
+
+@pytest.mark.unit
+class TestWalkForwardWindows:
+    """滚动优化窗口测试"""
+
+    def test_windows(self):
+        """按交易日划分训练/测试区间，默认步长等于测试区间长度，不足一个窗口的尾部丢弃"""
+        pytest.importorskip('xtquant')
+        # 2024-01-02 至 2024-01-12 共9个交易日（1月1日元旦休市）
+        windows = walk_forward_windows('20240101', '20240112', train_days=3, test_days=2)
+        assert windows == [
+            {'train_start': '20240102', 'train_end': '20240104', 'test_start': '20240105', 'test_end': '20240108'},
+            {'train_start': '20240104', 'train_end': '20240108', 'test_start': '20240109', 'test_end': '20240110'},
+            {'train_start': '20240108', 'train_end': '20240110', 'test_start': '20240111', 'test_end': '20240112'},
+        ]
+
+        windows = walk_forward_windows('20240101', '20240112', train_days=3, test_days=2, step_days=4)
+        assert [w['train_start'] for w in windows] == ['20240102', '20240108']
+        assert walk_forward_windows('20240101', '20240112', train_days=8, test_days=2) == []
+
+
+@pytest.mark.unit
+class TestApplyParams:
+    """参数写入配置测试"""
+
+    def test_dotted_paths(self):
+        """点号路径写入嵌套配置（缺少的层级自动创建），其余参数合并到 strategy_params"""
+        config = {'backtest': {'init_capital': 100000, 'start_time': '20240101'},
+                  'strategy_params': {'EXISTING': 1}}
+        strategy_params = apply_params(config, {
+            'backtest.init_capital': 500000,
+            'backtest.trade_cost.commission_rate': 0.0002,
+            'risk.limits.position': 0.8,
+            'SHORT': 5,
+        })
+        assert strategy_params == {'SHORT': 5}
+        assert config['backtest'] == {'init_capital': 500000, 'start_time': '20240101',
+                                      'trade_cost': {'commission_rate': 0.0002}}
+        assert config['risk'] == {'limits': {'position': 0.8}}
+        assert config['strategy_params'] == {'EXISTING': 1, 'SHORT': 5}
+
+
+@pytest.mark.unit
+class TestComputeMetrics:
+    """compute_metrics 与结果窗口公式一致性测试"""
+
+    INIT = 1000000.0
+    RF = 0.03
+
+    @pytest.fixture
+    def backtest(self):
+        rng = np.random.default_rng(3)
+        dates = pd.bdate_range('2024-01-02', periods=40)
+        returns = rng.normal(0.001, 0.01, len(dates))
+        assets = self.INIT * np.cumprod(1 + returns)
+        daily_stats = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'total_asset': assets,
+                                    'daily_return': returns})
+        bench_closes = 3500 * np.cumprod(1 + rng.normal(0.0005, 0.008, len(dates)))
+        benchmark = BenchmarkSeries(['000300.SH'], dates.strftime('%Y%m%d').astype(int),
+                                    bench_closes.reshape(-1, 1), np.array([3480.0]))
+        trades = pd.DataFrame([
+            ('A', '2024-01-02 09:30:00', 'buy', 10.0, 100),
+            ('A', '2024-01-03 09:30:00', 'buy', 12.0, 100),
+            ('A', '2024-01-04 09:30:00', 'sell', 13.0, 150),
+            ('B', '2024-01-04 09:30:00', 'sell', 6.0, 100),
+            ('B', '2024-01-05 09:30:00', 'buy', 5.0, 100),
+            ('B', '2024-01-08 09:30:00', 'sell', 4.0, 100),
+        ], columns=['code', 'datetime', 'action', 'price', 'volume'])
+        return daily_stats, trades, benchmark
+
+    def test_matches_result_window_formulas(self, backtest):
+        """收益、回撤、波动率、夏普、索提诺、阿尔法/贝塔、胜率和盈亏比"""
+        daily_stats, trades, benchmark = backtest
+        metrics = compute_metrics(daily_stats, trades, self.INIT, benchmark, self.RF)
+
+        assets = daily_stats['total_asset'].to_numpy()
+        returns = daily_stats['daily_return'].to_numpy()
+        days = n = len(returns)
+        total_return = assets[-1] / self.INIT - 1
+        annual_return = ((1 + total_return) ** (250 / days) - 1) * 100
+        cummax = np.maximum.accumulate(assets)
+        volatility = np.sqrt(250 / n * np.sum((returns - returns.mean()) ** 2))
+        returns_annual = np.prod(1 + returns) ** (250 / n) - 1
+
+        closes = benchmark.closes[:, 0]
+        bench_returns = np.diff(np.concatenate(([3480.0], closes))) / np.concatenate(([3480.0], closes[:-1]))
+        benchmark_return = (closes[-1] / 3480.0 - 1) * 100
+        benchmark_annual = ((1 + benchmark_return / 100) ** (250 / days) - 1) * 100
+        # 贝塔按日期对齐，基准首日收益率由回测区间内的收盘价计算，不可用
+        beta = np.cov(returns[1:], bench_returns[1:])[0, 1] / np.var(bench_returns[1:])
+        alpha = (annual_return - (self.RF * 100 + beta * (benchmark_annual - self.RF * 100))) / 100
+        diff = returns - bench_returns
+        downside_risk = np.sqrt(250 / n * np.sum(np.where(diff < 0, diff ** 2, 0.0)))
+
+        assert metrics['total_return'] == pytest.approx(total_return * 100)
+        assert metrics['annual_return'] == pytest.approx(annual_return)
+        assert metrics['max_drawdown'] == pytest.approx(((cummax - assets) / cummax * 100).max())
+        assert metrics['volatility'] == pytest.approx(volatility)
+        assert metrics['sharpe_ratio'] == pytest.approx((returns_annual - self.RF) / volatility)
+        assert metrics['sortino_ratio'] == pytest.approx((returns_annual - self.RF) / downside_risk)
+        assert metrics['benchmark_return'] == pytest.approx(benchmark_return)
+        assert metrics['beta'] == pytest.approx(beta)
+        assert metrics['alpha'] == pytest.approx(alpha)
+        # A：均价11元卖出150股盈利300元；B：无持仓时的卖出不计，4元卖出亏损100元
+        assert metrics['win_rate'] == pytest.approx(0.5)
+        assert metrics['profit_ratio'] == pytest.approx(3.0)
+        assert metrics['trade_count'] == 6
+        assert metrics['trade_days'] == 40
+
+    def test_default_benchmark_return_for_sortino(self, backtest):
+        """无基准时索提诺比率按默认日收益率0.03%计算，阿尔法/贝塔为0"""
+        daily_stats, trades, _ = backtest
+        metrics = compute_metrics(daily_stats, trades, self.INIT, None, self.RF)
+
+        returns = daily_stats['daily_return'].to_numpy()
+        n = len(returns)
+        returns_annual = np.prod(1 + returns) ** (250 / n) - 1
+        diff = returns - 0.0003
+        downside_risk = np.sqrt(250 / n * np.sum(np.where(diff < 0, diff ** 2, 0.0)))
+        assert metrics['sortino_ratio'] == pytest.approx((returns_annual - self.RF) / downside_risk)
+        assert metrics['alpha'] == metrics['beta'] == metrics['benchmark_return'] == 0.0
+
+    def test_empty(self):
+        """没有每日统计时指标为0"""
+        metrics = compute_metrics(pd.DataFrame(), pd.DataFrame(), self.INIT)
+        assert metrics['total_return'] == 0.0
+        assert metrics['trade_days'] == 0
+
+
+@pytest.mark.unit
+class TestSummarize:
+    """汇总表测试"""
+
+    def test_snapshot_miss_warning_by_mode(self, tmp_path, caplog):
+        """进程池中 strict 模式的未命中提示回测失败，串行回测的未命中提示已回退到 xtdata"""
+        optimizer = ParameterOptimizer.__new__(ParameterOptimizer)
+        optimizer.output_dir = str(tmp_path)
+        optimizer.objective = 'sharpe_ratio'
+        rows = [
+            {'trial_id': 0, 'sharpe_ratio': 1.0, 'snapshot_misses': 2, 'strict_snapshot': False},
+            {'trial_id': 1, 'error': 'miss', 'snapshot_misses': 1, 'strict_snapshot': True},
+            {'trial_id': 2, 'sharpe_ratio': 2.0, 'snapshot_misses': 0, 'strict_snapshot': True},
+        ]
+        with caplog.at_level(logging.WARNING):
+            summary = optimizer._summarize(rows, 'summary.csv')
+
+        messages = [record.getMessage() for record in caplog.records]
+        assert any(m.startswith('1 组回测的行情不在快照中，工作进程不访问 xtdata') for m in messages)
+        assert any(m.startswith('1 组回测的行情不在快照中，已回退到 xtdata') for m in messages)
+        assert summary['trial_id'].tolist() == [2, 0, 1]
+        assert (tmp_path / 'summary.csv').exists()
@@ -0,0 +1,126 @@
+# coding: utf-8
+"""
+khPortfolio 模块测试
+
+覆盖 PortfolioLedger 与原持仓字典的读写兼容性以及向量化盯市计算。
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from khPortfolio import PortfolioLedger, POSITION_KEYS
+
+
+def make_position(code, volume, price, **extra):
+    """构造与回测持仓字典字段一致的持仓"""
+    position = {
+        'account_type': 2, 'account_id': 'test', 'stock_code': code,
+        'volume': volume, 'can_use_volume': volume, 'open_price': price,
+        'market_value': volume * price, 'frozen_volume': 0, 'on_road_volume': 0,
+        'yesterday_volume': 0, 'avg_price': price, 'current_price': price,
+        'direction': 48, 'profit': 0.0, 'profit_ratio': 0.0,
+    }
+    position.update(extra)
+    return position
+
+
+@pytest.mark.unit
+class TestPortfolioLedgerDictCompat:
+    """PortfolioLedger 字典接口测试"""
+
+    def test_read_write_like_dict(self):
+        """positions[code][field]、get、in、len、items 与普通字典一致"""
+        ledger = PortfolioLedger()
+        ledger['000001.SZ'] = make_position('000001.SZ', 1000, 10.5)
+
+        assert '000001.SZ' in ledger
+        assert '000002.SZ' not in ledger
+        assert ledger.get('000002.SZ') is None
+        assert len(ledger) == 1
+
+        position = ledger['000001.SZ']
+        assert position['volume'] == 1000
+        assert isinstance(position['volume'], int)
+        assert isinstance(position['avg_price'], float)
+        assert position['stock_code'] == '000001.SZ'
+        assert position.get('missing', 'default') == 'default'
+
+        position['can_use_volume'] -= 300
+        assert ledger['000001.SZ']['can_use_volume'] == 700
+        assert dict(ledger.items())['000001.SZ']['can_use_volume'] == 700
+
+    def test_copy_matches_original_dict(self):
+        """copy() 得到与原持仓字典相同的普通字典，键顺序一致且可JSON序列化"""
+        original = {
+            '000001.SZ': make_position('000001.SZ', 1000, 10.5),
+            '600000.SH': make_position('600000.SH', 200, 7.25, remark='test'),
+        }
+        ledger = PortfolioLedger(original)
+
+        copied = ledger.copy()
+        assert copied == original
+        assert list(copied['000001.SZ']) == list(POSITION_KEYS)
+        assert list(copied['600000.SH'])[-1] == 'remark'
+        assert json.loads(json.dumps(copied)) == original
+
+    def test_iteration_order_and_delete(self):
+        """迭代按建仓顺序，清仓后槽位保留并在再次建仓时复用"""
+        ledger = PortfolioLedger(capacity=1)
+        for code in ('B', 'A', 'C'):
+            ledger[code] = make_position(code, 100, 1.0)
+        assert list(ledger) == ['B', 'A', 'C']
+
+        slot = ledger.slot_of('A')
+        del ledger['A']
+        assert list(ledger) == ['B', 'C']
+        with pytest.raises(KeyError):
+            ledger['A']
+
+        ledger['A'] = make_position('A', 50, 2.0)
+        assert ledger.slot_of('A') == slot
+        assert list(ledger) == ['B', 'C', 'A']
+        assert ledger['A']['volume'] == 50
+
+    def test_base_fields_protected(self):
+        """数值字段不可删除、股票代码不可修改，附加字段可增删"""
+        ledger = PortfolioLedger({'A': make_position('A', 100, 1.0)})
+        position = ledger['A']
+        with pytest.raises(KeyError):
+            del position['volume']
+        with pytest.raises(ValueError):
+            position['stock_code'] = 'B'
+        position['note'] = 'x'
+        assert ledger['A']['note'] == 'x'
+        del position['note']
+        assert 'note' not in ledger['A']
+
+
+@pytest.mark.unit
+class TestPortfolioLedgerValuation:
+    """PortfolioLedger 盯市计算测试"""
+
+    def test_mark_to_market_matches_loop(self):
+        """向量化盯市结果与逐只计算一致，总市值缓存随修改失效"""
+        ledger = PortfolioLedger()
+        ledger['A'] = make_position('A', 100, 10.0)
+        ledger['B'] = make_position('B', 300, 5.0)
+        prices = np.array([10.5, 4.8])
+
+        total = ledger.mark_to_market(prices)
+        assert total == 100 * 10.5 + 300 * 4.8
+        assert ledger['B']['profit'] == pytest.approx((4.8 - 5.0) * 300)
+        assert ledger['B']['profit_ratio'] == pytest.approx(4.8 / 5.0 - 1)
+        assert ledger.total_market_value() == total
+
+        ledger['A']['market_value'] = 0.0
+        assert ledger.total_market_value() == 300 * 4.8
+        assert ledger.exposure() == 100 * 10.5 + 300 * 4.8
+
+    def test_empty_ledger(self):
+        """空账本的总市值为0"""
+        ledger = PortfolioLedger()
+        assert ledger.mark_to_market([]) == 0.0
+        assert ledger.total_market_value() == 0.0
+        assert ledger.copy() == {}
@@ -0,0 +1,147 @@
+# coding: utf-8
+"""
+khRealtimeTrader 模块测试
+
+覆盖账户持仓缓存：启动时同步一次，之后由成交、持仓、资产推送原地更新而不重新查询交易接口；
+以及按股票复用的策略上下文字典。
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('xtquant')
+
+from xtquant import xtconstant
+
+import khRealtimeTrader
+from khRealtimeTrader import RealtimeTrader
+
+
+class Config(dict):
+    """同时提供字典访问和 config_dict 属性的配置（交易管理器读取 config_dict）"""
+    config_dict = {}
+
+
+class StubTrader:
+    """只实现账户和持仓查询的交易接口替身，记录查询次数"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def query_account_status(self):
+        self.queries += 1
+        return {'cash': 100000.0, 'frozen_cash': 0.0, 'market_value': 10000.0, 'total_asset': 110000.0}
+
+    def query_positions(self):
+        return [SimpleNamespace(stock_code='000001.SZ', volume=1000, can_use_volume=1000, market_value=10000.0)]
+
+
+def make_trader():
+    trader = RealtimeTrader(Config(stock_list=['000001.SZ', '600000.SH']), '')
+    trader.trader = StubTrader()
+    trader.quote_data = {'000001.SZ': {'time': 1704162600000, 'close': 10.5, 'open': 10.0}}
+    return trader
+
+
+def fill(code, order_type, volume, price):
+    return SimpleNamespace(stock_code=code, order_type=order_type, traded_volume=volume,
+                           traded_price=price, traded_amount=volume * price)
+
+
+@pytest.mark.unit
+class TestAccountCache:
+    """账户持仓缓存测试"""
+
+    def test_fills_update_cache_without_query(self):
+        """成交推送原地调整持仓和资金，不触发重新查询"""
+        trader = make_trader()
+        trader._build_context('000001.SZ')
+        assert trader.trader.queries == 1
+
+        trader.on_trade_fill(fill('600000.SH', xtconstant.STOCK_BUY, 500, 8.0))
+        trader.on_trade_fill(fill('000001.SZ', xtconstant.STOCK_SELL, 400, 10.5))
+        context = trader._build_context('000001.SZ')
+
+        assert trader.trader.queries == 1
+        assert context['cash'] == pytest.approx(100000.0 - 4000.0 + 4200.0)
+        assert context['market_value'] == pytest.approx(10000.0 + 4000.0 - 4200.0)
+        assert context['position_600000.SH']['volume'] == 500
+        position = context['position_000001.SZ']
+        assert (position['volume'], position['can_use_volume']) == (600, 600)
+
+    def test_sell_out_removes_position(self):
+        """卖出全部持仓后上下文中不再有该股票的持仓字段"""
+        trader = make_trader()
+        assert trader._build_context('000001.SZ')['has_000001.SZ']
+        trader.on_trade_fill(fill('000001.SZ', xtconstant.STOCK_SELL, 1000, 10.0))
+        context = trader._build_context('000001.SZ')
+        assert 'has_000001.SZ' not in context
+        assert 'position_000001.SZ' not in context
+
+    def test_pushes_override_fill_estimates(self):
+        """随后到达的持仓和资产推送覆盖按成交估算的值"""
+        trader = make_trader()
+        trader._build_context('000001.SZ')
+        trader.on_trade_fill(fill('600000.SH', xtconstant.STOCK_BUY, 500, 8.0))
+        trader.update_position(SimpleNamespace(stock_code='600000.SH', volume=500, can_use_volume=0,
+                                               avg_price=8.01, market_value=4000.0))
+        trader.update_asset({'cash': 95995.0, 'market_value': 14000.0, 'total_asset': 109995.0})
+
+        context = trader._build_context('000001.SZ')
+        assert context['cash'] == 95995.0
+        assert context['position_600000.SH']['avg_price'] == 8.01
+        assert trader.trader.queries == 1
+
+    def test_reconnect_resyncs(self, monkeypatch):
+        """交易接口重新启动后，下次构建上下文时重新同步一次"""
+        trader = make_trader()
+        trader._build_context('000001.SZ')
+        trader.on_trade_fill(fill('600000.SH', xtconstant.STOCK_BUY, 500, 8.0))
+
+        class Reconnected(StubTrader):
+            def __init__(self, path, session_id):
+                super().__init__()
+
+            def set_callback(self, callback):
+                pass
+
+            def start(self):
+                return True
+
+        monkeypatch.setattr(khRealtimeTrader, 'XtQuantTrader', Reconnected)
+        assert trader._init_trader()
+        context = trader._build_context('000001.SZ')
+        assert trader.trader.queries == 1
+        assert 'position_600000.SH' not in context
+        assert context['cash'] == 100000.0
+
+
+@pytest.mark.unit
+class TestContextReuse:
+    """策略上下文复用测试"""
+
+    def test_context_dict_reused(self):
+        """同一股票的上下文字典复用，行情字段原地更新"""
+        trader = make_trader()
+        first = trader._build_context('000001.SZ')
+        trader.quote_data['000001.SZ'] = {'time': 1704162660000, 'close': 10.6, 'open': 10.0}
+        second = trader._build_context('000001.SZ')
+
+        assert second is first
+        assert second['close'] == 10.6
+        assert second['time_str'] == datetime.fromtimestamp(1704162660).strftime('%H:%M:%S')
+        assert trader._build_context('600000.SH') is not first
+
+    def test_position_fields_refreshed_on_version_change(self):
+        """持仓版本不变时不重写持仓字段，变化后按最新持仓刷新"""
+        trader = make_trader()
+        context = trader._build_context('000001.SZ')
+        position = context['position_000001.SZ']
+        assert trader._build_context('000001.SZ')['position_000001.SZ'] is position
+
+        trader.on_trade_fill(fill('000001.SZ', xtconstant.STOCK_BUY, 100, 10.0))
+        refreshed = trader._build_context('000001.SZ')['position_000001.SZ']
+        assert refreshed is not position
+        assert refreshed['volume'] == 1100
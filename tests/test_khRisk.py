@@ -0,0 +1,147 @@
+# coding: utf-8
+"""
+khRisk 模块测试
+
+覆盖增量维护的风控状态：初始资金、成交/盯市事件、与交易管理器的同步以及各项检查。
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from khPortfolio import PortfolioLedger
+from khRisk import KhRiskManager
+
+
+def make_config(**kwargs):
+    config = {'init_capital': 1000000, 'run_mode': 'backtest'}
+    config.update(kwargs)
+    return SimpleNamespace(**config)
+
+
+def make_trade_manager(cash, positions=None):
+    """只提供 assets/positions 的交易管理器替身"""
+    return SimpleNamespace(assets={'cash': cash}, positions=PortfolioLedger(positions or {}), risk_manager=None)
+
+
+@pytest.mark.unit
+class TestRiskState:
+    """风控状态测试"""
+
+    def test_standalone_seeded_from_init_capital(self):
+        """未关联交易管理器时以初始资金为起点"""
+        risk = KhRiskManager(make_config(init_capital=500000))
+        assert risk.cash == 500000
+        assert risk.equity == 500000
+        assert risk.peak_equity == 500000
+        assert risk.position_ratio == 0.0
+        assert risk.check_risk()[0]
+
+    def test_seeded_from_trade_manager(self):
+        """关联交易管理器时从其账户同步，并注册为其风控管理器"""
+        trade_mgr = make_trade_manager(800000, {'A': {'volume': 1000, 'market_value': 200000.0}})
+        risk = KhRiskManager(make_config(), trade_mgr)
+        assert trade_mgr.risk_manager is risk
+        assert risk.cash == 800000
+        assert risk.position_value == 200000
+        assert risk.equity == 1000000
+        assert risk.position_ratio == pytest.approx(0.2)
+
+    def test_fill_events_match_full_sync(self):
+        """成交事件增量更新的状态与从交易管理器完整同步的结果一致"""
+        trade_mgr = make_trade_manager(1000000)
+        risk = KhRiskManager(make_config(), trade_mgr)
+
+        risk.on_fill('buy', 100000.0, 30.0)
+        risk.on_fill('buy', 50000.0, 15.0)
+        risk.on_fill('sell', 40000.0, 52.0)
+        assert risk.order_count_today == 3
+
+        trade_mgr.assets['cash'] = 1000000 - 100030.0 - 50015.0 + 39948.0
+        trade_mgr.positions['A'] = {'volume': 1000, 'market_value': 110000.0}
+        expected = (risk.cash, risk.position_value, risk.equity, risk.position_ratio)
+        risk.sync()
+        assert (risk.cash, risk.position_value, risk.equity, risk.position_ratio) == pytest.approx(expected)
+
+    def test_position_limit_uses_mark_to_market(self):
+        """持仓比例检查读取盯市更新后的状态"""
+        risk = KhRiskManager(make_config(position_limit=0.5))
+        risk.on_mark_to_market(400000.0, 600000.0)
+        passed, message = risk.check_risk()
+        assert not passed
+        assert '持仓比例' in message
+        assert risk.stats['position_violations'] == 1
+
+        risk.on_mark_to_market(600000.0, 400000.0)
+        assert risk.check_risk()[0]
+
+    def test_drawdown_tracks_peak(self):
+        """回撤按峰值权益计算，每日重置时以当前权益为新的峰值"""
+        trade_mgr = make_trade_manager(1000000)
+        risk = KhRiskManager(make_config(drawdown_limit=0.15, loss_limit=0.5), trade_mgr)
+        risk.on_mark_to_market(200000.0, 1000000.0)
+        assert risk.peak_equity == 1200000
+        risk.on_mark_to_market(200000.0, 800000.0)
+        assert risk.drawdown == pytest.approx(200000 / 1200000)
+        passed, message = risk.check_risk()
+        assert not passed
+        assert '回撤' in message
+
+        trade_mgr.assets['cash'] = 200000.0
+        trade_mgr.positions['A'] = {'volume': 1000, 'market_value': 800000.0}
+        risk.reset_daily_counters()
+        assert risk.peak_equity == risk.equity == 1000000
+        assert risk.drawdown == 0.0
+        assert risk.order_count_today == 0
+        assert risk.check_risk()[0]
+
+    def test_loss_limit_against_init_capital(self):
+        """累计亏损按初始资金计算"""
+        risk = KhRiskManager(make_config(loss_limit=0.1, drawdown_limit=1.0))
+        risk.on_mark_to_market(850000.0, 0.0)
+        passed, message = risk.check_risk()
+        assert not passed
+        assert '止损' in message
+
+
+@pytest.mark.unit
+class TestBatchRiskCheck:
+    """批量风控预检查测试"""
+
+    SIGNALS = [
+        {'code': 'A', 'action': 'buy', 'price': 10.0, 'volume': 1000},
+        {'code': 'B', 'action': 'buy', 'price': 50.0, 'volume': 8000},
+        {'code': 'C', 'action': 'sell', 'price': 20.0, 'volume': 0},
+        {'code': 'D', 'action': 'buy', 'price': 100.0, 'volume': 3100},
+        {'code': 'E', 'action': 'sell', 'price': 8.0, 'volume': 500},
+    ]
+
+    @pytest.mark.parametrize('state', [
+        {},
+        {'position_value': 990000.0, 'cash': 10000.0},
+        {'position_value': 0.0, 'cash': 850000.0},
+        {'order_count_today': 100},
+    ])
+    def test_matches_check_risk_per_signal(self, state):
+        """与逐个信号调用 check_risk 的通过/拒绝结果和统计一致"""
+        managers = []
+        for _ in range(2):
+            risk = KhRiskManager(make_config(position_limit=0.95, single_order_limit=0.3))
+            if 'cash' in state:
+                risk.on_mark_to_market(state['cash'], state['position_value'])
+            risk.order_count_today = state.get('order_count_today', 0)
+            managers.append(risk)
+        sequential, batch = managers
+
+        expected = [sequential.check_risk(signal) for signal in self.SIGNALS]
+        passed, reasons = batch.check_signals_batch(self.SIGNALS)
+
+        assert passed.tolist() == [ok for ok, _ in expected]
+        assert reasons == [msg for _, msg in expected]
+        assert batch.stats == sequential.stats
+
+    def test_empty_batch(self):
+        """空信号列表"""
+        risk = KhRiskManager(make_config())
+        passed, reasons = risk.check_signals_batch([])
+        assert len(passed) == 0 and reasons == []
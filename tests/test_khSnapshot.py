@@ -0,0 +1,95 @@
+# coding: utf-8
+"""
+khSnapshot 模块测试
+
+覆盖按时间截取、多段记录拼接、字段子集匹配以及 strict 模式下的未命中。
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from khSnapshot import MarketSnapshot, SnapshotDataSource, SnapshotMiss, normalize_request
+
+FIELDS = ['time', 'open', 'close']
+DATES = ['20231227', '20231228', '20231229', '20240102', '20240103', '20240104', '20240105']
+
+
+def make_ex(code, dates, fields=FIELDS):
+    """构造 get_market_data_ex 格式的结果，数值为日期序号"""
+    values = {field: np.arange(len(dates), dtype=float) + DATES.index(dates[0]) for field in fields}
+    return {code: pd.DataFrame(values, index=dates)}
+
+
+def record_ex(snapshot, code, start, end, fields=FIELDS):
+    dates = [d for d in DATES if start <= d <= end]
+    request = normalize_request((), {'field_list': fields, 'stock_list': [code], 'period': '1d',
+                                     'start_time': start, 'end_time': end})
+    snapshot.record('get_market_data_ex', request, make_ex(code, dates, fields))
+
+
+def ex_request(fields, codes, start, end):
+    return normalize_request((), {'field_list': fields, 'stock_list': codes, 'period': '1d',
+                                  'start_time': start, 'end_time': end})
+
+
+@pytest.fixture
+def snapshot():
+    snapshot = MarketSnapshot()
+    record_ex(snapshot, '000001.SZ', '20231227', '20240102')
+    record_ex(snapshot, '000001.SZ', '20240102', '20240105')
+    return snapshot
+
+
+@pytest.mark.unit
+class TestMarketSnapshot:
+    """MarketSnapshot 测试"""
+
+    def test_slice_single_record(self, snapshot):
+        """请求落在一段记录之内时按时间截取"""
+        found, result = snapshot.lookup('get_market_data_ex',
+                                        ex_request(FIELDS, ['000001.SZ'], '20240103', '20240104'))
+        assert found
+        assert result['000001.SZ'].index.tolist() == ['20240103', '20240104']
+
+    def test_union_of_records(self, snapshot):
+        """跨越两段首尾相接的记录时拼接，重叠日期只保留一次"""
+        found, result = snapshot.lookup('get_market_data_ex',
+                                        ex_request(['time', 'close'], ['000001.SZ'], '20231228', '20240104'))
+        assert found
+        frame = result['000001.SZ']
+        assert list(frame.columns) == ['time', 'close']
+        assert frame.index.tolist() == ['20231228', '20231229', '20240102', '20240103', '20240104']
+        assert frame['close'].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+    def test_gap_or_missing_field_misses(self, snapshot):
+        """超出记录范围、字段或股票不在记录中时未命中"""
+        assert not snapshot.lookup('get_market_data_ex',
+                                   ex_request(FIELDS, ['000001.SZ'], '20231201', '20240104'))[0]
+        assert not snapshot.lookup('get_market_data_ex',
+                                   ex_request(['volume'], ['000001.SZ'], '20231228', '20240104'))[0]
+        assert not snapshot.lookup('get_market_data_ex',
+                                   ex_request(FIELDS, ['000002.SZ'], '20231228', '20240104'))[0]
+
+        gapped = MarketSnapshot()
+        record_ex(gapped, '000001.SZ', '20231227', '20231228')
+        record_ex(gapped, '000001.SZ', '20240102', '20240105')
+        assert not gapped.lookup('get_market_data_ex',
+                                 ex_request(FIELDS, ['000001.SZ'], '20231227', '20240104'))[0]
+
+    def test_stocks_from_different_records(self, snapshot):
+        """多只股票的数据来自不同的记录"""
+        record_ex(snapshot, '000002.SZ', '20231227', '20240105')
+        found, result = snapshot.lookup('get_market_data_ex',
+                                        ex_request(FIELDS, ['000001.SZ', '000002.SZ'], '20231229', '20240103'))
+        assert found
+        assert sorted(result) == ['000001.SZ', '000002.SZ']
+        assert len(result['000001.SZ']) == len(result['000002.SZ']) == 3
+
+    def test_strict_source_raises_on_miss(self, snapshot):
+        """strict 模式下未命中抛出 SnapshotMiss 而不回退到 xtdata"""
+        source = SnapshotDataSource(snapshot, strict=True)
+        source.get_market_data_ex(FIELDS, ['000001.SZ'], '1d', '20231228', '20240104')
+        with pytest.raises(SnapshotMiss):
+            source.get_market_data_ex(FIELDS, ['000001.SZ'], '1d', '20231201', '20240104')
+        assert (source.hits, source.misses) == (1, 1)
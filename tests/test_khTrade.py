@@ -0,0 +1,148 @@
+# coding: utf-8
+"""
+khTrade 模块测试
+
+覆盖回测批量执行路径：与逐笔执行的成交、资金和持仓结果一致，以及被拒绝信号的汇总回调。
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('xtquant')
+
+from khRisk import KhRiskManager
+from khTrade import KhTradeManager
+
+
+TRADE_COST = {
+    'min_commission': 5.0,
+    'commission_rate': 0.0003,
+    'stamp_tax_rate': 0.001,
+    'flow_fee': 0.1,
+    'slippage': {'type': 'ratio', 'tick_size': 0.01, 'tick_count': 2, 'ratio': 0.001},
+}
+
+
+def make_manager(batch_order_threshold, cash=100000.0, t0_mode=False, **backtest):
+    """构造持有两只股票的回测交易管理器"""
+    config = SimpleNamespace(
+        config_dict={'backtest': {'trade_cost': TRADE_COST, 'batch_order_threshold': batch_order_threshold,
+                                  **backtest}},
+        run_mode='backtest', account_id='test', init_capital=cash)
+    manager = KhTradeManager(config)
+    manager.t0_mode = t0_mode
+    manager.assets = {'cash': cash}
+    for code, volume, price in (('000001.SZ', 1000, 10.0), ('600000.SH', 500, 8.0)):
+        manager.positions[code] = {
+            'account_type': 2, 'account_id': 'test', 'stock_code': code,
+            'volume': volume, 'can_use_volume': volume, 'open_price': price,
+            'market_value': volume * price, 'frozen_volume': 0, 'on_road_volume': 0,
+            'yesterday_volume': 0, 'avg_price': price, 'current_price': price,
+            'direction': 48, 'profit': 0.0, 'profit_ratio': 0.0,
+        }
+    return manager
+
+
+def make_signals():
+    """先卖后买的一批信号，包含可用持仓不足、资金不足、同一股票多次买卖的情况"""
+    sells = [
+        ('000001.SZ', 10.2, 400), ('000001.SZ', 10.2, 400), ('000001.SZ', 10.2, 400),
+        ('600000.SH', 8.1, 500), ('000002.SZ', 15.0, 100),
+    ]
+    buys = [
+        ('000002.SZ', 15.3, 2000), ('000001.SZ', 10.25, 3000), ('300750.SZ', 180.0, 1000),
+        ('000002.SZ', 15.31, 1000), ('510300.SH', 3.865, 5000), ('600036.SH', 35.0, 300),
+    ]
+    signals = [{'code': code, 'action': 'sell', 'price': price, 'volume': volume, 'reason': 'test'}
+               for code, price, volume in sells]
+    signals += [{'code': code, 'action': 'buy', 'price': price, 'volume': volume, 'reason': 'test'}
+                for code, price, volume in buys]
+    return signals
+
+
+def fills(manager):
+    return [(t['stock_code'], t['order_type'], t['traded_price'], t['traded_volume'], t['traded_amount'])
+            for t in manager.trades.values()]
+
+
+@pytest.mark.unit
+class TestBatchExecution:
+    """批量执行与逐笔执行一致性测试"""
+
+    @pytest.mark.parametrize('t0_mode', [False, True])
+    def test_batch_matches_sequential(self, t0_mode):
+        """同一批信号的成交记录、现金和持仓与逐笔执行完全一致"""
+        sequential = make_manager(0, t0_mode=t0_mode)
+        batch = make_manager(1, t0_mode=t0_mode)
+        assert not sequential._can_batch(make_signals())
+        assert batch._can_batch(make_signals())
+
+        sequential.process_signals(make_signals())
+        batch.process_signals(make_signals())
+
+        assert fills(batch) == fills(sequential)
+        assert batch.assets['cash'] == sequential.assets['cash']
+        assert batch.positions.copy() == sequential.positions.copy()
+        assert list(batch.positions) == list(sequential.positions)
+
+    def test_batch_summary(self):
+        """批量执行返回成交笔数和被拒绝的信号"""
+        manager = make_manager(1)
+        summary = manager.process_signals_batch(make_signals())
+        rejected = dict(summary['rejected'])
+        assert rejected['000002.SZ'] in ('可用持仓不足', '资金不足')
+        assert ('000001.SZ', '可用持仓不足') in summary['rejected']
+        assert ('300750.SZ', '资金不足') in summary['rejected']
+        assert summary['executed'] == len(manager.trades)
+        assert summary['cash'] == manager.assets['cash']
+
+    def test_interleaved_signals_batched_sell_first(self):
+        """卖出与买入交错的信号同样走批量路径，结果与先卖后买排序后逐笔执行一致"""
+        signals = make_signals()
+        interleaved = [signal for pair in zip(signals[5:], signals[:5]) for signal in pair] + signals[10:]
+        batch = make_manager(1)
+        assert batch._can_batch(interleaved)
+        assert not batch._can_batch(interleaved + [dict(signals[0], action='cancel')])
+
+        sequential = make_manager(0)
+        sequential.process_signals(make_signals())
+        batch.process_signals(interleaved)
+        assert fills(batch) == fills(sequential)
+        assert batch.assets['cash'] == sequential.assets['cash']
+
+    def test_rejected_signals_single_order_error(self):
+        """被拒绝的信号汇总为一次 on_order_error 回调"""
+        errors, batches = [], []
+        callback = SimpleNamespace(
+            gui=SimpleNamespace(log_message=lambda message, level: None),
+            on_order_error=errors.append, on_stock_batch=batches.append)
+        manager = make_manager(1)
+        manager.callback = callback
+        summary = manager.process_signals_batch(make_signals())
+
+        assert len(errors) == 1 and len(batches) == 1
+        error = errors[0]
+        assert error.error_id == -3
+        assert error.rejected == summary['rejected']
+        assert set(error.stock_code.split(',')) == {code for code, _ in summary['rejected']}
+
+        manager = make_manager(1, cash=1e9)
+        manager.callback = callback
+        manager.process_signals_batch(make_signals()[3:4] + make_signals()[5:])
+        assert len(errors) == 1
+
+    def test_batch_risk_check_opt_in(self):
+        """开启 batch_risk_check 时风控未通过的信号不执行并列入 rejected，默认不检查"""
+        manager = make_manager(1, batch_risk_check=True)
+        KhRiskManager(manager.config, manager)
+        summary = manager.process_signals_batch(make_signals())
+        # 单笔金额超过权益30%的信号被风控拦截
+        assert ('300750.SZ', '风控拦截: 单笔委托金额 180000.00 超过资产比例限制') in summary['rejected']
+        assert '300750.SZ' not in [t['stock_code'] for t in manager.trades.values()]
+
+        default = make_manager(1)
+        KhRiskManager(default.config, default)
+        assert not default.batch_risk_check
+        summary = default.process_signals_batch(make_signals())
+        assert not any(reason.startswith('风控拦截') for _, reason in summary['rejected'])